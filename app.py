@@ -5,35 +5,49 @@ from flask_restx import Api, Resource, fields, Namespace
 from functools import wraps
 import mysql.connector
 from mysql.connector import Error
+from db_pool import ConnectionPool
+from migrations import run_migrations
+from schema_cache import SchemaCache
+from pagination import parse_limit, keyset_condition, split_page, DEFAULT_PAGE_SIZE
+from financial_summary import get_user_summary, SummaryReconciler
+from pdf_jobs import PdfRenderQueue, invoice_content_key, JOB_DONE, JOB_FAILED
+from template_cache import TemplateCache
+from streaming import iter_rows, csv_chunks, ndjson_chunks, stream_export, to_json
+from export_jobs import ExportJobQueue, JOB_DONE as EXPORT_JOB_DONE
+from audit_sink import AuditLogSink
+from sequences import next_document_number
+from unit_of_work import UnitOfWorkConnection, current_unit_of_work, init_unit_of_work
+from file_cleanup import FileCleanupQueue
+from ledger import (balance_as_of, account_statement, find_ledger_drift, LedgerSnapshotter,
+                    post_movement, post_movements, post_adjustment, post_opening, post_closing, posted_source,
+                    posted_sources)
+from events import EventBus, sse_stream
+from http_cache import collection_versions, make_etag, is_not_modified, init_compression
+from json_provider import FastJSONProvider, json_default
+from instrumentation import RequestInstrumentation
+from reference_cache import ReferenceCache
 import os
-import csv
+import re
 import json
 from datetime import datetime, date, timezone, timedelta
+from decimal import Decimal
+from collections import defaultdict
 import pytz
 import uuid
+import hmac
 import random
 from werkzeug.utils import secure_filename
 from werkzeug.security import generate_password_hash, check_password_hash
-from reportlab.lib.pagesizes import letter, A4, landscape
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-from reportlab.lib import colors
-import pandas as pd
 import io
 import mimetypes
 import shutil
-# PDF processing imports
-try:
-    import PyPDF2
-    import fitz  # PyMuPDF for advanced PDF manipulation
-    from PIL import Image, ImageDraw, ImageFont
-    PDF_PROCESSING_AVAILABLE = True
-except ImportError:
-    PDF_PROCESSING_AVAILABLE = False
 
 app = Flask(__name__)
 app.secret_key = 'your-secret-key-here'
+# jsonify() serializes Decimal/date/datetime rows directly (orjson when available)
+app.json_provider_class = FastJSONProvider
+app.json = FastJSONProvider(app)
+app.config['RESTX_JSON'] = {'default': json_default}
 CORS(app, supports_credentials=True)
 
 # Configure Swagger/OpenAPI documentation
@@ -132,6 +146,36 @@ os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(EXPORT_FOLDER, exist_ok=True)
 os.makedirs(TEMPLATE_FOLDER, exist_ok=True)
 
+# Background invoice PDF rendering; PDFs are cached by content key
+PDF_CACHE_FOLDER = os.path.join(EXPORT_FOLDER, 'invoice_cache')
+PDF_TEMPLATE_FILES = ('pdftemp.html', 'pdftemp_in.html')
+PDF_RENDER_TIMEOUT = int(os.environ.get('PDF_RENDER_TIMEOUT', 120))
+pdf_render_queue = PdfRenderQueue(
+    PDF_CACHE_FOLDER,
+    max_workers=int(os.environ.get('PDF_RENDER_WORKERS', 2)),
+    max_age=int(os.environ.get('PDF_CACHE_MAX_AGE', 7 * 86400)),
+    max_bytes=int(os.environ.get('PDF_CACHE_MAX_MB', 512)) * 1024 * 1024,
+    prune_interval=int(os.environ.get('PDF_CACHE_PRUNE_INTERVAL', 600)),
+)
+
+# Uploaded files of deleted rows are removed in the background after commit
+file_cleanup_queue = FileCleanupQueue(UPLOAD_FOLDER)
+
+# Approval/pending-count events pushed to open pages over /api/events/stream
+event_bus = EventBus()
+SSE_KEEPALIVE = int(os.environ.get('SSE_KEEPALIVE', 15))
+SSE_STREAM_SECONDS = int(os.environ.get('SSE_STREAM_SECONDS', 300))
+# How often a stream checks the database for changes committed by other worker processes
+SSE_SYNC_SECONDS = float(os.environ.get('SSE_SYNC_SECONDS', 5))
+
+# Compiled invoice HTML templates (pdftemp*.html on disk)
+invoice_template_cache = TemplateCache('.', os.environ.get('TEMPLATE_BYTECODE_DIR', os.path.join(EXPORT_FOLDER, 'template_bytecode')))
+
+# Per-user profile, company/user settings and bank accounts, checked against
+# trigger-bumped versions once per request so every worker sees writes at once
+reference_cache = ReferenceCache(max_entries=int(os.environ.get('REFERENCE_CACHE_SIZE', 4096)),
+                                 ttl=int(os.environ.get('REFERENCE_CACHE_TTL', 300)))
+
 # Database configuration
 DB_CONFIG = {
     'host': 'localhost',
@@ -140,138 +184,90 @@ DB_CONFIG = {
     'database': 'expense_tracker'
 }
 
+# Connection pool configuration (override via environment variables)
+DB_POOL_CONFIG = {
+    'pool_size': int(os.environ.get('DB_POOL_SIZE', 10)),
+    'max_overflow': int(os.environ.get('DB_POOL_MAX_OVERFLOW', 10)),
+    'timeout': float(os.environ.get('DB_POOL_TIMEOUT', 30)),
+    'recycle': int(os.environ.get('DB_POOL_RECYCLE', 3600)),
+    'ping_after': int(os.environ.get('DB_POOL_PING_AFTER', 30))
+}
+
+# Per-request SQL/latency metrics, exported at /metrics; requests slower than
+# SLOW_REQUEST_SECONDS are logged with their query fingerprints. With several
+# worker processes, METRICS_MULTIPROC_DIR (set by gunicorn.conf.py) lets every
+# worker report totals for all of them. Scrapers authenticate with
+# METRICS_TOKEN; without a token only logged-in admins can read /metrics.
+request_metrics = RequestInstrumentation(slow_request_seconds=float(os.environ.get('SLOW_REQUEST_SECONDS', 1.0)),
+                                         multiprocess_dir=os.environ.get('METRICS_MULTIPROC_DIR'))
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+db_pool = ConnectionPool(DB_CONFIG, **DB_POOL_CONFIG, observer=request_metrics)
+request_metrics.add_gauges('laitusneo_db_pool', db_pool.stats)
+request_metrics.add_gauges('laitusneo_event_bus', event_bus.stats)
+request_metrics.add_gauges('laitusneo_reference_cache', reference_cache.stats)
+
 def get_db_connection():
-    """Get database connection"""
+    """Get a pooled database connection; close() returns it to the pool"""
     try:
-        connection = mysql.connector.connect(**DB_CONFIG)
-        return connection
+        return db_pool.get_connection()
     except Error as e:
         print(f"Error connecting to database: {e}")
         return None
 
-def create_sub_users_table():
-    """Create sub_users table if it doesn't exist"""
+def get_request_connection():
+    """Connection shared by everything in the current request (one transaction,
+    committed after a successful response). Outside a request this is just
+    get_db_connection()."""
+    uow = current_unit_of_work(get_db_connection)
+    if uow is None:
+        return get_db_connection()
+    return uow.connection()
+
+def fail_request_connection(connection):
+    """Make a failed step fail the whole request: the unit of work turns
+    rollback-only (nothing it did is committed); a plain connection rolls back."""
+    try:
+        if isinstance(connection, UnitOfWorkConnection):
+            connection.mark_rollback_only()
+        else:
+            connection.rollback()
+    except Exception as e:
+        print(f"DEBUG: Rollback after failed step failed: {e}")
+
+def after_request_commit(callback):
+    """Run callback once the request's unit of work has committed (dropped if it
+    rolls back). Outside a request it runs right away."""
+    uow = current_unit_of_work(get_db_connection)
+    if uow is None:
+        callback()
+    else:
+        uow.after_commit(callback)
+
+# Admin bulk exports run on a DB-backed job queue; artifacts expire after EXPORT_RETENTION_DAYS
+export_job_queue = ExportJobQueue(get_db_connection, EXPORT_FOLDER,
+                                  retention_days=int(os.environ.get('EXPORT_RETENTION_DAYS', 7)))
+
+request_metrics.init_app(app)
+init_unit_of_work(app)
+
+# gzip/brotli for JSON responses of at least COMPRESS_MIN_SIZE bytes
+init_compression(app, min_size=int(os.environ.get('COMPRESS_MIN_SIZE', 1024)),
+                 level=int(os.environ.get('COMPRESS_LEVEL', 6)))
+
+# Table columns are loaded once per process and refreshed after migrations
+schema_cache = SchemaCache()
+
+def get_table_columns(connection, table):
+    """Column names of `table` from the process-wide schema cache"""
+    return schema_cache.get_columns(connection, table)
+
+def migrate_database(connection):
+    """Apply pending schema migrations and refresh the cached schema"""
     try:
-        print("Creating sub_users table...")
-        connection = get_db_connection()
-        if not connection:
-            print("Failed to get database connection")
-            return False
-        
-        cursor = connection.cursor()
-        
-        # Create sub_users table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS sub_users (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                sub_user_id VARCHAR(50) UNIQUE NOT NULL,
-                password_hash VARCHAR(255) NOT NULL,
-                first_name VARCHAR(100) NOT NULL,
-                last_name VARCHAR(100) NOT NULL,
-                email VARCHAR(255),
-                created_by INT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-                is_active BOOLEAN DEFAULT TRUE,
-                FOREIGN KEY (created_by) REFERENCES users(id) ON DELETE CASCADE,
-                INDEX idx_sub_user_id (sub_user_id),
-                INDEX idx_created_by (created_by)
-            )
-        """)
-        
-        # Add approval tracking columns to invoices table if they don't exist
-        try:
-            cursor.execute("ALTER TABLE invoices ADD COLUMN approved_at TIMESTAMP NULL")
-            print("Added approved_at column to invoices table")
-        except:
-            pass  # Column already exists
-            
-        try:
-            cursor.execute("ALTER TABLE invoices ADD COLUMN approved_by INT NULL")
-            print("Added approved_by column to invoices table")
-        except:
-            pass  # Column already exists
-            
-        try:
-            cursor.execute("ALTER TABLE invoices ADD COLUMN approved_bank_account_id INT NULL")
-            print("Added approved_bank_account_id column to invoices table")
-        except:
-            pass  # Column already exists
-            
-        try:
-            cursor.execute("ALTER TABLE invoices ADD COLUMN approved_payment_method VARCHAR(20) NULL")
-            print("Added approved_payment_method column to invoices table")
-        except:
-            pass  # Column already exists
-        
-        # Create sub_user_requests table for expense/transaction requests
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS sub_user_requests (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                sub_user_id INT NOT NULL,
-                request_type ENUM('expense', 'transaction', 'invoice') NOT NULL,
-                request_data JSON NOT NULL,
-                status ENUM('pending', 'approved', 'rejected') DEFAULT 'pending',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-                reviewed_by INT,
-                reviewed_at TIMESTAMP NULL,
-                notes TEXT,
-                FOREIGN KEY (sub_user_id) REFERENCES sub_users(id) ON DELETE CASCADE,
-                FOREIGN KEY (reviewed_by) REFERENCES users(id) ON DELETE SET NULL,
-                INDEX idx_sub_user_id (sub_user_id),
-                INDEX idx_status (status),
-                INDEX idx_request_type (request_type)
-            )
-        """)
-        
-        # Add created_by_sub_user column to expenses table if it doesn't exist
-        try:
-            cursor.execute("SHOW COLUMNS FROM expenses LIKE 'created_by_sub_user'")
-            if not cursor.fetchone():
-                cursor.execute("ALTER TABLE expenses ADD COLUMN created_by_sub_user INT NULL")
-                cursor.execute("ALTER TABLE expenses ADD FOREIGN KEY (created_by_sub_user) REFERENCES sub_users(id) ON DELETE SET NULL")
-        except Exception as e:
-            print(f"Error adding created_by_sub_user to expenses: {e}")
-        
-        # Add created_by_sub_user column to transactions table if it doesn't exist
-        try:
-            cursor.execute("SHOW COLUMNS FROM transactions LIKE 'created_by_sub_user'")
-            if not cursor.fetchone():
-                cursor.execute("ALTER TABLE transactions ADD COLUMN created_by_sub_user INT NULL")
-                cursor.execute("ALTER TABLE transactions ADD FOREIGN KEY (created_by_sub_user) REFERENCES sub_users(id) ON DELETE SET NULL")
-        except Exception as e:
-            print(f"Error adding created_by_sub_user to transactions: {e}")
-        
-        # Create sub_user_bank_accounts table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS sub_user_bank_accounts (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                sub_user_id INT NOT NULL,
-                bank_name VARCHAR(255) NOT NULL,
-                account_number VARCHAR(50) NOT NULL,
-                ifsc_code VARCHAR(20) NOT NULL,
-                account_holder_name VARCHAR(255) NOT NULL,
-                upi_id VARCHAR(255),
-                phone_number VARCHAR(20),
-                notes TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-                FOREIGN KEY (sub_user_id) REFERENCES sub_users(id) ON DELETE CASCADE,
-                UNIQUE KEY unique_sub_user_bank (sub_user_id),
-                INDEX idx_sub_user_id (sub_user_id)
-            )
-        """)
-        
-        connection.commit()
-        cursor.close()
-        connection.close()
-        print("Sub_users table created successfully")
-        return True
-        
-    except Error as e:
-        print(f"Error creating sub_users table: {e}")
-        return False
+        return run_migrations(connection)
+    finally:
+        schema_cache.invalidate()
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -286,121 +282,122 @@ def generate_unique_id(record_type='TXN'):
     random_suffix = ''.join(random.choices('ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789', k=4))
     return f"{record_type}-{timestamp}-{random_suffix}"
 
-def generate_invoice_number(user_id, invoice_type='out'):
-    """Generate unique invoice number for user based on invoice type"""
+def generate_invoice_number(user_id, invoice_type='out', cursor=None):
+    """Allocate the next invoice number for a user (LNTP for out, LNTS for in invoices).
+    
+    Pass the caller's cursor to allocate inside its transaction, so the number
+    is only consumed if the invoice is committed.
+    """
+    doc_type = 'LNTS' if invoice_type == 'in' else 'LNTP'
+    if cursor is not None:
+        return next_document_number(cursor, user_id, doc_type)
+    
     connection = get_db_connection()
     if connection:
         cursor = connection.cursor()
         try:
-            # Different prefixes for IN and OUT invoices
-            if invoice_type == 'in':
-                prefix = "LNTS"
-            else:
-                prefix = "LNTP"
-            
-            print(f"DEBUG: Generating {invoice_type} invoice with prefix: {prefix}")
-            
-            # Find the highest invoice number for this user and type
-            cursor.execute(
-                "SELECT MAX(CAST(SUBSTRING(invoice_number, LENGTH(%s) + 1) AS UNSIGNED)) FROM invoices WHERE user_id = %s AND invoice_number LIKE %s",
-                (prefix, user_id, f"{prefix}%")
-            )
-            result = cursor.fetchone()[0]
-            
-            # If no invoices exist for this user and type, start with 001
-            next_number = 1 if result is None else result + 1
-            
-            print(f"DEBUG: Next number for {prefix}: {next_number}")
-            
-            invoice_number = f"{prefix}{next_number:03d}"
-            
-            # Verify that this invoice number doesn't already exist
-            cursor.execute(
-                "SELECT COUNT(*) FROM invoices WHERE user_id = %s AND invoice_number = %s",
-                (user_id, invoice_number)
-            )
-            exists = cursor.fetchone()[0] > 0
-            
-            # If it exists, try the next number (with safety limit)
-            max_attempts = 1000  # Prevent infinite loops
-            attempts = 0
-            while exists and attempts < max_attempts:
-                next_number += 1
-                invoice_number = f"{prefix}{next_number:03d}"
-                cursor.execute(
-                    "SELECT COUNT(*) FROM invoices WHERE user_id = %s AND invoice_number = %s",
-                    (user_id, invoice_number)
-                )
-                exists = cursor.fetchone()[0] > 0
-                attempts += 1
-            
-            if attempts >= max_attempts:
-                print(f"WARNING: Could not find unique invoice number after {max_attempts} attempts")
-                # Fall back to timestamp-based number
-                timestamp = datetime.now().strftime("%H%M%S")
-                invoice_number = f"{prefix}{timestamp}"
-                
-            cursor.close()
-            connection.close()
+            invoice_number = next_document_number(cursor, user_id, doc_type)
+            connection.commit()
             return invoice_number
         except Exception as e:
             print(f"Error generating invoice number: {e}")
+        finally:
             cursor.close()
             connection.close()
-            
+    
     # Fallback pattern with timestamp to ensure uniqueness
     timestamp = datetime.now().strftime("%H%M%S")
-    if invoice_type == 'in':
-        return f"LNTS{timestamp}"
-    else:
-        return f"LNTP{timestamp}"
+    return f"{doc_type}{timestamp}"
+
+def ledger_contra(transaction_type):
+    """Ledger contra account of a credit (income) or debit (expense) movement"""
+    return 'income' if transaction_type == 'credit' else 'expense'
+
+def sub_user_request_ids(cursor, user_id, unique_ids):
+    """{unique_id: [sub_user_request id]} for the requests rows with these unique_ids were approved from"""
+    unique_ids = sorted({unique_id for unique_id in unique_ids if unique_id})
+    if not unique_ids:
+        return {}
+    placeholders = ','.join(['%s'] * len(unique_ids))
+    cursor.execute(f"""
+        SELECT id, payload_unique_id FROM sub_user_requests
+        WHERE owner_user_id = %s AND payload_unique_id IN ({placeholders})
+    """, [user_id] + unique_ids)
+    requests_by_unique_id = defaultdict(list)
+    for row in cursor.fetchall():
+        request_id, unique_id = (row['id'], row['payload_unique_id']) if isinstance(row, dict) else row
+        requests_by_unique_id[unique_id].append(request_id)
+    return requests_by_unique_id
+
+def sub_user_request_sources(cursor, user_id, row):
+    """Ledger source of the sub-user request an expense/transaction row was approved from"""
+    # Fallback approval inserts may leave created_by_sub_user empty, so match on unique_id alone
+    if not row.get('unique_id'):
+        return []
+    return [('sub_user_request', request_id)
+            for request_id in sub_user_request_ids(cursor, user_id, [row['unique_id']]).get(row['unique_id'], [])]
 
-def update_bank_balance(bank_account_id, amount, transaction_type, user_id):
-    """Update bank account balance based on transaction type"""
+def transaction_ledger_sources(cursor, user_id, transactions):
+    """{transaction id: (source_type, source_id)} its balance movement was journaled under.
+    
+    Resolved for all rows at once: one query for the sub-user requests and one
+    for the posted sources, however many transactions are given.
+    """
+    requests_by_unique_id = sub_user_request_ids(cursor, user_id, [t.get('unique_id') for t in transactions])
+    candidates = {}
+    for transaction in transactions:
+        # Money recorded by an expense, invoice or sub-user request is usually posted under that row
+        rows = [('transaction', transaction['id'])]
+        if transaction.get('source') in ('expense', 'invoice') and transaction.get('source_id'):
+            rows.append((transaction['source'], transaction['source_id']))
+        if transaction.get('invoice_id'):
+            rows.append(('invoice', transaction['invoice_id']))
+        rows += [('sub_user_request', request_id) for request_id in requests_by_unique_id.get(transaction.get('unique_id'), [])]
+        candidates[transaction['id']] = rows
+    return posted_sources(cursor, candidates)
+
+def transaction_ledger_source(cursor, user_id, transaction):
+    """(source_type, source_id) a transaction row's balance movement was journaled under"""
+    return transaction_ledger_sources(cursor, user_id, [transaction])[transaction['id']]
+
+def update_bank_balance(bank_account_id, amount, transaction_type, user_id, source_type, source_id):
+    """Update bank account balance based on transaction type. On failure the
+    request's unit of work is marked rollback-only so the caller's ledger and
+    transaction rows are not committed without the balance change."""
+    connection = get_request_connection()
+    if not connection:
+        print("Database connection failed for bank balance update")
+        return False
+    cursor = None
     try:
-        connection = get_db_connection()
-        if not connection:
-            print("Database connection failed for bank balance update")
-            return False
-        
         cursor = connection.cursor()
         
-        if transaction_type == 'credit':
-            # Credit: Add money to bank account
-            cursor.execute("""
-                UPDATE bank_accounts 
-                SET current_balance = current_balance + %s 
-                WHERE id = %s AND user_id = %s
-            """, (amount, bank_account_id, user_id))
-            print(f"Added ₹{amount} to bank account {bank_account_id}")
-        else:
-            # Debit: Deduct money from bank account
-            cursor.execute("""
-                UPDATE bank_accounts 
-                SET current_balance = current_balance - %s 
-                WHERE id = %s AND user_id = %s
-            """, (amount, bank_account_id, user_id))
-            print(f"Deducted ₹{amount} from bank account {bank_account_id}")
-        
-        if cursor.rowcount == 0:
+        # Credit adds money to the bank account, debit deducts it
+        if not post_movement(cursor, user_id, 'bank', bank_account_id, transaction_type, amount,
+                             ledger_contra(transaction_type), source_type, source_id):
             print(f"Warning: Could not update bank account {bank_account_id} balance")
+            fail_request_connection(connection)
             return False
+        print(f"{'Added' if transaction_type == 'credit' else 'Deducted'} ₹{amount} for bank account {bank_account_id}")
         
         connection.commit()
-        cursor.close()
-        connection.close()
         return True
         
     except Exception as e:
         print(f"Error updating bank balance: {e}")
+        fail_request_connection(connection)
         return False
+    finally:
+        if cursor is not None:
+            cursor.close()
+        connection.close()
 
 def create_invoice_transaction(invoice_id, invoice_type, total_amount, invoice_number, client_name, bank_account_id=None, cursor=None, connection=None, user_id=None):
     """Create automatic transaction for invoice and update bank balance"""
     try:
         # Use provided cursor/connection or create new ones
         if cursor is None or connection is None:
-            connection = get_db_connection()
+            connection = get_request_connection()
             if not connection:
                 print("Database connection failed for invoice transaction")
                 return None
@@ -416,16 +413,6 @@ def create_invoice_transaction(invoice_id, invoice_type, total_amount, invoice_n
                 print("Error: No user_id available for invoice transaction")
                 return None
         
-        # First, ensure the transactions table has the required columns
-        try:
-            cursor.execute("ALTER TABLE transactions ADD COLUMN IF NOT EXISTS source VARCHAR(50)")
-            cursor.execute("ALTER TABLE transactions ADD COLUMN IF NOT EXISTS source_id INT")
-            cursor.execute("ALTER TABLE transactions ADD COLUMN IF NOT EXISTS payment_method VARCHAR(50) DEFAULT 'cash'")
-            cursor.execute("ALTER TABLE transactions ADD COLUMN IF NOT EXISTS bank_account_id INT NULL")
-            connection.commit()
-        except Exception as e:
-            print(f"Warning: Could not add columns to transactions table: {e}")
-        
         # Determine transaction type based on invoice type
         if invoice_type == 'in':
             transaction_type = 'credit'  # Money coming in
@@ -473,10 +460,10 @@ def create_invoice_transaction(invoice_id, invoice_type, total_amount, invoice_n
         # Update balances based on payment method
         print(f"Updating balances for invoice transaction: bank_account_id={bank_account_id}, payment_method={payment_method}, transaction_type={transaction_type}, amount={total_amount}")
         if bank_account_id and payment_method == 'online':
-            result = update_bank_balance(bank_account_id, total_amount, transaction_type, user_id)
+            result = update_bank_balance(bank_account_id, total_amount, transaction_type, user_id, 'invoice', invoice_id)
             print(f"Bank balance update result: {result}")
         elif payment_method == 'cash':
-            result = update_cash_balance_transaction(total_amount, transaction_type, user_id)
+            result = update_cash_balance_transaction(total_amount, transaction_type, user_id, 'invoice', invoice_id)
             print(f"Cash balance update result: {result}")
         else:
             print(f"No balance update needed - bank_account_id: {bank_account_id}, payment_method: {payment_method}")
@@ -505,6 +492,8 @@ def create_invoice_transaction(invoice_id, invoice_type, total_amount, invoice_n
 def extract_text_positions(pdf_path):
     """Extract text positions from PDF"""
     try:
+        import fitz  # PyMuPDF, loaded on first use
+        
         doc = fitz.open(pdf_path)
         page = doc[0]  # Get first page
         text_instances = page.get_text("dict")
@@ -528,6 +517,51 @@ def extract_text_positions(pdf_path):
         print(f"Error extracting PDF text positions: {e}")
         return []
 
+def build_list_query(alias, date_column, type_column):
+    """WHERE conditions, params and page size for a filtered, keyset-paginated list.
+
+    Supported query args: date_from, date_to, type, payment_method and
+    bank_account_id (exact), category and search (substring of the category
+    and the unique_id), limit and cursor. limit is None (no pagination) unless
+    limit or cursor is given, so existing callers keep receiving a plain list.
+    """
+    args = request.args
+    conditions, params = [], []
+    
+    for arg, operator in (('date_from', '>='), ('date_to', '<=')):
+        value = args.get(arg)
+        if value:
+            try:
+                params.append(date.fromisoformat(value))
+            except ValueError:
+                raise ValueError(f'{arg} must be a YYYY-MM-DD date')
+            conditions.append(f"{alias}.{date_column} {operator} %s")
+    
+    for arg, column in (('type', type_column), ('payment_method', 'payment_method'),
+                        ('bank_account_id', 'bank_account_id')):
+        value = args.get(arg)
+        if value:
+            conditions.append(f"{alias}.{column} = %s")
+            params.append(value)
+    
+    # The list pages filter as the user types, so these match anywhere in the value
+    for arg, column in (('category', 'category'), ('search', 'unique_id')):
+        value = (args.get(arg) or '').strip()
+        if value:
+            escaped = value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            conditions.append(f"{alias}.{column} LIKE %s")
+            params.append(f"%{escaped}%")
+    
+    limit = None
+    if args.get('limit') or args.get('cursor'):
+        limit = parse_limit(args.get('limit'))
+        if args.get('cursor'):
+            condition, cursor_params = keyset_condition(alias, args['cursor'])
+            conditions.append(condition)
+            params.extend(cursor_params)
+    
+    return conditions, params, limit
+
 def login_required(f):
     """Decorator to require login for routes"""
     @wraps(f)
@@ -538,12 +572,60 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def conditional_collection(*collections, scope='user'):
+    """Answer unchanged list polls with 304 from the owner's collection versions.
+
+    The ETag covers the versions of `collections` (bumped by triggers on every
+    write) and the query string, and is checked before the view runs its query.
+    scope='sub_user' keys the versions by the logged-in sub user.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            owner_id = session.get('sub_user_id' if scope == 'sub_user' else 'user_id')
+            connection = get_db_connection() if owner_id else None
+            if not connection:
+                return f(*args, **kwargs)
+            try:
+                cursor = connection.cursor()
+                versions = collection_versions(cursor, owner_id, collections)
+                cursor.close()
+            except Exception as e:
+                print(f"DEBUG: Could not read collection versions: {e}")
+                return f(*args, **kwargs)
+            finally:
+                connection.close()
+            
+            etag = make_etag(scope, owner_id, versions, request.query_string)
+            if is_not_modified(etag):
+                response = Response(status=304)
+            else:
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag, weak=True)
+            # Browsers may keep the body but must revalidate before reusing it
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return decorated_function
+    return decorator
+
 # Initialize sub_users table
 @app.route('/init-sub-users')
 def init_sub_users_table():
     """Initialize sub_users table"""
     try:
-        success = create_sub_users_table()
+        connection = get_db_connection()
+        if not connection:
+            return jsonify({
+                'status': 'error',
+                'message': 'Database connection failed'
+            }), 500
+        try:
+            migrate_database(connection)
+            success = True
+        finally:
+            connection.close()
         if success:
             return jsonify({
                 'status': 'success',
@@ -654,15 +736,6 @@ def debug_invoices():
         """, (user_id,))
         sample_invoices = cursor.fetchall()
         
-        # Convert dates to strings for JSON serialization
-        for invoice in sample_invoices:
-            if invoice['invoice_date']:
-                invoice['invoice_date'] = invoice['invoice_date'].isoformat()
-            if invoice['due_date']:
-                invoice['due_date'] = invoice['due_date'].isoformat()
-            if invoice['created_at']:
-                invoice['created_at'] = invoice['created_at'].isoformat()
-        
         # Also test the exact query used by the API endpoint
         cursor.execute("""
             SELECT * FROM invoices 
@@ -671,17 +744,6 @@ def debug_invoices():
         """, (user_id,))
         all_invoices = cursor.fetchall()
         
-        # Convert dates for all invoices
-        for invoice in all_invoices:
-            if invoice['invoice_date']:
-                invoice['invoice_date'] = invoice['invoice_date'].isoformat()
-            if invoice['due_date']:
-                invoice['due_date'] = invoice['due_date'].isoformat()
-            if invoice['created_at']:
-                invoice['created_at'] = invoice['created_at'].isoformat()
-            if invoice['updated_at']:
-                invoice['updated_at'] = invoice['updated_at'].isoformat()
-        
         cursor.close()
         connection.close()
         
@@ -729,17 +791,6 @@ def test_api_direct():
         invoices = cursor.fetchall()
         print(f"DIRECT TEST: Found {len(invoices)} invoices")
         
-        # Convert date objects to strings (same as API endpoint)
-        for invoice in invoices:
-            if invoice['invoice_date']:
-                invoice['invoice_date'] = invoice['invoice_date'].isoformat()
-            if invoice['due_date']:
-                invoice['due_date'] = invoice['due_date'].isoformat()
-            if invoice['created_at']:
-                invoice['created_at'] = invoice['created_at'].isoformat()
-            if invoice['updated_at']:
-                invoice['updated_at'] = invoice['updated_at'].isoformat()
-        
         cursor.close()
         connection.close()
         
@@ -763,16 +814,41 @@ def get_current_user():
     if 'user_id' not in session:
         return None
     
-    connection = get_db_connection()
+    connection = get_request_connection()
     if connection:
-        cursor = connection.cursor(dictionary=True)
-        cursor.execute("SELECT id, username, email, first_name, last_name FROM users WHERE id = %s", (session['user_id'],))
-        user = cursor.fetchone()
-        cursor.close()
+        user = cached_profile(connection, session['user_id'])
         connection.close()
         return user
     return None
 
+def cached_profile(connection, user_id):
+    """id, username, email and name of a user, from the reference cache"""
+    def load(cursor):
+        cursor.execute("SELECT id, username, email, first_name, last_name FROM users WHERE id = %s", (user_id,))
+        return cursor.fetchone()
+    return reference_cache.get(connection, user_id, 'profile', load)
+
+def cached_company_settings(connection, user_id):
+    """The user's company_settings row (None if there is none), from the reference cache"""
+    def load(cursor):
+        cursor.execute("SELECT * FROM company_settings WHERE user_id = %s LIMIT 1", (user_id,))
+        return cursor.fetchone()
+    return reference_cache.get(connection, user_id, 'company_settings', load)
+
+def cached_user_settings(connection, user_id):
+    """The user's user_settings row (None if there is none), from the reference cache"""
+    def load(cursor):
+        cursor.execute("SELECT * FROM user_settings WHERE user_id = %s", (user_id,))
+        return cursor.fetchone()
+    return reference_cache.get(connection, user_id, 'user_settings', load)
+
+def cached_bank_accounts(connection, user_id):
+    """The user's bank_accounts rows ordered by bank name, from the reference cache"""
+    def load(cursor):
+        cursor.execute("SELECT * FROM bank_accounts WHERE user_id = %s ORDER BY bank_name", (user_id,))
+        return cursor.fetchall()
+    return reference_cache.get(connection, user_id, 'bank_accounts', load)
+
 def get_india_time():
     """Get current time in India timezone"""
     india_tz = pytz.timezone('Asia/Kolkata')
@@ -820,30 +896,68 @@ def get_current_admin():
         return admin
     return None
 
+# Audit rows are queued here and written in batches by a background thread
+audit_sink = AuditLogSink(
+    get_db_connection,
+    os.environ.get('AUDIT_SPILL_FILE', os.path.join(EXPORT_FOLDER, 'spool', 'audit_spill.jsonl')),
+    batch_size=int(os.environ.get('AUDIT_BATCH_SIZE', 200)),
+    flush_interval=float(os.environ.get('AUDIT_FLUSH_INTERVAL', 1.0))
+)
+request_metrics.add_gauges('laitusneo_audit_sink', audit_sink.stats)
+
 def log_audit_event(user_id=None, admin_id=None, action='', table_name=None, record_id=None, old_values=None, new_values=None):
-    """Log audit events"""
+    """Log audit events (queued; written asynchronously by audit_sink)"""
+    audit_sink.log((
+        user_id, admin_id, action, table_name, record_id,
+        json.dumps(old_values) if old_values else None,
+        json.dumps(new_values) if new_values else None,
+        request.remote_addr,
+        request.headers.get('User-Agent', ''),
+        get_india_time()
+    ))
+    if event_bus.has_subscribers('admin'):
+        event_bus.publish('admin', 'activity', {'action': action, 'table_name': table_name})
+
+def count_pending_approvals(cursor, owner_user_id):
+    """Pending sub-user requests and OUT invoices awaiting the owner's approval"""
+    cursor.execute("""
+        SELECT
+            (SELECT COUNT(*) FROM sub_user_requests WHERE owner_user_id = %s AND status = 'pending') AS pending_requests,
+            (SELECT COUNT(*) FROM invoices
+             WHERE user_id = %s AND created_by_sub_user IS NOT NULL
+               AND invoice_type = 'out' AND status = 'pending') AS pending_invoices
+    """, (owner_user_id, owner_user_id))
+    row = cursor.fetchone()
+    return {'pending_requests': row[0], 'pending_invoices': row[1]}
+
+def publish_pending_count(owner_user_id):
+    """Push the owner's current pending counts to their open pages (after commit)"""
+    channel = f'user:{owner_user_id}'
+    if not owner_user_id or not event_bus.has_subscribers(channel):
+        return
     connection = get_db_connection()
-    if connection:
+    if not connection:
+        return
+    try:
         cursor = connection.cursor()
-        india_time = get_india_time()
-        cursor.execute("""
-            INSERT INTO audit_logs (user_id, admin_id, action, table_name, record_id, old_values, new_values, ip_address, user_agent, created_at)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-        """, (
-            user_id, admin_id, action, table_name, record_id,
-            json.dumps(old_values) if old_values else None,
-            json.dumps(new_values) if new_values else None,
-            request.remote_addr,
-            request.headers.get('User-Agent', ''),
-            india_time
-        ))
-        connection.commit()
+        event_bus.publish(channel, 'pending_count', count_pending_approvals(cursor, owner_user_id))
         cursor.close()
+    except Exception as e:
+        print(f"DEBUG: Could not publish pending count for user {owner_user_id}: {e}")
+    finally:
         connection.close()
 
+def publish_request_update(owner_user_id, sub_user_id, kind, record_id, status):
+    """Tell the sub user and the owner that a request/invoice was approved or rejected"""
+    payload = {'kind': kind, 'id': record_id, 'status': status}
+    if sub_user_id:
+        event_bus.publish(f'sub_user:{sub_user_id}', 'request_status', payload)
+    event_bus.publish(f'user:{owner_user_id}', 'request_status', payload)
+    publish_pending_count(owner_user_id)
+
 def track_user_session(user_id, session_id):
     """Track user session"""
-    connection = get_db_connection()
+    connection = get_request_connection()
     if connection:
         cursor = connection.cursor()
         india_time = get_india_time()
@@ -857,7 +971,7 @@ def track_user_session(user_id, session_id):
 
 def update_user_last_login(user_id):
     """Update user's last login time"""
-    connection = get_db_connection()
+    connection = get_request_connection()
     if connection:
         cursor = connection.cursor()
         india_time = get_india_time()
@@ -868,7 +982,7 @@ def update_user_last_login(user_id):
 
 def update_admin_last_login(admin_id):
     """Update admin's last login time"""
-    connection = get_db_connection()
+    connection = get_request_connection()
     if connection:
         cursor = connection.cursor()
         india_time = get_india_time()
@@ -887,7 +1001,7 @@ def login():
         password = request.form.get('password')
         remember = request.form.get('remember')
         
-        connection = get_db_connection()
+        connection = get_request_connection()
         if connection:
             cursor = connection.cursor(dictionary=True)
             cursor.execute("SELECT * FROM users WHERE email = %s", (email,))
@@ -1087,43 +1201,88 @@ def banking():
 # ==================== DEBT MANAGEMENT API ENDPOINTS ====================
 
 # Customer Management
+def customer_search_condition(search):
+    """WHERE fragment and params for the customer search box, backed by indexes.
+    
+    Phone numbers and customer codes are matched by prefix on (user_id, phone)
+    and (user_id, customer_code); names and emails go through the
+    ft_customers_name_email full-text index with prefix terms.
+    """
+    search = search.strip()
+    if re.fullmatch(r'[\d+\-\s]+', search):
+        return "c.phone LIKE %s", [search.replace(' ', '') + '%']
+    if re.fullmatch(r'CUST\d*', search, re.IGNORECASE):
+        return "c.customer_code LIKE %s", [search.upper() + '%']
+    
+    # Boolean-mode operators in user input would change the query's meaning
+    words = [w for w in re.split(r'[^\w]+', search) if len(w) >= 3]
+    if not words:
+        escaped = search.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        return "c.name LIKE %s", [escaped + '%']
+    return "MATCH(c.name, c.email) AGAINST (%s IN BOOLEAN MODE)", [' '.join(f'+{w}*' for w in words)]
+
 @app.route('/api/banking/customers', methods=['GET'])
 @login_required
 def get_customers():
-    """Get all customers for the current user"""
+    """Get customers for the current user with their outstanding debt balance.
+    
+    Optional query args: search, limit and cursor (keyset pagination on
+    created_at, id). Without limit/cursor the full list is returned as before.
+    """
+    try:
+        search = request.args.get('search', '')
+        limit = parse_limit(request.args.get('limit'), default=None)
+        cursor_arg = request.args.get('cursor')
+        if cursor_arg and limit is None:
+            limit = DEFAULT_PAGE_SIZE
+        
+        conditions = ["c.user_id = %s"]
+        params = [session['user_id']]
+        if search.strip():
+            condition, search_params = customer_search_condition(search)
+            conditions.append(condition)
+            params.extend(search_params)
+        if cursor_arg:
+            condition, cursor_params = keyset_condition('c', cursor_arg)
+            conditions.append(condition)
+            params.extend(cursor_params)
+        
+        # Outstanding balances come from one grouped pass over the user's open
+        # debts instead of a SUM query per customer
+        query = f"""
+            SELECT c.*, COALESCE(d.total_outstanding, 0) AS outstanding_balance
+            FROM customers c
+            LEFT JOIN (
+                SELECT customer_id, SUM(balance) AS total_outstanding
+                FROM debts
+                WHERE user_id = %s AND status IN ('active', 'overdue')
+                GROUP BY customer_id
+            ) d ON d.customer_id = c.id
+            WHERE {' AND '.join(conditions)}
+            ORDER BY c.created_at DESC, c.id DESC
+        """
+        params.insert(0, session['user_id'])
+        if limit is not None:
+            query += " LIMIT %s"
+            params.append(limit + 1)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
     try:
         connection = get_db_connection()
         if not connection:
             return jsonify({'error': 'Database connection failed'}), 500
         
         cursor = connection.cursor(dictionary=True)
-        search = request.args.get('search', '')
-        
-        query = "SELECT * FROM customers WHERE user_id = %s"
-        params = [session['user_id']]
-        
-        if search:
-            query += " AND (name LIKE %s OR phone LIKE %s OR email LIKE %s OR customer_code LIKE %s)"
-            search_param = f"%{search}%"
-            params.extend([search_param, search_param, search_param, search_param])
-        
-        query += " ORDER BY created_at DESC"
         cursor.execute(query, params)
         customers = cursor.fetchall()
-        
-        # Calculate outstanding balance for each customer
-        for customer in customers:
-            cursor.execute("""
-                SELECT COALESCE(SUM(balance), 0) as total_outstanding
-                FROM debts 
-                WHERE customer_id = %s AND user_id = %s AND status IN ('active', 'overdue')
-            """, (customer['id'], session['user_id']))
-            result = cursor.fetchone()
-            customer['outstanding_balance'] = float(result['total_outstanding']) if result else 0.0
-        
         cursor.close()
         connection.close()
-        return jsonify(customers)
+        
+        if limit is None:
+            return jsonify(customers)
+        customers, next_cursor = split_page(customers, limit)
+        return jsonify({'items': customers, 'next_cursor': next_cursor, 'limit': limit})
     except Exception as e:
         import traceback
         traceback.print_exc()
@@ -1368,6 +1527,7 @@ def generate_customers_pdf(customers):
 # Debt Management
 @app.route('/api/banking/debts', methods=['GET'])
 @login_required
+@conditional_collection('debts', 'customers')
 def get_debts():
     """Get all debts with filters"""
     try:
@@ -1386,7 +1546,8 @@ def get_debts():
         amount = request.args.get('amount', '').strip()
         
         query = """
-            SELECT d.*, c.name as customer_name, c.phone as customer_phone, c.email as customer_email
+            SELECT d.*, COALESCE(d.interest_rate, 0) as interest_rate, COALESCE(d.emi_amount, 0) as emi_amount,
+                   c.name as customer_name, c.phone as customer_phone, c.email as customer_email
             FROM debts d
             LEFT JOIN customers c ON d.customer_id = c.id
             WHERE d.user_id = %s
@@ -1429,18 +1590,6 @@ def get_debts():
         cursor.execute(query, params)
         debts = cursor.fetchall()
         
-        # Convert decimal to float for JSON serialization
-        for debt in debts:
-            debt['total_amount'] = float(debt['total_amount'])
-            debt['paid_amount'] = float(debt['paid_amount'])
-            debt['balance'] = float(debt['balance'])
-            debt['interest_rate'] = float(debt['interest_rate']) if debt['interest_rate'] else 0.0
-            debt['emi_amount'] = float(debt['emi_amount']) if debt['emi_amount'] else 0.0
-            if debt['due_date']:
-                debt['due_date'] = debt['due_date'].isoformat()
-            if debt['start_date']:
-                debt['start_date'] = debt['start_date'].isoformat()
-        
         cursor.close()
         connection.close()
         return jsonify(debts)
@@ -1470,9 +1619,7 @@ def create_debt():
         # Generate debt code if not provided
         debt_code = data.get('debt_code')
         if not debt_code:
-            cursor.execute("SELECT COUNT(*) as count FROM debts WHERE user_id = %s", (session['user_id'],))
-            count = cursor.fetchone()[0]
-            debt_code = f"DEBT{str(count + 1).zfill(4)}"
+            debt_code = next_document_number(cursor, session['user_id'], 'DEBT')
         
         # Calculate EMI amount if enabled
         emi_amount = 0.0
@@ -1582,7 +1729,7 @@ def get_emis(debt_id):
         
         cursor = connection.cursor(dictionary=True)
         cursor.execute("""
-            SELECT e.*, 
+            SELECT e.*, COALESCE(e.late_fee, 0) as late_fee,
                    (SELECT receipt_number FROM debt_payments 
                     WHERE emi_id = e.id AND user_id = %s 
                     ORDER BY payment_date DESC, created_at DESC LIMIT 1) as receipt_number,
@@ -1596,15 +1743,6 @@ def get_emis(debt_id):
         
         emis = cursor.fetchall()
         
-        for emi in emis:
-            emi['amount'] = float(emi['amount'])
-            emi['paid_amount'] = float(emi['paid_amount'])
-            emi['late_fee'] = float(emi['late_fee']) if emi['late_fee'] else 0.0
-            if emi['due_date']:
-                emi['due_date'] = emi['due_date'].isoformat()
-            if emi['paid_date']:
-                emi['paid_date'] = emi['paid_date'].isoformat()
-        
         cursor.close()
         connection.close()
         return jsonify(emis)
@@ -1634,9 +1772,7 @@ def create_payment():
         # Generate receipt number if not provided
         receipt_number = data.get('receipt_number')
         if not receipt_number:
-            cursor.execute("SELECT COUNT(*) as count FROM debt_payments WHERE user_id = %s", (session['user_id'],))
-            count = cursor.fetchone()[0]
-            receipt_number = f"RCP{str(count + 1).zfill(6)}"
+            receipt_number = next_document_number(cursor, session['user_id'], 'RCP')
         
         cursor.execute("""
             INSERT INTO debt_payments (debt_id, customer_id, user_id, emi_id, amount, payment_method, payment_date,
@@ -1727,21 +1863,15 @@ def create_payment():
                         emi_id,
                         bank_account_id
                     ))
+                    transaction_id = cursor.lastrowid
                     
-                    # Update bank balance if bank account is specified
+                    # Update bank balance if bank account is specified, else cash balance
                     if bank_account_id:
-                        cursor.execute("""
-                            UPDATE bank_accounts 
-                            SET current_balance = current_balance + %s 
-                            WHERE id = %s AND user_id = %s
-                        """, (amount, bank_account_id, session['user_id']))
+                        post_movement(cursor, session['user_id'], 'bank', bank_account_id, 'credit', amount,
+                                      'income', 'transaction', transaction_id)
                     else:
-                        # Update cash balance if no bank account
-                        cursor.execute("""
-                            UPDATE users 
-                            SET cash_balance = cash_balance + %s 
-                            WHERE id = %s
-                        """, (amount, session['user_id']))
+                        post_movement(cursor, session['user_id'], 'cash', session['user_id'], 'credit', amount,
+                                      'income', 'transaction', transaction_id)
             except Exception as e:
                 # Log error but don't fail the payment
                 import traceback
@@ -1793,11 +1923,6 @@ def get_payments():
         cursor.execute(query, params)
         payments = cursor.fetchall()
         
-        for payment in payments:
-            payment['amount'] = float(payment['amount'])
-            if payment['payment_date']:
-                payment['payment_date'] = payment['payment_date'].isoformat()
-        
         cursor.close()
         connection.close()
         return jsonify(payments)
@@ -1829,12 +1954,6 @@ def get_reminders():
         
         reminders = cursor.fetchall()
         
-        for reminder in reminders:
-            if reminder['scheduled_date']:
-                reminder['scheduled_date'] = reminder['scheduled_date'].isoformat()
-            if reminder['sent_date']:
-                reminder['sent_date'] = reminder['sent_date'].isoformat()
-        
         cursor.close()
         connection.close()
         return jsonify(reminders)
@@ -1935,8 +2054,6 @@ def get_banking_dashboard():
             ORDER BY month ASC
         """, (user_id,))
         monthly_trend = cursor.fetchall()
-        for item in monthly_trend:
-            item['collected'] = float(item['collected'])
         
         cursor.close()
         connection.close()
@@ -1979,12 +2096,6 @@ def get_upcoming_payments():
         
         payments = cursor.fetchall()
         
-        for payment in payments:
-            payment['amount'] = float(payment['amount'])
-            payment['paid_amount'] = float(payment['paid_amount'])
-            if payment['due_date']:
-                payment['due_date'] = payment['due_date'].isoformat()
-        
         cursor.close()
         connection.close()
         return jsonify(payments)
@@ -2058,15 +2169,6 @@ class ExpenseList(Resource):
         """, (session['user_id'],))
         expenses = cursor.fetchall()
         
-        # Convert date objects to strings
-        for expense in expenses:
-            if expense['expense_date']:
-                expense['expense_date'] = expense['expense_date'].isoformat()
-            if expense['created_at']:
-                expense['created_at'] = expense['created_at'].isoformat()
-            if expense['updated_at']:
-                expense['updated_at'] = expense['updated_at'].isoformat()
-        
         cursor.close()
         connection.close()
         return expenses, 200
@@ -2089,33 +2191,36 @@ class ExpenseList(Resource):
 # Keep the original route for backward compatibility
 @app.route('/api/expenses', methods=['GET'])
 @login_required
+@conditional_collection('expenses', 'sub_users')
 def get_expenses():
+    try:
+        conditions, params, limit = build_list_query('e', 'expense_date', 'expense_type')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
     connection = get_db_connection()
     if not connection:
         return jsonify({'error': 'Database connection failed'}), 500
     
     cursor = connection.cursor(dictionary=True)
-    cursor.execute("""
+    cursor.execute(f"""
         SELECT e.*, 
                su.sub_user_id, CONCAT(su.first_name, ' ', su.last_name) as sub_user_name
         FROM expenses e
         LEFT JOIN sub_users su ON e.created_by_sub_user = su.id
-        WHERE e.user_id = %s
-        ORDER BY e.created_at DESC
-    """, (session['user_id'],))
+        WHERE e.user_id = %s {''.join(' AND ' + c for c in conditions)}
+        ORDER BY e.created_at DESC, e.id DESC
+        {'LIMIT %s' if limit else ''}
+    """, [session['user_id']] + params + ([limit + 1] if limit else []))
     expenses = cursor.fetchall()
-    
-    # Convert date objects to strings
-    for expense in expenses:
-        if expense['expense_date']:
-            expense['expense_date'] = expense['expense_date'].isoformat()
-        if expense['created_at']:
-            expense['created_at'] = expense['created_at'].isoformat()
-        if expense['updated_at']:
-            expense['updated_at'] = expense['updated_at'].isoformat()
+    next_cursor = None
+    if limit:
+        expenses, next_cursor = split_page(expenses, limit)
     
     cursor.close()
     connection.close()
+    if limit:
+        return jsonify({'items': expenses, 'next_cursor': next_cursor, 'limit': limit})
     return jsonify(expenses)
 
 @app.route('/api/expenses', methods=['POST'])
@@ -2141,65 +2246,8 @@ def add_expense():
         
         cursor = connection.cursor()
         
-        # Ensure required columns exist in expenses table
-        try:
-            cursor.execute("ALTER TABLE expenses ADD COLUMN IF NOT EXISTS payment_type ENUM('invoice', 'cash') DEFAULT 'cash'")
-            cursor.execute("ALTER TABLE expenses ADD COLUMN IF NOT EXISTS payment_method ENUM('cash', 'online') DEFAULT 'cash'")
-            cursor.execute("ALTER TABLE expenses ADD COLUMN IF NOT EXISTS bank_account_id INT NULL")
-            cursor.execute("ALTER TABLE expenses ADD COLUMN IF NOT EXISTS unique_id VARCHAR(50)")
-            cursor.execute("ALTER TABLE expenses ADD COLUMN IF NOT EXISTS purpose VARCHAR(255)")
-            connection.commit()
-        except Exception as e:
-            print(f"Warning: Could not add columns to expenses table: {e}")
-            # Continue with existing structure
-        
         purpose_value = data.get('purpose', data.get('title', ''))
         
-        # Check the foreign key constraints on expenses table
-        try:
-            cursor.execute("""
-                SELECT 
-                    CONSTRAINT_NAME,
-                    COLUMN_NAME,
-                    REFERENCED_TABLE_NAME,
-                    REFERENCED_COLUMN_NAME
-                FROM information_schema.KEY_COLUMN_USAGE 
-                WHERE TABLE_SCHEMA = 'expense_tracker' 
-                AND TABLE_NAME = 'expenses' 
-                AND REFERENCED_TABLE_NAME IS NOT NULL
-            """)
-            foreign_keys = cursor.fetchall()
-            print(f"DEBUG: Foreign key constraints on expenses table: {foreign_keys}")
-            
-            # If there's a foreign key constraint pointing to user_banks, try to fix it
-            for fk in foreign_keys:
-                if fk[2] == 'user_banks' and fk[1] == 'bank_account_id':
-                    print(f"DEBUG: Found problematic foreign key: {fk}")
-                    try:
-                        # Drop the problematic foreign key
-                        cursor.execute(f"ALTER TABLE expenses DROP FOREIGN KEY {fk[0]}")
-                        print(f"DEBUG: Dropped foreign key constraint: {fk[0]}")
-                        
-                        # Add new foreign key constraint pointing to bank_accounts
-                        cursor.execute("""
-                            ALTER TABLE expenses 
-                            ADD CONSTRAINT fk_expenses_bank_accounts 
-                            FOREIGN KEY (bank_account_id) REFERENCES bank_accounts(id) ON DELETE SET NULL
-                        """)
-                        print("DEBUG: Added new foreign key constraint to bank_accounts")
-                        connection.commit()
-                    except Exception as fk_error:
-                        print(f"Warning: Could not fix foreign key constraint: {fk_error}")
-        except Exception as e:
-            print(f"Warning: Could not check foreign keys: {e}")
-        
-        # Try to update expense_type enum if it exists
-        try:
-            cursor.execute("ALTER TABLE expenses MODIFY COLUMN expense_type ENUM('completed', 'upcoming') NOT NULL DEFAULT 'completed'")
-        except:
-            # If expense_type column doesn't exist, create it
-            cursor.execute("ALTER TABLE expenses ADD COLUMN IF NOT EXISTS expense_type ENUM('completed', 'upcoming') NOT NULL DEFAULT 'completed'")
-        
         # Validate required fields
         if not data.get('amount') or data.get('amount').strip() == '':
             return jsonify({'error': 'Amount is required and cannot be empty'}), 400
@@ -2224,8 +2272,7 @@ def add_expense():
         print(f"DEBUG: Bank account ID: {bank_account_id}")
         
         # Check which columns exist and build dynamic query
-        cursor.execute("DESCRIBE expenses")
-        columns = [row[0] for row in cursor.fetchall()]
+        columns = get_table_columns(connection, 'expenses')
         
         if 'payment_type' in columns and 'unique_id' in columns and 'purpose' in columns:
             # Full structure available
@@ -2269,20 +2316,8 @@ def add_expense():
         # Ensure the expense is committed before creating invoice
         connection.commit()
         
-        # Ensure required columns exist in transactions table
-        try:
-            cursor.execute("ALTER TABLE transactions ADD COLUMN IF NOT EXISTS unique_id VARCHAR(50)")
-            cursor.execute("ALTER TABLE transactions ADD COLUMN IF NOT EXISTS payment_method ENUM('cash', 'online') DEFAULT 'cash'")
-            cursor.execute("ALTER TABLE transactions ADD COLUMN IF NOT EXISTS source VARCHAR(50)")
-            cursor.execute("ALTER TABLE transactions ADD COLUMN IF NOT EXISTS source_id INT")
-            connection.commit()
-        except Exception as e:
-            print(f"Warning: Could not add columns to transactions table: {e}")
-            # Continue with existing structure
-        
         # Check which columns exist in transactions table and build dynamic query
-        cursor.execute("DESCRIBE transactions")
-        trans_columns = [row[0] for row in cursor.fetchall()]
+        trans_columns = get_table_columns(connection, 'transactions')
         
         # Only create transaction if it's NOT an invoice type expense
         # Invoice type expenses will be handled by the invoice transaction creation
@@ -2398,17 +2433,11 @@ def add_expense():
                 
                 # Update balances based on payment method
                 if payment_method == 'online' and bank_account_id:
-                    cursor.execute("""
-                        UPDATE bank_accounts 
-                        SET current_balance = current_balance - %s 
-                        WHERE id = %s AND user_id = %s
-                    """, (float(data['amount']), bank_account_id, session['user_id']))
+                    post_movement(cursor, session['user_id'], 'bank', bank_account_id, 'debit', data['amount'],
+                                  'expense', 'expense', expense_id)
                 elif payment_method == 'cash':
-                    cursor.execute("""
-                        UPDATE users 
-                        SET cash_balance = cash_balance - %s 
-                        WHERE id = %s
-                    """, (float(data['amount']), session['user_id']))
+                    post_movement(cursor, session['user_id'], 'cash', session['user_id'], 'debit', data['amount'],
+                                  'expense', 'expense', expense_id)
                 
                 connection.commit()
                 print(f"Created invoice {invoice_id} and transaction for expense {expense_id}")
@@ -2422,17 +2451,11 @@ def add_expense():
         else:
             # For non-invoice expenses, update balances directly
             if payment_method == 'online' and bank_account_id:
-                cursor.execute("""
-                    UPDATE bank_accounts 
-                    SET current_balance = current_balance - %s 
-                    WHERE id = %s AND user_id = %s
-                """, (float(data['amount']), bank_account_id, session['user_id']))
+                post_movement(cursor, session['user_id'], 'bank', bank_account_id, 'debit', data['amount'],
+                              'expense', 'expense', expense_id)
             elif payment_method == 'cash':
-                cursor.execute("""
-                    UPDATE users 
-                    SET cash_balance = cash_balance - %s 
-                    WHERE id = %s
-                """, (float(data['amount']), session['user_id']))
+                post_movement(cursor, session['user_id'], 'cash', session['user_id'], 'debit', data['amount'],
+                              'expense', 'expense', expense_id)
             
             connection.commit()
         
@@ -2460,27 +2483,8 @@ def update_expense(expense_id):
         
         cursor = connection.cursor()
         
-        # Ensure required columns exist in expenses table
-        try:
-            cursor.execute("ALTER TABLE expenses ADD COLUMN IF NOT EXISTS payment_type ENUM('invoice', 'cash') DEFAULT 'cash'")
-            cursor.execute("ALTER TABLE expenses ADD COLUMN IF NOT EXISTS payment_method ENUM('cash', 'online') DEFAULT 'cash'")
-            cursor.execute("ALTER TABLE expenses ADD COLUMN IF NOT EXISTS bank_account_id INT NULL")
-            cursor.execute("ALTER TABLE expenses ADD COLUMN IF NOT EXISTS unique_id VARCHAR(50)")
-            cursor.execute("ALTER TABLE expenses ADD COLUMN IF NOT EXISTS purpose VARCHAR(255)")
-            connection.commit()
-        except Exception as e:
-            print(f"Warning: Could not add columns to expenses table: {e}")
-            # Continue with existing structure
-        
         purpose_value = data.get('purpose', data.get('title', ''))
         
-        # Try to update expense_type enum if it exists
-        try:
-            cursor.execute("ALTER TABLE expenses MODIFY COLUMN expense_type ENUM('completed', 'upcoming') NOT NULL DEFAULT 'completed'")
-        except:
-            # If expense_type column doesn't exist, create it
-            cursor.execute("ALTER TABLE expenses ADD COLUMN IF NOT EXISTS expense_type ENUM('completed', 'upcoming') NOT NULL DEFAULT 'completed'")
-        
         # Handle bank_account_id based on payment method
         payment_method = data.get('payment_method', 'cash')
         bank_account_id = None
@@ -2491,8 +2495,7 @@ def update_expense(expense_id):
         print(f"DEBUG UPDATE: Bank account ID: {bank_account_id}")
         
         # Check which columns exist and build dynamic query
-        cursor.execute("DESCRIBE expenses")
-        columns = [row[0] for row in cursor.fetchall()]
+        columns = get_table_columns(connection, 'expenses')
         
         if 'payment_type' in columns and 'unique_id' in columns and 'purpose' in columns:
             # Full structure available
@@ -2579,21 +2582,17 @@ def delete_expense(expense_id):
         # For regular expenses: balance was deducted when created, so we add it back
         print(f"DEBUG: Reversing balance for expense {expense_id}, amount: {expense['amount']}, payment_method: {expense['payment_method']}, created_by_sub_user: {expense.get('created_by_sub_user')}")
         
+        source_type, source_id = posted_source(cursor, [('expense', expense_id)]
+                                               + sub_user_request_sources(cursor, session['user_id'], expense))
         if expense['payment_method'] == 'online' and expense['bank_account_id']:
             # For online payments, add back to bank account balance
-            cursor.execute("""
-                UPDATE bank_accounts 
-                SET current_balance = current_balance + %s 
-                WHERE id = %s AND user_id = %s
-            """, (float(expense['amount']), expense['bank_account_id'], session['user_id']))
+            post_movement(cursor, session['user_id'], 'bank', expense['bank_account_id'], 'credit', expense['amount'],
+                          'expense', source_type, source_id)
             print(f"DEBUG: Added {expense['amount']} back to bank account {expense['bank_account_id']}")
         elif expense['payment_method'] == 'cash':
             # For cash payments, add back to cash balance
-            cursor.execute("""
-                UPDATE users 
-                SET cash_balance = cash_balance + %s 
-                WHERE id = %s
-            """, (float(expense['amount']), session['user_id']))
+            post_movement(cursor, session['user_id'], 'cash', session['user_id'], 'credit', expense['amount'],
+                          'expense', source_type, source_id)
             print(f"DEBUG: Added {expense['amount']} back to cash balance for user {session['user_id']}")
         else:
             print(f"DEBUG: Warning - Unknown payment method: {expense['payment_method']} or missing bank_account_id")
@@ -3166,7 +3165,7 @@ def bulk_delete_transactions():
         if not transaction_ids:
             return jsonify({'success': False, 'message': 'No transaction IDs provided'}), 400
         
-        connection = get_db_connection()
+        connection = get_request_connection()
         if not connection:
             return jsonify({'success': False, 'message': 'Database connection failed'}), 500
         
@@ -3176,7 +3175,8 @@ def bulk_delete_transactions():
         # Get all transactions to be deleted
         placeholders = ','.join(['%s'] * len(transaction_ids))
         cursor.execute(f"""
-            SELECT id, receipt_file, amount, transaction_type, payment_method, bank_account_id, description
+            SELECT id, receipt_file, amount, transaction_type, payment_method, bank_account_id, description,
+                   source, source_id, invoice_id, unique_id, created_by_sub_user
             FROM transactions 
             WHERE id IN ({placeholders}) AND user_id = %s
         """, transaction_ids + [user_id])
@@ -3188,80 +3188,35 @@ def bulk_delete_transactions():
             connection.close()
             return jsonify({'success': False, 'message': 'No transactions found or access denied'}), 404
         
-        total_adjustment = 0
+        # Reversals grouped per bank account and for cash, each account updated once:
+        # reversing a credit takes the amount back out, reversing a debit puts it back
+        bank_movements = defaultdict(list)
+        cash_movements = []
+        # Ledger sources of every selected row, resolved in two queries rather than per row
+        sources = transaction_ledger_sources(cursor, user_id, transactions)
+        for transaction in transactions:
+            amount = transaction['amount'] or Decimal(0)
+            if amount <= 0:
+                continue
+            reversal = ('debit' if transaction['transaction_type'] == 'credit' else 'credit', amount,
+                        ledger_contra(transaction['transaction_type'])) + sources[transaction['id']]
+            if transaction['payment_method'] == 'online' and transaction['bank_account_id']:
+                bank_movements[transaction['bank_account_id']].append(reversal)
+            elif transaction['payment_method'] == 'cash':
+                cash_movements.append(reversal)
+        
+        total_adjustment = Decimal(0)
         adjustments_made = 0
         
-        # Process each transaction for financial adjustments
-        for transaction in transactions:
-            amount = float(transaction['amount']) if transaction['amount'] else 0
-            payment_method = transaction['payment_method']
-            transaction_type = transaction['transaction_type']
-            
-            print(f"DEBUG: Bulk delete - processing transaction {transaction['id']}, amount: {amount}, type: {transaction_type}, payment_method: {payment_method}")
-            
-            if amount > 0:
-                # Delete associated file if it exists
-                if transaction['receipt_file']:
-                    file_path = os.path.join(app.config['UPLOAD_FOLDER'], transaction['receipt_file'])
-                    if os.path.exists(file_path):
-                        try:
-                            os.remove(file_path)
-                        except OSError:
-                            pass  # Continue even if file deletion fails
-                
-                # Reverse bank balance if payment method was online
-                if payment_method == 'online' and transaction['bank_account_id']:
-                    try:
-                        if transaction_type == 'credit':
-                            # Reverse credit: deduct the amount from bank account
-                            cursor.execute("""
-                                UPDATE bank_accounts 
-                                SET current_balance = current_balance - %s 
-                                WHERE id = %s AND user_id = %s
-                            """, (amount, transaction['bank_account_id'], user_id))
-                            print(f"DEBUG: Reversed credit transaction: Deducted ₹{amount} from bank account {transaction['bank_account_id']}")
-                        else:
-                            # Reverse debit: add the amount back to bank account
-                            cursor.execute("""
-                                UPDATE bank_accounts 
-                                SET current_balance = current_balance + %s 
-                                WHERE id = %s AND user_id = %s
-                            """, (amount, transaction['bank_account_id'], user_id))
-                            print(f"DEBUG: Reversed debit transaction: Added ₹{amount} back to bank account {transaction['bank_account_id']}")
-                        
-                        if cursor.rowcount > 0:
-                            total_adjustment += amount
-                            adjustments_made += 1
-                            
-                    except Exception as bank_error:
-                        print(f"Error reversing bank balance for transaction {transaction['id']}: {bank_error}")
-                
-                # Reverse cash balance if payment method was cash
-                elif payment_method == 'cash':
-                    try:
-                        if transaction_type == 'credit':
-                            # Reverse credit: deduct the amount from cash balance
-                            cursor.execute("""
-                                UPDATE users 
-                                SET cash_balance = cash_balance - %s 
-                                WHERE id = %s
-                            """, (amount, user_id))
-                            print(f"DEBUG: Bulk delete - Reversed credit transaction: Deducted ₹{amount} from cash balance for user {user_id}")
-                        else:
-                            # Reverse debit: add the amount back to cash balance
-                            cursor.execute("""
-                                UPDATE users 
-                                SET cash_balance = cash_balance + %s 
-                                WHERE id = %s
-                            """, (amount, user_id))
-                            print(f"DEBUG: Bulk delete - Reversed debit transaction: Added ₹{amount} back to cash balance for user {user_id}")
-                        
-                        if cursor.rowcount > 0:
-                            total_adjustment += amount
-                            adjustments_made += 1
-                            
-                    except Exception as cash_error:
-                        print(f"Error reversing cash balance for transaction {transaction['id']}: {cash_error}")
+        # Only the user's own accounts are adjusted (and locked until commit)
+        for account_type, account_id, movements in (
+                [('bank', account_id, movements) for account_id, movements in bank_movements.items()]
+                + ([('cash', user_id, cash_movements)] if cash_movements else [])):
+            if post_movements(cursor, user_id, account_type, account_id, movements):
+                gross = sum((movement[1] for movement in movements), Decimal(0))
+                adjustments_made += len(movements)
+                total_adjustment += gross
+                print(f"DEBUG: Bulk delete - reversed ₹{gross} on {account_type} account {account_id} ({len(movements)} transactions)")
         
         # Delete all transactions
         cursor.execute(f"""
@@ -3275,6 +3230,12 @@ def bulk_delete_transactions():
         cursor.close()
         connection.close()
         
+        # Receipts are removed only once the rows are gone for good
+        receipt_files = [transaction['receipt_file'] for transaction in transactions]
+        after_request_commit(lambda: file_cleanup_queue.schedule(receipt_files))
+        
+        total_adjustment = float(total_adjustment)
+        
         message = f"Successfully deleted {deleted_count} transaction(s)"
         if adjustments_made > 0:
             message += f" and adjusted balances by ₹{total_adjustment:.2f} across {adjustments_made} transactions"
@@ -3424,13 +3385,19 @@ def generate_transactions_pdf(transactions):
 # API Routes for Transactions
 @app.route('/api/transactions', methods=['GET'])
 @login_required
+@conditional_collection('transactions', 'invoices', 'sub_users')
 def get_transactions():
+    try:
+        conditions, params, limit = build_list_query('t', 'transaction_date', 'transaction_type')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
     connection = get_db_connection()
     if not connection:
         return jsonify({'error': 'Database connection failed'}), 500
     
     cursor = connection.cursor(dictionary=True)
-    cursor.execute("""
+    cursor.execute(f"""
         SELECT t.*, 
                i.invoice_number, i.client_name as invoice_client_name, i.invoice_type,
                i.invoice_date, i.due_date, i.status as invoice_status,
@@ -3438,26 +3405,19 @@ def get_transactions():
         FROM transactions t
         LEFT JOIN invoices i ON t.source_id = i.id AND t.source = 'invoice'
         LEFT JOIN sub_users su ON t.created_by_sub_user = su.id
-        WHERE t.user_id = %s
-        ORDER BY t.created_at DESC
-    """, (session['user_id'],))
+        WHERE t.user_id = %s {''.join(' AND ' + c for c in conditions)}
+        ORDER BY t.created_at DESC, t.id DESC
+        {'LIMIT %s' if limit else ''}
+    """, [session['user_id']] + params + ([limit + 1] if limit else []))
     transactions = cursor.fetchall()
-    
-    # Convert date objects to strings
-    for transaction in transactions:
-        if transaction['transaction_date']:
-            transaction['transaction_date'] = transaction['transaction_date'].isoformat()
-        if transaction['created_at']:
-            transaction['created_at'] = transaction['created_at'].isoformat()
-        if transaction['updated_at']:
-            transaction['updated_at'] = transaction['updated_at'].isoformat()
-        if transaction.get('invoice_date'):
-            transaction['invoice_date'] = transaction['invoice_date'].isoformat()
-        if transaction.get('due_date'):
-            transaction['due_date'] = transaction['due_date'].isoformat()
+    next_cursor = None
+    if limit:
+        transactions, next_cursor = split_page(transactions, limit)
     
     cursor.close()
     connection.close()
+    if limit:
+        return jsonify({'items': transactions, 'next_cursor': next_cursor, 'limit': limit})
     return jsonify(transactions)
 
 @app.route('/api/transactions', methods=['POST'])
@@ -3476,7 +3436,8 @@ def add_transaction():
             filename = str(uuid.uuid4()) + '_' + secure_filename(file.filename)
             file.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
         
-        connection = get_db_connection()
+        # The row and its balance movement commit together with the request
+        connection = get_request_connection()
         if not connection:
             return jsonify({'error': 'Database connection failed'}), 500
         
@@ -3513,53 +3474,23 @@ def add_transaction():
         amount = float(data['amount'])
         
         if bank_account_id and payment_method == 'online':
-            try:
-                if transaction_type == 'credit':
-                    # Credit: Add money to bank account
-                    cursor.execute("""
-                        UPDATE bank_accounts 
-                        SET current_balance = current_balance + %s 
-                        WHERE id = %s AND user_id = %s
-                    """, (amount, bank_account_id, session['user_id']))
-                    print(f"DEBUG: Added ₹{amount} to bank account {bank_account_id} for user {session['user_id']}")
-                else:
-                    # Debit: Deduct money from bank account
-                    cursor.execute("""
-                        UPDATE bank_accounts 
-                        SET current_balance = current_balance - %s 
-                        WHERE id = %s AND user_id = %s
-                    """, (amount, bank_account_id, session['user_id']))
-                    print(f"DEBUG: Deducted ₹{amount} from bank account {bank_account_id} for user {session['user_id']}")
-                
-                if cursor.rowcount == 0:
-                    print(f"Warning: Could not update bank account {bank_account_id} balance")
-            except Exception as bank_error:
-                print(f"Error updating bank balance: {bank_error}")
+            # Credit adds money to the bank account, debit deducts it
+            if not post_movement(cursor, session['user_id'], 'bank', bank_account_id, transaction_type, amount,
+                                 ledger_contra(transaction_type), 'transaction', transaction_id):
+                print(f"Warning: Could not update bank account {bank_account_id} balance")
+                cursor.close()
+                return jsonify({'error': 'Bank account not found'}), 400
+            print(f"DEBUG: {'Added' if transaction_type == 'credit' else 'Deducted'} ₹{amount} for bank account {bank_account_id} for user {session['user_id']}")
         
         # Update cash balance if payment method is cash
         if payment_method == 'cash':
-            try:
-                if transaction_type == 'credit':
-                    # Credit: Add money to cash balance
-                    cursor.execute("""
-                        UPDATE users 
-                        SET cash_balance = cash_balance + %s 
-                        WHERE id = %s
-                    """, (amount, session['user_id']))
-                    print(f"DEBUG: Added ₹{amount} to cash balance for user {session['user_id']}")
-                else:
-                    # Debit: Deduct money from cash balance
-                    cursor.execute("""
-                        UPDATE users 
-                        SET cash_balance = cash_balance - %s 
-                        WHERE id = %s
-                    """, (amount, session['user_id']))
-                    print(f"DEBUG: Deducted ₹{amount} from cash balance for user {session['user_id']}")
-                
-                if cursor.rowcount == 0:
-                    print(f"Warning: Could not update cash balance for user {session['user_id']}")
-            except Exception as cash_error:
-                print(f"Error updating cash balance: {cash_error}")
+            # Credit adds money to the cash balance, debit deducts it
+            if not post_movement(cursor, session['user_id'], 'cash', session['user_id'], transaction_type, amount,
+                                 ledger_contra(transaction_type), 'transaction', transaction_id):
+                print(f"Warning: Could not update cash balance for user {session['user_id']}")
+                cursor.close()
+                return jsonify({'error': 'Could not update cash balance'}), 400
+            print(f"DEBUG: {'Added' if transaction_type == 'credit' else 'Deducted'} ₹{amount} for cash balance of user {session['user_id']}")
         
         connection.commit()
         cursor.close()
@@ -3580,7 +3511,7 @@ def update_transaction(transaction_id):
     try:
         data = request.get_json()
         
-        connection = get_db_connection()
+        connection = get_request_connection()
         if not connection:
             return jsonify({'error': 'Database connection failed'}), 500
         
@@ -3619,7 +3550,8 @@ def update_transaction(transaction_id):
 @login_required
 def delete_transaction(transaction_id):
     try:
-        connection = get_db_connection()
+        # The delete and both balance reversals commit together with the request
+        connection = get_request_connection()
         if not connection:
             return jsonify({'error': 'Database connection failed'}), 500
         
@@ -3627,7 +3559,8 @@ def delete_transaction(transaction_id):
         
         # First, get the transaction details for balance reversal
         cursor.execute("""
-            SELECT receipt_file, amount, transaction_type, payment_method, bank_account_id, description, created_by_sub_user
+            SELECT id, receipt_file, amount, transaction_type, payment_method, bank_account_id, description,
+                   created_by_sub_user, source, source_id, invoice_id, unique_id
             FROM transactions 
             WHERE id=%s AND user_id=%s
         """, (transaction_id, session['user_id']))
@@ -3653,84 +3586,51 @@ def delete_transaction(transaction_id):
         else:
             print(f"DEBUG: Will reverse balance for transaction {transaction_id} - sub_user: {is_sub_user_transaction}")
         
-        # Delete the associated file if it exists
+        # Delete the associated file once the deletion has committed
         if transaction['receipt_file']:
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], transaction['receipt_file'])
-            if os.path.exists(file_path):
-                try:
-                    os.remove(file_path)
-                except OSError:
-                    pass  # Continue even if file deletion fails
+            receipt_file = transaction['receipt_file']
+            after_request_commit(lambda: file_cleanup_queue.schedule([receipt_file]))
+        
+        if not is_expense_deletion_transaction:
+            source_type, source_id = transaction_ledger_source(cursor, session['user_id'], transaction)
         
         # Reverse bank balance if payment method was online (skip only for expense deletion transactions)
         if not is_expense_deletion_transaction and transaction['payment_method'] == 'online' and transaction['bank_account_id']:
-            try:
-                # Get current bank balance before update
-                cursor.execute("SELECT current_balance FROM bank_accounts WHERE id = %s AND user_id = %s", (transaction['bank_account_id'], session['user_id']))
-                current_bank_balance = cursor.fetchone()
-                if current_bank_balance and 'current_balance' in current_bank_balance:
-                    print(f"DEBUG: Current bank balance before deletion: ₹{current_bank_balance['current_balance']}")
-                
-                if transaction['transaction_type'] == 'credit':
-                    # Reverse credit: deduct the amount from bank account
-                    cursor.execute("""
-                        UPDATE bank_accounts 
-                        SET current_balance = current_balance - %s 
-                        WHERE id = %s AND user_id = %s
-                    """, (float(transaction['amount']), transaction['bank_account_id'], session['user_id']))
-                    print(f"DEBUG: Reversed credit transaction deletion: Deducted ₹{transaction['amount']} from bank account {transaction['bank_account_id']}")
-                else:
-                    # Reverse debit: add the amount back to bank account
-                    cursor.execute("""
-                        UPDATE bank_accounts 
-                        SET current_balance = current_balance + %s 
-                        WHERE id = %s AND user_id = %s
-                    """, (float(transaction['amount']), transaction['bank_account_id'], session['user_id']))
-                    print(f"DEBUG: Reversed debit transaction deletion: Added ₹{transaction['amount']} back to bank account {transaction['bank_account_id']}")
-                
-                if cursor.rowcount == 0:
-                    print(f"Warning: Could not reverse bank balance for transaction {transaction_id}")
-                else:
-                    print(f"DEBUG: Bank balance update successful for transaction {transaction_id}")
-                
-            except Exception as bank_error:
-                print(f"Error reversing bank balance for transaction deletion: {bank_error}")
-                # Don't fail the deletion if balance reversal fails
+            # Get current bank balance before update
+            cursor.execute("SELECT current_balance FROM bank_accounts WHERE id = %s AND user_id = %s", (transaction['bank_account_id'], session['user_id']))
+            current_bank_balance = cursor.fetchone()
+            if current_bank_balance and 'current_balance' in current_bank_balance:
+                print(f"DEBUG: Current bank balance before deletion: ₹{current_bank_balance['current_balance']}")
+            
+            # Reversing a credit deducts the amount, reversing a debit adds it back.
+            # Errors propagate so the delete and the reversal roll back together
+            reversed_ok = post_movement(cursor, session['user_id'], 'bank', transaction['bank_account_id'],
+                                        'debit' if transaction['transaction_type'] == 'credit' else 'credit',
+                                        transaction['amount'], ledger_contra(transaction['transaction_type']),
+                                        source_type, source_id)
+            if not reversed_ok:
+                # The account no longer exists for this user; nothing was written
+                print(f"Warning: Could not reverse bank balance for transaction {transaction_id}")
+            print(f"DEBUG: Reversed {transaction['transaction_type']} transaction deletion: ₹{transaction['amount']} on bank account {transaction['bank_account_id']}")
         
         # Reverse cash balance if payment method was cash (skip only for expense deletion transactions)
         if not is_expense_deletion_transaction and transaction['payment_method'] == 'cash':
-            try:
-                # Get current cash balance before update
-                cursor.execute("SELECT cash_balance FROM users WHERE id = %s", (session['user_id'],))
-                current_balance = cursor.fetchone()
-                if current_balance and 'cash_balance' in current_balance:
-                    print(f"DEBUG: Current cash balance before deletion: ₹{current_balance['cash_balance']}")
-                
-                if transaction['transaction_type'] == 'credit':
-                    # Reverse credit: deduct the amount from cash balance
-                    cursor.execute("""
-                        UPDATE users 
-                        SET cash_balance = cash_balance - %s 
-                        WHERE id = %s
-                    """, (float(transaction['amount']), session['user_id']))
-                    print(f"DEBUG: Reversed credit transaction deletion: Deducted ₹{transaction['amount']} from cash balance for user {session['user_id']}")
-                else:
-                    # Reverse debit: add the amount back to cash balance
-                    cursor.execute("""
-                        UPDATE users 
-                        SET cash_balance = cash_balance + %s 
-                        WHERE id = %s
-                    """, (float(transaction['amount']), session['user_id']))
-                    print(f"DEBUG: Reversed debit transaction deletion: Added ₹{transaction['amount']} back to cash balance for user {session['user_id']}")
-                
-                if cursor.rowcount == 0:
-                    print(f"Warning: Could not reverse cash balance for transaction {transaction_id}")
-                else:
-                    print(f"DEBUG: Cash balance update successful for transaction {transaction_id}")
-                
-            except Exception as cash_error:
-                print(f"Error reversing cash balance for transaction deletion: {cash_error}")
-                # Don't fail the deletion if balance reversal fails
+            # Get current cash balance before update
+            cursor.execute("SELECT cash_balance FROM users WHERE id = %s", (session['user_id'],))
+            current_balance = cursor.fetchone()
+            if current_balance and 'cash_balance' in current_balance:
+                print(f"DEBUG: Current cash balance before deletion: ₹{current_balance['cash_balance']}")
+            
+            # Reversing a credit deducts the amount, reversing a debit adds it back.
+            # Errors propagate so the delete and the reversal roll back together
+            reversed_ok = post_movement(cursor, session['user_id'], 'cash', session['user_id'],
+                                        'debit' if transaction['transaction_type'] == 'credit' else 'credit',
+                                        transaction['amount'], ledger_contra(transaction['transaction_type']),
+                                        source_type, source_id)
+            if not reversed_ok:
+                # The account no longer exists for this user; nothing was written
+                print(f"Warning: Could not reverse cash balance for transaction {transaction_id}")
+            print(f"DEBUG: Reversed {transaction['transaction_type']} transaction deletion: ₹{transaction['amount']} on cash balance for user {session['user_id']}")
         
         # For sub-user transactions, update the original request status to 'deleted'
         if is_sub_user_transaction and transaction.get('created_by_sub_user'):
@@ -3773,19 +3673,6 @@ def delete_transaction(transaction_id):
                 print(f"DEBUG: Updated bank balance for account {transaction['bank_account_id']}: ₹{updated_bank_balance['current_balance']}")
         
         connection.commit()
-        
-        # Final verification - check balances one more time after commit
-        if transaction['payment_method'] == 'cash':
-            cursor.execute("SELECT cash_balance FROM users WHERE id = %s", (session['user_id'],))
-            final_cash_balance = cursor.fetchone()
-            if final_cash_balance and 'cash_balance' in final_cash_balance:
-                print(f"DEBUG: Final cash balance after commit: ₹{final_cash_balance['cash_balance']}")
-        elif transaction['payment_method'] == 'online' and transaction['bank_account_id']:
-            cursor.execute("SELECT current_balance FROM bank_accounts WHERE id = %s AND user_id = %s", (transaction['bank_account_id'], session['user_id']))
-            final_bank_balance = cursor.fetchone()
-            if final_bank_balance and 'current_balance' in final_bank_balance:
-                print(f"DEBUG: Final bank balance after commit: ₹{final_bank_balance['current_balance']}")
-        
         cursor.close()
         connection.close()
         
@@ -3796,7 +3683,7 @@ def delete_transaction(transaction_id):
 
 
 # API Routes for Invoices
-# Add a temporary route to run migration with better error handling
+# Apply pending schema migrations on demand (they also run once at startup)
 @app.route('/run-migration')
 def run_migration():
     try:
@@ -3804,50 +3691,18 @@ def run_migration():
         if not connection:
             return jsonify({'success': False, 'message': 'Database connection failed'}), 500
         
-        cursor = connection.cursor()
-        
-        # Check if column already exists
         try:
-            cursor.execute("SHOW COLUMNS FROM invoices LIKE 'invoice_type'")
-            column_exists = cursor.fetchone() is not None
-            
-            if column_exists:
-                cursor.close()
-                connection.close()
-                return jsonify({'success': True, 'message': 'Column already exists', 'column_exists': True})
-            
-            # Add invoice_type column if it doesn't exist
-            cursor.execute("""
-                ALTER TABLE invoices 
-                ADD COLUMN invoice_type ENUM('in', 'out') DEFAULT 'out' AFTER status
-            """)
-            
-            # Create index for better performance
-            cursor.execute("CREATE INDEX idx_invoices_type ON invoices(invoice_type)")
-            
-            connection.commit()
-            
-            # Verify column was added
-            cursor.execute("SHOW COLUMNS FROM invoices LIKE 'invoice_type'")
-            verification = cursor.fetchone() is not None
-            
-            cursor.close()
-            connection.close()
-            
-            if verification:
-                return jsonify({'success': True, 'message': 'Migration completed successfully', 'column_exists': True})
-            else:
-                return jsonify({'success': False, 'message': 'Migration failed to add column', 'column_exists': False})
-                
+            applied = migrate_database(connection)
         except mysql.connector.Error as db_error:
-            cursor.close()
-            connection.close()
             return jsonify({'success': False, 'message': f'Database error: {str(db_error)}', 'error_details': str(db_error)})
+        finally:
+            connection.close()
+        
+        return jsonify({'success': True, 'message': 'Migrations completed successfully', 'applied': applied})
             
     except Exception as e:
         return jsonify({'success': False, 'message': f'General error: {str(e)}', 'error_details': str(e)}), 500
 
-# Add a temporary route to run migration immediately
 @app.route('/fix-database')
 def fix_database():
     try:
@@ -3855,50 +3710,21 @@ def fix_database():
         if not connection:
             return "<h2>Error: Database connection failed</h2><p>Please check your database configuration.</p>"
         
-        cursor = connection.cursor()
-        
-        # Check if column already exists
-        cursor.execute("SHOW COLUMNS FROM invoices LIKE 'invoice_type'")
-        column_exists = cursor.fetchone() is not None
-        
-        if column_exists:
-            cursor.close()
-            connection.close()
-            return "<h2>Success: Column already exists</h2><p>The invoice_type column already exists in your database.</p>"
-        
-        # Add invoice_type column
         try:
-            cursor.execute("""
-                ALTER TABLE invoices 
-                ADD COLUMN invoice_type ENUM('in', 'out') DEFAULT 'out' AFTER status
-            """)
-            
-            # Create index
-            cursor.execute("CREATE INDEX idx_invoices_type ON invoices(invoice_type)")
-            
-            connection.commit()
-            
-            # Verify column was added
-            cursor.execute("SHOW COLUMNS FROM invoices LIKE 'invoice_type'")
-            verification = cursor.fetchone() is not None
-            
-            cursor.close()
-            connection.close()
-            
-            if verification:
-                return """
-                <h2>Success: Database fixed!</h2>
-                <p>The invoice_type column has been successfully added to your database.</p>
-                <p>You can now create both In and Out invoices.</p>
-                <a href="/invoices">Go to Invoices Page</a>
-                """
-            else:
-                return "<h2>Error: Migration failed</h2><p>The column was not added successfully. Please try again.</p>"
-                
+            applied = migrate_database(connection)
         except mysql.connector.Error as db_error:
-            cursor.close()
-            connection.close()
             return f"<h2>Database Error:</h2><p>{str(db_error)}</p><p>Please check your database permissions.</p>"
+        finally:
+            connection.close()
+        
+        if not applied:
+            return "<h2>Success: Database is up to date</h2><p>All schema migrations have already been applied.</p>"
+        
+        return f"""
+        <h2>Success: Database fixed!</h2>
+        <p>Applied migrations: {', '.join(str(version) for version in applied)}</p>
+        <a href="/invoices">Go to Invoices Page</a>
+        """
             
     except Exception as e:
         return f"<h2>General Error:</h2><p>{str(e)}</p>"
@@ -3958,6 +3784,7 @@ class InvoiceList(Resource):
 # Keep the original route for backward compatibility
 @app.route('/api/invoices', methods=['GET'])
 @login_required
+@conditional_collection('invoices')
 def get_invoices():
     search = request.args.get('search', '')
     
@@ -3982,17 +3809,6 @@ def get_invoices():
     
     invoices = cursor.fetchall()
     
-    # Convert date objects to strings
-    for invoice in invoices:
-        if invoice['invoice_date']:
-            invoice['invoice_date'] = invoice['invoice_date'].isoformat()
-        if invoice['due_date']:
-            invoice['due_date'] = invoice['due_date'].isoformat()
-        if invoice['created_at']:
-            invoice['created_at'] = invoice['created_at'].isoformat()
-        if invoice['updated_at']:
-            invoice['updated_at'] = invoice['updated_at'].isoformat()
-    
     cursor.close()
     connection.close()
     return jsonify(invoices)
@@ -4009,25 +3825,18 @@ def create_invoice():
         print(f"DEBUG: Received invoice data: {data}")
         print(f"DEBUG: Bank account ID from request: {data.get('bank_account_id')}")
         
-        connection = get_db_connection()
+        connection = get_request_connection()
         if not connection:
             return jsonify({'error': 'Database connection failed'}), 500
         
         cursor = connection.cursor()
         
-        # Ensure required columns exist in invoices table
-        try:
-            cursor.execute("ALTER TABLE invoices ADD COLUMN IF NOT EXISTS bank_account_id INT NULL")
-            connection.commit()
-        except Exception as e:
-            print(f"Warning: Could not add bank_account_id column: {e}")
-        
         # Determine invoice type (default to 'out' if not specified)
         invoice_type = data.get('invoice_type', 'out')
         print(f"DEBUG: Creating invoice with type: {invoice_type}")
         
         # Generate invoice number based on type
-        invoice_number = generate_invoice_number(session['user_id'], invoice_type)
+        invoice_number = generate_invoice_number(session['user_id'], invoice_type, cursor)
         
         # Calculate totals
         subtotal = sum(item['quantity'] * item['unit_price'] for item in data['items'])
@@ -4179,13 +3988,6 @@ def create_invoice():
         # Store bank account ID for balance updates if provided
         bank_account_id = data.get('bank_account_id')
         if bank_account_id:
-            # First ensure the bank_account_id column exists
-            try:
-                cursor.execute("ALTER TABLE invoices ADD COLUMN IF NOT EXISTS bank_account_id INT NULL")
-                connection.commit()
-            except Exception as e:
-                print(f"Warning: Could not add bank_account_id column: {e}")
-            
             cursor.execute("""
                 UPDATE invoices SET bank_account_id = %s WHERE id = %s
             """, (bank_account_id, invoice_id))
@@ -4213,13 +4015,6 @@ def create_invoice():
         transaction_id = None
         if invoice_type == 'out':
             try:
-                # Ensure invoices table has expense_id column to link
-                try:
-                    cursor.execute("ALTER TABLE invoices ADD COLUMN IF NOT EXISTS expense_id INT NULL")
-                    connection.commit()
-                except Exception as e:
-                    print(f"Warning: Could not ensure invoices.expense_id column: {e}")
-
                 # Derive payment method and bank account for the expense
                 expense_payment_method = 'cash'
                 expense_bank_account_id = None
@@ -4234,8 +4029,7 @@ def create_invoice():
                 expense_date = data.get('invoice_date')
 
                 # Create expense using dynamic columns similar to add_expense
-                cursor.execute("DESCRIBE expenses")
-                exp_cols = [row[0] for row in cursor.fetchall()]
+                exp_cols = get_table_columns(connection, 'expenses')
 
                 expense_unique_id = generate_unique_id('EXP')
 
@@ -4286,8 +4080,7 @@ def create_invoice():
 
                 # Insert a matching transaction for the expense (debit) if transactions table supports it
                 try:
-                    cursor.execute("DESCRIBE transactions")
-                    trans_cols = [row[0] for row in cursor.fetchall()]
+                    trans_cols = get_table_columns(connection, 'transactions')
 
                     if all(col in trans_cols for col in ['payment_method', 'source', 'source_id']):
                         cursor.execute(
@@ -4333,21 +4126,11 @@ def create_invoice():
 
                 # Update balances once based on payment method
                 if expense_payment_method == 'online' and expense_bank_account_id:
-                    cursor.execute(
-                        """
-                        UPDATE bank_accounts SET current_balance = current_balance - %s 
-                        WHERE id = %s AND user_id = %s
-                        """,
-                        (float(total_amount), expense_bank_account_id, session['user_id']),
-                    )
+                    post_movement(cursor, session['user_id'], 'bank', expense_bank_account_id, 'debit', total_amount,
+                                  'expense', 'expense', expense_id)
                 elif expense_payment_method == 'cash':
-                    cursor.execute(
-                        """
-                        UPDATE users SET cash_balance = cash_balance - %s 
-                        WHERE id = %s
-                        """,
-                        (float(total_amount), session['user_id']),
-                    )
+                    post_movement(cursor, session['user_id'], 'cash', session['user_id'], 'debit', total_amount,
+                                  'expense', 'expense', expense_id)
 
                 connection.commit()
                 print(f"Created expense {expense_id} for OUT invoice {invoice_id} and deducted once")
@@ -4441,13 +4224,6 @@ def update_invoice(invoice_id):
 
         cursor = connection.cursor(dictionary=True)
         
-        # Ensure required columns exist in invoices table
-        try:
-            cursor.execute("ALTER TABLE invoices ADD COLUMN IF NOT EXISTS bank_account_id INT NULL")
-            connection.commit()
-        except Exception as e:
-            print(f"Warning: Could not add bank_account_id column: {e}")
-        
         # Check if invoice exists and belongs to user
         cursor.execute("""SELECT id FROM invoices 
                        WHERE id = %s AND user_id = %s""", 
@@ -4714,6 +4490,11 @@ def generate_pdf_template_invoice(invoice, items, company, pdf_template_path, fi
             return generate_pdftemp_invoice(invoice, items, company, bank_details, filepath, filename)
         
         # Generate content PDF using reportlab
+        from reportlab.lib.pagesizes import A4
+        from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+        from reportlab.lib.styles import getSampleStyleSheet
+        from reportlab.lib import colors
+        
         content_pdf_path = os.path.join(app.config['EXPORT_FOLDER'], f"content_{filename}")
         
         # Create content PDF with invoice data
@@ -4864,6 +4645,11 @@ def generate_pdf_template_invoice(invoice, items, company, pdf_template_path, fi
 def generate_default_invoice_pdf(invoice, items, company, filepath, filename):
     """Generate default PDF invoice using reportlab"""
     try:
+        from reportlab.lib.pagesizes import A4
+        from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+        from reportlab.lib.styles import getSampleStyleSheet
+        from reportlab.lib import colors
+        
         doc = SimpleDocTemplate(filepath, pagesize=A4)
         styles = getSampleStyleSheet()
         story = []
@@ -5151,8 +4937,6 @@ def generate_sales_template_invoice(invoice, items, company, bank_details, filep
 def generate_pdftemp_invoice(invoice, items, company, bank_details, filepath, filename):
     """Generate PDF invoice using the pdftemp.html template with Jinja2"""
     try:
-        from jinja2 import Template
-        
         # Determine which template to use based on invoice type
         invoice_type = invoice.get('invoice_type', 'out')
         print(f"DEBUG: Invoice type from database: {invoice_type}")
@@ -5172,16 +4956,11 @@ def generate_pdftemp_invoice(invoice, items, company, bank_details, filepath, fi
         
         if not os.path.exists(template_path):
             print(f"DEBUG: {template_path} template not found at {template_path}")
-            return jsonify({'error': 'Template not found'}), 400
+            # Plain tuple (no jsonify) so this also works on the render worker threads
+            return {'error': 'Template not found'}, 400
         
-        with open(template_path, 'r', encoding='utf-8') as f:
-            template_content = f.read()
-        
-        # Debug print for template content
-        print(f"DEBUG: generate_pdftemp_invoice - First 100 chars of '{template_path}': '{template_content[:100]}'")
-        
-        # Create Jinja2 template
-        template = Template(template_content)
+        # Compiled once and reused until the file's mtime/size change
+        template = invoice_template_cache.get_file_template(template_path)
         
         # Prepare data for template - Use actual billing information from database
         # For 'in' invoices, we show the client as the billing party (BILL TO)
@@ -6143,31 +5922,38 @@ def generate_default_invoice_pdf_file(invoice, items, company, filepath, filenam
 
 
 # CSV Export Routes
+def parse_export_format(default='csv'):
+    """Read ?format= (csv/ndjson) and ?compress=gzip; returns (format, compress) or raises ValueError"""
+    format_type = request.args.get('format', default)
+    if format_type not in ('csv', 'ndjson'):
+        raise ValueError('Unsupported format')
+    return format_type, request.args.get('compress') == 'gzip'
+
+def stream_table_export(name, query, params):
+    """Stream a single query as a CSV/NDJSON (optionally gzipped) download"""
+    try:
+        format_type, compress = parse_export_format()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    connection = get_db_connection()
+    if not connection:
+        return jsonify({'error': 'Database connection failed'}), 500
+    
+    rows = iter_rows(connection, query, params)
+    chunks = csv_chunks(rows) if format_type == 'csv' else ndjson_chunks(rows)
+    filename = f"{name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{format_type}"
+    return stream_export(chunks, filename, format_type, compress=compress, on_close=connection.close)
+
 @app.route('/api/export/expenses')
 @login_required
 def export_expenses_csv():
     try:
-        connection = get_db_connection()
-        if not connection:
-            return jsonify({'error': 'Database connection failed'}), 500
-        
-        cursor = connection.cursor(dictionary=True)
-        cursor.execute("SELECT * FROM expenses WHERE user_id = %s ORDER BY expense_date DESC", (session['user_id'],))
-        expenses = cursor.fetchall()
-        cursor.close()
-        connection.close()
-        
-        filename = f"expenses_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-        filepath = os.path.join(app.config['EXPORT_FOLDER'], filename)
-        
-        with open(filepath, 'w', newline='', encoding='utf-8') as csvfile:
-            if expenses:
-                fieldnames = expenses[0].keys()
-                writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-                writer.writeheader()
-                writer.writerows(expenses)
-        
-        return send_file(filepath, as_attachment=True, download_name=filename)
+        return stream_table_export(
+            'expenses',
+            "SELECT * FROM expenses WHERE user_id = %s ORDER BY expense_date DESC",
+            (session['user_id'],)
+        )
     except Exception as e:
         return jsonify({'error': str(e)}), 400
 
@@ -6175,27 +5961,11 @@ def export_expenses_csv():
 @login_required
 def export_transactions_csv():
     try:
-        connection = get_db_connection()
-        if not connection:
-            return jsonify({'error': 'Database connection failed'}), 500
-        
-        cursor = connection.cursor(dictionary=True)
-        cursor.execute("SELECT * FROM transactions WHERE user_id = %s ORDER BY transaction_date DESC", (session['user_id'],))
-        transactions = cursor.fetchall()
-        cursor.close()
-        connection.close()
-        
-        filename = f"transactions_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-        filepath = os.path.join(app.config['EXPORT_FOLDER'], filename)
-        
-        with open(filepath, 'w', newline='', encoding='utf-8') as csvfile:
-            if transactions:
-                fieldnames = transactions[0].keys()
-                writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-                writer.writeheader()
-                writer.writerows(transactions)
-        
-        return send_file(filepath, as_attachment=True, download_name=filename)
+        return stream_table_export(
+            'transactions',
+            "SELECT * FROM transactions WHERE user_id = %s ORDER BY transaction_date DESC",
+            (session['user_id'],)
+        )
     except Exception as e:
         return jsonify({'error': str(e)}), 400
 
@@ -6209,19 +5979,12 @@ def update_invoice_status(invoice_id):
         if not new_status or new_status not in ['draft', 'sent', 'paid', 'overdue']:
             return jsonify({'error': 'Invalid status. Must be draft, sent, paid, or overdue'}), 400
         
-        connection = get_db_connection()
+        connection = get_request_connection()
         if not connection:
             return jsonify({'error': 'Database connection failed'}), 500
         
         cursor = connection.cursor()
         
-        # Ensure required columns exist in invoices table
-        try:
-            cursor.execute("ALTER TABLE invoices ADD COLUMN IF NOT EXISTS bank_account_id INT NULL")
-            connection.commit()
-        except Exception as e:
-            print(f"Warning: Could not add bank_account_id column: {e}")
-        
         # Update invoice status
         cursor.execute("""
             UPDATE invoices 
@@ -6269,24 +6032,14 @@ def update_invoice_status(invoice_id):
                 
                 if bank_account_id:
                     try:
-                        if invoice_type == 'in':
-                            # Reverse IN invoice: deduct money from bank account (was credit)
-                            cursor.execute("""
-                                UPDATE bank_accounts 
-                                SET current_balance = current_balance - %s 
-                                WHERE id = %s AND user_id = %s
-                            """, (float(amount), bank_account_id, session['user_id']))
-                            print(f"Reversed IN invoice to {new_status}: Deducted ₹{amount} from bank account {bank_account_id}")
-                        else:
-                            # Reverse OUT invoice: add money back to bank account (was debit)
-                            cursor.execute("""
-                                UPDATE bank_accounts 
-                                SET current_balance = current_balance + %s 
-                                WHERE id = %s AND user_id = %s
-                            """, (float(amount), bank_account_id, session['user_id']))
-                            print(f"Reversed OUT invoice to {new_status}: Added ₹{amount} back to bank account {bank_account_id}")
+                        # Reverse IN invoice: deduct money (was credit); OUT invoice: add it back (was debit)
+                        source_type, source_id = posted_source(cursor, [('invoice', invoice_id), ('transaction', transaction_id)])
+                        reversed_ok = post_movement(cursor, session['user_id'], 'bank', bank_account_id,
+                                                    'debit' if invoice_type == 'in' else 'credit', amount,
+                                                    'income' if invoice_type == 'in' else 'expense', source_type, source_id)
+                        print(f"Reversed {invoice_type.upper()} invoice to {new_status}: ₹{amount} on bank account {bank_account_id}")
                         
-                        if cursor.rowcount == 0:
+                        if not reversed_ok:
                             print(f"Warning: Could not reverse bank balance for invoice {invoice_id}")
                         
                     except Exception as bank_error:
@@ -6434,6 +6187,9 @@ def delete_invoice(invoice_id):
                     deleted_transactions = cursor.rowcount
                     print(f"DEBUG: Deleted {deleted_transactions} transaction(s) for OUT invoice {invoice_id}")
                 
+                # The refund reverses whichever of the expense or the invoice carried the deduction
+                refund_source = posted_source(cursor, [('expense', expense_id), ('invoice', invoice_id)])
+                
                 # Process refund based on the exact payment method used during approval
                 if refund_payment_method == 'bank' and refund_bank_account_id:
                     # BANK REFUND - Refund to the specific bank account selected during approval
@@ -6448,12 +6204,8 @@ def delete_invoice(invoice_id):
                         print(f"DEBUG: Bank '{bank_name}' current balance before refund: ₹{current_balance}")
                         
                         # Refund to the specific bank account
-                        cursor.execute("""
-                            UPDATE bank_accounts 
-                            SET current_balance = current_balance + %s 
-                            WHERE id = %s AND user_id = %s
-                        """, (float(total_amount), refund_bank_account_id, session['user_id']))
-                        affected_rows = cursor.rowcount
+                        affected_rows = int(post_movement(cursor, session['user_id'], 'bank', refund_bank_account_id, 'credit',
+                                                          total_amount, 'expense', *refund_source))
                         print(f"DEBUG: Bank update affected {affected_rows} rows")
                         
                         if affected_rows > 0:
@@ -6503,12 +6255,8 @@ def delete_invoice(invoice_id):
                     print(f"DEBUG: Current cash balance before refund: ₹{current_cash}")
                     
                     # Refund to cash balance
-                    cursor.execute("""
-                        UPDATE users 
-                        SET cash_balance = cash_balance + %s 
-                        WHERE id = %s
-                    """, (float(total_amount), session['user_id']))
-                    affected_rows = cursor.rowcount
+                    affected_rows = int(post_movement(cursor, session['user_id'], 'cash', session['user_id'], 'credit',
+                                                      total_amount, 'expense', *refund_source))
                     
                     if affected_rows > 0:
                         # Check balance after refund
@@ -6565,11 +6313,8 @@ def delete_invoice(invoice_id):
         elif invoice_type == 'in' and not expense_exists:
             # Handle IN invoice deletions (reverse the credit)
             if bank_account_id:
-                cursor.execute("""
-                    UPDATE bank_accounts 
-                    SET current_balance = current_balance - %s 
-                    WHERE id = %s AND user_id = %s
-                """, (float(total_amount), bank_account_id, session['user_id']))
+                post_movement(cursor, session['user_id'], 'bank', bank_account_id, 'debit', total_amount,
+                              'income', 'invoice', invoice_id)
                 print(f"Reversed IN invoice deletion: Deducted ₹{total_amount} from bank account {bank_account_id}")
         else:
             if expense_exists:
@@ -6825,89 +6570,142 @@ def create_manual_pdf_invoice():
 @app.route('/api/invoices/<int:invoice_id>/pdf')
 @login_required
 def generate_invoice_pdf(invoice_id):
-    """Generate and download a PDF for an invoice"""
+    """Download a PDF for an invoice, rendering it on the worker pool if not cached"""
     try:
         print(f"DEBUG: Generating PDF for invoice {invoice_id}")
-        connection = get_db_connection()
-        if not connection:
-            return jsonify({'error': 'Database connection failed'}), 500
-        
-        cursor = connection.cursor(dictionary=True)
-        
-        # Get invoice data with user_id filter
-        cursor.execute("SELECT * FROM invoices WHERE id=%s AND user_id=%s", (invoice_id, session['user_id']))
-        invoice = cursor.fetchone()
-        
-        if not invoice:
-            return jsonify({'error': 'Invoice not found'}), 404
+        job, error = enqueue_invoice_pdf(invoice_id, session['user_id'])
+        if error:
+            return error
+        
+        key = job['job_id']
+        if job['status'] != JOB_DONE:
+            # Synchronous callers still get the file; the render happens off this thread
+            pdf_render_queue.wait(key, timeout=PDF_RENDER_TIMEOUT)
+            job = pdf_render_queue.status(key, session['user_id'])
+        
+        if not job or job['status'] != JOB_DONE:
+            error_msg = job['error'] if job and job['status'] == JOB_FAILED else 'PDF generation did not finish'
+            print(f"DEBUG: PDF generation failed: {error_msg}")
+            return jsonify({'error': error_msg}), 500
         
-        # Debug invoice data and ensure invoice_type is set
-        print(f"DEBUG: Invoice type retrieved from database: {invoice.get('invoice_type', 'none')}")
+        track_invoice_download(invoice_id, session['user_id'])
+        return send_file(pdf_render_queue.pdf_path(key), as_attachment=True, download_name=job['filename'])
         
-        # Ensure invoice_type is set correctly
-        if 'invoice_type' not in invoice or invoice['invoice_type'] is None:
-            invoice['invoice_type'] = 'out'
-            print("DEBUG: Setting default invoice_type to 'out'")
-        else:
-            print(f"DEBUG: Using existing invoice_type: {invoice['invoice_type']}")
+    except Exception as e:
+        print(f"DEBUG: Error generating invoice PDF: {e}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
+
+def load_invoice_pdf_context(invoice_id, user_id):
+    """Fetch invoice, items, company settings and bank details for PDF rendering"""
+    connection = get_db_connection()
+    if not connection:
+        return None
+    
+    cursor = connection.cursor(dictionary=True)
+    try:
+        cursor.execute("SELECT * FROM invoices WHERE id=%s AND user_id=%s", (invoice_id, user_id))
+        invoice = cursor.fetchone()
+        if not invoice:
+            return {}
+        
+        # Ensure invoice_type is set correctly
+        if 'invoice_type' not in invoice or invoice['invoice_type'] is None:
+            invoice['invoice_type'] = 'out'
         
-        # Get invoice items
         cursor.execute("SELECT * FROM invoice_items WHERE invoice_id=%s", (invoice_id,))
         items = cursor.fetchall()
         
-        # Get company settings for current user
-        cursor.execute("SELECT * FROM company_settings WHERE user_id = %s LIMIT 1", (session['user_id'],))
-        company = cursor.fetchone()
+        company = cached_company_settings(connection, user_id)
         
-        # Get bank details
         cursor.execute("SELECT * FROM bank_details WHERE invoice_id = %s", (invoice_id,))
         bank_details = cursor.fetchone()
         
+        return {'invoice': invoice, 'items': items, 'company': company, 'bank_details': bank_details}
+    finally:
         cursor.close()
         connection.close()
-        
-        # Generate PDF
-        filename = f"invoice_{invoice['invoice_number']}.pdf"
-        filepath = os.path.join(app.config['EXPORT_FOLDER'], filename)
-        
-        # Ensure exports directory exists
-        os.makedirs(app.config['EXPORT_FOLDER'], exist_ok=True)
-        
-        # Generate the PDF using pdftemp.html template
-        result = generate_pdftemp_invoice(invoice, items, company, bank_details, filepath, filename)
-        
-        # Check if result is a file path (success) or error tuple
-        if isinstance(result, str) and os.path.exists(result):
-            print(f"DEBUG: PDF generated successfully at {result}")
-            
-            # Track download in history (if table exists)
-            try:
-                connection = get_db_connection()
-                if connection:
-                    cursor = connection.cursor()
-                    cursor.execute(
-                        "INSERT INTO pdf_download_history (invoice_id, user_id, download_time) VALUES (%s, %s, %s)",
-                        (invoice_id, session['user_id'], datetime.now())
-                    )
-                    connection.commit()
-                    cursor.close()
-                    connection.close()
-            except Exception as track_error:
-                print(f"DEBUG: Warning - Could not track invoice download: {track_error}")
-            
-            return send_file(result, as_attachment=True, download_name=filename)
-        else:
-            # Handle error case
-            error_msg = result[0]['error'] if isinstance(result, tuple) else str(result)
-            print(f"DEBUG: PDF generation failed: {error_msg}")
-            return jsonify({'error': error_msg}), 500
-        
+
+def enqueue_invoice_pdf(invoice_id, user_id):
+    """Queue (or reuse) a cached render of an invoice; returns (job, error_response)"""
+    context = load_invoice_pdf_context(invoice_id, user_id)
+    if context is None:
+        return None, (jsonify({'error': 'Database connection failed'}), 500)
+    if not context:
+        return None, (jsonify({'error': 'Invoice not found'}), 404)
+    
+    invoice, items = context['invoice'], context['items']
+    company, bank_details = context['company'], context['bank_details']
+    key = invoice_content_key(invoice, items, company, bank_details, PDF_TEMPLATE_FILES)
+    filename = f"invoice_{invoice['invoice_number']}.pdf"
+    
+    def render(filepath):
+        return generate_pdftemp_invoice(invoice, items, company, bank_details, filepath, filename)
+    
+    return pdf_render_queue.enqueue(key, user_id, invoice_id, filename, render), None
+
+def track_invoice_download(invoice_id, user_id):
+    """Record an invoice download in history (if the table exists)"""
+    try:
+        connection = get_db_connection()
+        if connection:
+            cursor = connection.cursor()
+            cursor.execute(
+                "INSERT INTO pdf_download_history (invoice_id, user_id, download_time) VALUES (%s, %s, %s)",
+                (invoice_id, user_id, datetime.now())
+            )
+            connection.commit()
+            cursor.close()
+            connection.close()
+    except Exception as track_error:
+        print(f"DEBUG: Warning - Could not track invoice download: {track_error}")
+
+def pdf_job_response(job):
+    """JSON body describing a PDF render job"""
+    return {
+        'job_id': job['job_id'],
+        'invoice_id': job['invoice_id'],
+        'status': job['status'],
+        'error': job['error'],
+        'status_url': url_for('get_invoice_pdf_job', job_id=job['job_id']),
+        'download_url': url_for('download_invoice_pdf_job', job_id=job['job_id']) if job['status'] == JOB_DONE else None
+    }
+
+@app.route('/api/invoices/<int:invoice_id>/pdf/jobs', methods=['POST'])
+@login_required
+def create_invoice_pdf_job(invoice_id):
+    """Enqueue a background PDF render for an invoice"""
+    try:
+        job, error = enqueue_invoice_pdf(invoice_id, session['user_id'])
+        if error:
+            return error
+        status_code = 200 if job['status'] == JOB_DONE else 202
+        return jsonify(pdf_job_response(job)), status_code
     except Exception as e:
-        print(f"DEBUG: Error generating invoice PDF: {e}")
-        import traceback
-        traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/invoices/pdf/jobs/<job_id>')
+@login_required
+def get_invoice_pdf_job(job_id):
+    """Status of a background PDF render"""
+    job = pdf_render_queue.status(job_id, session['user_id'])
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(pdf_job_response(job))
+
+@app.route('/api/invoices/pdf/jobs/<job_id>/download')
+@login_required
+def download_invoice_pdf_job(job_id):
+    """Download the PDF produced by a finished render job"""
+    job = pdf_render_queue.status(job_id, session['user_id'])
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    if job['status'] != JOB_DONE:
+        return jsonify(pdf_job_response(job)), 409
+    track_invoice_download(job['invoice_id'], session['user_id'])
+    return send_file(pdf_render_queue.pdf_path(job_id), as_attachment=True, download_name=job['filename'])
+
 @app.route('/api/invoices/<int:invoice_id>/expense-file')
 @login_required
 def download_expense_invoice_file(invoice_id):
@@ -6958,6 +6756,7 @@ def download_expense_invoice_file(invoice_id):
 
 @app.route('/api/products', methods=['GET'])
 @login_required
+@conditional_collection('products')
 def get_products():
     """Get all products for the current user"""
     try:
@@ -7153,32 +6952,13 @@ def get_low_stock_products():
         if not connection:
             return jsonify({'error': 'Database connection failed'}), 500
         
-        cursor = connection.cursor(dictionary=True)
-        
-        # Get user's low stock threshold - handle case where column might not exist
+        # Get user's low stock threshold (column is created by migration 0006)
         threshold = 5  # Default threshold
-        try:
-            # First check if the column exists
-            cursor.execute("SHOW COLUMNS FROM user_settings LIKE 'low_stock_threshold'")
-            column_exists = cursor.fetchone()
-            
-            if column_exists:
-                cursor.execute("SELECT low_stock_threshold FROM user_settings WHERE user_id = %s", (session['user_id'],))
-                setting = cursor.fetchone()
-                if setting and setting.get('low_stock_threshold') is not None:
-                    threshold = int(setting['low_stock_threshold'])
-            else:
-                # Column doesn't exist, try to add it
-                try:
-                    cursor.execute("ALTER TABLE user_settings ADD COLUMN low_stock_threshold INT DEFAULT 5")
-                    connection.commit()
-                    print("Added low_stock_threshold column to user_settings table")
-                except Exception as alter_error:
-                    print(f"Could not add low_stock_threshold column: {alter_error}")
-                    # Continue with default value
-        except Exception as e:
-            print(f"Error checking low_stock_threshold: {e}")
-            # Continue with default value of 5
+        setting = cached_user_settings(connection, session['user_id'])
+        if setting and setting.get('low_stock_threshold') is not None:
+            threshold = int(setting['low_stock_threshold'])
+        
+        cursor = connection.cursor(dictionary=True)
         
         # Get products with quantity below threshold
         cursor.execute("""
@@ -7209,11 +6989,7 @@ def get_low_stock_threshold():
         if not connection:
             return jsonify({'error': 'Database connection failed'}), 500
         
-        cursor = connection.cursor(dictionary=True)
-        cursor.execute("SELECT low_stock_threshold FROM user_settings WHERE user_id = %s", (session['user_id'],))
-        setting = cursor.fetchone()
-        
-        cursor.close()
+        setting = cached_user_settings(connection, session['user_id'])
         connection.close()
         
         threshold = setting['low_stock_threshold'] if setting else 5
@@ -7248,6 +7024,7 @@ def update_low_stock_threshold():
         connection.commit()
         cursor.close()
         connection.close()
+        reference_cache.invalidate(session['user_id'], 'user_settings')
         
         return jsonify({'success': True, 'threshold': threshold, 'message': 'Low stock threshold updated successfully'})
     except Exception as e:
@@ -7263,11 +7040,7 @@ def get_user_banks():
         if not connection:
             return jsonify({'error': 'Database connection failed'}), 500
         
-        cursor = connection.cursor(dictionary=True)
-        cursor.execute("SELECT * FROM bank_accounts WHERE user_id = %s ORDER BY bank_name", (session['user_id'],))
-        banks = cursor.fetchall()
-        
-        cursor.close()
+        banks = cached_bank_accounts(connection, session['user_id'])
         connection.close()
         
         return jsonify(banks)
@@ -7324,9 +7097,11 @@ def create_user_bank():
         ))
         
         bank_id = cursor.lastrowid
+        post_opening(cursor, session['user_id'], 'bank', bank_id, 'bank_account', bank_id)
         connection.commit()
         cursor.close()
         connection.close()
+        reference_cache.invalidate(session['user_id'], 'bank_accounts')
         
         return jsonify({'success': True, 'id': bank_id}), 201
     except Exception as e:
@@ -7366,10 +7141,18 @@ def update_user_bank(bank_id):
         if is_default:
             cursor.execute("UPDATE bank_accounts SET is_default = FALSE WHERE user_id = %s AND id != %s", (session['user_id'], bank_id))
         
+        # A balance edited by hand is journaled as a manual adjustment
+        if not post_adjustment(cursor, session['user_id'], 'bank', bank_id, data.get('current_balance', 0.00),
+                               'bank_account', bank_id):
+            connection.rollback()
+            cursor.close()
+            connection.close()
+            return jsonify({'error': 'Bank not found or not authorized'}), 404
+        
         # Update bank account
         cursor.execute("""
             UPDATE bank_accounts 
-            SET bank_name = %s, account_number = %s, ifsc_code = %s, upi_id = %s, initial_balance = %s, current_balance = %s, is_default = %s
+            SET bank_name = %s, account_number = %s, ifsc_code = %s, upi_id = %s, initial_balance = %s, is_default = %s
             WHERE id = %s AND user_id = %s
         """, (
             data['bank_name'],
@@ -7377,20 +7160,15 @@ def update_user_bank(bank_id):
             data['ifsc_code'],
             data.get('upi_id', ''),
             data.get('initial_balance', 0.00),
-            data.get('current_balance', 0.00),
             is_default,
             bank_id,
             session['user_id']
         ))
         
-        if cursor.rowcount == 0:
-            cursor.close()
-            connection.close()
-            return jsonify({'error': 'Bank not found or not authorized'}), 404
-        
         connection.commit()
         cursor.close()
         connection.close()
+        reference_cache.invalidate(session['user_id'], 'bank_accounts')
         
         return jsonify({'success': True})
     except Exception as e:
@@ -7406,6 +7184,8 @@ def delete_user_bank(bank_id):
             return jsonify({'error': 'Database connection failed'}), 500
         
         cursor = connection.cursor()
+        # The remaining balance leaves the ledger with the account
+        post_closing(cursor, session['user_id'], 'bank', bank_id, 'bank_account', bank_id)
         cursor.execute("DELETE FROM bank_accounts WHERE id = %s AND user_id = %s", (bank_id, session['user_id']))
         
         if cursor.rowcount == 0:
@@ -7416,6 +7196,7 @@ def delete_user_bank(bank_id):
         connection.commit()
         cursor.close()
         connection.close()
+        reference_cache.invalidate(session['user_id'], 'bank_accounts')
         
         return jsonify({'success': True})
     except Exception as e:
@@ -7450,6 +7231,7 @@ def set_default_bank(bank_id):
         connection.commit()
         cursor.close()
         connection.close()
+        reference_cache.invalidate(session['user_id'], 'bank_accounts')
         
         return jsonify({'success': True, 'message': 'Default bank updated successfully'})
         
@@ -7522,46 +7304,36 @@ def get_dashboard_stats():
         if not connection:
             return jsonify({'error': 'Database connection failed'}), 500
         
+        # All aggregates come from the trigger-maintained summary row (one primary-key lookup)
+        summary = get_user_summary(connection, session['user_id'])
+        
         cursor = connection.cursor(dictionary=True)
         
-        # Get expense stats for current user (for display only, NOT used in balance calculation)
-        cursor.execute("""
-            SELECT 
-                COUNT(*) as total_expenses,
-                COALESCE(SUM(amount), 0) as total_expense_amount,
-                COALESCE(SUM(CASE WHEN expense_type = 'upcoming' THEN amount ELSE 0 END), 0) as upcoming_expenses
-            FROM expenses
-            WHERE user_id = %s
-        """, (session['user_id'],))
-        expense_stats = cursor.fetchone()
+        # Expense stats (for display only, NOT used in balance calculation)
+        expense_stats = {
+            'total_expenses': summary['total_expenses'],
+            'total_expense_amount': summary['total_expense_amount'],
+            'upcoming_expenses': summary['upcoming_expenses']
+        }
         
-        # Get transaction stats for current user (THIS IS WHAT DETERMINES THE BALANCE)
-        cursor.execute("""
-            SELECT 
-                COUNT(*) as total_transactions,
-                COALESCE(SUM(CASE WHEN transaction_type = 'debit' THEN amount ELSE 0 END), 0) as total_debits,
-                COALESCE(SUM(CASE WHEN transaction_type = 'credit' THEN amount ELSE 0 END), 0) as total_credits,
-                COALESCE(SUM(CASE WHEN transaction_type = 'credit' AND (payment_method = 'cash' OR payment_method IS NULL) THEN amount ELSE 0 END), 0) as cash_credits,
-                COALESCE(SUM(CASE WHEN transaction_type = 'credit' AND payment_method = 'online' THEN amount ELSE 0 END), 0) as bank_credits,
-                COALESCE(SUM(CASE WHEN transaction_type = 'debit' AND (payment_method = 'cash' OR payment_method IS NULL) THEN amount ELSE 0 END), 0) as cash_debits,
-                COALESCE(SUM(CASE WHEN transaction_type = 'debit' AND payment_method = 'online' THEN amount ELSE 0 END), 0) as bank_debits
-            FROM transactions
-            WHERE user_id = %s
-        """, (session['user_id'],))
-        transaction_stats = cursor.fetchone()
+        # Transaction stats (THIS IS WHAT DETERMINES THE BALANCE)
+        transaction_stats = {
+            'total_transactions': summary['total_transactions'],
+            'total_debits': summary['total_debits'],
+            'total_credits': summary['total_credits'],
+            'cash_credits': summary['cash_credits'],
+            'bank_credits': summary['bank_credits'],
+            'cash_debits': summary['cash_debits'],
+            'bank_debits': summary['bank_debits']
+        }
         
-        # Get invoice stats for current user
-        cursor.execute("""
-            SELECT 
-                COUNT(*) as total_invoices,
-                COALESCE(SUM(total_amount), 0) as total_invoice_amount,
-                COALESCE(SUM(CASE WHEN status = 'paid' THEN total_amount ELSE 0 END), 0) as paid_amount,
-                COALESCE(SUM(CASE WHEN invoice_type = 'in' THEN total_amount ELSE 0 END), 0) as in_invoice_amount,
-                COALESCE(SUM(CASE WHEN invoice_type = 'out' THEN total_amount ELSE 0 END), 0) as out_invoice_amount
-            FROM invoices
-            WHERE user_id = %s
-        """, (session['user_id'],))
-        invoice_stats = cursor.fetchone()
+        invoice_stats = {
+            'total_invoices': summary['total_invoices'],
+            'total_invoice_amount': summary['total_invoice_amount'],
+            'paid_amount': summary['paid_amount'],
+            'in_invoice_amount': summary['in_invoice_amount'],
+            'out_invoice_amount': summary['out_invoice_amount']
+        }
         
         # Get recent expenses
         cursor.execute("""
@@ -7593,44 +7365,19 @@ def get_dashboard_stats():
         """, (session['user_id'],))
         upcoming_expenses = cursor.fetchall()
         
-        # Calculate overdue amounts with detailed statistics
         # Incoming overdue: Invoices that are overdue (money we should receive)
-        cursor.execute("""
-            SELECT 
-                COALESCE(SUM(total_amount), 0) as incoming_overdue,
-                COUNT(*) as overdue_invoice_count
-            FROM invoices 
-            WHERE user_id = %s AND status = 'overdue'
-        """, (session['user_id'],))
-        incoming_overdue_data = cursor.fetchone()
-        incoming_overdue = incoming_overdue_data['incoming_overdue']
-        overdue_invoice_count = incoming_overdue_data['overdue_invoice_count']
+        incoming_overdue = summary['incoming_overdue']
+        overdue_invoice_count = summary['overdue_invoice_count']
         
         # Outgoing overdue: Upcoming expenses (money we need to pay out)
-        cursor.execute("""
-            SELECT 
-                COALESCE(SUM(amount), 0) as outgoing_overdue,
-                COUNT(*) as upcoming_expense_count
-            FROM expenses 
-            WHERE user_id = %s AND expense_type = 'upcoming'
-        """, (session['user_id'],))
-        outgoing_overdue_data = cursor.fetchone()
-        outgoing_overdue = outgoing_overdue_data['outgoing_overdue']
-        upcoming_expense_count = outgoing_overdue_data['upcoming_expense_count']
+        outgoing_overdue = summary['upcoming_expenses']
+        upcoming_expense_count = summary['upcoming_expense_count']
         
         # Get stored bank account balances and default bank info BEFORE closing connection
-        cursor.execute("""
-            SELECT 
-                SUM(current_balance) as total_bank_balance,
-                SUM(CASE WHEN is_default = TRUE THEN current_balance ELSE 0 END) as default_bank_balance,
-                SUM(CASE WHEN is_default = TRUE THEN 1 ELSE 0 END) as has_default_bank
-            FROM bank_accounts 
-            WHERE user_id = %s
-        """, (session['user_id'],))
-        bank_result = cursor.fetchone()
-        stored_bank_balance = float(bank_result['total_bank_balance'] or 0)
-        default_bank_balance = float(bank_result['default_bank_balance'] or 0)
-        has_default_bank = bool(bank_result['has_default_bank'])
+        banks = cached_bank_accounts(connection, session['user_id'])
+        stored_bank_balance = float(sum(bank['current_balance'] or 0 for bank in banks))
+        default_bank_balance = float(sum(bank['current_balance'] or 0 for bank in banks if bank['is_default']))
+        has_default_bank = any(bank['is_default'] for bank in banks)
         
         # Get actual cash balance from users table
         cursor.execute("SELECT cash_balance FROM users WHERE id = %s", (session['user_id'],))
@@ -7644,19 +7391,6 @@ def get_dashboard_stats():
         cursor.close()
         connection.close()
         
-        # Convert dates to strings for JSON serialization
-        for expense in recent_expenses:
-            if expense['expense_date']:
-                expense['expense_date'] = expense['expense_date'].isoformat()
-        
-        for invoice in overdue_invoices:
-            if invoice['due_date']:
-                invoice['due_date'] = invoice['due_date'].isoformat()
-        
-        for expense in upcoming_expenses:
-            if expense['expense_date']:
-                expense['expense_date'] = expense['expense_date'].isoformat()
-        
         return jsonify({
             'expenses': expense_stats,
             'transactions': transaction_stats,
@@ -7751,6 +7485,7 @@ def update_profile():
         connection.commit()
         cursor.close()
         connection.close()
+        reference_cache.invalidate(session['user_id'], 'profile')
         
         return jsonify({'message': 'Profile updated successfully'})
         
@@ -7819,21 +7554,20 @@ def get_settings():
         if not connection:
             return jsonify({'error': 'Database connection failed'}), 500
         
-        cursor = connection.cursor(dictionary=True)
-        cursor.execute("""
-            SELECT currency, date_format, theme, email_notifications, two_factor_auth
-            FROM user_settings 
-            WHERE user_id = %s
-        """, (session['user_id'],))
-        settings = cursor.fetchone()
+        row = cached_user_settings(connection, session['user_id'])
         
-        if not settings:
+        if row:
+            settings = {name: row.get(name) for name in ('currency', 'date_format', 'theme', 'email_notifications', 'two_factor_auth')}
+        else:
             # Create default settings if none exist
+            cursor = connection.cursor()
             cursor.execute("""
                 INSERT INTO user_settings (user_id, currency, date_format, theme, email_notifications, two_factor_auth)
                 VALUES (%s, 'INR', 'DD/MM/YYYY', 'light', TRUE, FALSE)
             """, (session['user_id'],))
             connection.commit()
+            cursor.close()
+            reference_cache.invalidate(session['user_id'], 'user_settings')
             
             settings = {
                 'currency': 'INR',
@@ -7843,7 +7577,6 @@ def get_settings():
                 'two_factor_auth': False
             }
         
-        cursor.close()
         connection.close()
         
         return jsonify(settings)
@@ -7887,119 +7620,85 @@ def update_settings():
         connection.commit()
         cursor.close()
         connection.close()
+        reference_cache.invalidate(session['user_id'], 'user_settings')
         
         return jsonify({'message': 'Settings updated successfully'})
         
     except Exception as e:
         return jsonify({'error': str(e)}), 400
 
+# Sections of the full account export, in output order: (key, query, single_row)
+ACCOUNT_EXPORT_SECTIONS = [
+    ('user_info', "SELECT id, username, email, first_name, last_name, created_at FROM users WHERE id = %s", True),
+    ('expenses', "SELECT * FROM expenses WHERE user_id = %s", False),
+    ('transactions', "SELECT * FROM transactions WHERE user_id = %s", False),
+    ('invoices', "SELECT * FROM invoices WHERE user_id = %s", False),
+    ('invoice_items', """
+        SELECT ii.* FROM invoice_items ii 
+        JOIN invoices i ON ii.invoice_id = i.id 
+        WHERE i.user_id = %s
+    """, False),
+    ('company_settings', "SELECT * FROM company_settings WHERE user_id = %s LIMIT 1", True),
+]
+
+def account_export_json(connection, user_id):
+    """Yield the account export as one JSON object, a section at a time"""
+    yield '{'
+    for key, query, single_row in ACCOUNT_EXPORT_SECTIONS:
+        rows = iter_rows(connection, query, (user_id,))
+        if single_row:
+            row = next(rows, None)
+            rows.close()
+            yield f'{to_json(key)}: {to_json(row)}, '
+            continue
+        yield f'{to_json(key)}: ['
+        first = True
+        for row in rows:
+            yield ('' if first else ', ') + to_json(row)
+            first = False
+        yield '], '
+    yield f'"exported_at": {to_json(datetime.now().isoformat())}}}'
+
+def account_export_records(connection, user_id):
+    """Yield {'type', 'data'} records for the NDJSON account export"""
+    for key, query, single_row in ACCOUNT_EXPORT_SECTIONS:
+        for row in iter_rows(connection, query, (user_id,)):
+            yield {'type': key, 'data': row}
+
+def account_export_csv_rows(connection, user_id):
+    """Yield the simplified Type/Description/Amount/Date rows for the CSV account export"""
+    for row in iter_rows(connection, "SELECT title, amount, expense_date FROM expenses WHERE user_id = %s", (user_id,)):
+        yield {'Type': 'Expense', 'Description': row['title'], 'Amount': row['amount'], 'Date': row['expense_date']}
+    for row in iter_rows(connection, "SELECT description, amount, transaction_date FROM transactions WHERE user_id = %s", (user_id,)):
+        yield {'Type': 'Transaction', 'Description': row['description'], 'Amount': row['amount'], 'Date': row['transaction_date']}
+
 @app.route('/api/export/all', methods=['GET'])
 @login_required
 def export_all_user_data():
+    """Stream every record the user owns as JSON, NDJSON or CSV (?compress=gzip to gzip it)"""
     try:
         format_type = request.args.get('format', 'json')
+        compress = request.args.get('compress') == 'gzip'
+        if format_type not in ('json', 'ndjson', 'csv'):
+            return jsonify({'error': 'Unsupported format'}), 400
         
         connection = get_db_connection()
         if not connection:
             return jsonify({'error': 'Database connection failed'}), 500
         
-        cursor = connection.cursor(dictionary=True)
-        
-        # Get all user data
-        data = {
-            'user_info': {},
-            'expenses': [],
-            'transactions': [],
-            'invoices': [],
-            'invoice_items': [],
-            'company_settings': {},
-            'exported_at': datetime.now().isoformat()
-        }
-        
-        # Get user info
-        cursor.execute("SELECT id, username, email, first_name, last_name, created_at FROM users WHERE id = %s", (session['user_id'],))
-        data['user_info'] = cursor.fetchone()
-        
-        # Get expenses
-        cursor.execute("SELECT * FROM expenses WHERE user_id = %s", (session['user_id'],))
-        expenses = cursor.fetchall()
-        for expense in expenses:
-            if expense['expense_date']:
-                expense['expense_date'] = expense['expense_date'].isoformat()
-            if expense['created_at']:
-                expense['created_at'] = expense['created_at'].isoformat()
-            if expense['updated_at']:
-                expense['updated_at'] = expense['updated_at'].isoformat()
-        data['expenses'] = expenses
-        
-        # Get transactions
-        cursor.execute("SELECT * FROM transactions WHERE user_id = %s", (session['user_id'],))
-        transactions = cursor.fetchall()
-        for transaction in transactions:
-            if transaction['transaction_date']:
-                transaction['transaction_date'] = transaction['transaction_date'].isoformat()
-            if transaction['created_at']:
-                transaction['created_at'] = transaction['created_at'].isoformat()
-            if transaction['updated_at']:
-                transaction['updated_at'] = transaction['updated_at'].isoformat()
-        data['transactions'] = transactions
-        
-        # Get invoices
-        cursor.execute("SELECT * FROM invoices WHERE user_id = %s", (session['user_id'],))
-        invoices = cursor.fetchall()
-        for invoice in invoices:
-            if invoice['invoice_date']:
-                invoice['invoice_date'] = invoice['invoice_date'].isoformat()
-            if invoice['due_date']:
-                invoice['due_date'] = invoice['due_date'].isoformat()
-            if invoice['created_at']:
-                invoice['created_at'] = invoice['created_at'].isoformat()
-            if invoice['updated_at']:
-                invoice['updated_at'] = invoice['updated_at'].isoformat()
-        data['invoices'] = invoices
-        
-        # Get invoice items
-        cursor.execute("""
-            SELECT ii.* FROM invoice_items ii 
-            JOIN invoices i ON ii.invoice_id = i.id 
-            WHERE i.user_id = %s
-        """, (session['user_id'],))
-        data['invoice_items'] = cursor.fetchall()
-        
-        # Get company settings
-        cursor.execute("SELECT * FROM company_settings WHERE user_id = %s", (session['user_id'],))
-        company_settings = cursor.fetchone()
-        if company_settings:
-            if company_settings['created_at']:
-                company_settings['created_at'] = company_settings['created_at'].isoformat()
-            if company_settings['updated_at']:
-                company_settings['updated_at'] = company_settings['updated_at'].isoformat()
-        data['company_settings'] = company_settings
-        
-        cursor.close()
-        connection.close()
-        
+        user_id = session['user_id']
         if format_type == 'json':
-            return jsonify(data)
-        elif format_type == 'csv':
-            # Convert to CSV format (simplified)
-            import csv
-            import io
-            output = io.StringIO()
-            writer = csv.writer(output)
-            
-            # Write expenses
-            writer.writerow(['Type', 'Description', 'Amount', 'Date'])
-            for expense in data['expenses']:
-                writer.writerow(['Expense', expense['title'], expense['amount'], expense['expense_date']])
-            
-            for transaction in data['transactions']:
-                writer.writerow(['Transaction', transaction['description'], transaction['amount'], transaction['transaction_date']])
-            
-            output.seek(0)
-            return Response(output.getvalue(), mimetype='text/csv', headers={'Content-Disposition': 'attachment; filename=expense_data.csv'})
+            chunks = account_export_json(connection, user_id)
+            filename = 'expense_data.json'
+        elif format_type == 'ndjson':
+            chunks = ndjson_chunks(account_export_records(connection, user_id))
+            filename = 'expense_data.ndjson'
         else:
-            return jsonify({'error': 'Unsupported format'}), 400
+            chunks = csv_chunks(account_export_csv_rows(connection, user_id),
+                                fieldnames=['Type', 'Description', 'Amount', 'Date'])
+            filename = 'expense_data.csv'
+        
+        return stream_export(chunks, filename, format_type, compress=compress, on_close=connection.close)
         
     except Exception as e:
         return jsonify({'error': str(e)}), 400
@@ -8075,13 +7774,6 @@ def get_templates():
         """, (session['user_id'],))
         templates = cursor.fetchall()
         
-        # Convert date objects to strings
-        for template in templates:
-            if template['created_at']:
-                template['created_at'] = template['created_at'].isoformat()
-            if template['updated_at']:
-                template['updated_at'] = template['updated_at'].isoformat()
-        
         cursor.close()
         connection.close()
         return jsonify(templates)
@@ -8657,272 +8349,178 @@ def admin_delete_user(user_id):
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)})
 
+def build_user_data_export(params, progress, folder):
+    """Export job: one user's profile, expenses, transactions, invoices and items as XLSX"""
+    import pandas as pd
+    
+    user_id = params['user_id']
+    connection = get_db_connection()
+    if not connection:
+        raise RuntimeError('Database connection failed')
+    
+    cursor = connection.cursor(dictionary=True)
+    try:
+        cursor.execute("SELECT * FROM users WHERE id = %s", (user_id,))
+        user = cursor.fetchone()
+        if not user:
+            raise ValueError('User not found')
+        progress(10, 'Loading records')
+        
+        # Get user's expenses with detailed information
+        cursor.execute("""
+            SELECT 
+                id, expense_type, category, amount, title, description, 
+                expense_date, bill_file, created_at, updated_at
+            FROM expenses 
+            WHERE user_id = %s 
+            ORDER BY expense_date DESC
+        """, (user_id,))
+        expenses = cursor.fetchall()
+        
+        # Get user's transactions with detailed information
+        cursor.execute("""
+            SELECT 
+                id, transaction_type, amount, title, description, purpose, utr_number,
+                transaction_date, category, receipt_file, created_at, updated_at
+            FROM transactions 
+            WHERE user_id = %s 
+            ORDER BY transaction_date DESC
+        """, (user_id,))
+        transactions = cursor.fetchall()
+        
+        # Get user's invoices with detailed information
+        cursor.execute("""
+            SELECT 
+                id, invoice_number, client_name, client_email, client_address, client_phone,
+                invoice_date, due_date, subtotal, tax_rate, tax_amount, 
+                total_amount, status, notes, created_at, updated_at
+            FROM invoices 
+            WHERE user_id = %s 
+            ORDER BY invoice_date DESC
+        """, (user_id,))
+        invoices = cursor.fetchall()
+        
+        # Get invoice items if they exist
+        invoice_items = []
+        if invoices:
+            invoice_ids = [invoice['id'] for invoice in invoices]
+            placeholders = ','.join(['%s'] * len(invoice_ids))
+            cursor.execute(f"""
+                SELECT 
+                    id, invoice_id, description, quantity, 
+                    unit_price, total_price
+                FROM invoice_items 
+                WHERE invoice_id IN ({placeholders})
+                ORDER BY invoice_id, id
+            """, invoice_ids)
+            invoice_items = cursor.fetchall()
+    finally:
+        cursor.close()
+        connection.close()
+    
+    progress(50, 'Loaded records')
+    
+    # Create Excel file
+    timestamp = get_india_time().strftime('%Y%m%d_%H%M%S')
+    filename = f'user_data_{user["username"]}_{timestamp}.xlsx'
+    filepath = os.path.join(folder, filename)
+    progress(60, 'Writing workbook')
+    
+    with pd.ExcelWriter(filepath, engine='openpyxl') as writer:
+        # User details sheet
+        user_details = {
+            'User ID': user['id'],
+            'Username': user['username'],
+            'Email': user['email'],
+            'First Name': user['first_name'],
+            'Last Name': user['last_name'],
+            'Is Active': 'Yes' if user['is_active'] else 'No',
+            'Is Admin': 'Yes' if user['is_admin'] else 'No',
+            'Created At': format_india_time(user['created_at']),
+            'Last Login': format_india_time(user['last_login']) if user['last_login'] else 'Never',
+            'Updated At': format_india_time(user['updated_at'])
+        }
+        user_df = pd.DataFrame([user_details])
+        user_df.to_excel(writer, sheet_name='User_Details', index=False)
+        
+        # Expenses sheet
+        if expenses:
+            # Format dates for better readability
+            for expense in expenses:
+                if expense['expense_date']:
+                    expense['expense_date'] = format_india_time(expense['expense_date'])
+                if expense['created_at']:
+                    expense['created_at'] = format_india_time(expense['created_at'])
+                if expense['updated_at']:
+                    expense['updated_at'] = format_india_time(expense['updated_at'])
+            
+            expenses_df = pd.DataFrame(expenses)
+            expenses_df.to_excel(writer, sheet_name='Expenses', index=False)
+        else:
+            pd.DataFrame(columns=['No expenses found for this user']).to_excel(writer, sheet_name='Expenses', index=False)
+        
+        # Transactions sheet
+        if transactions:
+            # Format dates for better readability
+            for transaction in transactions:
+                if transaction['transaction_date']:
+                    transaction['transaction_date'] = format_india_time(transaction['transaction_date'])
+                if transaction['created_at']:
+                    transaction['created_at'] = format_india_time(transaction['created_at'])
+                if transaction['updated_at']:
+                    transaction['updated_at'] = format_india_time(transaction['updated_at'])
+            
+            transactions_df = pd.DataFrame(transactions)
+            transactions_df.to_excel(writer, sheet_name='Transactions', index=False)
+        else:
+            pd.DataFrame(columns=['No transactions found for this user']).to_excel(writer, sheet_name='Transactions', index=False)
+        
+        # Invoices sheet
+        if invoices:
+            # Format dates for better readability
+            for invoice in invoices:
+                if invoice['invoice_date']:
+                    invoice['invoice_date'] = format_india_time(invoice['invoice_date'])
+                if invoice['due_date']:
+                    invoice['due_date'] = format_india_time(invoice['due_date'])
+                if invoice['created_at']:
+                    invoice['created_at'] = format_india_time(invoice['created_at'])
+                if invoice['updated_at']:
+                    invoice['updated_at'] = format_india_time(invoice['updated_at'])
+            
+            invoices_df = pd.DataFrame(invoices)
+            invoices_df.to_excel(writer, sheet_name='Invoices', index=False)
+        else:
+            pd.DataFrame(columns=['No invoices found for this user']).to_excel(writer, sheet_name='Invoices', index=False)
+        
+        # Invoice Items sheet (if any invoices exist)
+        if invoice_items:
+            invoice_items_df = pd.DataFrame(invoice_items)
+            invoice_items_df.to_excel(writer, sheet_name='Invoice_Items', index=False)
+        elif invoices:
+            pd.DataFrame(columns=['No invoice items found']).to_excel(writer, sheet_name='Invoice_Items', index=False)
+    
+    return filepath, filename
+
 @app.route('/admin/api/users/<int:user_id>/export-data')
 @admin_required
 def admin_export_user_data(user_id):
+    """Queue an XLSX export of one user's data"""
     try:
         connection = get_db_connection()
-        if connection:
-            cursor = connection.cursor(dictionary=True)
-            
-            # Get user details
-            cursor.execute("SELECT * FROM users WHERE id = %s", (user_id,))
-            user = cursor.fetchone()
-            
-            if not user:
-                cursor.close()
-                connection.close()
-                return jsonify({'error': 'User not found'}), 404
-            
-            # Get user's expenses with detailed information
-            cursor.execute("""
-                SELECT 
-                    id, expense_type, category, amount, title, description, 
-                    expense_date, bill_file, created_at, updated_at
-                FROM expenses 
-                WHERE user_id = %s 
-                ORDER BY expense_date DESC
-            """, (user_id,))
-            expenses = cursor.fetchall()
-            
-            # Get user's transactions with detailed information
-            cursor.execute("""
-                SELECT 
-                    id, transaction_type, amount, title, description, purpose, utr_number,
-                    transaction_date, category, receipt_file, created_at, updated_at
-                FROM transactions 
-                WHERE user_id = %s 
-                ORDER BY transaction_date DESC
-            """, (user_id,))
-            transactions = cursor.fetchall()
-            
-            # Get user's invoices with detailed information
-            cursor.execute("""
-                SELECT 
-                    id, invoice_number, client_name, client_email, client_address, client_phone,
-                    invoice_date, due_date, subtotal, tax_rate, tax_amount, 
-                    total_amount, status, notes, created_at, updated_at
-                FROM invoices 
-                WHERE user_id = %s 
-                ORDER BY invoice_date DESC
-            """, (user_id,))
-            invoices = cursor.fetchall()
-            
-            # Get invoice items if they exist
-            invoice_items = []
-            if invoices:
-                invoice_ids = [invoice['id'] for invoice in invoices]
-                placeholders = ','.join(['%s'] * len(invoice_ids))
-                cursor.execute(f"""
-                    SELECT 
-                        id, invoice_id, description, quantity, 
-                        unit_price, total_price
-                    FROM invoice_items 
-                    WHERE invoice_id IN ({placeholders})
-                    ORDER BY invoice_id, id
-                """, invoice_ids)
-                invoice_items = cursor.fetchall()
-            
-            cursor.close()
-            connection.close()
-            
-            # Create Excel file
-            timestamp = get_india_time().strftime('%Y%m%d_%H%M%S')
-            filename = f'user_data_{user["username"]}_{timestamp}.xlsx'
-            filepath = os.path.join(EXPORT_FOLDER, filename)
-            
-            with pd.ExcelWriter(filepath, engine='openpyxl') as writer:
-                # User details sheet
-                user_details = {
-                    'User ID': user['id'],
-                    'Username': user['username'],
-                    'Email': user['email'],
-                    'First Name': user['first_name'],
-                    'Last Name': user['last_name'],
-                    'Is Active': 'Yes' if user['is_active'] else 'No',
-                    'Is Admin': 'Yes' if user['is_admin'] else 'No',
-                    'Created At': format_india_time(user['created_at']),
-                    'Last Login': format_india_time(user['last_login']) if user['last_login'] else 'Never',
-                    'Updated At': format_india_time(user['updated_at'])
-                }
-                user_df = pd.DataFrame([user_details])
-                user_df.to_excel(writer, sheet_name='User_Details', index=False)
-                
-                # Expenses sheet
-                if expenses:
-                    # Format dates for better readability
-                    for expense in expenses:
-                        if expense['expense_date']:
-                            expense['expense_date'] = format_india_time(expense['expense_date'])
-                        if expense['created_at']:
-                            expense['created_at'] = format_india_time(expense['created_at'])
-                        if expense['updated_at']:
-                            expense['updated_at'] = format_india_time(expense['updated_at'])
-                    
-                    expenses_df = pd.DataFrame(expenses)
-                    expenses_df.to_excel(writer, sheet_name='Expenses', index=False)
-                else:
-                    pd.DataFrame(columns=['No expenses found for this user']).to_excel(writer, sheet_name='Expenses', index=False)
-                
-                # Transactions sheet
-                if transactions:
-                    # Format dates for better readability
-                    for transaction in transactions:
-                        if transaction['transaction_date']:
-                            transaction['transaction_date'] = format_india_time(transaction['transaction_date'])
-                        if transaction['created_at']:
-                            transaction['created_at'] = format_india_time(transaction['created_at'])
-                        if transaction['updated_at']:
-                            transaction['updated_at'] = format_india_time(transaction['updated_at'])
-                    
-                    transactions_df = pd.DataFrame(transactions)
-                    transactions_df.to_excel(writer, sheet_name='Transactions', index=False)
-                else:
-                    pd.DataFrame(columns=['No transactions found for this user']).to_excel(writer, sheet_name='Transactions', index=False)
-                
-                # Invoices sheet
-                if invoices:
-                    # Format dates for better readability
-                    for invoice in invoices:
-                        if invoice['invoice_date']:
-                            invoice['invoice_date'] = format_india_time(invoice['invoice_date'])
-                        if invoice['due_date']:
-                            invoice['due_date'] = format_india_time(invoice['due_date'])
-                        if invoice['created_at']:
-                            invoice['created_at'] = format_india_time(invoice['created_at'])
-                        if invoice['updated_at']:
-                            invoice['updated_at'] = format_india_time(invoice['updated_at'])
-                    
-                    invoices_df = pd.DataFrame(invoices)
-                    invoices_df.to_excel(writer, sheet_name='Invoices', index=False)
-                else:
-                    pd.DataFrame(columns=['No invoices found for this user']).to_excel(writer, sheet_name='Invoices', index=False)
-                
-                # Invoice Items sheet (if any invoices exist)
-                if invoice_items:
-                    invoice_items_df = pd.DataFrame(invoice_items)
-                    invoice_items_df.to_excel(writer, sheet_name='Invoice_Items', index=False)
-                elif invoices:
-                    pd.DataFrame(columns=['No invoice items found']).to_excel(writer, sheet_name='Invoice_Items', index=False)
-            
-            log_audit_event(admin_id=session['admin_id'], action='EXPORT_USER_DATA', table_name='users', record_id=user_id)
-            
-            return send_file(filepath, as_attachment=True, download_name=filename)
-            
-            # Get user's invoices with detailed information
-            cursor.execute("""
-                SELECT 
-                    id, invoice_number, client_name, client_email, client_address, client_phone,
-                    invoice_date, due_date, subtotal, tax_rate, tax_amount, 
-                    total_amount, status, notes, created_at, updated_at
-                FROM invoices 
-                WHERE user_id = %s 
-                ORDER BY invoice_date DESC
-            """, (user_id,))
-            invoices = cursor.fetchall()
-            
-            # Get invoice items if they exist
-            invoice_items = []
-            if invoices:
-                invoice_ids = [invoice['id'] for invoice in invoices]
-                placeholders = ','.join(['%s'] * len(invoice_ids))
-                cursor.execute(f"""
-                    SELECT 
-                        id, invoice_id, description, quantity, 
-                        unit_price, total_price
-                    FROM invoice_items 
-                    WHERE invoice_id IN ({placeholders})
-                    ORDER BY invoice_id, id
-                """, invoice_ids)
-                invoice_items = cursor.fetchall()
-            
-            cursor.close()
-            connection.close()
-            
-            # Create Excel file
-            timestamp = get_india_time().strftime('%Y%m%d_%H%M%S')
-            filename = f'user_data_{user["username"]}_{timestamp}.xlsx'
-            filepath = os.path.join(EXPORT_FOLDER, filename)
-            
-            with pd.ExcelWriter(filepath, engine='openpyxl') as writer:
-                # User details sheet
-                user_details = {
-                    'User ID': user['id'],
-                    'Username': user['username'],
-                    'Email': user['email'],
-                    'First Name': user['first_name'],
-                    'Last Name': user['last_name'],
-                    'Is Active': 'Yes' if user['is_active'] else 'No',
-                    'Is Admin': 'Yes' if user['is_admin'] else 'No',
-                    'Created At': format_india_time(user['created_at']),
-                    'Last Login': format_india_time(user['last_login']) if user['last_login'] else 'Never',
-                    'Updated At': format_india_time(user['updated_at'])
-                }
-                user_df = pd.DataFrame([user_details])
-                user_df.to_excel(writer, sheet_name='User_Details', index=False)
-                
-                # Expenses sheet
-                if expenses:
-                    # Format dates for better readability
-                    for expense in expenses:
-                        if expense['expense_date']:
-                            expense['expense_date'] = format_india_time(expense['expense_date'])
-                        if expense['created_at']:
-                            expense['created_at'] = format_india_time(expense['created_at'])
-                        if expense['updated_at']:
-                            expense['updated_at'] = format_india_time(expense['updated_at'])
-                    
-                    expenses_df = pd.DataFrame(expenses)
-                    expenses_df.to_excel(writer, sheet_name='Expenses', index=False)
-                else:
-                    pd.DataFrame(columns=['No expenses found for this user']).to_excel(writer, sheet_name='Expenses', index=False)
-                
-                # Transactions sheet
-                if transactions:
-                    # Format dates for better readability
-                    for transaction in transactions:
-                        if transaction['transaction_date']:
-                            transaction['transaction_date'] = format_india_time(transaction['transaction_date'])
-                        if transaction['created_at']:
-                            transaction['created_at'] = format_india_time(transaction['created_at'])
-                        if transaction['updated_at']:
-                            transaction['updated_at'] = format_india_time(transaction['updated_at'])
-                    
-                    transactions_df = pd.DataFrame(transactions)
-                    transactions_df.to_excel(writer, sheet_name='Transactions', index=False)
-                else:
-                    pd.DataFrame(columns=['No transactions found for this user']).to_excel(writer, sheet_name='Transactions', index=False)
-                
-                # Invoices sheet
-                if invoices:
-                    # Format dates for better readability
-                    for invoice in invoices:
-                        if invoice['invoice_date']:
-                            invoice['invoice_date'] = format_india_time(invoice['invoice_date'])
-                        if invoice['due_date']:
-                            invoice['due_date'] = format_india_time(invoice['due_date'])
-                        if invoice['created_at']:
-                            invoice['created_at'] = format_india_time(invoice['created_at'])
-                        if invoice['updated_at']:
-                            invoice['updated_at'] = format_india_time(invoice['updated_at'])
-                    
-                    invoices_df = pd.DataFrame(invoices)
-                    invoices_df.to_excel(writer, sheet_name='Invoices', index=False)
-                else:
-                    pd.DataFrame(columns=['No invoices found for this user']).to_excel(writer, sheet_name='Invoices', index=False)
-                
-                # Invoice Items sheet (if any invoices exist)
-                if invoice_items:
-                    invoice_items_df = pd.DataFrame(invoice_items)
-                    invoice_items_df.to_excel(writer, sheet_name='Invoice_Items', index=False)
-                elif invoices:
-                    pd.DataFrame(columns=['No invoice items found']).to_excel(writer, sheet_name='Invoice_Items', index=False)
-            
-            log_audit_event(admin_id=session['admin_id'], action='EXPORT_USER_DATA', table_name='users', record_id=user_id)
-            
-            return send_file(filepath, as_attachment=True, download_name=filename)
+        if not connection:
+            return jsonify({'error': 'Database connection failed'}), 500
+        cursor = connection.cursor()
+        cursor.execute("SELECT id FROM users WHERE id = %s", (user_id,))
+        user = cursor.fetchone()
+        cursor.close()
+        connection.close()
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
         
-        return jsonify({'error': 'Database connection failed'}), 500
+        response = enqueue_admin_export('user_data', {'user_id': user_id})
+        log_audit_event(admin_id=session['admin_id'], action='EXPORT_USER_DATA', table_name='users', record_id=user_id)
+        return response
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -9228,114 +8826,185 @@ def admin_chart_data():
             activity_labels.append(item['date'].strftime('%m/%d'))
             activity_counts.append(item['count'])
         
-        return jsonify({
-            'active_users': active_users,
-            'inactive_users': inactive_users,
-            'admin_users': admin_users,
-            'activity_labels': activity_labels,
-            'activity_data': activity_counts
-        })
+        return jsonify({
+            'active_users': active_users,
+            'inactive_users': inactive_users,
+            'admin_users': admin_users,
+            'activity_labels': activity_labels,
+            'activity_data': activity_counts
+        })
+    
+    return jsonify({'error': 'Database connection failed'}), 500
+
+AUDIT_LOG_EXPORT_QUERY = """
+    SELECT al.*, u.username as user_name, au.username as admin_name
+    FROM audit_logs al
+    LEFT JOIN users u ON al.user_id = u.id
+    LEFT JOIN admin_users au ON al.admin_id = au.id
+    ORDER BY al.created_at DESC
+"""
+
+def build_all_data_export(params, progress, folder):
+    """Export job: every user (with record counts) plus the audit log as XLSX"""
+    import pandas as pd
+    
+    connection = get_db_connection()
+    if not connection:
+        raise RuntimeError('Database connection failed')
+    
+    cursor = connection.cursor(dictionary=True)
+    try:
+        # Record counts come from the trigger-maintained summary instead of a
+        # 4-way LEFT JOIN with COUNT(DISTINCT ...) over every user's rows
+        cursor.execute("""
+            SELECT u.*, 
+                   COALESCE(s.total_expenses, 0) as expenses_count,
+                   COALESCE(s.total_transactions, 0) as transactions_count,
+                   COALESCE(s.total_invoices, 0) as invoices_count
+            FROM users u
+            LEFT JOIN user_financial_summary s ON s.user_id = u.id
+            ORDER BY u.created_at DESC
+        """)
+        users_data = cursor.fetchall()
+        progress(20, 'Loaded users')
+        
+        cursor.execute(AUDIT_LOG_EXPORT_QUERY)
+        audit_data = cursor.fetchall()
+        progress(50, 'Loaded audit logs')
+    finally:
+        cursor.close()
+        connection.close()
+    
+    timestamp = get_india_time().strftime('%Y%m%d_%H%M%S')
+    filename = f'admin_export_all_data_{timestamp}.xlsx'
+    filepath = os.path.join(folder, filename)
+    
+    with pd.ExcelWriter(filepath, engine='openpyxl') as writer:
+        # Users sheet
+        users_df = pd.DataFrame(users_data)
+        users_df.to_excel(writer, sheet_name='Users', index=False)
+        progress(75, 'Wrote users sheet')
+        
+        # Audit logs sheet
+        audit_df = pd.DataFrame(audit_data)
+        audit_df.to_excel(writer, sheet_name='Audit_Logs', index=False)
+    
+    return filepath, filename
+
+def build_audit_logs_export(params, progress, folder):
+    """Export job: the audit log as CSV, streamed from the database to disk"""
+    connection = get_db_connection()
+    if not connection:
+        raise RuntimeError('Database connection failed')
+    
+    timestamp = get_india_time().strftime('%Y%m%d_%H%M%S')
+    filename = f'audit_logs_{timestamp}.csv'
+    filepath = os.path.join(folder, filename)
+    
+    try:
+        cursor = connection.cursor()
+        cursor.execute("SELECT COUNT(*) FROM audit_logs")
+        total = cursor.fetchone()[0] or 1
+        cursor.close()
+        
+        written = 0
+        with open(filepath, 'w', newline='', encoding='utf-8') as csvfile:
+            for chunk in csv_chunks(iter_rows(connection, AUDIT_LOG_EXPORT_QUERY)):
+                csvfile.write(chunk)
+                written += chunk.count('\n')
+                progress(min(95, written * 100 // total), f'Wrote {written} rows')
+    finally:
+        connection.close()
     
-    return jsonify({'error': 'Database connection failed'}), 500
+    return filepath, filename
+
+def export_job_response(job):
+    """JSON body describing an admin export job"""
+    return {
+        'id': job['id'],
+        'job_type': job['job_type'],
+        'status': job['status'],
+        'progress': job['progress'],
+        'message': job['message'],
+        'error': job['error'],
+        'filename': job['filename'],
+        'created_at': job['created_at'].isoformat() if job['created_at'] else None,
+        'finished_at': job['finished_at'].isoformat() if job['finished_at'] else None,
+        'expires_at': job['expires_at'].isoformat() if job['expires_at'] else None,
+        'status_url': url_for('admin_get_export_job', job_id=job['id']),
+        'download_url': url_for('admin_download_export_job', job_id=job['id']) if job['status'] == EXPORT_JOB_DONE else None
+    }
+
+def enqueue_admin_export(job_type, params=None):
+    """Queue an export job and return a 202 response pointing at its status"""
+    job_id = export_job_queue.enqueue(job_type, params, admin_id=session.get('admin_id'))
+    if job_id is None:
+        return jsonify({'error': 'Database connection failed'}), 500
+    return jsonify({'success': True, 'job': export_job_response(export_job_queue.get(job_id))}), 202
 
 @app.route('/admin/api/export-all-data')
 @admin_required
 def admin_export_all_data():
+    """Queue an XLSX export of all users and audit logs"""
     try:
-        connection = get_db_connection()
-        if connection:
-            cursor = connection.cursor(dictionary=True)
-            
-            # Get all users data
-            cursor.execute("""
-                SELECT u.*, 
-                       COUNT(DISTINCT e.id) as expenses_count,
-                       COUNT(DISTINCT t.id) as transactions_count,
-                       COUNT(DISTINCT i.id) as invoices_count
-                FROM users u
-                LEFT JOIN expenses e ON u.id = e.user_id
-                LEFT JOIN transactions t ON u.id = t.user_id
-                LEFT JOIN invoices i ON u.id = i.user_id
-                GROUP BY u.id
-                ORDER BY u.created_at DESC
-            """)
-            users_data = cursor.fetchall()
-            
-            # Get audit logs data
-            cursor.execute("""
-                SELECT al.*, u.username as user_name, au.username as admin_name
-                FROM audit_logs al
-                LEFT JOIN users u ON al.user_id = u.id
-                LEFT JOIN admin_users au ON al.admin_id = au.id
-                ORDER BY al.created_at DESC
-            """)
-            audit_data = cursor.fetchall()
-            
-            cursor.close()
-            connection.close()
-            
-            # Create Excel file
-            timestamp = get_india_time().strftime('%Y%m%d_%H%M%S')
-            filename = f'admin_export_all_data_{timestamp}.xlsx'
-            filepath = os.path.join(EXPORT_FOLDER, filename)
-            
-            with pd.ExcelWriter(filepath, engine='openpyxl') as writer:
-                # Users sheet
-                users_df = pd.DataFrame(users_data)
-                users_df.to_excel(writer, sheet_name='Users', index=False)
-                
-                # Audit logs sheet
-                audit_df = pd.DataFrame(audit_data)
-                audit_df.to_excel(writer, sheet_name='Audit_Logs', index=False)
-            
-            log_audit_event(admin_id=session['admin_id'], action='EXPORT_ALL_DATA', table_name='system')
-            
-            return send_file(filepath, as_attachment=True, download_name=filename)
-        
-        return jsonify({'error': 'Database connection failed'}), 500
-        
+        response = enqueue_admin_export('all_data')
+        log_audit_event(admin_id=session['admin_id'], action='EXPORT_ALL_DATA', table_name='system')
+        return response
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/admin/api/export-audit-logs')
 @admin_required
 def admin_export_audit_logs():
+    """Queue a CSV export of the audit log"""
     try:
-        connection = get_db_connection()
-        if connection:
-            cursor = connection.cursor(dictionary=True)
-            cursor.execute("""
-                SELECT al.*, u.username as user_name, au.username as admin_name
-                FROM audit_logs al
-                LEFT JOIN users u ON al.user_id = u.id
-                LEFT JOIN admin_users au ON al.admin_id = au.id
-                ORDER BY al.created_at DESC
-            """)
-            audit_data = cursor.fetchall()
-            cursor.close()
-            connection.close()
-            
-            # Create CSV file
-            timestamp = get_india_time().strftime('%Y%m%d_%H%M%S')
-            filename = f'audit_logs_{timestamp}.csv'
-            filepath = os.path.join(EXPORT_FOLDER, filename)
-            
-            with open(filepath, 'w', newline='', encoding='utf-8') as csvfile:
-                if audit_data:
-                    fieldnames = audit_data[0].keys()
-                    writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-                    writer.writeheader()
-                    writer.writerows(audit_data)
-            
-            log_audit_event(admin_id=session['admin_id'], action='EXPORT_AUDIT_LOGS', table_name='audit_logs')
-            
-            return send_file(filepath, as_attachment=True, download_name=filename)
-        
-        return jsonify({'error': 'Database connection failed'}), 500
-        
+        response = enqueue_admin_export('audit_logs')
+        log_audit_event(admin_id=session['admin_id'], action='EXPORT_AUDIT_LOGS', table_name='audit_logs')
+        return response
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/admin/api/export-jobs')
+@admin_required
+def admin_list_export_jobs():
+    """Recent export jobs, newest first"""
+    jobs = export_job_queue.recent(limit=min(int(request.args.get('limit', 50)), 200))
+    if jobs is None:
+        return jsonify({'error': 'Database connection failed'}), 500
+    return jsonify({'success': True, 'jobs': [export_job_response(job) for job in jobs]})
+
+@app.route('/admin/api/export-jobs/<int:job_id>')
+@admin_required
+def admin_get_export_job(job_id):
+    """Status and progress of one export job"""
+    job = export_job_queue.get(job_id)
+    if not job:
+        return jsonify({'error': 'Export job not found'}), 404
+    return jsonify({'success': True, 'job': export_job_response(job)})
+
+@app.route('/admin/api/export-jobs/<int:job_id>/download')
+@admin_required
+def admin_download_export_job(job_id):
+    """Download the artifact of a finished export job"""
+    job = export_job_queue.get(job_id)
+    if not job:
+        return jsonify({'error': 'Export job not found'}), 404
+    if job['status'] != EXPORT_JOB_DONE:
+        return jsonify({'success': False, 'job': export_job_response(job)}), 409
+    if not job['file_path'] or not os.path.exists(job['file_path']):
+        return jsonify({'error': 'Export file has expired'}), 410
+    return send_file(job['file_path'], as_attachment=True, download_name=job['filename'])
+
+@app.route('/admin/api/export-jobs/cleanup', methods=['POST'])
+@admin_required
+def admin_cleanup_exports():
+    """Delete expired export artifacts and old files in the export folder"""
+    try:
+        result = export_job_queue.cleanup()
+        return jsonify({'success': True, **result})
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
 @app.route('/admin/api/generate-report')
 @admin_required
 def admin_generate_report():
@@ -9382,6 +9051,11 @@ def admin_generate_report():
             filename = f'admin_report_{timestamp}.pdf'
             filepath = os.path.join(EXPORT_FOLDER, filename)
             
+            from reportlab.lib.pagesizes import letter
+            from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+            from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+            from reportlab.lib import colors
+            
             doc = SimpleDocTemplate(filepath, pagesize=letter)
             elements = []
             
@@ -9488,6 +9162,116 @@ def admin_system_report():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/admin/api/db-pool')
+@admin_required
+def admin_db_pool_stats():
+    """Connection pool metrics (in-use, waits, checkouts/sec)"""
+    return jsonify(db_pool.stats())
+
+@app.route('/admin/api/audit-writer')
+@admin_required
+def admin_audit_writer_stats():
+    """Audit log writer metrics (queued, written, spilled to disk)"""
+    return jsonify(audit_sink.stats())
+
+@app.route('/admin/api/events/stream')
+@admin_required
+def admin_events_stream():
+    """Server-sent events for the admin dashboard (audited activity)"""
+    return event_stream_response(['admin'], sync=admin_stream_sync())
+
+@app.route('/admin/api/event-bus')
+@admin_required
+def admin_event_bus_stats():
+    """Push channel metrics (open subscriptions, events published/delivered)"""
+    return jsonify(event_bus.stats())
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus scrape endpoint; needs `Authorization: Bearer <METRICS_TOKEN>` or an admin session"""
+    authorized = 'admin_id' in session
+    if METRICS_TOKEN and hmac.compare_digest(request.headers.get('Authorization', ''), f"Bearer {METRICS_TOKEN}"):
+        authorized = True
+    if not authorized:
+        return jsonify({'error': 'Unauthorized'}), 401
+    return Response(request_metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/healthz')
+def liveness_probe():
+    """Liveness: the worker is answering requests (never touches the database)"""
+    return jsonify({'status': 'ok', 'pid': os.getpid()})
+
+@app.route('/readyz')
+def readiness_probe():
+    """Readiness: a pooled connection answers SELECT 1 and the pool is not exhausted"""
+    pool = db_pool.stats()
+    if pool['in_use'] >= db_pool.max_connections:
+        return jsonify({'status': 'unavailable', 'reason': 'connection pool exhausted', 'pool': pool}), 503
+    
+    connection = get_db_connection()
+    if not connection:
+        return jsonify({'status': 'unavailable', 'reason': 'database connection failed', 'pool': db_pool.stats()}), 503
+    try:
+        cursor = connection.cursor()
+        cursor.execute("SELECT 1")
+        cursor.fetchall()
+        cursor.close()
+    except Error as e:
+        return jsonify({'status': 'unavailable', 'reason': str(e), 'pool': db_pool.stats()}), 503
+    finally:
+        connection.close()
+    
+    return jsonify({'status': 'ready', 'pid': os.getpid(), 'pool': db_pool.stats()})
+
+@app.route('/admin/api/template-cache')
+@admin_required
+def admin_template_cache_stats():
+    """Compiled invoice template cache metrics (hits, misses, entries)"""
+    return jsonify(invoice_template_cache.stats())
+
+@app.route('/admin/api/reference-cache')
+@admin_required
+def admin_reference_cache_stats():
+    """Per-user reference data cache metrics (hit rate, stale entries, evictions)"""
+    return jsonify(reference_cache.stats())
+
+@app.route('/admin/api/reconcile-summaries', methods=['POST'])
+@admin_required
+def admin_reconcile_summaries():
+    """Recompute per-user financial summaries and report any drift"""
+    drift = summary_reconciler.run_once(repair=request.args.get('repair', '1') == '1')
+    if drift is None:
+        return jsonify({'success': False, 'message': 'Reconciliation already running or database unavailable'}), 409
+    return jsonify({'success': True, 'drifted_users': len(drift), 'drift': drift})
+
+@app.route('/admin/api/ledger-drift')
+@admin_required
+def admin_ledger_drift():
+    """Balance counters and source rows that disagree with the ledger"""
+    connection = get_db_connection()
+    if not connection:
+        return jsonify({'error': 'Database connection failed'}), 500
+    try:
+        drift = find_ledger_drift(connection)
+        return jsonify({'drifted_accounts': len(drift), 'drift': drift})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    finally:
+        connection.close()
+
+@app.route('/admin/api/ledger-snapshots', methods=['POST'])
+@admin_required
+def admin_ledger_snapshots():
+    """Snapshot ledger balances for ?date=YYYY-MM-DD (default: yesterday) and check drift"""
+    try:
+        snapshot_date = datetime.strptime(request.args['date'], '%Y-%m-%d').date() if request.args.get('date') else None
+    except ValueError:
+        return jsonify({'error': 'date must be YYYY-MM-DD'}), 400
+    drift = ledger_snapshotter.run_once(snapshot_date)
+    if drift is None:
+        return jsonify({'success': False, 'message': 'Snapshot already running or database unavailable'}), 409
+    return jsonify({'success': True, 'drifted_accounts': len(drift), 'drift': drift})
+
 @app.route('/admin/api/clear-old-logs', methods=['POST'])
 @admin_required
 def admin_clear_old_logs():
@@ -9549,6 +9333,81 @@ def get_cash_balance():
         return jsonify({'error': str(e)}), 500
 
 
+def parse_ledger_account(args):
+    """(account_type, account_id) from ?account=cash|bank&account_id=, or None if invalid"""
+    account_type = args.get('account', 'cash')
+    if account_type == 'cash':
+        return 'cash', session['user_id']
+    if account_type == 'bank' and args.get('account_id', '').isdigit():
+        return 'bank', int(args['account_id'])
+    return None
+
+
+@app.route('/api/ledger/balance', methods=['GET'])
+@login_required
+def get_ledger_balance():
+    """Cash or bank balance at the end of ?as_of=YYYY-MM-DD (default: today)"""
+    account = parse_ledger_account(request.args)
+    if not account:
+        return jsonify({'error': 'account must be cash, or bank with an account_id'}), 400
+    try:
+        as_of = datetime.strptime(request.args.get('as_of', date.today().isoformat()), '%Y-%m-%d').date()
+    except ValueError:
+        return jsonify({'error': 'as_of must be YYYY-MM-DD'}), 400
+    
+    connection = get_db_connection()
+    if not connection:
+        return jsonify({'error': 'Database connection failed'}), 500
+    cursor = connection.cursor()
+    try:
+        balance = balance_as_of(cursor, session['user_id'], account[0], account[1], as_of)
+        return jsonify({'account': account[0], 'account_id': account[1],
+                        'as_of': as_of.isoformat(), 'balance': float(balance)})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    finally:
+        cursor.close()
+        connection.close()
+
+
+@app.route('/api/ledger/statement', methods=['GET'])
+@login_required
+def get_ledger_statement():
+    """Opening balance, movements and closing balance between ?date_from= and ?date_to="""
+    account = parse_ledger_account(request.args)
+    if not account:
+        return jsonify({'error': 'account must be cash, or bank with an account_id'}), 400
+    try:
+        date_to = datetime.strptime(request.args.get('date_to', date.today().isoformat()), '%Y-%m-%d').date()
+        date_from = (datetime.strptime(request.args['date_from'], '%Y-%m-%d').date()
+                     if request.args.get('date_from') else date_to.replace(day=1))
+    except ValueError:
+        return jsonify({'error': 'date_from and date_to must be YYYY-MM-DD'}), 400
+    if date_from > date_to:
+        return jsonify({'error': 'date_from must not be after date_to'}), 400
+    
+    connection = get_db_connection()
+    if not connection:
+        return jsonify({'error': 'Database connection failed'}), 500
+    cursor = connection.cursor()
+    try:
+        statement = account_statement(cursor, session['user_id'], account[0], account[1], date_from, date_to)
+        return jsonify({
+            'account': account[0],
+            'account_id': account[1],
+            'date_from': date_from.isoformat(),
+            'date_to': date_to.isoformat(),
+            'opening_balance': float(statement['opening_balance']),
+            'closing_balance': float(statement['closing_balance']),
+            'entries': statement['entries']
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    finally:
+        cursor.close()
+        connection.close()
+
+
 @app.route('/api/cash-balance', methods=['POST'])
 @login_required
 def update_cash_balance():
@@ -9570,24 +9429,20 @@ def update_cash_balance():
         
         cursor = connection.cursor()
         
-        # Update cash balance in users table
-        cursor.execute("""
-            UPDATE users 
-            SET cash_balance = %s 
-            WHERE id = %s
-        """, (cash_amount, session['user_id']))
-        
-        if cursor.rowcount == 0:
-            cursor.close()
-            connection.close()
-            return jsonify({'error': 'User not found'}), 404
-        
         # Log the cash balance update
         cursor.execute("""
             INSERT INTO cash_balance_history (user_id, amount, notes, created_at)
             VALUES (%s, %s, %s, NOW())
         """, (session['user_id'], cash_amount, notes))
         
+        # Set the cash balance, journaling the difference as a manual adjustment
+        if not post_adjustment(cursor, session['user_id'], 'cash', session['user_id'], cash_amount,
+                               'cash_balance_history', cursor.lastrowid):
+            connection.rollback()
+            cursor.close()
+            connection.close()
+            return jsonify({'error': 'User not found'}), 404
+        
         connection.commit()
         cursor.close()
         connection.close()
@@ -9598,43 +9453,35 @@ def update_cash_balance():
         return jsonify({'error': str(e)}), 500
 
 
-def update_cash_balance_transaction(amount, transaction_type, user_id):
-    """Update cash balance when a cash transaction is made"""
+def update_cash_balance_transaction(amount, transaction_type, user_id, source_type, source_id):
+    """Update cash balance when a cash transaction is made. Fails the request's
+    unit of work on error, like update_bank_balance."""
+    connection = get_request_connection()
+    if not connection:
+        print("Database connection failed for cash balance update")
+        return False
+    cursor = None
     try:
-        connection = get_db_connection()
-        if not connection:
-            print("Database connection failed for cash balance update")
-            return False
-        
         cursor = connection.cursor()
         
-        if transaction_type == 'credit':
-            cursor.execute("""
-                UPDATE users 
-                SET cash_balance = cash_balance + %s 
-                WHERE id = %s
-            """, (amount, user_id))
-            print(f"Added ₹{amount} to cash balance for user {user_id}")
-        else:  # debit
-            cursor.execute("""
-                UPDATE users 
-                SET cash_balance = cash_balance - %s 
-                WHERE id = %s
-            """, (amount, user_id))
-            print(f"Deducted ₹{amount} from cash balance for user {user_id}")
-        
-        if cursor.rowcount == 0:
+        if not post_movement(cursor, user_id, 'cash', user_id, transaction_type, amount,
+                             ledger_contra(transaction_type), source_type, source_id):
             print(f"Warning: Could not update cash balance for user {user_id}")
+            fail_request_connection(connection)
             return False
+        print(f"{'Added' if transaction_type == 'credit' else 'Deducted'} ₹{amount} for cash balance of user {user_id}")
         
         connection.commit()
-        cursor.close()
-        connection.close()
         return True
         
     except Exception as e:
         print(f"Error updating cash balance: {e}")
+        fail_request_connection(connection)
         return False
+    finally:
+        if cursor is not None:
+            cursor.close()
+        connection.close()
 
 
 # Get payment details for an EMI
@@ -9987,9 +9834,8 @@ def get_sub_user_stats():
         # Get pending requests
         cursor.execute("""
             SELECT COUNT(*) as pending_requests
-            FROM sub_user_requests sur
-            JOIN sub_users su ON sur.sub_user_id = su.id
-            WHERE su.created_by = %s AND sur.status = 'pending'
+            FROM sub_user_requests
+            WHERE owner_user_id = %s AND status = 'pending'
         """, (user_id,))
         pending_requests = cursor.fetchone()['pending_requests']
         
@@ -10444,6 +10290,7 @@ def get_sub_user_recent_activity():
 
 # Sub User Expense Request API Routes
 @app.route('/api/sub-user/expense-requests', methods=['GET'])
+@conditional_collection('sub_user_requests', scope='sub_user')
 def get_sub_user_expense_requests():
     """Get sub user expense requests"""
     print(f"DEBUG: get_sub_user_expense_requests called, session keys: {list(session.keys())}")
@@ -10462,15 +10309,6 @@ def get_sub_user_expense_requests():
         sub_user_id = session['sub_user_id']
         print(f"DEBUG: Fetching expense requests for sub_user_id: {sub_user_id}")
         
-        # Test if sub_user_requests table exists
-        cursor.execute("SHOW TABLES LIKE 'sub_user_requests'")
-        table_exists = cursor.fetchone()
-        print(f"DEBUG: sub_user_requests table exists: {table_exists is not None}")
-        
-        if not table_exists:
-            print("DEBUG: sub_user_requests table does not exist, creating it...")
-            create_sub_users_table()
-        
         cursor.execute("""
             SELECT id, status, created_at, updated_at, notes,
                    JSON_EXTRACT(request_data, '$.title') as title,
@@ -10562,6 +10400,7 @@ def create_sub_user_expense_request():
         cursor.close()
         connection.close()
         
+        publish_pending_count(session.get('created_by'))
         return jsonify({'success': True, 'message': 'Expense request submitted successfully'})
     except Exception as e:
         print(f"Create expense request error: {e}")
@@ -10632,28 +10471,19 @@ def delete_sub_user_expense_request(expense_id):
                         
                         bank_account = cursor.fetchone()
                         if bank_account:
-                            cursor.execute("""
-                                UPDATE bank_accounts 
-                                SET current_balance = current_balance + %s 
-                                WHERE id = %s AND user_id = %s
-                            """, (amount, approved_bank_account_id, main_user_id))
+                            post_movement(cursor, main_user_id, 'bank', approved_bank_account_id, 'credit', amount,
+                                          'expense', 'sub_user_request', expense_id)
                             refund_payment_method = bank_account['bank_name']
                             print(f"DEBUG: Refunded {amount} to original bank account {approved_bank_account_id} ({refund_payment_method})")
                         else:
                             # Original bank account not found, refund to cash
-                            cursor.execute("""
-                                UPDATE users 
-                                SET cash_balance = cash_balance + %s 
-                                WHERE id = %s
-                            """, (amount, main_user_id))
+                            post_movement(cursor, main_user_id, 'cash', main_user_id, 'credit', amount,
+                                          'expense', 'sub_user_request', expense_id)
                             print(f"DEBUG: Original bank account not found, refunded {amount} to cash balance")
                     else:
                         # Refund to cash balance (original payment was cash)
-                        cursor.execute("""
-                            UPDATE users 
-                            SET cash_balance = cash_balance + %s 
-                            WHERE id = %s
-                        """, (amount, main_user_id))
+                        post_movement(cursor, main_user_id, 'cash', main_user_id, 'credit', amount,
+                                      'expense', 'sub_user_request', expense_id)
                         print(f"DEBUG: Refunded {amount} to cash balance (original payment was cash)")
                     
                     # Delete the original debit transaction
@@ -10864,27 +10694,22 @@ def approve_sub_user_expense_request(expense_id):
         
         # Update account balance
         if payment_method == 'online' and bank_account_id:
-            cursor.execute("""
-                UPDATE bank_accounts 
-                SET current_balance = current_balance - %s 
-                WHERE id = %s AND user_id = %s
-            """, (amount, bank_account_id, main_user_id))
+            post_movement(cursor, main_user_id, 'bank', bank_account_id, 'debit', amount,
+                          'expense', 'sub_user_request', expense_id)
         else:
             # For cash payments, deduct from cash balance
-            cursor.execute("""
-                UPDATE users 
-                SET cash_balance = cash_balance - %s 
-                WHERE id = %s
-            """, (amount, main_user_id))
+            post_movement(cursor, main_user_id, 'cash', main_user_id, 'debit', amount,
+                          'expense', 'sub_user_request', expense_id)
         
         # Update the expense request status
         cursor.execute("""
             UPDATE sub_user_requests 
             SET status = 'approved', 
                 notes = CONCAT(COALESCE(notes, ''), '\\nApproved - Unique ID: ', %s),
+                request_data = JSON_SET(request_data, '$.unique_id', %s),
                 updated_at = NOW()
             WHERE id = %s
-        """, (unique_id, expense_id))
+        """, (unique_id, unique_id, expense_id))
         
         connection.commit()
         cursor.close()
@@ -10972,26 +10797,17 @@ def bulk_delete_sub_user_expense_requests():
                         
                         bank_account = cursor.fetchone()
                         if bank_account:
-                            cursor.execute("""
-                                UPDATE bank_accounts 
-                                SET current_balance = current_balance + %s 
-                                WHERE id = %s AND user_id = %s
-                            """, (amount, bank_account['id'], main_user_id))
+                            post_movement(cursor, main_user_id, 'bank', bank_account['id'], 'credit', amount,
+                                          'expense', 'sub_user_request', expense_request['id'])
                         else:
                             # No bank account found, add to cash balance
-                            cursor.execute("""
-                                UPDATE users 
-                                SET cash_balance = cash_balance + %s 
-                                WHERE id = %s
-                            """, (amount, main_user_id))
+                            post_movement(cursor, main_user_id, 'cash', main_user_id, 'credit', amount,
+                                          'expense', 'sub_user_request', expense_request['id'])
                             
                     elif payment_method == 'cash':
                         # For cash payments, add back to cash balance
-                        cursor.execute("""
-                            UPDATE users 
-                            SET cash_balance = cash_balance + %s 
-                            WHERE id = %s
-                        """, (amount, main_user_id))
+                        post_movement(cursor, main_user_id, 'cash', main_user_id, 'credit', amount,
+                                      'expense', 'sub_user_request', expense_request['id'])
                     
                     # Add a credit transaction to log the adjustment
                     cursor.execute("""
@@ -11495,15 +11311,6 @@ def get_sub_user_transaction_requests():
         sub_user_id = session['sub_user_id']
         print(f"DEBUG: Fetching transaction requests for sub_user_id: {sub_user_id}")
         
-        # Test if sub_user_requests table exists
-        cursor.execute("SHOW TABLES LIKE 'sub_user_requests'")
-        table_exists = cursor.fetchone()
-        print(f"DEBUG: sub_user_requests table exists: {table_exists is not None}")
-        
-        if not table_exists:
-            print("DEBUG: sub_user_requests table does not exist, creating it...")
-            create_sub_users_table()
-        
         cursor.execute("""
             SELECT id, status, created_at, updated_at, notes,
                    JSON_EXTRACT(request_data, '$.title') as title,
@@ -11586,6 +11393,7 @@ def create_sub_user_transaction_request():
         cursor.close()
         connection.close()
         
+        publish_pending_count(session.get('created_by'))
         return jsonify({'success': True, 'message': 'Transaction request submitted successfully'})
     except Exception as e:
         print(f"Create transaction request error: {e}")
@@ -11917,6 +11725,94 @@ def get_sub_user_bank_details_for_main_user(sub_user_id):
         print(f"Get sub user bank details error: {e}")
         return jsonify({'success': False, 'message': str(e)}), 500
 
+def event_stream_response(channels, initial=None, sync=None):
+    """text/event-stream response relaying event_bus messages for `channels`"""
+    return Response(
+        sse_stream(event_bus, channels, keepalive=SSE_KEEPALIVE, max_duration=SSE_STREAM_SECONDS,
+                   initial=initial, sync=sync, sync_interval=SSE_SYNC_SECONDS),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def stream_change_sync(read_state, events):
+    """sync callable for sse_stream: returns events(state) whenever read_state(cursor) changes.
+
+    The first read happens here, while the request is still open, so only
+    changes made after the stream opened are reported.
+    """
+    def read():
+        connection = get_db_connection()
+        if not connection:
+            return None
+        try:
+            cursor = connection.cursor()
+            state = read_state(cursor)
+            cursor.close()
+            return state
+        finally:
+            connection.close()
+    
+    last = {'state': read()}
+    
+    def sync():
+        state = read()
+        if state is None or state == last['state']:
+            return []
+        changed = last['state'] is not None
+        last['state'] = state
+        return events(state) if changed else []
+    return sync
+
+def sub_user_stream_sync(sub_user_id):
+    """Announce request/invoice status changes for a sub user made in any worker"""
+    def read_state(cursor):
+        cursor.execute("SELECT created_by FROM sub_users WHERE id = %s", (sub_user_id,))
+        row = cursor.fetchone()
+        versions = collection_versions(cursor, sub_user_id, ['sub_user_requests'])
+        if row:
+            # Sub-user invoices live in the owner's invoices table
+            versions.update(collection_versions(cursor, row[0], ['invoices']))
+        return versions
+    return stream_change_sync(read_state, lambda state: [('request_status', {'kind': 'sync'})])
+
+def owner_stream_sync(user_id):
+    """Announce pending-approval changes for an owner made in any worker"""
+    return stream_change_sync(
+        lambda cursor: count_pending_approvals(cursor, user_id),
+        lambda counts: [('pending_count', counts), ('request_status', {'kind': 'sync'})]
+    )
+
+def admin_stream_sync():
+    """Announce audited activity written by any worker"""
+    def read_state(cursor):
+        cursor.execute("SELECT MAX(id) FROM audit_logs")
+        return cursor.fetchone()[0]
+    return stream_change_sync(read_state, lambda last_id: [('activity', {'action': None, 'table_name': None})])
+
+# Push channel replacing the sub-user and approval pages' polling
+@app.route('/api/events/stream', methods=['GET'])
+def events_stream():
+    """Server-sent events for the logged-in user (pending counts) or sub user (request status)"""
+    if 'sub_user_id' in session:
+        sub_user_id = session['sub_user_id']
+        return event_stream_response([f"sub_user:{sub_user_id}"], sync=sub_user_stream_sync(sub_user_id))
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'message': 'Not authenticated'}), 401
+    
+    user_id = session['user_id']
+    initial = None
+    connection = get_db_connection()
+    if connection:
+        try:
+            cursor = connection.cursor()
+            initial = [('pending_count', count_pending_approvals(cursor, user_id))]
+            cursor.close()
+        except Exception as e:
+            print(f"DEBUG: Could not load pending counts for event stream: {e}")
+        finally:
+            connection.close()
+    return event_stream_response([f'user:{user_id}'], initial, sync=owner_stream_sync(user_id))
+
 # Sub User Notifications API Route
 @app.route('/api/sub-user/notifications', methods=['GET'])
 def get_sub_user_notifications():
@@ -11941,8 +11837,8 @@ def get_sub_user_notifications():
                 created_at,
                 updated_at,
                 notes,
-                JSON_EXTRACT(request_data, '$.title') as title,
-                JSON_EXTRACT(request_data, '$.amount') as amount
+                payload_title as title,
+                payload_amount as amount
             FROM sub_user_requests 
             WHERE sub_user_id = %s 
             AND status IN ('approved', 'rejected')
@@ -11984,66 +11880,34 @@ def get_sub_user_notifications():
         return jsonify({'success': False, 'message': str(e)}), 500
 
 # Sub User Invoice Metrics API Route
-@app.route('/api/sub-user/invoice-metrics')
-def get_sub_user_invoice_metrics():
-    """Get sub user invoice metrics for summary cards"""
-    if 'sub_user_id' not in session:
-        return jsonify({'success': False, 'message': 'Not authenticated'}), 401
-    
-    try:
-        connection = get_db_connection()
-        cursor = connection.cursor(dictionary=True)
-        sub_user_id = session['sub_user_id']
-        
-        # Get total invoices and amounts by type
-        cursor.execute("""
-            SELECT 
-                COUNT(*) as total_invoices,
-                SUM(CASE WHEN JSON_EXTRACT(request_data, '$.invoice_type') = 'in' THEN 1 ELSE 0 END) as in_invoices,
-                SUM(CASE WHEN JSON_EXTRACT(request_data, '$.invoice_type') = 'out' THEN 1 ELSE 0 END) as out_invoices,
-                SUM(CASE WHEN JSON_EXTRACT(request_data, '$.invoice_type') = 'in' THEN JSON_EXTRACT(request_data, '$.total_amount') ELSE 0 END) as total_in_amount,
-                SUM(CASE WHEN JSON_EXTRACT(request_data, '$.invoice_type') = 'out' THEN JSON_EXTRACT(request_data, '$.total_amount') ELSE 0 END) as total_out_amount
-            FROM sub_user_requests 
-            WHERE sub_user_id = %s AND request_type = 'invoice'
-        """, (sub_user_id,))
-        
-        totals = cursor.fetchone()
-        
-        # Get paid invoices
-        cursor.execute("""
-            SELECT 
-                COUNT(*) as paid_invoices,
-                SUM(JSON_EXTRACT(request_data, '$.total_amount')) as paid_amount
-            FROM sub_user_requests 
-            WHERE sub_user_id = %s AND request_type = 'invoice' 
-            AND JSON_EXTRACT(request_data, '$.status') = 'paid'
-        """, (sub_user_id,))
-        
-        paid = cursor.fetchone()
-        
-        # Get pending invoices
-        cursor.execute("""
-            SELECT 
-                COUNT(*) as pending_invoices,
-                SUM(JSON_EXTRACT(request_data, '$.total_amount')) as pending_amount
-            FROM sub_user_requests 
-            WHERE sub_user_id = %s AND request_type = 'invoice' 
-            AND JSON_EXTRACT(request_data, '$.status') IN ('draft', 'sent')
-        """, (sub_user_id,))
-        
-        pending = cursor.fetchone()
+@app.route('/api/sub-user/invoice-metrics')
+def get_sub_user_invoice_metrics():
+    """Get sub user invoice metrics for summary cards"""
+    if 'sub_user_id' not in session:
+        return jsonify({'success': False, 'message': 'Not authenticated'}), 401
+    
+    try:
+        connection = get_db_connection()
+        cursor = connection.cursor(dictionary=True)
+        sub_user_id = session['sub_user_id']
         
-        # Get overdue invoices
+        # One pass over the sub user's invoice requests, served from idx_sur_invoice_metrics
         cursor.execute("""
             SELECT 
-                COUNT(*) as overdue_invoices,
-                SUM(JSON_EXTRACT(request_data, '$.total_amount')) as overdue_amount
+                COUNT(*) as total_invoices,
+                SUM(CASE WHEN payload_invoice_type = 'in' THEN payload_amount ELSE 0 END) as total_in_amount,
+                SUM(CASE WHEN payload_invoice_type = 'out' THEN payload_amount ELSE 0 END) as total_out_amount,
+                SUM(payload_status = 'paid') as paid_invoices,
+                SUM(CASE WHEN payload_status = 'paid' THEN payload_amount END) as paid_amount,
+                SUM(payload_status IN ('draft', 'sent')) as pending_invoices,
+                SUM(CASE WHEN payload_status IN ('draft', 'sent') THEN payload_amount END) as pending_amount,
+                SUM(payload_status = 'overdue') as overdue_invoices,
+                SUM(CASE WHEN payload_status = 'overdue' THEN payload_amount END) as overdue_amount
             FROM sub_user_requests 
-            WHERE sub_user_id = %s AND request_type = 'invoice' 
-            AND JSON_EXTRACT(request_data, '$.status') = 'overdue'
+            WHERE sub_user_id = %s AND request_type = 'invoice'
         """, (sub_user_id,))
         
-        overdue = cursor.fetchone()
+        totals = cursor.fetchone()
         
         cursor.close()
         connection.close()
@@ -12052,12 +11916,12 @@ def get_sub_user_invoice_metrics():
             'total_invoices': totals['total_invoices'] or 0,
             'total_in_amount': float(totals['total_in_amount'] or 0),
             'total_out_amount': float(totals['total_out_amount'] or 0),
-            'paid_invoices': paid['paid_invoices'] or 0,
-            'paid_amount': float(paid['paid_amount'] or 0),
-            'pending_invoices': pending['pending_invoices'] or 0,
-            'pending_amount': float(pending['pending_amount'] or 0),
-            'overdue_invoices': overdue['overdue_invoices'] or 0,
-            'overdue_amount': float(overdue['overdue_amount'] or 0)
+            'paid_invoices': int(totals['paid_invoices'] or 0),
+            'paid_amount': float(totals['paid_amount'] or 0),
+            'pending_invoices': int(totals['pending_invoices'] or 0),
+            'pending_amount': float(totals['pending_amount'] or 0),
+            'overdue_invoices': int(totals['overdue_invoices'] or 0),
+            'overdue_amount': float(totals['overdue_amount'] or 0)
         }
         
         return jsonify({'success': True, 'metrics': metrics})
@@ -12143,17 +12007,6 @@ def get_sub_user_invoice_requests():
         
         invoices = cursor.fetchall()
         
-        # Convert date objects to strings
-        for invoice in invoices:
-            if invoice['invoice_date']:
-                invoice['invoice_date'] = invoice['invoice_date'].isoformat()
-            if invoice['due_date']:
-                invoice['due_date'] = invoice['due_date'].isoformat()
-            if invoice['created_at']:
-                invoice['created_at'] = invoice['created_at'].isoformat()
-            if invoice['updated_at']:
-                invoice['updated_at'] = invoice['updated_at'].isoformat()
-        
         cursor.close()
         connection.close()
         
@@ -12212,6 +12065,7 @@ def create_sub_user_invoice_request():
         cursor.close()
         connection.close()
         
+        publish_pending_count(session.get('created_by'))
         return jsonify({'success': True, 'message': 'Invoice request created successfully', 'unique_id': unique_id})
         
     except Exception as e:
@@ -12664,13 +12518,13 @@ def get_pending_sub_user_requests():
         
         cursor.execute("""
             SELECT sur.id, sur.request_type, sur.status, sur.created_at,
-                   JSON_EXTRACT(sur.request_data, '$.title') as title,
-                   JSON_EXTRACT(sur.request_data, '$.amount') as amount,
+                   sur.payload_title as title,
+                   sur.payload_amount as amount,
                    sur.request_data,
                    su.sub_user_id, CONCAT(su.first_name, ' ', su.last_name) as sub_user_name
             FROM sub_user_requests sur
             JOIN sub_users su ON sur.sub_user_id = su.id
-            WHERE su.created_by = %s AND sur.status = 'pending'
+            WHERE sur.owner_user_id = %s AND sur.status = 'pending'
             ORDER BY sur.created_at DESC
         """, (user_id,))
         
@@ -12766,12 +12620,11 @@ def approve_sub_user_expense_with_payment(request_id):
         bank_account_id = data.get('bank_account_id')  # Can be None for cash
         payment_method = data.get('payment_method', 'cash')  # 'bank' or 'cash'
         
-        connection = get_db_connection()
+        # Deduction, expense and transaction rows commit together with the request
+        connection = get_request_connection()
         if not connection:
             return jsonify({'success': False, 'message': 'Database connection failed'}), 500
         
-        # Start transaction
-        connection.start_transaction()
         cursor = connection.cursor(dictionary=True)
         user_id = session['user_id']
         
@@ -12838,33 +12691,28 @@ def approve_sub_user_expense_with_payment(request_id):
         
         # Deduct amount from selected payment method
         if payment_method == 'bank' and bank_account_id:
-            cursor.execute("""
-                UPDATE bank_accounts 
-                SET current_balance = current_balance - %s 
-                WHERE id = %s AND user_id = %s
-            """, (expense_amount, bank_account_id, user_id))
+            post_movement(cursor, user_id, 'bank', bank_account_id, 'debit', expense_amount,
+                          'expense', 'sub_user_request', request_id)
             print(f"Deducted ₹{expense_amount} from bank account {bank_account_id}")
         else:
-            cursor.execute("""
-                UPDATE users 
-                SET cash_balance = cash_balance - %s 
-                WHERE id = %s
-            """, (expense_amount, user_id))
+            post_movement(cursor, user_id, 'cash', user_id, 'debit', expense_amount,
+                          'expense', 'sub_user_request', request_id)
             print(f"Deducted ₹{expense_amount} from cash balance")
         
+        # Generate or propagate unique_id across request → expense → transaction
+        request_json = json.loads(request_data['request_data'])
+        unique_id = request_json.get('unique_id') or generate_unique_id('EXP')
+        
         # Update request status to approved and record approval details
         cursor.execute("""
             UPDATE sub_user_requests 
             SET status = 'approved', 
                 reviewed_by = %s, 
                 reviewed_at = NOW(),
-                request_data = JSON_SET(request_data, '$.approved_payment_method', %s, '$.approved_bank_account_id', %s)
+                request_data = JSON_SET(request_data, '$.approved_payment_method', %s, '$.approved_bank_account_id', %s,
+                                        '$.unique_id', %s)
             WHERE id = %s
-        """, (user_id, payment_method, bank_account_id, request_id))
-        
-        # Generate or propagate unique_id across request → expense → transaction
-        request_json = json.loads(request_data['request_data'])
-        unique_id = request_json.get('unique_id') or generate_unique_id('EXP')
+        """, (user_id, payment_method, bank_account_id, unique_id, request_id))
         
         # Prepare description with bank account information
         description = request_json.get('description', '')
@@ -12936,6 +12784,8 @@ def approve_sub_user_expense_with_payment(request_id):
         cursor.close()
         connection.close()
         
+        sub_user_db_id = request_data['actual_sub_user_id']
+        after_request_commit(lambda: publish_request_update(user_id, sub_user_db_id, 'expense', request_id, 'approved'))
         return jsonify({
             'success': True,
             'message': f'Expense "{request_json["title"]}" approved and payment processed successfully',
@@ -12959,12 +12809,11 @@ def approve_sub_user_request(request_id):
     """Approve a sub user request"""
     connection = None
     try:
-        connection = get_db_connection()
+        # Rows, balance movement and status change commit together with the request
+        connection = get_request_connection()
         if not connection:
             return jsonify({'success': False, 'message': 'Database connection failed'}), 500
         
-        # Start transaction
-        connection.start_transaction()
         cursor = connection.cursor(dictionary=True)
         user_id = session['user_id']
         
@@ -13023,293 +12872,108 @@ def approve_sub_user_request(request_id):
             full_description = description + bank_info
             
             # Add expense to main user's account
-            try:
-                cursor.execute("""
-                    INSERT INTO expenses (user_id, unique_id, title, purpose, description, amount, category, expense_date, payment_method, expense_type, created_by_sub_user)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                """, (
-                    user_id,
-                    unique_id,
-                    f"{request_json['title']} (by {request_data['sub_user_name']})",
-                    request_json['title'],  # Use title as purpose
-                    full_description,
-                    request_json['amount'],
-                    request_json['category'],
-                    request_json['expense_date'],
-                    request_json['payment_method'],
-                    'completed',  # Set as completed since it's approved
-                    request_data['actual_sub_user_id']
-                ))
-                
-                # Also add as a transaction (debit) so it appears in transaction history
-                cursor.execute("""
-                    INSERT INTO transactions (user_id, unique_id, title, description, amount, transaction_type, transaction_date, payment_method, created_by_sub_user)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-                """, (
-                    user_id,
-                    unique_id,
-                    f"{request_json['title']} (by {request_data['sub_user_name']})",
-                    f"Expense: {full_description}",
-                    request_json['amount'],
-                    'debit',  # Expenses are debit transactions
-                    request_json['expense_date'],
-                    request_json['payment_method'],
-                    request_data['actual_sub_user_id']
-                ))
-                
-                # Update balance based on payment method
-                print(f"Updating balance: deducting {request_json['amount']} for user {user_id}")
-                try:
-                    balance_cursor = connection.cursor()
-                    payment_method = request_json.get('payment_method', 'cash')
-                    
-                    # Get current balance before update for debugging
-                    if payment_method == 'cash':
-                        balance_cursor.execute("SELECT cash_balance FROM users WHERE id = %s", (user_id,))
-                        current_balance = balance_cursor.fetchone()
-                        if current_balance:
-                            print(f"Current cash balance before deduction: ₹{current_balance[0]}")
-                    
-                    if payment_method == 'online':
-                        # For online payments, try to deduct from bank account first
-                        # Get the first available bank account for the main user
-                        balance_cursor.execute("""
-                            SELECT id, current_balance FROM bank_accounts 
-                            WHERE user_id = %s 
-                            ORDER BY is_default DESC, id LIMIT 1
-                        """, (user_id,))
-                        
-                        bank_account = balance_cursor.fetchone()
-                        if bank_account:
-                            print(f"Current bank balance before deduction: ₹{bank_account[1]}")
-                            # Deduct from bank account
-                            balance_cursor.execute("""
-                                UPDATE bank_accounts 
-                                SET current_balance = current_balance - %s 
-                                WHERE id = %s AND user_id = %s
-                            """, (request_json['amount'], bank_account[0], user_id))
-                            print(f"Deducted ₹{request_json['amount']} from bank account {bank_account[0]} for user {user_id}")
-                            
-                            # Verify the update
-                            balance_cursor.execute("SELECT current_balance FROM bank_accounts WHERE id = %s", (bank_account[0],))
-                            new_balance = balance_cursor.fetchone()
-                            if new_balance:
-                                print(f"New bank balance after deduction: ₹{new_balance[0]}")
-                        else:
-                            # No bank account found, deduct from cash balance
-                            balance_cursor.execute("""
-                                UPDATE users 
-                                SET cash_balance = cash_balance - %s 
-                                WHERE id = %s
-                            """, (request_json['amount'], user_id))
-                            print(f"No bank account found, deducted ₹{request_json['amount']} from cash balance for user {user_id}")
-                    else:
-                        # For cash payments, deduct from cash balance
-                        balance_cursor.execute("""
-                            UPDATE users 
-                            SET cash_balance = cash_balance - %s 
-                            WHERE id = %s
-                        """, (request_json['amount'], user_id))
-                        print(f"Deducted ₹{request_json['amount']} from cash balance for user {user_id}")
-                        
-                        # Verify the update
-                        balance_cursor.execute("SELECT cash_balance FROM users WHERE id = %s", (user_id,))
-                        new_balance = balance_cursor.fetchone()
-                        if new_balance:
-                            print(f"New cash balance after deduction: ₹{new_balance[0]}")
-                    
-                    balance_cursor.close()
-                except Exception as balance_error:
-                    print(f"Error updating balance: {balance_error}")
-                    # Continue with the approval even if balance update fails
-                
-            except Exception as e:
-                print(f"Error inserting expense with sub_user: {e}")
-                # Fallback without created_by_sub_user column
-                cursor.execute("""
-                    INSERT INTO expenses (user_id, unique_id, title, purpose, description, amount, category, expense_date, payment_method, expense_type)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                """, (
-                    user_id,
-                    unique_id,
-                    f"{request_json['title']} (by {request_data['sub_user_name']})",
-                    request_json['title'],  # Use title as purpose
-                    full_description,
-                    request_json['amount'],
-                    request_json['category'],
-                    request_json['expense_date'],
-                    request_json['payment_method'],
-                    'completed'  # Set as completed since it's approved
-                ))
-                
-                # Also add as a transaction (debit) so it appears in transaction history
-                cursor.execute("""
-                    INSERT INTO transactions (user_id, unique_id, title, description, amount, transaction_type, transaction_date, payment_method)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                """, (
-                    user_id,
-                    unique_id,
-                    f"{request_json['title']} (by {request_data['sub_user_name']})",
-                    f"Expense: {full_description}",
-                    request_json['amount'],
-                    'debit',  # Expenses are debit transactions
-                    request_json['expense_date'],
-                    request_json['payment_method']
-                ))
-                
-                # Update balance based on payment method (fallback)
-                print(f"Updating balance (fallback): deducting {request_json['amount']} for user {user_id}")
-                try:
-                    balance_cursor = connection.cursor()
-                    payment_method = request_json.get('payment_method', 'cash')
-                    
-                    # Get current balance before update for debugging
-                    if payment_method == 'cash':
-                        balance_cursor.execute("SELECT cash_balance FROM users WHERE id = %s", (user_id,))
-                        current_balance = balance_cursor.fetchone()
-                        if current_balance:
-                            print(f"Current cash balance before deduction (fallback): ₹{current_balance[0]}")
-                    
-                    if payment_method == 'online':
-                        # For online payments, try to deduct from bank account first
-                        balance_cursor.execute("""
-                            SELECT id, current_balance FROM bank_accounts 
-                            WHERE user_id = %s 
-                            ORDER BY is_default DESC, id LIMIT 1
-                        """, (user_id,))
-                        
-                        bank_account = balance_cursor.fetchone()
-                        if bank_account:
-                            print(f"Current bank balance before deduction (fallback): ₹{bank_account[1]}")
-                            # Deduct from bank account
-                            balance_cursor.execute("""
-                                UPDATE bank_accounts 
-                                SET current_balance = current_balance - %s 
-                                WHERE id = %s AND user_id = %s
-                            """, (request_json['amount'], bank_account[0], user_id))
-                            print(f"Deducted ₹{request_json['amount']} from bank account {bank_account[0]} for user {user_id} (fallback)")
-                            
-                            # Verify the update
-                            balance_cursor.execute("SELECT current_balance FROM bank_accounts WHERE id = %s", (bank_account[0],))
-                            new_balance = balance_cursor.fetchone()
-                            if new_balance:
-                                print(f"New bank balance after deduction (fallback): ₹{new_balance[0]}")
-                        else:
-                            # No bank account found, deduct from cash balance
-                            balance_cursor.execute("""
-                                UPDATE users 
-                                SET cash_balance = cash_balance - %s 
-                                WHERE id = %s
-                            """, (request_json['amount'], user_id))
-                            print(f"No bank account found, deducted ₹{request_json['amount']} from cash balance for user {user_id} (fallback)")
-                    else:
-                        # For cash payments, deduct from cash balance
-                        balance_cursor.execute("""
-                            UPDATE users 
-                            SET cash_balance = cash_balance - %s 
-                            WHERE id = %s
-                        """, (request_json['amount'], user_id))
-                        print(f"Deducted ₹{request_json['amount']} from cash balance for user {user_id} (fallback)")
-                        
-                        # Verify the update
-                        balance_cursor.execute("SELECT cash_balance FROM users WHERE id = %s", (user_id,))
-                        new_balance = balance_cursor.fetchone()
-                        if new_balance:
-                            print(f"New cash balance after deduction (fallback): ₹{new_balance[0]}")
-                    
-                    balance_cursor.close()
-                except Exception as balance_error:
-                    print(f"Error updating balance: {balance_error}")
-                    # Continue with the approval even if balance update fails
+            cursor.execute("""
+                INSERT INTO expenses (user_id, unique_id, title, purpose, description, amount, category, expense_date, payment_method, expense_type, created_by_sub_user)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            """, (
+                user_id,
+                unique_id,
+                f"{request_json['title']} (by {request_data['sub_user_name']})",
+                request_json['title'],  # Use title as purpose
+                full_description,
+                request_json['amount'],
+                request_json['category'],
+                request_json['expense_date'],
+                request_json['payment_method'],
+                'completed',  # Set as completed since it's approved
+                request_data['actual_sub_user_id']
+            ))
+            
+            # Also add as a transaction (debit) so it appears in transaction history
+            cursor.execute("""
+                INSERT INTO transactions (user_id, unique_id, title, description, amount, transaction_type, transaction_date, payment_method, created_by_sub_user)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+            """, (
+                user_id,
+                unique_id,
+                f"{request_json['title']} (by {request_data['sub_user_name']})",
+                f"Expense: {full_description}",
+                request_json['amount'],
+                'debit',  # Expenses are debit transactions
+                request_json['expense_date'],
+                request_json['payment_method'],
+                request_data['actual_sub_user_id']
+            ))
+            
+            # Update balance based on payment method. A failure here fails the
+            # approval, so the expense never commits without its deduction
+            print(f"Updating balance: deducting {request_json['amount']} for user {user_id}")
+            balance_cursor = connection.cursor()
+            payment_method = request_json.get('payment_method', 'cash')
+            bank_account = None
+            if payment_method == 'online':
+                # For online payments, deduct from the main user's first bank account
+                balance_cursor.execute("""
+                    SELECT id, current_balance FROM bank_accounts 
+                    WHERE user_id = %s 
+                    ORDER BY is_default DESC, id LIMIT 1
+                """, (user_id,))
+                bank_account = balance_cursor.fetchone()
+            
+            if bank_account:
+                posted = post_movement(balance_cursor, user_id, 'bank', bank_account[0], 'debit', request_json['amount'],
+                                       'expense', 'sub_user_request', request_id)
+                print(f"Deducted ₹{request_json['amount']} from bank account {bank_account[0]} for user {user_id}")
+            else:
+                # Cash payments, and online payments with no bank account, come out of cash
+                posted = post_movement(balance_cursor, user_id, 'cash', user_id, 'debit', request_json['amount'],
+                                       'expense', 'sub_user_request', request_id)
+                print(f"Deducted ₹{request_json['amount']} from cash balance for user {user_id}")
+            balance_cursor.close()
+            if not posted:
+                cursor.close()
+                return jsonify({'success': False, 'message': 'Could not update your balance for this request'}), 400
             
         elif request_data['request_type'] == 'transaction':
             # Add transaction to main user's account
-            try:
-                cursor.execute("""
-                    INSERT INTO transactions (user_id, unique_id, title, description, amount, transaction_type, transaction_date, payment_method, created_by_sub_user)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-                """, (
-                    user_id,
-                    unique_id,
-                    f"{request_json['title']} (by {request_data['sub_user_name']})",
-                    request_json['description'],
-                    request_json['amount'],
-                    request_json['transaction_type'],
-                    request_json['transaction_date'],
-                    request_json['payment_method'],
-                    request_data['actual_sub_user_id']
-                ))
-                
-                # Update cash balance based on transaction type (simplified approach)
-                print(f"Updating cash balance for transaction: {request_json['transaction_type']} {request_json['amount']} for user {user_id}")
-                try:
-                    # Use the same connection but after the main transaction
-                    balance_cursor = connection.cursor()
-                    if request_json['transaction_type'] == 'credit':
-                        balance_cursor.execute("""
-                            UPDATE users 
-                            SET cash_balance = cash_balance + %s 
-                            WHERE id = %s
-                        """, (request_json['amount'], user_id))
-                        print(f"Added ₹{request_json['amount']} to cash balance for user {user_id}")
-                    else:  # debit
-                        balance_cursor.execute("""
-                            UPDATE users 
-                            SET cash_balance = cash_balance - %s 
-                            WHERE id = %s
-                        """, (request_json['amount'], user_id))
-                        print(f"Deducted ₹{request_json['amount']} from cash balance for user {user_id}")
-                    balance_cursor.close()
-                except Exception as balance_error:
-                    print(f"Error updating cash balance: {balance_error}")
-                    # Continue with the approval even if balance update fails
-                
-            except Exception as e:
-                # Fallback without created_by_sub_user column
-                cursor.execute("""
-                    INSERT INTO transactions (user_id, unique_id, title, description, amount, transaction_type, transaction_date, payment_method)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                """, (
-                    user_id,
-                    unique_id,
-                    f"{request_json['title']} (by {request_data['sub_user_name']})",
-                    request_json['description'],
-                    request_json['amount'],
-                    request_json['transaction_type'],
-                    request_json['transaction_date'],
-                    request_json['payment_method']
-                ))
-                
-                # Update cash balance based on transaction type (simplified approach)
-                print(f"Updating cash balance for transaction (fallback): {request_json['transaction_type']} {request_json['amount']} for user {user_id}")
-                try:
-                    # Use the same connection but after the main transaction
-                    balance_cursor = connection.cursor()
-                    if request_json['transaction_type'] == 'credit':
-                        balance_cursor.execute("""
-                            UPDATE users 
-                            SET cash_balance = cash_balance + %s 
-                            WHERE id = %s
-                        """, (request_json['amount'], user_id))
-                        print(f"Added ₹{request_json['amount']} to cash balance for user {user_id}")
-                    else:  # debit
-                        balance_cursor.execute("""
-                            UPDATE users 
-                            SET cash_balance = cash_balance - %s 
-                            WHERE id = %s
-                        """, (request_json['amount'], user_id))
-                        print(f"Deducted ₹{request_json['amount']} from cash balance for user {user_id}")
-                    balance_cursor.close()
-                except Exception as balance_error:
-                    print(f"Error updating cash balance: {balance_error}")
-                    # Continue with the approval even if balance update fails
+            cursor.execute("""
+                INSERT INTO transactions (user_id, unique_id, title, description, amount, transaction_type, transaction_date, payment_method, created_by_sub_user)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+            """, (
+                user_id,
+                unique_id,
+                f"{request_json['title']} (by {request_data['sub_user_name']})",
+                request_json['description'],
+                request_json['amount'],
+                request_json['transaction_type'],
+                request_json['transaction_date'],
+                request_json['payment_method'],
+                request_data['actual_sub_user_id']
+            ))
+            
+            # Update cash balance based on transaction type; a failure fails the approval
+            print(f"Updating cash balance for transaction: {request_json['transaction_type']} {request_json['amount']} for user {user_id}")
+            balance_cursor = connection.cursor()
+            if request_json['transaction_type'] == 'credit':
+                posted = post_movement(balance_cursor, user_id, 'cash', user_id, 'credit', request_json['amount'],
+                                       'income', 'sub_user_request', request_id)
+                print(f"Added ₹{request_json['amount']} to cash balance for user {user_id}")
+            else:  # debit
+                posted = post_movement(balance_cursor, user_id, 'cash', user_id, 'debit', request_json['amount'],
+                                       'expense', 'sub_user_request', request_id)
+                print(f"Deducted ₹{request_json['amount']} from cash balance for user {user_id}")
+            balance_cursor.close()
+            if not posted:
+                cursor.close()
+                return jsonify({'success': False, 'message': 'Could not update your balance for this request'}), 400
         
-        # Update the sub_user_requests table with the unique_id for tracking
+        # Record the unique_id on the request; reversals find the request's ledger source through it
         cursor.execute("""
             UPDATE sub_user_requests 
-            SET status = 'approved', reviewed_by = %s, reviewed_at = NOW(), notes = %s
+            SET status = 'approved', reviewed_by = %s, reviewed_at = NOW(), notes = %s,
+                request_data = JSON_SET(request_data, '$.unique_id', %s)
             WHERE id = %s
-        """, (user_id, f"Approved - Unique ID: {unique_id}", request_id))
+        """, (user_id, f"Approved - Unique ID: {unique_id}", unique_id, request_id))
         
         print(f"Committing approval for request {request_id}")
         connection.commit()
@@ -13317,6 +12981,8 @@ def approve_sub_user_request(request_id):
         connection.close()
         
         print(f"Approval completed successfully for request {request_id}")
+        sub_user_db_id, request_type = request_data['actual_sub_user_id'], request_data['request_type']
+        after_request_commit(lambda: publish_request_update(user_id, sub_user_db_id, request_type, request_id, 'approved'))
         return jsonify({'success': True, 'message': 'Request approved and added to your account'})
     except Exception as e:
         print(f"Approve request error: {e}")
@@ -13346,12 +13012,13 @@ def reject_sub_user_request(request_id):
         
         # Check if request exists and belongs to user
         cursor.execute("""
-            SELECT sur.id FROM sub_user_requests sur
+            SELECT sur.id, sur.sub_user_id, sur.request_type FROM sub_user_requests sur
             JOIN sub_users su ON sur.sub_user_id = su.id
             WHERE sur.id = %s AND su.created_by = %s AND sur.status = 'pending'
         """, (request_id, user_id))
         
-        if not cursor.fetchone():
+        pending_request = cursor.fetchone()
+        if not pending_request:
             cursor.close()
             connection.close()
             return jsonify({'success': False, 'message': 'Request not found or already processed'}), 404
@@ -13367,6 +13034,7 @@ def reject_sub_user_request(request_id):
         cursor.close()
         connection.close()
         
+        publish_request_update(user_id, pending_request[1], pending_request[2], request_id, 'rejected')
         return jsonify({'success': True, 'message': 'Request rejected successfully'})
     except Exception as e:
         print(f"Reject request error: {e}")
@@ -13469,7 +13137,7 @@ def create_sub_user_invoice():
         main_user_id = sub_user_record['created_by']
         
         # Generate invoice number and unique ID
-        invoice_number = generate_invoice_number(main_user_id, data.get('invoice_type', 'out'))
+        invoice_number = generate_invoice_number(main_user_id, data.get('invoice_type', 'out'), cursor)
         unique_id = generate_unique_id('INV')
         
         # Set status - IN invoices are auto-approved, OUT invoices are pending
@@ -13574,19 +13242,13 @@ def create_sub_user_invoice():
                 
                 # Add money to bank account or cash balance
                 if bank_account_id:
-                    cursor.execute("""
-                        UPDATE bank_accounts 
-                        SET current_balance = current_balance + %s 
-                        WHERE id = %s AND user_id = %s
-                    """, (invoice_amount, bank_account_id, main_user_id))
+                    post_movement(cursor, main_user_id, 'bank', bank_account_id, 'credit', invoice_amount,
+                                  'income', 'invoice', invoice_id)
                     print(f"Added ₹{invoice_amount} to bank account {bank_account_id}")
                 else:
                     # No bank account found, add to cash balance
-                    cursor.execute("""
-                        UPDATE users 
-                        SET cash_balance = cash_balance + %s 
-                        WHERE id = %s
-                    """, (invoice_amount, main_user_id))
+                    post_movement(cursor, main_user_id, 'cash', main_user_id, 'credit', invoice_amount,
+                                  'income', 'invoice', invoice_id)
                     print(f"Added ₹{invoice_amount} to cash balance for main user {main_user_id}")
                 
                 # Create a transaction record for the IN invoice
@@ -13625,6 +13287,8 @@ def create_sub_user_invoice():
         cursor.close()
         connection.close()
         
+        if invoice_status == 'pending':
+            publish_pending_count(main_user_id)
         return jsonify({
             'success': True, 
             'message': 'Invoice created successfully', 
@@ -13717,19 +13381,13 @@ def delete_sub_user_invoice(invoice_id):
                     
                     # Deduct money from bank account or cash balance
                     if bank_account_id:
-                        cursor.execute("""
-                            UPDATE bank_accounts 
-                            SET current_balance = current_balance - %s 
-                            WHERE id = %s AND user_id = %s
-                        """, (invoice_amount, bank_account_id, main_user_id))
+                        post_movement(cursor, main_user_id, 'bank', bank_account_id, 'debit', invoice_amount,
+                                      'income', 'invoice', invoice_id)
                         print(f"DEBUG: Deducted ₹{invoice_amount} from bank account {bank_account_id}")
                     else:
                         # No bank account found, deduct from cash balance
-                        cursor.execute("""
-                            UPDATE users 
-                            SET cash_balance = cash_balance - %s 
-                            WHERE id = %s
-                        """, (invoice_amount, main_user_id))
+                        post_movement(cursor, main_user_id, 'cash', main_user_id, 'debit', invoice_amount,
+                                      'income', 'invoice', invoice_id)
                         print(f"DEBUG: Deducted ₹{invoice_amount} from cash balance for main user {main_user_id}")
                     
                     # Create a debit transaction to record the reversal
@@ -13800,29 +13458,20 @@ def delete_sub_user_invoice(invoice_id):
                             
                             bank_account = cursor.fetchone()
                             if bank_account:
-                                cursor.execute("""
-                                    UPDATE bank_accounts 
-                                    SET current_balance = current_balance + %s 
-                                    WHERE id = %s AND user_id = %s
-                                """, (invoice_amount, refund_bank_account_id, main_user_id))
+                                post_movement(cursor, main_user_id, 'bank', refund_bank_account_id, 'credit', invoice_amount,
+                                              'expense', 'invoice', invoice_id)
                                 print(f"DEBUG: Refunded ₹{invoice_amount} to bank account {refund_bank_account_id} ({bank_account['bank_name']})")
                             else:
                                 # Bank account no longer exists, refund to cash
-                                cursor.execute("""
-                                    UPDATE users 
-                                    SET cash_balance = cash_balance + %s 
-                                    WHERE id = %s
-                                """, (invoice_amount, main_user_id))
+                                post_movement(cursor, main_user_id, 'cash', main_user_id, 'credit', invoice_amount,
+                                              'expense', 'invoice', invoice_id)
                                 refund_payment_method = 'cash'
                                 refund_bank_account_id = None
                                 print(f"DEBUG: Original bank account not found, refunded ₹{invoice_amount} to cash balance")
                         else:
                             # Cash refund
-                            cursor.execute("""
-                                UPDATE users 
-                                SET cash_balance = cash_balance + %s 
-                                WHERE id = %s
-                            """, (invoice_amount, main_user_id))
+                            post_movement(cursor, main_user_id, 'cash', main_user_id, 'credit', invoice_amount,
+                                          'expense', 'invoice', invoice_id)
                             print(f"DEBUG: Refunded ₹{invoice_amount} to cash balance")
                         
                         # Create a credit transaction to record the refund
@@ -13949,8 +13598,7 @@ def download_sub_user_invoice_pdf(invoice_id):
         items = cursor.fetchall()
         
         # Get company settings for the main user (invoice belongs to main user)
-        cursor.execute("SELECT * FROM company_settings WHERE user_id = %s LIMIT 1", (invoice['user_id'],))
-        company = cursor.fetchone()
+        company = cached_company_settings(connection, invoice['user_id'])
         
         # Get bank details
         cursor.execute("SELECT * FROM bank_details WHERE invoice_id = %s", (invoice_id,))
@@ -14103,11 +13751,6 @@ def get_pending_invoice_download_approvals():
         
         requests = cursor.fetchall()
         
-        # Convert datetime to string for JSON serialization
-        for request in requests:
-            if request['requested_at']:
-                request['requested_at'] = request['requested_at'].isoformat()
-        
         cursor.close()
         connection.close()
         
@@ -14412,18 +14055,12 @@ def approve_sub_user_out_invoice(invoice_id):
         
         # Deduct amount from selected payment method
         if payment_method == 'bank' and bank_account_id:
-            cursor.execute("""
-                UPDATE bank_accounts 
-                SET current_balance = current_balance - %s 
-                WHERE id = %s AND user_id = %s
-            """, (invoice_amount, bank_account_id, user_id))
+            post_movement(cursor, user_id, 'bank', bank_account_id, 'debit', invoice_amount,
+                          'expense', 'invoice', invoice_id)
             print(f"Deducted ₹{invoice_amount} from bank account {bank_account_id}")
         else:
-            cursor.execute("""
-                UPDATE users 
-                SET cash_balance = cash_balance - %s 
-                WHERE id = %s
-            """, (invoice_amount, user_id))
+            post_movement(cursor, user_id, 'cash', user_id, 'debit', invoice_amount,
+                          'expense', 'invoice', invoice_id)
             print(f"Deducted ₹{invoice_amount} from cash balance")
         
         # Update invoice status to approved and record approval details
@@ -14511,6 +14148,7 @@ def approve_sub_user_out_invoice(invoice_id):
         
         payment_source = f"bank account ({bank_account['bank_name']})" if payment_method == 'bank' else "cash balance"
         
+        publish_request_update(user_id, invoice['sub_user_id'], 'invoice', invoice_id, 'approved')
         return jsonify({
             'success': True,
             'message': f'OUT invoice {invoice["invoice_number"]} approved successfully. ₹{invoice_amount} deducted from {payment_source}',
@@ -14630,6 +14268,7 @@ def reject_sub_user_out_invoice(invoice_id):
         cursor.close()
         connection.close()
         
+        publish_request_update(user_id, invoice['created_by_sub_user'], 'invoice', invoice_id, 'rejected')
         return jsonify({
             'success': True,
             'message': f'OUT invoice {invoice["invoice_number"]} rejected successfully',
@@ -14774,383 +14413,83 @@ def check_auth_status():
         'timestamp': datetime.now().isoformat()
     })
 
-# Create the download approvals table if it doesn't exist
-def create_download_approvals_table():
-    """Create sub_user_download_approvals table if it doesn't exist"""
-    try:
-        connection = get_db_connection()
-        if not connection:
-            print("Failed to get database connection for download approvals table")
-            return False
-        
-        cursor = connection.cursor()
-        
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS sub_user_download_approvals (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                invoice_id INT NOT NULL,
-                sub_user_id INT NOT NULL,
-                status ENUM('pending', 'approved', 'rejected') DEFAULT 'pending',
-                requested_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                approved_at TIMESTAMP NULL,
-                approved_by INT NULL,
-                notes TEXT,
-                FOREIGN KEY (invoice_id) REFERENCES invoices(id) ON DELETE CASCADE,
-                FOREIGN KEY (sub_user_id) REFERENCES sub_users(id) ON DELETE CASCADE,
-                FOREIGN KEY (approved_by) REFERENCES users(id) ON DELETE SET NULL,
-                UNIQUE KEY unique_request (invoice_id, sub_user_id),
-                INDEX idx_status (status),
-                INDEX idx_sub_user (sub_user_id)
-            )
-        """)
-        
-        connection.commit()
-        cursor.close()
-        connection.close()
-        print("Download approvals table created successfully")
-        return True
-        
-    except Exception as e:
-        print(f"Error creating download approvals table: {e}")
-        return False
-
-def create_vendor_bank_details_table():
-    """Create vendor_bank_details table if it doesn't exist"""
-    try:
-        connection = get_db_connection()
-        if not connection:
-            print("Failed to get database connection for vendor bank details table")
-            return False
-        
-        cursor = connection.cursor()
-        
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS vendor_bank_details (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                invoice_id INT NOT NULL,
-                bank_name VARCHAR(255),
-                account_number VARCHAR(50),
-                ifsc_code VARCHAR(20),
-                account_holder_name VARCHAR(255),
-                upi_id VARCHAR(100),
-                phone_number VARCHAR(20),
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (invoice_id) REFERENCES invoices(id) ON DELETE CASCADE,
-                INDEX idx_invoice (invoice_id)
-            )
-        """)
-        
-        connection.commit()
-        cursor.close()
-        connection.close()
-        print("Vendor bank details table created successfully")
-        return True
-        
-    except Exception as e:
-        print(f"Error creating vendor bank details table: {e}")
-        return False
-
-def update_invoices_table_for_enhanced_fields():
-    """Add new fields to invoices table for enhanced sub-user invoice functionality"""
-    try:
-        connection = get_db_connection()
-        if not connection:
-            print("Failed to get database connection for invoices table update")
-            return False
-        
-        cursor = connection.cursor()
-        
-        # Add new columns to invoices table
-        new_columns = [
-            "ALTER TABLE invoices ADD COLUMN IF NOT EXISTS billing_company_name VARCHAR(255)",
-            "ALTER TABLE invoices ADD COLUMN IF NOT EXISTS billing_address TEXT",
-            "ALTER TABLE invoices ADD COLUMN IF NOT EXISTS billing_city VARCHAR(100)",
-            "ALTER TABLE invoices ADD COLUMN IF NOT EXISTS billing_state VARCHAR(100)",
-            "ALTER TABLE invoices ADD COLUMN IF NOT EXISTS billing_pin VARCHAR(10)",
-            "ALTER TABLE invoices ADD COLUMN IF NOT EXISTS gstin_number VARCHAR(20)",
-            "ALTER TABLE invoices ADD COLUMN IF NOT EXISTS pan_number VARCHAR(20)",
-            "ALTER TABLE invoices ADD COLUMN IF NOT EXISTS payment_method VARCHAR(20) DEFAULT 'cash'",
-            "ALTER TABLE invoices ADD COLUMN IF NOT EXISTS bank_account_type VARCHAR(20)"
-        ]
-        
-        for column_query in new_columns:
-            try:
-                cursor.execute(column_query)
-                print(f"Added column: {column_query}")
-            except Exception as e:
-                print(f"Column may already exist or error adding: {column_query} - {e}")
-        
-        connection.commit()
-        cursor.close()
-        connection.close()
-        print("Invoices table updated successfully with enhanced fields")
-        return True
-        
-    except Exception as e:
-        print(f"Error updating invoices table: {e}")
-        return False
-
-def update_invoices_table_for_sub_users():
-    """Add created_by_sub_user column to invoices table if it doesn't exist"""
-    try:
-        connection = get_db_connection()
-        if not connection:
-            print("Failed to get database connection for invoices table update")
-            return False
-        
-        cursor = connection.cursor()
-        
-        # Check if column already exists
-        cursor.execute("""
-            SELECT COLUMN_NAME 
-            FROM INFORMATION_SCHEMA.COLUMNS 
-            WHERE TABLE_SCHEMA = DATABASE() 
-            AND TABLE_NAME = 'invoices' 
-            AND COLUMN_NAME = 'created_by_sub_user'
-        """)
-        
-        column_exists = cursor.fetchone()
-        
-        if not column_exists:
-            print("Adding created_by_sub_user column to invoices table...")
-            # Add the column
-            cursor.execute("""
-                ALTER TABLE invoices 
-                ADD COLUMN created_by_sub_user INT NULL,
-                ADD INDEX idx_created_by_sub_user (created_by_sub_user)
-            """)
-            connection.commit()
-            print("created_by_sub_user column added to invoices table successfully")
-        else:
-            print("created_by_sub_user column already exists in invoices table")
-        
-        cursor.close()
-        connection.close()
-        return True
-        
-    except Exception as e:
-        print(f"Error updating invoices table: {e}")
-        return False
-
-def create_debt_management_tables():
-    """Create debt management tables if they don't exist"""
-    try:
-        print("Creating debt management tables...")
-        connection = get_db_connection()
-        if not connection:
-            print("Failed to get database connection for debt management tables")
-            return False
-        
-        cursor = connection.cursor()
-        
-        # Create customers table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS `customers` (
-              `id` int(11) NOT NULL AUTO_INCREMENT,
-              `user_id` int(11) NOT NULL,
-              `customer_code` varchar(50) DEFAULT NULL,
-              `name` varchar(255) NOT NULL,
-              `phone` varchar(20) DEFAULT NULL,
-              `email` varchar(255) DEFAULT NULL,
-              `address` text DEFAULT NULL,
-              `city` varchar(100) DEFAULT NULL,
-              `state` varchar(100) DEFAULT NULL,
-              `pincode` varchar(10) DEFAULT NULL,
-              `pan_number` varchar(20) DEFAULT NULL,
-              `aadhar_number` varchar(20) DEFAULT NULL,
-              `status` enum('active','inactive') DEFAULT 'active',
-              `notes` text DEFAULT NULL,
-              `created_at` timestamp NOT NULL DEFAULT current_timestamp(),
-              `updated_at` timestamp NOT NULL DEFAULT current_timestamp() ON UPDATE current_timestamp(),
-              PRIMARY KEY (`id`),
-              KEY `idx_user_id` (`user_id`),
-              KEY `idx_customer_code` (`customer_code`),
-              KEY `idx_status` (`status`),
-              KEY `idx_name` (`name`),
-              FOREIGN KEY (`user_id`) REFERENCES `users` (`id`) ON DELETE CASCADE
-            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci
-        """)
-        
-        # Create debts table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS `debts` (
-              `id` int(11) NOT NULL AUTO_INCREMENT,
-              `user_id` int(11) NOT NULL,
-              `customer_id` int(11) NOT NULL,
-              `debt_code` varchar(50) DEFAULT NULL,
-              `total_amount` decimal(15,2) NOT NULL DEFAULT 0.00,
-              `paid_amount` decimal(15,2) NOT NULL DEFAULT 0.00,
-              `balance` decimal(15,2) NOT NULL DEFAULT 0.00,
-              `interest_rate` decimal(5,2) DEFAULT 0.00,
-              `due_date` date DEFAULT NULL,
-              `start_date` date NOT NULL,
-              `status` enum('active','overdue','settled','cancelled') DEFAULT 'active',
-              `loan_purpose` text DEFAULT NULL,
-              `notes` text DEFAULT NULL,
-              `emi_enabled` tinyint(1) DEFAULT 0,
-              `emi_count` int(11) DEFAULT 0,
-              `emi_amount` decimal(15,2) DEFAULT 0.00,
-              `product_id` int(11) DEFAULT NULL,
-              `transaction_id` int(11) DEFAULT NULL,
-              `created_at` timestamp NOT NULL DEFAULT current_timestamp(),
-              `updated_at` timestamp NOT NULL DEFAULT current_timestamp() ON UPDATE current_timestamp(),
-              PRIMARY KEY (`id`),
-              KEY `idx_user_id` (`user_id`),
-              KEY `idx_customer_id` (`customer_id`),
-              KEY `idx_debt_code` (`debt_code`),
-              KEY `idx_status` (`status`),
-              KEY `idx_due_date` (`due_date`),
-              FOREIGN KEY (`user_id`) REFERENCES `users` (`id`) ON DELETE CASCADE,
-              FOREIGN KEY (`customer_id`) REFERENCES `customers` (`id`) ON DELETE CASCADE
-            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci
-        """)
-        
-        # Create emis table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS `emis` (
-              `id` int(11) NOT NULL AUTO_INCREMENT,
-              `debt_id` int(11) NOT NULL,
-              `customer_id` int(11) NOT NULL,
-              `user_id` int(11) NOT NULL,
-              `installment_number` int(11) NOT NULL,
-              `due_date` date NOT NULL,
-              `amount` decimal(15,2) NOT NULL DEFAULT 0.00,
-              `paid_amount` decimal(15,2) NOT NULL DEFAULT 0.00,
-              `status` enum('pending','paid','overdue','partial') DEFAULT 'pending',
-              `paid_date` date DEFAULT NULL,
-              `late_fee` decimal(15,2) DEFAULT 0.00,
-              `notes` text DEFAULT NULL,
-              `created_at` timestamp NOT NULL DEFAULT current_timestamp(),
-              `updated_at` timestamp NOT NULL DEFAULT current_timestamp() ON UPDATE current_timestamp(),
-              PRIMARY KEY (`id`),
-              KEY `idx_debt_id` (`debt_id`),
-              KEY `idx_customer_id` (`customer_id`),
-              KEY `idx_user_id` (`user_id`),
-              KEY `idx_due_date` (`due_date`),
-              KEY `idx_status` (`status`),
-              FOREIGN KEY (`debt_id`) REFERENCES `debts` (`id`) ON DELETE CASCADE,
-              FOREIGN KEY (`customer_id`) REFERENCES `customers` (`id`) ON DELETE CASCADE,
-              FOREIGN KEY (`user_id`) REFERENCES `users` (`id`) ON DELETE CASCADE
-            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci
-        """)
-        
-        # Create debt_payments table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS `debt_payments` (
-              `id` int(11) NOT NULL AUTO_INCREMENT,
-              `debt_id` int(11) NOT NULL,
-              `customer_id` int(11) NOT NULL,
-              `user_id` int(11) NOT NULL,
-              `emi_id` int(11) DEFAULT NULL,
-              `amount` decimal(15,2) NOT NULL DEFAULT 0.00,
-              `payment_method` enum('cash','upi','bank','card','cheque','other') DEFAULT 'cash',
-              `payment_date` date NOT NULL,
-              `transaction_id` varchar(255) DEFAULT NULL,
-              `bank_account_id` int(11) DEFAULT NULL,
-              `receipt_number` varchar(50) DEFAULT NULL,
-              `remarks` text DEFAULT NULL,
-              `created_at` timestamp NOT NULL DEFAULT current_timestamp(),
-              `updated_at` timestamp NOT NULL DEFAULT current_timestamp() ON UPDATE current_timestamp(),
-              PRIMARY KEY (`id`),
-              KEY `idx_debt_id` (`debt_id`),
-              KEY `idx_customer_id` (`customer_id`),
-              KEY `idx_user_id` (`user_id`),
-              KEY `idx_emi_id` (`emi_id`),
-              KEY `idx_payment_date` (`payment_date`),
-              KEY `idx_receipt_number` (`receipt_number`),
-              FOREIGN KEY (`debt_id`) REFERENCES `debts` (`id`) ON DELETE CASCADE,
-              FOREIGN KEY (`customer_id`) REFERENCES `customers` (`id`) ON DELETE CASCADE,
-              FOREIGN KEY (`user_id`) REFERENCES `users` (`id`) ON DELETE CASCADE,
-              FOREIGN KEY (`emi_id`) REFERENCES `emis` (`id`) ON DELETE SET NULL
-            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci
-        """)
-        
-        # Create debt_reminders table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS `debt_reminders` (
-              `id` int(11) NOT NULL AUTO_INCREMENT,
-              `debt_id` int(11) NOT NULL,
-              `customer_id` int(11) NOT NULL,
-              `user_id` int(11) NOT NULL,
-              `emi_id` int(11) DEFAULT NULL,
-              `reminder_type` enum('upcoming_due','due_today','overdue','manual') DEFAULT 'upcoming_due',
-              `scheduled_date` date NOT NULL,
-              `sent_date` datetime DEFAULT NULL,
-              `sent` tinyint(1) DEFAULT 0,
-              `channel` enum('email','sms','whatsapp','in_app') DEFAULT 'in_app',
-              `message` text DEFAULT NULL,
-              `subject` varchar(255) DEFAULT NULL,
-              `created_at` timestamp NOT NULL DEFAULT current_timestamp(),
-              `updated_at` timestamp NOT NULL DEFAULT current_timestamp() ON UPDATE current_timestamp(),
-              PRIMARY KEY (`id`),
-              KEY `idx_debt_id` (`debt_id`),
-              KEY `idx_customer_id` (`customer_id`),
-              KEY `idx_user_id` (`user_id`),
-              KEY `idx_emi_id` (`emi_id`),
-              KEY `idx_scheduled_date` (`scheduled_date`),
-              KEY `idx_sent` (`sent`),
-              KEY `idx_reminder_type` (`reminder_type`),
-              FOREIGN KEY (`debt_id`) REFERENCES `debts` (`id`) ON DELETE CASCADE,
-              FOREIGN KEY (`customer_id`) REFERENCES `customers` (`id`) ON DELETE CASCADE,
-              FOREIGN KEY (`user_id`) REFERENCES `users` (`id`) ON DELETE CASCADE,
-              FOREIGN KEY (`emi_id`) REFERENCES `emis` (`id`) ON DELETE SET NULL
-            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci
-        """)
-        
-        # Create debt_settings table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS `debt_settings` (
-              `id` int(11) NOT NULL AUTO_INCREMENT,
-              `user_id` int(11) NOT NULL,
-              `reminder_days_before` varchar(50) DEFAULT '3,1,0',
-              `notification_channels` varchar(100) DEFAULT 'in_app,email',
-              `default_emi_max_installments` int(11) DEFAULT 12,
-              `grace_period_days` int(11) DEFAULT 0,
-              `late_fee_percentage` decimal(5,2) DEFAULT 0.00,
-              `auto_reminder_enabled` tinyint(1) DEFAULT 1,
-              `created_at` timestamp NOT NULL DEFAULT current_timestamp(),
-              `updated_at` timestamp NOT NULL DEFAULT current_timestamp() ON UPDATE current_timestamp(),
-              PRIMARY KEY (`id`),
-              UNIQUE KEY `unique_user_debt_settings` (`user_id`),
-              FOREIGN KEY (`user_id`) REFERENCES `users` (`id`) ON DELETE CASCADE
-            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci
-        """)
-        
-        connection.commit()
-        cursor.close()
-        connection.close()
-        print("✓ Debt management tables created successfully")
-        return True
-    except Exception as e:
-        print(f"Error creating debt management tables: {e}")
-        import traceback
-        traceback.print_exc()
-        if 'connection' in locals():
-            connection.close()
-        return False
+def apply_startup_migrations():
+    """Apply pending schema migrations once when the process starts"""
+    connection = get_db_connection()
+    if not connection:
+        print("Skipping schema migrations: database connection failed")
+        return
+    try:
+        migrate_database(connection)
+    except Exception as e:
+        print(f"Error applying schema migrations: {e}")
+    finally:
+        connection.close()
+
+# Periodically detect (and repair) drift in the materialized dashboard summaries
+summary_reconciler = SummaryReconciler(get_db_connection, int(os.environ.get('SUMMARY_RECONCILE_INTERVAL', 3600)))
+
+# Daily ledger snapshots keep balance-as-of queries O(snapshot + one day of entries)
+ledger_snapshotter = LedgerSnapshotter(get_db_connection, int(os.environ.get('LEDGER_SNAPSHOT_INTERVAL', 3600)))
+
+# Local worker for the admin export queue
+export_job_queue.register('all_data', build_all_data_export)
+export_job_queue.register('audit_logs', build_audit_logs_export)
+export_job_queue.register('user_data', build_user_data_export)
+
+def start_background_services():
+    """Start this process's background workers; a no-op once they are running"""
+    summary_reconciler.start()
+    ledger_snapshotter.start()
+    export_job_queue.start()
+    pdf_render_queue.start()
+
+_services_started_pid = None
+
+@app.before_request
+def ensure_background_services():
+    """Workers start in the process that serves requests, not in whichever
+    process imported the app (a preloading master or the reloader parent)"""
+    global _services_started_pid
+    if _services_started_pid != os.getpid():
+        _services_started_pid = os.getpid()
+        start_background_services()
+
+def reinit_after_fork():
+    """Give a forked worker its own pool, queues and threads (gunicorn post_fork).
+
+    Connections, queued work and thread handles inherited from the parent
+    belong to the parent; each is reset here and the workers are started.
+    """
+    global _services_started_pid
+    db_pool.reset_after_fork()
+    audit_sink.reset_after_fork()
+    pdf_render_queue.reset_after_fork()
+    file_cleanup_queue.reset_after_fork()
+    event_bus.reset_after_fork()
+    _services_started_pid = os.getpid()
+    start_background_services()
+
+_app_initialized = False
+
+def create_app():
+    """Application factory: run startup migrations and return the configured app.
+
+    Importing this module only declares the app; nothing touches the database
+    until create_app() (migrations) or the first request (background workers).
+    Use `gunicorn 'app:create_app()'` or `python app.py`.
+    """
+    global _app_initialized
+    if not _app_initialized:
+        _app_initialized = True
+        if os.environ.get('RUN_MIGRATIONS_ON_STARTUP', '1') == '1':
+            apply_startup_migrations()
+    return app
 
 if __name__ == '__main__':
-    # Create sub users table on startup
-    create_sub_users_table()
-    
-    # Create download approvals table
-    create_download_approvals_table()
-    
-    # Create vendor bank details table
-    create_vendor_bank_details_table()
-    
-    # Update invoices table for sub user support
-    update_invoices_table_for_sub_users()
-    
-    # Update invoices table with enhanced fields
-    update_invoices_table_for_enhanced_fields()
-    
-    # Create debt management tables
-    create_debt_management_tables()
-    
     port = int(os.environ.get('PORT', 5000))
     
-    # Run in debug mode only in development
-    debug_mode = True  # Force debug mode to reload templates
+    # Development server (reloader, debugger); production uses gunicorn.conf.py
+    debug_mode = os.environ.get('FLASK_DEBUG', '1') == '1'
     
-    app.run(debug=debug_mode, host='0.0.0.0', port=port)
+    create_app().run(debug=debug_mode, host='0.0.0.0', port=port)
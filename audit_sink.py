@@ -0,0 +1,323 @@
+"""
+Buffered, asynchronous audit log writer.
+
+log_audit_event() hands rows to AuditLogSink.log(), which only appends to an
+in-memory queue. A background thread batches queued rows into multi-row
+INSERTs, flushing when a batch is full or the oldest row has waited
+`flush_interval` seconds. If the database is unavailable the batch is
+appended to a local JSON-lines spill file, which is replayed into
+audit_logs once the database accepts writes again (checked whenever the
+writer is idle and at least every `replay_interval` seconds under load).
+A batch the database rejects is retried row by row, so one bad row does
+not cost the rest; rows refused on their own go to a `.rejected` file
+instead of being retried forever. Pending rows are drained on interpreter
+shutdown.
+
+Every worker process appends to the same spill file. A replaying worker
+claims it by renaming it, under an flock, to a name carrying its pid, so
+each spilled row is replayed by exactly one process; claimed files left
+by a process that has died are adopted the same way.
+"""
+import atexit
+import fcntl
+import glob
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+AUDIT_COLUMNS = ('user_id', 'admin_id', 'action', 'table_name', 'record_id', 'old_values',
+                 'new_values', 'ip_address', 'user_agent', 'created_at')
+
+INSERT_AUDIT_SQL = (
+    f"INSERT INTO audit_logs ({', '.join(AUDIT_COLUMNS)}) "
+    f"VALUES ({', '.join(['%s'] * len(AUDIT_COLUMNS))})"
+)
+
+# DB-API error classes that mean "cannot reach the database", not "bad row"
+UNAVAILABLE_ERRORS = ('OperationalError', 'InterfaceError', 'PoolError')
+
+
+def _database_unavailable(error):
+    if isinstance(error, (RuntimeError, OSError)):
+        return True
+    return any(cls.__name__ in UNAVAILABLE_ERRORS for cls in type(error).__mro__)
+
+
+class AuditLogSink:
+    """Queue + background writer for audit_logs rows"""
+
+    def __init__(self, get_connection, spill_path, batch_size=200, flush_interval=1.0, max_queue=10000,
+                 replay_interval=30):
+        self.get_connection = get_connection
+        self.spill_path = spill_path
+        self.rejected_path = spill_path + '.rejected'
+        self.lock_path = spill_path + '.lock'
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.replay_interval = replay_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._thread = None
+        self._spill_lock = threading.Lock()
+        self._last_replay = 0
+        self._atexit_registered = False
+        self.enqueued = 0
+        self.written = 0
+        self.batches = 0
+        self.spilled = 0
+        self.replayed = 0
+        self.rejected = 0
+        os.makedirs(os.path.dirname(spill_path) or '.', exist_ok=True)
+
+    def log(self, row):
+        """Queue one audit row (a tuple in AUDIT_COLUMNS order); never blocks the caller"""
+        if self._thread is None or not self._thread.is_alive():
+            self.start()
+        try:
+            self._queue.put_nowait(row)
+            self.enqueued += 1
+        except queue.Full:
+            # Writer is far behind; keep the event on disk rather than block a request
+            self._spill([row])
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+            self._thread.start()
+            if not self._atexit_registered:
+                # Survives fork, and shutdown() always acts on the current thread
+                atexit.register(self.shutdown)
+                self._atexit_registered = True
+
+    def shutdown(self, timeout=10):
+        """Stop the writer after flushing everything still queued"""
+        thread = self._thread
+        if thread is None:
+            return
+        self._stop.set()
+        thread.join(timeout)
+        self._thread = None
+        # Anything the writer did not get to (e.g. join timed out) goes to the spill file
+        leftover = self._drain_nowait()
+        if leftover:
+            self._spill(leftover)
+
+    def reset_after_fork(self):
+        """Start clean in a forked child: rows queued in the parent are the parent's to write"""
+        self._queue = queue.Queue(maxsize=self._queue.maxsize)
+        self._stop = threading.Event()
+        self._thread = None
+        self._spill_lock = threading.Lock()
+        self._last_replay = 0
+        self.enqueued = self.written = self.batches = self.spilled = self.replayed = self.rejected = 0
+
+    def _drain_nowait(self, limit=None):
+        rows = []
+        while limit is None or len(rows) < limit:
+            try:
+                rows.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return rows
+
+    def _run(self):
+        while True:
+            try:
+                if not self._run_once():
+                    return
+            except Exception as e:
+                # Never let one bad spill file or write take the writer down for good
+                print(f"DEBUG: Audit writer error: {e}")
+                self._stop.wait(self.flush_interval)
+
+    def _run_once(self):
+        """Write one batch (or replay the spill file when idle); False once stopped and drained"""
+        try:
+            first = self._queue.get(timeout=self.flush_interval)
+        except queue.Empty:
+            if self._stop.is_set():
+                return False
+            self._replay_spill()
+            return True
+
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size and not self._stop.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        if self._stop.is_set():
+            batch.extend(self._drain_nowait())
+
+        for start in range(0, len(batch), self.batch_size):
+            self._write(batch[start:start + self.batch_size])
+        # A steady trickle of rows never leaves the queue empty for long
+        if time.monotonic() - self._last_replay >= self.replay_interval:
+            self._replay_spill()
+        return True
+
+    def _insert(self, rows):
+        connection = self.get_connection()
+        if not connection:
+            raise RuntimeError('Database connection failed')
+        cursor = connection.cursor()
+        try:
+            # mysql-connector rewrites executemany() INSERTs into one multi-row INSERT
+            cursor.executemany(INSERT_AUDIT_SQL, rows)
+            connection.commit()
+        finally:
+            cursor.close()
+            connection.close()
+
+    def _store(self, rows):
+        """Insert rows, one by one if the batch is rejected.
+
+        Returns (rows written, rows left unwritten because the database is
+        unavailable). Rows the database refuses individually are set aside
+        in the rejected file.
+        """
+        try:
+            self._insert(rows)
+            return len(rows), []
+        except Exception as e:
+            if _database_unavailable(e):
+                print(f"DEBUG: Audit log write failed, database unavailable: {e}")
+                return 0, rows
+            print(f"DEBUG: Audit batch of {len(rows)} rows rejected, retrying row by row: {e}")
+
+        written = 0
+        for index, row in enumerate(rows):
+            try:
+                self._insert([row])
+                written += 1
+            except Exception as e:
+                if _database_unavailable(e):
+                    print(f"DEBUG: Audit log write failed, database unavailable: {e}")
+                    return written, rows[index:]
+                print(f"DEBUG: Audit row rejected ({row[2]}): {e}")
+                with self._spill_lock:
+                    self._spill_to(self.rejected_path, [row])
+                    self.rejected += 1
+        return written, []
+
+    def _write(self, rows):
+        written, unwritten = self._store(rows)
+        self.written += written
+        if written:
+            self.batches += 1
+        if unwritten:
+            print(f"DEBUG: Spilling {len(unwritten)} audit rows")
+            self._spill(unwritten)
+
+    def _spill(self, rows):
+        with self._spill_lock, self._file_lock():
+            self._spill_to(self.spill_path, rows)
+            self.spilled += len(rows)
+
+    def _file_lock(self):
+        """Exclusive flock shared by every process using this spill file (released on close)"""
+        lock = open(self.lock_path, 'a')
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        return lock
+
+    def _claim_path(self, pid=None):
+        return f"{self.spill_path}.{pid or os.getpid()}.replay"
+
+    def _claimable(self):
+        """The shared spill file, then replay files whose owning process is gone"""
+        candidates = [self.spill_path, self.spill_path + '.replay']
+        for path in glob.glob(glob.escape(self.spill_path) + '.*.replay'):
+            pid = path[len(self.spill_path) + 1:-len('.replay')]
+            if not pid.isdigit():
+                continue
+            try:
+                os.kill(int(pid), 0)
+            except ProcessLookupError:
+                candidates.append(path)
+            except OSError:
+                pass
+        return candidates
+
+    def _claim_spill(self):
+        """Rename a spill file to this process's replay file; its path, or None if there is nothing to replay"""
+        claimed = self._claim_path()
+        if os.path.exists(claimed):
+            return claimed
+        with self._spill_lock, self._file_lock():
+            for path in self._claimable():
+                try:
+                    # Atomic: if two processes race for a file only one rename succeeds
+                    os.replace(path, claimed)
+                    return claimed
+                except FileNotFoundError:
+                    continue
+        return None
+
+    @staticmethod
+    def _spill_to(path, rows):
+        with open(path, 'a', encoding='utf-8') as f:
+            for row in rows:
+                record = dict(zip(AUDIT_COLUMNS, row))
+                if isinstance(record['created_at'], datetime):
+                    record['created_at'] = record['created_at'].isoformat()
+                f.write(json.dumps(record, default=str) + '\n')
+
+    def _replay_spill(self):
+        """Move spilled rows back into audit_logs once the database is reachable"""
+        self._last_replay = time.monotonic()
+        replay_path = self._claim_spill()
+        if replay_path is None:
+            return
+
+        rows = []
+        with open(replay_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                    if record.get('created_at'):
+                        record['created_at'] = datetime.fromisoformat(record['created_at'])
+                except (ValueError, AttributeError) as e:
+                    # e.g. a line cut short by a crash mid-append; keep it for inspection
+                    print(f"DEBUG: Unreadable audit spill line set aside: {e}")
+                    with self._spill_lock, open(self.rejected_path, 'a', encoding='utf-8') as rejected:
+                        rejected.write(line if line.endswith('\n') else line + '\n')
+                    self.rejected += 1
+                    continue
+                rows.append(tuple(record.get(column) for column in AUDIT_COLUMNS))
+
+        for start in range(0, len(rows), self.batch_size):
+            written, unwritten = self._store(rows[start:start + self.batch_size])
+            self.replayed += written
+            if unwritten:
+                # Still unavailable; keep only the rows not yet inserted and retry later
+                pending_path = replay_path + '.tmp'
+                if os.path.exists(pending_path):
+                    os.remove(pending_path)
+                self._spill_to(pending_path, unwritten + rows[start + self.batch_size:])
+                os.replace(pending_path, replay_path)
+                return
+        os.remove(replay_path)
+
+    def stats(self):
+        return {
+            'queued': self._queue.qsize(),
+            'enqueued': self.enqueued,
+            'written': self.written,
+            'batches': self.batches,
+            'spilled': self.spilled,
+            'replayed': self.replayed,
+            'rejected': self.rejected,
+            'spill_pending': os.path.exists(self.spill_path)
+                             or bool(glob.glob(glob.escape(self.spill_path) + '*.replay')),
+            'running': self._thread is not None and self._thread.is_alive()
+        }
@@ -0,0 +1,72 @@
+"""
+Serialization time for a list response of database rows.
+
+Compares the old approach (convert every date/Decimal cell in Python, then
+Flask's stdlib json) with FastJSONProvider's encoders:
+
+    python benchmarks/bench_json.py --rows 10000 --repeat 20
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import json_provider
+from json_provider import json_default
+from fixtures import make_transaction_rows as make_rows
+
+
+def per_row_conversion(rows):
+    """What the list views used to do before jsonify()"""
+    for row in rows:
+        row['amount'] = float(row['amount'])
+        for key in ('transaction_date', 'created_at', 'updated_at', 'invoice_date', 'due_date'):
+            if row[key]:
+                row[key] = row[key].isoformat()
+    return json.dumps(rows, separators=(',', ':'), sort_keys=True).encode('utf-8')
+
+
+def stdlib_default(rows):
+    return json.dumps(rows, default=json_default, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def orjson_default(rows):
+    return json_provider.orjson.dumps(rows, default=json_default, option=json_provider.ORJSON_OPTIONS)
+
+
+def measure(func, row_count, repeat):
+    timings = []
+    size = 0
+    for _ in range(repeat):
+        rows = make_rows(row_count)  # fresh rows: the old approach mutates them
+        started = time.perf_counter()
+        size = len(func(rows))
+        timings.append((time.perf_counter() - started) * 1000)
+    return min(timings), statistics.median(timings), size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    cases = [('per-row conversion + json', per_row_conversion), ('json + json_default', stdlib_default)]
+    if json_provider.orjson is not None:
+        cases.append(('orjson + json_default', orjson_default))
+
+    print(f"{args.rows} rows, best/median of {args.repeat}")
+    baseline = None
+    for name, func in cases:
+        best, median, size = measure(func, args.rows, args.repeat)
+        baseline = baseline or median
+        print(f"  {name:28s} best {best:8.2f} ms  median {median:8.2f} ms  "
+              f"{size / 1024:8.1f} KiB  x{baseline / median:.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""
+Cold import time of app.py, i.e. what every worker boot pays.
+
+Imports the app in fresh interpreters, reports the median wall time and,
+from one `python -X importtime` run, the modules with the largest cumulative
+import cost. Also checks that the heavy export/PDF libraries are not loaded
+by the import itself (they are imported on first use):
+
+    python benchmarks/bench_startup.py --repeat 5 --top 15
+    python benchmarks/bench_startup.py --output benchmarks/baselines/startup.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Only the export and PDF paths need these
+LAZY_MODULES = ('pandas', 'reportlab', 'PyPDF2', 'fitz', 'PIL', 'weasyprint')
+
+CHECK_LAZY = (
+    "import sys, app; "
+    f"print(','.join(m for m in {LAZY_MODULES!r} if m in sys.modules))"
+)
+
+
+def run_python(args):
+    return subprocess.run([sys.executable] + args, cwd=REPO_ROOT, capture_output=True, text=True)
+
+
+def import_wall_time():
+    started = time.perf_counter()
+    result = run_python(['-c', 'import app'])
+    elapsed = time.perf_counter() - started
+    if result.returncode != 0:
+        sys.exit(f"import app failed:\n{result.stderr}")
+    return elapsed
+
+
+def top_imports(count):
+    """(cumulative microseconds, module) of the most expensive imports"""
+    result = run_python(['-X', 'importtime', '-c', 'import app'])
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = (part.strip() for part in line[len('import time:'):].split('|'))
+        rows.append((int(cumulative_us), name))
+    # Only top-level packages, otherwise a package and its submodules crowd the list
+    seen, top = set(), []
+    for cumulative_us, name in sorted(rows, reverse=True):
+        root = name.split('.')[0]
+        if root not in seen:
+            seen.add(root)
+            top.append((cumulative_us, name))
+    return top[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure how long importing app.py takes')
+    parser.add_argument('--repeat', type=int, default=5, help='fresh interpreters to time')
+    parser.add_argument('--top', type=int, default=15, help='most expensive imports to list')
+    parser.add_argument('--output', help='also write this run as JSON')
+    args = parser.parse_args()
+
+    run_python(['-c', 'import app'])  # warm the filesystem and bytecode caches
+    timings = [import_wall_time() for _ in range(args.repeat)]
+    print(f"import app: median {statistics.median(timings) * 1000:.0f} ms, "
+          f"best {min(timings) * 1000:.0f} ms over {args.repeat} runs (includes interpreter start)")
+
+    print("\nLargest imports (cumulative):")
+    top = top_imports(args.top)
+    for cumulative_us, name in top:
+        print(f"  {cumulative_us / 1000:8.1f} ms  {name}")
+
+    loaded = run_python(['-c', CHECK_LAZY]).stdout.strip()
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump({
+                'python': platform.python_version(),
+                'machine': platform.machine(),
+                'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'median_ms': round(statistics.median(timings) * 1000, 1),
+                'best_ms': round(min(timings) * 1000, 1),
+                'runs': args.repeat,
+                'top_imports_ms': {name: round(cumulative_us / 1000, 1) for cumulative_us, name in top},
+                'lazy_modules_loaded': loaded.split(',') if loaded else [],
+            }, f, indent=2)
+        print(f"Wrote {args.output}")
+    if loaded:
+        print(f"\nLoaded at import but only needed on first use: {loaded}")
+        return 1
+    print("\nHeavy export/PDF libraries are not loaded at import")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,161 @@
+"""
+Deterministic fixture rows shaped like the dictionary-cursor results the
+views pass to jsonify() and the PDF generators. Nothing here touches MySQL.
+"""
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+START = datetime(2024, 4, 1, 9, 30)
+CATEGORIES = ['Office Supplies', 'Travel', 'Food & Dining', 'Utilities', 'Marketing', 'Software']
+CITIES = [('Mumbai', 'Maharashtra'), ('Bengaluru', 'Karnataka'), ('Chennai', 'Tamil Nadu'), ('Delhi', 'Delhi')]
+
+
+def amount(i, scale=100000):
+    return Decimal(f'{(i * 37) % scale}.{i % 100:02d}')
+
+
+def make_transaction_rows(count):
+    """Rows shaped like /api/transactions results"""
+    rows = []
+    for i in range(count):
+        created = START + timedelta(minutes=17 * i)
+        rows.append({
+            'id': i + 1,
+            'user_id': 42,
+            'unique_id': f'TXN{i:08d}',
+            'title': f'Payment {i}',
+            'purpose': CATEGORIES[i % len(CATEGORIES)],
+            'description': 'Office supplies and sundry expenses',
+            'amount': amount(i),
+            'transaction_type': 'debit' if i % 3 else 'credit',
+            'category': CATEGORIES[i % len(CATEGORIES)],
+            'transaction_date': created.date(),
+            'payment_method': 'online' if i % 2 else 'cash',
+            'bank_account_id': 7 if i % 2 else None,
+            'bank_name': 'HDFC Bank' if i % 2 else None,
+            'account_number': '50100012345678' if i % 2 else None,
+            'created_at': created,
+            'updated_at': created + timedelta(seconds=45),
+            'invoice_number': f'LNTP{i:03d}' if i % 5 == 0 else None,
+            'invoice_date': created.date() if i % 5 == 0 else None,
+            'due_date': (created + timedelta(days=30)).date() if i % 5 == 0 else None,
+            'sub_user_name': None,
+        })
+    return rows
+
+
+def make_expense_rows(count):
+    """Rows shaped like the expenses export query"""
+    rows = []
+    for i in range(count):
+        rows.append({
+            'id': i + 1,
+            'unique_id': f'EXP{i:08d}',
+            'purpose': CATEGORIES[i % len(CATEGORIES)],
+            'amount': amount(i, 20000),
+            'category': CATEGORIES[i % len(CATEGORIES)],
+            'payment_method': 'online' if i % 2 else 'cash',
+            'expense_date': (START + timedelta(hours=7 * i)).date(),
+            'bank_name': 'ICICI Bank' if i % 2 else None,
+            'account_number': '000401234567' if i % 2 else None,
+        })
+    return rows
+
+
+def make_invoice_rows(count):
+    """Rows shaped like the invoices export query"""
+    rows = []
+    for i in range(count):
+        rows.append({
+            'id': i + 1,
+            'unique_id': f'INV{i:08d}',
+            'invoice_number': f'LNTP{i:05d}',
+            'client_name': f'Client {i % 500} Pvt Ltd',
+            'invoice_type': 'in' if i % 4 == 0 else 'out',
+            'invoice_date': (START + timedelta(hours=5 * i)).date(),
+            'total_amount': amount(i, 500000),
+            'status': ('paid', 'sent', 'draft', 'overdue')[i % 4],
+        })
+    return rows
+
+
+def make_customer_rows(count):
+    """Rows shaped like the customers export query"""
+    rows = []
+    for i in range(count):
+        city, state = CITIES[i % len(CITIES)]
+        rows.append({
+            'id': i + 1,
+            'customer_code': f'CUST{i:06d}',
+            'name': f'Customer {i}',
+            'phone': f'98{i:08d}'[:10],
+            'email': f'customer{i}@example.com',
+            'outstanding_balance': amount(i, 250000),
+            'status': 'active' if i % 9 else 'inactive',
+            'city': city,
+            'state': state,
+        })
+    return rows
+
+
+def make_invoice(item_count, invoice_type='out'):
+    """(invoice, items, company, bank_details) as load_invoice_pdf_context() returns them"""
+    items = []
+    for i in range(item_count):
+        quantity = Decimal(1 + i % 5)
+        unit_price = amount(i + 1, 50000)
+        items.append({
+            'description': f'Consulting services, phase {i + 1}',
+            'quantity': quantity,
+            'unit_price': unit_price,
+            'total_price': quantity * unit_price,
+            'sac_code': '998313',
+            'tax_rate': Decimal('18.00'),
+        })
+    subtotal = sum(item['total_price'] for item in items)
+    tax = (subtotal * Decimal('0.18')).quantize(Decimal('0.01'))
+    invoice = {
+        'id': 1,
+        'invoice_number': 'LNTP00042',
+        'invoice_type': invoice_type,
+        'invoice_date': date(2024, 4, 15),
+        'due_date': date(2024, 5, 15),
+        'status': 'sent',
+        'client_name': 'Acme Industries Pvt Ltd',
+        'client_email': 'accounts@acme.example',
+        'client_address': '12 MG Road, Bengaluru',
+        'client_state': 'Karnataka',
+        'client_pin': '560001',
+        'client_gstin': '29ABCDE1234F1Z5',
+        'client_pan': 'ABCDE1234F',
+        'billing_company_name': 'Laitusneo Technologies',
+        'billing_address': '4th Floor, Bandra Kurla Complex',
+        'billing_state': 'Maharashtra',
+        'billing_pin': '400051',
+        'gstin_number': '27ABCDE1234F1Z5',
+        'pan_number': 'ABCDE1234F',
+        'subtotal': subtotal,
+        'tax_amount': tax,
+        'cgst_rate': Decimal('9.00'),
+        'cgst_amount': tax / 2,
+        'sgst_rate': Decimal('9.00'),
+        'sgst_amount': tax / 2,
+        'igst_rate': Decimal('0.00'),
+        'igst_amount': Decimal('0.00'),
+        'total_amount': subtotal + tax,
+        'received_amount': Decimal('0.00'),
+        'notes': 'Payment due within 30 days.',
+    }
+    company = {
+        'company_name': 'Laitusneo Technologies',
+        'company_email': 'billing@laitusneo.example',
+        'company_phone': '+91 22 4000 1234',
+        'company_address': '4th Floor, Bandra Kurla Complex, Mumbai',
+    }
+    bank_details = {
+        'bank_name': 'HDFC Bank',
+        'account_number': '50100012345678',
+        'ifsc_code': 'HDFC0000123',
+        'upi_id': 'laitusneo@hdfcbank',
+    }
+    return invoice, items, company, bank_details
@@ -0,0 +1,403 @@
+"""
+Scripted load against a running instance seeded by seed_data.py.
+
+Each virtual user logs in as one of the seeded tenants and loops over a
+weighted mix of scenarios until --duration runs out:
+
+    login             POST /login with a fresh session
+    dashboard         GET /api/dashboard/stats
+    lists             GET transactions, expenses, invoices, products and debts
+    invoice_pdf       POST /api/invoices, then GET /api/invoices/<id>/pdf
+    bulk_delete       POST five transactions, then /api/transactions/bulk-delete
+    sub_user_approval sub user files an expense request, owner approves it
+    sub_user_reversal sub user files a transaction request, owner approves it
+                      and then deletes the transaction it created
+
+Latency is recorded per endpoint and reported as p50/p95/p99 and
+requests/sec. Save a run with --output and pass it to a later run with
+--compare to see the change:
+
+    python app.py                                 # or gunicorn, against a local MySQL
+    python benchmarks/seed_data.py --users 20
+    python benchmarks/load_test.py --concurrency 16 --duration 60 --output before.json
+    python benchmarks/load_test.py --concurrency 16 --duration 60 --compare before.json
+
+--check-ledger connects to the database afterwards and fails the run if
+find_ledger_drift() reports drift for any seeded tenant, i.e. a scenario
+moved a balance without journaling it or reversed it under the wrong source.
+"""
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DEFAULT_MANIFEST = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'loadtest_manifest.json')
+
+SCENARIO_WEIGHTS = {
+    'login': 1,
+    'dashboard': 5,
+    'lists': 10,
+    'invoice_pdf': 2,
+    'bulk_delete': 1,
+    'sub_user_approval': 2,
+    'sub_user_reversal': 1,
+}
+
+LIST_ENDPOINTS = ['/api/transactions', '/api/expenses', '/api/invoices', '/api/products', '/api/banking/debts']
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Run scripted scenarios and report per-endpoint latency')
+    parser.add_argument('--base-url', default='http://127.0.0.1:5000')
+    parser.add_argument('--manifest', default=DEFAULT_MANIFEST, help='account list written by seed_data.py')
+    parser.add_argument('--concurrency', type=int, default=8, help='virtual users running in parallel')
+    parser.add_argument('--duration', type=float, default=60, help='seconds to run after warm-up')
+    parser.add_argument('--warmup', type=float, default=5, help='seconds of traffic not included in the results')
+    parser.add_argument('--scenarios', default=','.join(SCENARIO_WEIGHTS),
+                        help='comma-separated subset of: ' + ', '.join(SCENARIO_WEIGHTS))
+    parser.add_argument('--timeout', type=float, default=60, help='per-request timeout in seconds')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--compare', help='JSON results of an earlier run to compare against')
+    parser.add_argument('--check-ledger', action='store_true', help='fail if the ledger drifted for a seeded tenant')
+    parser.add_argument('--db-host', default=os.environ.get('BENCH_DB_HOST', 'localhost'))
+    parser.add_argument('--db-user', default=os.environ.get('BENCH_DB_USER', 'root'))
+    parser.add_argument('--db-password', default=os.environ.get('BENCH_DB_PASSWORD', ''))
+    parser.add_argument('--db-name', default=os.environ.get('BENCH_DB_NAME', 'expense_tracker'))
+    return parser.parse_args()
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100.0 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class Recorder:
+    """Latencies and errors per endpoint name, shared by all virtual users"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.recording = False
+
+    def add(self, name, elapsed, ok):
+        if not self.recording:
+            return
+        with self._lock:
+            self.latencies[name].append(elapsed)
+            if not ok:
+                self.errors[name] += 1
+
+    def summary(self, duration):
+        results = {}
+        with self._lock:
+            for name, values in self.latencies.items():
+                values = sorted(values)
+                results[name] = {
+                    'requests': len(values),
+                    'errors': self.errors.get(name, 0),
+                    'rps': round(len(values) / duration, 2),
+                    'p50_ms': round(percentile(values, 50) * 1000, 1),
+                    'p95_ms': round(percentile(values, 95) * 1000, 1),
+                    'p99_ms': round(percentile(values, 99) * 1000, 1),
+                    'max_ms': round(values[-1] * 1000, 1),
+                }
+        return results
+
+
+class Client:
+    """requests.Session that times each call under an endpoint name"""
+
+    def __init__(self, base_url, recorder, timeout):
+        self.base_url = base_url.rstrip('/')
+        self.recorder = recorder
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def call(self, name, method, path, expect=(200,), **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        kwargs.setdefault('allow_redirects', False)
+        started = time.perf_counter()
+        try:
+            response = self.session.request(method, self.base_url + path, **kwargs)
+            # Read the whole body so streamed and file responses are timed to the last byte
+            response.content
+        except requests.RequestException as e:
+            self.recorder.add(name, time.perf_counter() - started, False)
+            raise ScenarioError(f"{name}: {e}")
+        elapsed = time.perf_counter() - started
+        ok = response.status_code in expect
+        self.recorder.add(name, elapsed, ok)
+        if not ok:
+            raise ScenarioError(f"{name}: HTTP {response.status_code}")
+        return response
+
+
+class ScenarioError(Exception):
+    pass
+
+
+def login_owner(client, email, password):
+    response = client.call('POST /login', 'POST', '/login', expect=(302,),
+                           data={'email': email, 'password': password})
+    if '/login' in response.headers.get('Location', ''):
+        raise ScenarioError(f"login failed for {email}")
+
+
+def login_sub_user(client, sub_user_id, password):
+    response = client.call('POST /sub-user-login', 'POST', '/sub-user-login', expect=(302,),
+                           data={'sub_user_id': sub_user_id, 'password': password})
+    if '/login' in response.headers.get('Location', ''):
+        raise ScenarioError(f"sub user login failed for {sub_user_id}")
+
+
+class VirtualUser:
+    """One simulated tenant session running scenarios in a loop"""
+
+    def __init__(self, args, account, password, recorder, rng):
+        self.args = args
+        self.account = account
+        self.password = password
+        self.recorder = recorder
+        self.rng = rng
+        self.client = Client(args.base_url, recorder, args.timeout)
+        self.counter = 0
+
+    def new_client(self):
+        return Client(self.args.base_url, self.recorder, self.args.timeout)
+
+    def unique(self, prefix):
+        self.counter += 1
+        return f"{prefix}-{threading.get_ident()}-{self.counter}"
+
+    def scenario_login(self):
+        login_owner(self.new_client(), self.account['email'], self.password)
+
+    def scenario_dashboard(self):
+        self.client.call('GET /api/dashboard/stats', 'GET', '/api/dashboard/stats')
+
+    def scenario_lists(self):
+        for path in LIST_ENDPOINTS:
+            self.client.call(f'GET {path}', 'GET', path)
+
+    def scenario_invoice_pdf(self):
+        today = date.today()
+        items = [{
+            'description': f"Consulting {n}",
+            'quantity': self.rng.choice([1, 2, 5]),
+            'unit_price': round(self.rng.uniform(500, 20000), 2),
+            'sac_code': '998313',
+            'tax_rate': 18,
+        } for n in range(self.rng.choice([1, 2, 3]))]
+        response = self.client.call('POST /api/invoices', 'POST', '/api/invoices', json={
+            'invoice_type': 'out',
+            'status': 'draft',
+            'client_name': self.unique('Load Test Client'),
+            'client_email': 'client@loadtest.invalid',
+            'client_address': 'Mumbai',
+            'invoice_date': today.isoformat(),
+            'due_date': (today + timedelta(days=30)).isoformat(),
+            'items': items,
+        })
+        invoice_id = response.json()['id']
+        self.client.call('GET /api/invoices/<id>/pdf', 'GET', f'/api/invoices/{invoice_id}/pdf')
+
+    def scenario_bulk_delete(self):
+        ids = []
+        for _ in range(5):
+            response = self.client.call('POST /api/transactions', 'POST', '/api/transactions', data={
+                'title': self.unique('Load test'),
+                'amount': round(self.rng.uniform(10, 5000), 2),
+                'transaction_type': 'debit',
+                'category': 'Other',
+                'payment_method': 'cash',
+                'transaction_date': date.today().isoformat(),
+            })
+            ids.append(response.json()['id'])
+        self.client.call('POST /api/transactions/bulk-delete', 'POST', '/api/transactions/bulk-delete',
+                         json={'transaction_ids': ids})
+
+    def scenario_sub_user_approval(self):
+        if not self.account['sub_users']:
+            return
+        sub_client = self.new_client()
+        login_sub_user(sub_client, self.rng.choice(self.account['sub_users']), self.password)
+        title = self.unique('Load test claim')
+        sub_client.call('POST /api/sub-user/expense-requests', 'POST', '/api/sub-user/expense-requests', json={
+            'title': title,
+            'amount': round(self.rng.uniform(100, 3000), 2),
+            'category': 'Travel',
+            'expense_date': date.today().isoformat(),
+            'payment_method': 'cash',
+        })
+        response = self.client.call('GET /api/sub-user-requests/pending', 'GET', '/api/sub-user-requests/pending')
+        pending = [r for r in response.json().get('requests', []) if r.get('title') == title]
+        if not pending:
+            raise ScenarioError('submitted request not in the pending list')
+        self.client.call('PUT /api/sub-user-requests/<id>/approve', 'PUT',
+                         f"/api/sub-user-requests/{pending[0]['id']}/approve")
+
+    def scenario_sub_user_reversal(self):
+        if not self.account['sub_users']:
+            return
+        sub_client = self.new_client()
+        login_sub_user(sub_client, self.rng.choice(self.account['sub_users']), self.password)
+        title = self.unique('Load test request')
+        sub_client.call('POST /api/sub-user/transaction-requests', 'POST', '/api/sub-user/transaction-requests', json={
+            'title': title,
+            'description': 'Approved, then deleted by the owner',
+            'amount': round(self.rng.uniform(100, 3000), 2),
+            'transaction_type': self.rng.choice(['income', 'expense']),
+            'transaction_date': date.today().isoformat(),
+            'payment_method': 'cash',
+        })
+        response = self.client.call('GET /api/sub-user-requests/pending', 'GET', '/api/sub-user-requests/pending')
+        pending = [r for r in response.json().get('requests', []) if r.get('title') == title]
+        if not pending:
+            raise ScenarioError('submitted request not in the pending list')
+        self.client.call('PUT /api/sub-user-requests/<id>/approve', 'PUT',
+                         f"/api/sub-user-requests/{pending[0]['id']}/approve")
+        response = self.client.call('GET /api/transactions', 'GET', '/api/transactions', params={'limit': 50})
+        created = [t for t in response.json()['items'] if (t.get('title') or '').startswith(title)]
+        if not created:
+            raise ScenarioError('approved request did not create a transaction')
+        self.client.call('DELETE /api/transactions/<id>', 'DELETE', f"/api/transactions/{created[0]['id']}")
+
+    def run(self, scenarios, weights, deadline, failures):
+        try:
+            login_owner(self.client, self.account['email'], self.password)
+        except ScenarioError as e:
+            failures.append(str(e))
+            return
+        while time.monotonic() < deadline:
+            name = self.rng.choices(scenarios, weights)[0]
+            try:
+                getattr(self, f'scenario_{name}')()
+            except (ScenarioError, KeyError, ValueError) as e:
+                failures.append(f"{name}: {e}")
+
+
+def print_report(results, duration, baseline=None):
+    header = f"{'endpoint':<42} {'reqs':>7} {'err':>5} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}"
+    if baseline:
+        header += f" {'p95 vs base':>12} {'rps vs base':>12}"
+    print(header)
+    print('-' * len(header))
+    for name in sorted(results):
+        r = results[name]
+        line = (f"{name:<42} {r['requests']:>7} {r['errors']:>5} {r['rps']:>8.2f} "
+                f"{r['p50_ms']:>9.1f} {r['p95_ms']:>9.1f} {r['p99_ms']:>9.1f} {r['max_ms']:>9.1f}")
+        if baseline:
+            base = baseline.get(name)
+            line += f" {change(base and base['p95_ms'], r['p95_ms']):>12} {change(base and base['rps'], r['rps']):>12}"
+        print(line)
+    total = sum(r['requests'] for r in results.values())
+    errors = sum(r['errors'] for r in results.values())
+    print(f"\n{total} requests in {duration:.0f}s ({total / duration:.1f} req/s), {errors} errors")
+
+
+def check_ledger(args, accounts):
+    """Ledger drift for the seeded tenants (after the run, straight from the database)"""
+    import mysql.connector
+    from ledger import find_ledger_drift
+
+    connection = mysql.connector.connect(host=args.db_host, user=args.db_user,
+                                         password=args.db_password, database=args.db_name)
+    try:
+        user_ids = {account['user_id'] for account in accounts}
+        return [row for row in find_ledger_drift(connection) if row['user_id'] in user_ids]
+    finally:
+        connection.close()
+
+
+def change(before, after):
+    if not before:
+        return 'n/a'
+    return f"{(after - before) / before * 100:+.1f}%"
+
+
+def main():
+    args = parse_args()
+    with open(args.manifest) as f:
+        manifest = json.load(f)
+    accounts = manifest['users']
+    if not accounts:
+        print("The manifest has no users; run seed_data.py first")
+        return 1
+
+    scenarios = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = [name for name in scenarios if name not in SCENARIO_WEIGHTS]
+    if unknown:
+        print(f"Unknown scenarios: {', '.join(unknown)}")
+        return 1
+    weights = [SCENARIO_WEIGHTS[name] for name in scenarios]
+
+    recorder = Recorder()
+    failures = []
+    deadline = time.monotonic() + args.warmup + args.duration
+    threads = []
+    for i in range(args.concurrency):
+        user = VirtualUser(args, accounts[i % len(accounts)], manifest['password'], recorder,
+                           random.Random(args.seed + i))
+        thread = threading.Thread(target=user.run, args=(scenarios, weights, deadline, failures), daemon=True)
+        thread.start()
+        threads.append(thread)
+
+    print(f"Running {args.concurrency} virtual users against {args.base_url} "
+          f"({args.warmup:.0f}s warm-up, {args.duration:.0f}s measured)")
+    time.sleep(args.warmup)
+    recorder.recording = True
+    started = time.monotonic()
+    for thread in threads:
+        thread.join()
+    duration = time.monotonic() - started
+
+    results = recorder.summary(duration)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['endpoints']
+    print_report(results, duration, baseline)
+    if failures:
+        print(f"\n{len(failures)} scenario failures, first few:")
+        for failure in failures[:10]:
+            print(f"  {failure}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'base_url': args.base_url,
+                'concurrency': args.concurrency,
+                'duration': round(duration, 1),
+                'scenarios': scenarios,
+                'endpoints': results,
+            }, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.check_ledger:
+        drift = check_ledger(args, accounts)
+        if drift:
+            print(f"\nLedger drift for {len(drift)} accounts/sources, first few:")
+            for row in drift[:10]:
+                print(f"  {row}")
+            return 1
+        print("\nLedger: no drift for the seeded tenants")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,222 @@
+"""
+Microbenchmarks for the pure-Python hot paths and PDF generators in app.py.
+
+Runs offline: inputs come from fixtures.py and importing app.py does not
+touch the database, so no MySQL server is needed. Each case runs at several row
+counts; the suite records the median/best wall time and the peak traced
+memory (tracemalloc) of a single call, measured in a separate run so tracing
+overhead does not skew the timings.
+
+    python benchmarks/microbench.py                       # all cases, print results
+    python benchmarks/microbench.py --only pdf --quick    # subset, small sizes only
+    python benchmarks/microbench.py --save-baseline       # write baselines/microbench.json
+    python benchmarks/microbench.py --compare             # diff against the saved baseline
+
+--compare marks cases whose median time or peak memory grew more than
+--threshold (default 20%) and, with --fail-on-regression, exits non-zero.
+Baselines are machine-specific; compare runs taken on the same host. The
+committed baseline was recorded with --quick (the 50000-row cases alone
+take well over ten minutes), so compare with `--quick --compare`.
+"""
+import argparse
+import contextlib
+import gc
+import importlib.util
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines', 'microbench.json')
+
+sys.path.insert(0, REPO_ROOT)
+
+import fixtures
+
+LIST_SIZES = (10, 1000, 10000, 50000)
+INVOICE_SIZES = (10, 100, 1000)
+QUICK_LIMIT = 1000
+
+
+class Case:
+    """One function under test; setup(size) builds its arguments outside the timed region"""
+
+    def __init__(self, name, sizes, setup, run):
+        self.name = name
+        self.sizes = sizes
+        self.setup = setup
+        self.run = run
+
+
+def load_app():
+    """Import app.py (declares routes only; migrations run in create_app())"""
+    os.chdir(REPO_ROOT)  # the invoice generators resolve pdftemp*.html relative to the cwd
+    with quiet():
+        import app
+    return app
+
+
+@contextlib.contextmanager
+def quiet():
+    """Silence the DEBUG prints so they are not part of what is measured"""
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def build_cases(app, workdir):
+    def list_pdf(function, make_rows):
+        return lambda size: (make_rows(size),), lambda rows: function(rows)
+
+    def invoice_pdf(function, invoice_type):
+        def setup(size):
+            invoice, items, company, bank_details = fixtures.make_invoice(size, invoice_type)
+            path = os.path.join(workdir, f'{function.__name__}_{size}.pdf')
+            return invoice, items, company, bank_details, path, os.path.basename(path)
+        return setup, function
+
+    def amounts(size):
+        return ([(i * 7919) % 10000000 + 0.5 for i in range(size)],)
+
+    def words(values):
+        for value in values:
+            app.convert_number_to_words(value)
+
+    def text_pdf(size):
+        """One tall page holding `size` spans, so extraction cost scales with size"""
+        import fitz
+        doc = fitz.open()
+        page = doc.new_page(width=595, height=max(842, 14 * size + 72))
+        for i in range(size):
+            page.insert_text((36, 36 + 14 * i), f'Line {i}: Consulting services  Rs. {i * 37:,}.00', fontsize=10)
+        path = os.path.join(workdir, f'text_{size}.pdf')
+        doc.save(path)
+        doc.close()
+        return (path,)
+
+    cases = [
+        Case('convert_number_to_words', LIST_SIZES, amounts, words),
+        Case('generate_transactions_pdf', LIST_SIZES, *list_pdf(app.generate_transactions_pdf, fixtures.make_transaction_rows)),
+        Case('generate_expenses_pdf', LIST_SIZES, *list_pdf(app.generate_expenses_pdf, fixtures.make_expense_rows)),
+        Case('generate_invoices_pdf', LIST_SIZES, *list_pdf(app.generate_invoices_pdf, fixtures.make_invoice_rows)),
+        Case('generate_customers_pdf', LIST_SIZES, *list_pdf(app.generate_customers_pdf, fixtures.make_customer_rows)),
+        Case('generate_pdftemp_invoice[out]', INVOICE_SIZES, *invoice_pdf(app.generate_pdftemp_invoice, 'out')),
+        Case('generate_pdftemp_invoice[in]', INVOICE_SIZES, *invoice_pdf(app.generate_pdftemp_invoice, 'in')),
+        Case('generate_reportlab_fallback', INVOICE_SIZES, *invoice_pdf(app.generate_reportlab_fallback, 'out')),
+        Case('generate_pdftemp_with_reportlab', INVOICE_SIZES, *invoice_pdf(app.generate_pdftemp_with_reportlab, 'out')),
+    ]
+    if importlib.util.find_spec('fitz') is not None:
+        cases.append(Case('extract_text_positions', (10, 1000, 10000), text_pdf, app.extract_text_positions))
+    return cases
+
+
+def measure(case, size, repeat, budget):
+    """Median/best seconds over up to `repeat` calls (stopping early past `budget`), then peak bytes of one call"""
+    args = case.setup(size)
+    timings = []
+    with quiet():
+        case.run(*args)  # warm-up: imports, template compilation, font loading
+        spent = 0.0
+        while len(timings) < repeat and (not timings or spent < budget):
+            gc.collect()
+            started = time.perf_counter()
+            case.run(*args)
+            elapsed = time.perf_counter() - started
+            timings.append(elapsed)
+            spent += elapsed
+
+        gc.collect()
+        tracemalloc.start()
+        try:
+            case.run(*args)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return {
+        'median_ms': round(statistics.median(timings) * 1000, 3),
+        'best_ms': round(min(timings) * 1000, 3),
+        'peak_kib': round(peak / 1024, 1),
+        'samples': len(timings),
+    }
+
+
+def compare(results, baseline, threshold):
+    """Print deltas against the baseline; returns the keys that regressed"""
+    regressed = []
+    print(f"\n{'case':<48} {'time':>10} {'memory':>10}")
+    for key, result in results.items():
+        base = baseline.get(key)
+        if not base:
+            print(f"{key:<48} {'new':>10} {'new':>10}")
+            continue
+        time_change = (result['median_ms'] - base['median_ms']) / base['median_ms'] if base['median_ms'] else 0.0
+        memory_change = (result['peak_kib'] - base['peak_kib']) / base['peak_kib'] if base['peak_kib'] else 0.0
+        flag = ''
+        if time_change > threshold or memory_change > threshold:
+            flag = '  REGRESSION'
+            regressed.append(key)
+        print(f"{key:<48} {time_change:>+10.1%} {memory_change:>+10.1%}{flag}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time and peak memory of app.py hot paths at several input sizes')
+    parser.add_argument('--only', action='append', default=[], help='run cases whose name contains this (repeatable)')
+    parser.add_argument('--quick', action='store_true', help=f'skip sizes above {QUICK_LIMIT}')
+    parser.add_argument('--repeat', type=int, default=5, help='timed calls per case and size')
+    parser.add_argument('--budget', type=float, default=10.0, help='stop repeating a case after this many seconds')
+    parser.add_argument('--output', help='also write this run as JSON')
+    parser.add_argument('--save-baseline', nargs='?', const=DEFAULT_BASELINE, help='store this run as the baseline')
+    parser.add_argument('--compare', nargs='?', const=DEFAULT_BASELINE, help='compare against a saved baseline')
+    parser.add_argument('--threshold', type=float, default=0.2, help='relative growth reported as a regression')
+    parser.add_argument('--fail-on-regression', action='store_true')
+    args = parser.parse_args()
+    # load_app() changes directory; resolve file arguments first
+    for name in ('output', 'save_baseline', 'compare'):
+        if getattr(args, name):
+            setattr(args, name, os.path.abspath(getattr(args, name)))
+
+    app = load_app()
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='microbench-') as workdir:
+        cases = build_cases(app, workdir)
+        if args.only:
+            cases = [case for case in cases if any(pattern in case.name for pattern in args.only)]
+        print(f"{'case':<48} {'median ms':>11} {'best ms':>11} {'peak KiB':>11} {'n':>4}")
+        for case in cases:
+            for size in case.sizes:
+                if args.quick and size > QUICK_LIMIT:
+                    continue
+                key = f"{case.name}/{size}"
+                result = measure(case, size, args.repeat, args.budget)
+                results[key] = result
+                print(f"{key:<48} {result['median_ms']:>11.2f} {result['best_ms']:>11.2f} "
+                      f"{result['peak_kib']:>11.1f} {result['samples']:>4}")
+
+    run = {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': results,
+    }
+    for path in filter(None, (args.output, args.save_baseline)):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(run, f, indent=2)
+        print(f"Wrote {path}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+        regressed = compare(results, baseline, args.threshold)
+        if regressed and args.fail_on_regression:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
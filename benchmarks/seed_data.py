@@ -0,0 +1,417 @@
+"""
+Synthetic multi-tenant dataset for load testing.
+
+Bulk-inserts users with their bank accounts, sub users (with pending expense
+requests to approve), customers, debts with EMIs, products, invoices with
+items, transactions and expenses straight into the expense_tracker schema.
+Run it against a local MySQL copy, never production:
+
+    python benchmarks/seed_data.py --users 50 --transactions 2000 --expenses 800
+    python benchmarks/seed_data.py --reset          # remove previously seeded data
+
+Every seeded user has an email like bench-0007@loadtest.invalid and the
+password given by --user-password; load_test.py reads the manifest written
+at the end to know which accounts to log in as.
+
+Per-user activity is skewed (a few busy tenants, many quiet ones), amounts
+are log-normal and dates cluster on weekdays and recent months, so list and
+dashboard queries see realistic row counts rather than a uniform grid.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+import mysql.connector
+from werkzeug.security import generate_password_hash
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ledger import seed_opening_entries
+
+EMAIL_DOMAIN = 'loadtest.invalid'
+EMAIL_PATTERN = f'bench-%@{EMAIL_DOMAIN}'
+DEFAULT_MANIFEST = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'loadtest_manifest.json')
+BATCH_SIZE = 1000
+
+TRANSACTION_CATEGORIES = [
+    ('Business Income', 18), ('Salary', 6), ('Bills', 14), ('Groceries', 10), ('Transportation', 10),
+    ('Healthcare', 4), ('Entertainment', 5), ('Investment', 3), ('Other', 8),
+]
+EXPENSE_CATEGORIES = [
+    ('Office Supplies', 20), ('Travel', 15), ('Food & Dining', 18), ('Utilities', 12),
+    ('Marketing', 8), ('Equipment', 6), ('Software', 10), ('Other', 6),
+]
+BANK_NAMES = ['State Bank of India', 'HDFC Bank', 'ICICI Bank', 'Axis Bank', 'Kotak Mahindra Bank']
+CITIES = [('Mumbai', 'Maharashtra'), ('Pune', 'Maharashtra'), ('Bengaluru', 'Karnataka'),
+          ('Chennai', 'Tamil Nadu'), ('Hyderabad', 'Telangana'), ('Delhi', 'Delhi')]
+FIRST_NAMES = ['Aarav', 'Diya', 'Ishaan', 'Kavya', 'Rohan', 'Saanvi', 'Vivaan', 'Ananya', 'Arjun', 'Meera']
+LAST_NAMES = ['Sharma', 'Patel', 'Iyer', 'Reddy', 'Gupta', 'Nair', 'Das', 'Kulkarni', 'Singh', 'Menon']
+PRODUCTS = ['Consulting Hour', 'Annual Support', 'Laptop', 'Monitor', 'Cloud Hosting', 'Design Package',
+            'Training Session', 'Audit Report', 'License Seat', 'Installation']
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Seed a synthetic multi-tenant dataset for load testing')
+    parser.add_argument('--users', type=int, default=20, help='tenants (owner accounts) to create')
+    parser.add_argument('--sub-users', type=int, default=3, help='sub users per tenant')
+    parser.add_argument('--pending-requests', type=int, default=10, help='pending expense requests per sub user')
+    parser.add_argument('--bank-accounts', type=int, default=2, help='bank accounts per tenant')
+    parser.add_argument('--customers', type=int, default=40, help='customers per tenant (average)')
+    parser.add_argument('--debts', type=int, default=15, help='debts per tenant (average)')
+    parser.add_argument('--products', type=int, default=30, help='products per tenant (average)')
+    parser.add_argument('--invoices', type=int, default=200, help='invoices per tenant (average)')
+    parser.add_argument('--transactions', type=int, default=1000, help='transactions per tenant (average)')
+    parser.add_argument('--expenses', type=int, default=500, help='expenses per tenant (average)')
+    parser.add_argument('--days', type=int, default=365, help='spread dates over this many past days')
+    parser.add_argument('--seed', type=int, default=42, help='random seed (same seed, same dataset)')
+    parser.add_argument('--user-password', default='bench-password', help='password for every seeded account')
+    parser.add_argument('--manifest', default=DEFAULT_MANIFEST, help='where to write the account list')
+    parser.add_argument('--reset', action='store_true', help='delete previously seeded data and exit')
+    parser.add_argument('--db-host', default=os.environ.get('BENCH_DB_HOST', 'localhost'))
+    parser.add_argument('--db-user', default=os.environ.get('BENCH_DB_USER', 'root'))
+    parser.add_argument('--db-password', default=os.environ.get('BENCH_DB_PASSWORD', ''))
+    parser.add_argument('--db-name', default=os.environ.get('BENCH_DB_NAME', 'expense_tracker'))
+    return parser.parse_args()
+
+
+class Generator:
+    """Random values with the shapes real tenants produce"""
+
+    def __init__(self, seed, days):
+        self.rng = random.Random(seed)
+        self.days = days
+        self.today = date.today()
+
+    def activity(self):
+        """Multiplier for a tenant's row counts; log-normal with mean 1"""
+        sigma = 0.8
+        return self.rng.lognormvariate(-sigma * sigma / 2, sigma)
+
+    def count(self, average, weight):
+        return max(1, int(round(average * weight)))
+
+    def amount(self, median=1800, sigma=1.1, low=10, high=500000):
+        value = self.rng.lognormvariate(0, sigma) * median
+        return round(min(max(value, low), high), 2)
+
+    def past_date(self):
+        """Skewed toward recent days; weekends are a third as likely"""
+        while True:
+            offset = int(self.rng.triangular(0, self.days, 0))
+            day = self.today - timedelta(days=offset)
+            if day.weekday() < 5 or self.rng.random() < 0.33:
+                return day
+
+    def weighted(self, choices):
+        values, weights = zip(*choices)
+        return self.rng.choices(values, weights)[0]
+
+    def person(self):
+        return self.rng.choice(FIRST_NAMES), self.rng.choice(LAST_NAMES)
+
+    def phone(self):
+        return f"9{self.rng.randrange(10 ** 8, 10 ** 9)}"
+
+
+def insert_many(cursor, sql, rows):
+    for start in range(0, len(rows), BATCH_SIZE):
+        cursor.executemany(sql, rows[start:start + BATCH_SIZE])
+
+
+def ids_by_key(cursor, table, key_column, user_id, keys):
+    """Map seeded natural keys back to auto-increment ids"""
+    mapping = {}
+    for start in range(0, len(keys), BATCH_SIZE):
+        chunk = keys[start:start + BATCH_SIZE]
+        placeholders = ', '.join(['%s'] * len(chunk))
+        cursor.execute(f"SELECT {key_column}, id FROM {table} WHERE user_id = %s AND {key_column} IN ({placeholders})",
+                       [user_id] + chunk)
+        mapping.update(dict(cursor.fetchall()))
+    return mapping
+
+
+def seed_user(cursor, gen, args, index, password_hash):
+    """Create one tenant and everything it owns; returns its manifest entry"""
+    rng = gen.rng
+    weight = gen.activity()
+    first, last = gen.person()
+    email = f"bench-{index:04d}@{EMAIL_DOMAIN}"
+    tag = f"B{index:04d}"
+
+    cursor.execute(
+        "INSERT INTO users (username, email, password_hash, first_name, last_name) VALUES (%s, %s, %s, %s, %s)",
+        (f"bench{index:04d}", email, password_hash, first, last)
+    )
+    user_id = cursor.lastrowid
+    cursor.execute("UPDATE users SET cash_balance = %s WHERE id = %s", (gen.amount(median=50000), user_id))
+
+    bank_rows = []
+    for i in range(args.bank_accounts):
+        balance = gen.amount(median=250000, sigma=0.9)
+        bank_rows.append((user_id, rng.choice(BANK_NAMES), f"{tag}{i:02d}{rng.randrange(10 ** 9, 10 ** 10)}",
+                          f"BNCH0{rng.randrange(100000, 999999)}", None, balance, balance, i == 0))
+    insert_many(cursor, """
+        INSERT INTO bank_accounts (user_id, bank_name, account_number, ifsc_code, upi_id, initial_balance, current_balance, is_default)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+    """, bank_rows)
+    cursor.execute("SELECT id FROM bank_accounts WHERE user_id = %s ORDER BY id", (user_id,))
+    bank_ids = [row[0] for row in cursor.fetchall()]
+
+    def payment():
+        if bank_ids and rng.random() < 0.6:
+            return 'online', rng.choice(bank_ids)
+        return 'cash', None
+
+    # Customers, debts and EMIs
+    customer_rows = []
+    for i in range(gen.count(args.customers, weight)):
+        cfirst, clast = gen.person()
+        city, state = rng.choice(CITIES)
+        customer_rows.append((user_id, f"{tag}-CUST{i:05d}", f"{cfirst} {clast}", gen.phone(),
+                              f"{cfirst.lower()}.{clast.lower()}{i}@{EMAIL_DOMAIN}", f"{rng.randrange(1, 500)} Main Road",
+                              city, state, f"{rng.randrange(400000, 700000)}", None, None,
+                              'active' if rng.random() < 0.9 else 'inactive', None))
+    insert_many(cursor, """
+        INSERT INTO customers (user_id, customer_code, name, phone, email, address, city, state, pincode, pan_number, aadhar_number, status, notes)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    """, customer_rows)
+    customer_ids = list(ids_by_key(cursor, 'customers', 'customer_code', user_id,
+                                   [row[1] for row in customer_rows]).values())
+
+    debt_rows = []
+    for i in range(gen.count(args.debts, weight)):
+        total = gen.amount(median=60000, sigma=0.8)
+        paid = round(total * rng.choice([0, 0, 0.1, 0.25, 0.5, 1.0]), 2)
+        start = gen.past_date()
+        emi_count = rng.choice([0, 0, 3, 6, 12])
+        status = 'settled' if paid >= total else ('overdue' if rng.random() < 0.15 else 'active')
+        debt_rows.append((user_id, rng.choice(customer_ids), f"{tag}-DEBT{i:05d}", total, paid, round(total - paid, 2),
+                          rng.choice([0, 0, 8.5, 12, 18]), start + timedelta(days=30 * max(emi_count, 1)), start,
+                          status, 'Working capital', None, emi_count > 0, emi_count,
+                          round(total / emi_count, 2) if emi_count else 0, None, None))
+    insert_many(cursor, """
+        INSERT INTO debts (user_id, customer_id, debt_code, total_amount, paid_amount, balance, interest_rate,
+                           due_date, start_date, status, loan_purpose, notes, emi_enabled, emi_count, emi_amount, product_id, transaction_id)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    """, debt_rows)
+    debt_ids = ids_by_key(cursor, 'debts', 'debt_code', user_id, [row[2] for row in debt_rows])
+    emi_rows = []
+    for row in debt_rows:
+        emi_count = row[13]
+        for n in range(1, emi_count + 1):
+            due = row[8] + timedelta(days=30 * n)
+            paid = due < gen.today and rng.random() < 0.7
+            emi_rows.append((debt_ids[row[2]], row[1], user_id, n, due, row[14], row[14] if paid else 0,
+                             'paid' if paid else ('overdue' if due < gen.today else 'pending'),
+                             due if paid else None))
+    insert_many(cursor, """
+        INSERT INTO emis (debt_id, customer_id, user_id, installment_number, due_date, amount, paid_amount, status, paid_date)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+    """, emi_rows)
+
+    # Products
+    product_rows = []
+    for i in range(gen.count(args.products, weight)):
+        price = gen.amount(median=2500, sigma=1.0)
+        product_rows.append((user_id, f"{rng.choice(PRODUCTS)} {i}", f"{tag}-P{i:05d}", None, rng.randrange(0, 500),
+                             price, '998313', round(price * rng.uniform(0.5, 0.9), 2), rng.choice(['Services', 'Hardware', 'Software']),
+                             f"{tag}-SKU{i:05d}", 'pcs', 'active'))
+    insert_many(cursor, """
+        INSERT INTO products (user_id, product_name, product_code, description, quantity,
+                              unit_price, sac_code, cost_price, category, sku, unit, status)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    """, product_rows)
+    product_ids = list(ids_by_key(cursor, 'products', 'product_code', user_id, [row[2] for row in product_rows]).values())
+
+    # Invoices with 1-6 items each
+    invoice_rows = []
+    invoice_items = {}
+    for i in range(gen.count(args.invoices, weight)):
+        invoice_type = 'out' if rng.random() < 0.7 else 'in'
+        invoice_date = gen.past_date()
+        items = []
+        for _ in range(rng.choice([1, 1, 2, 2, 3, 4, 6])):
+            quantity = rng.choice([1, 1, 2, 3, 5, 10])
+            unit_price = gen.amount(median=3000, sigma=0.9)
+            items.append((rng.choice(PRODUCTS), quantity, unit_price, round(quantity * unit_price, 2),
+                          '998313', 18, rng.choice(product_ids) if product_ids and rng.random() < 0.5 else None))
+        subtotal = round(sum(item[3] for item in items), 2)
+        tax = round(subtotal * 0.18, 2)
+        cfirst, clast = gen.person()
+        number = f"{tag}-{'LNTS' if invoice_type == 'in' else 'LNTP'}{i:05d}"
+        invoice_rows.append((user_id, number, number, f"{cfirst} {clast} Pvt Ltd", f"accounts{i}@{EMAIL_DOMAIN}",
+                             rng.choice(CITIES)[0], invoice_date, invoice_date + timedelta(days=30),
+                             subtotal, tax, round(subtotal + tax, 2),
+                             gen.weighted([('paid', 50), ('sent', 25), ('draft', 15), ('overdue', 10)]),
+                             invoice_type, None))
+        invoice_items[number] = items
+    insert_many(cursor, """
+        INSERT INTO invoices (user_id, unique_id, invoice_number, client_name, client_email, client_address,
+                              invoice_date, due_date, subtotal, tax_amount, total_amount, status, invoice_type, notes)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    """, invoice_rows)
+    invoice_ids = ids_by_key(cursor, 'invoices', 'unique_id', user_id, list(invoice_items))
+    item_rows = [(invoice_ids[number],) + item for number, items in invoice_items.items() for item in items]
+    insert_many(cursor, """
+        INSERT INTO invoice_items (invoice_id, description, quantity, unit_price, total_price, sac_code, tax_rate, product_id)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+    """, item_rows)
+
+    # Transactions and expenses
+    transaction_rows = []
+    for i in range(gen.count(args.transactions, weight)):
+        transaction_type = 'credit' if rng.random() < 0.4 else 'debit'
+        category = 'Business Income' if transaction_type == 'credit' and rng.random() < 0.7 else gen.weighted(TRANSACTION_CATEGORIES)
+        method, bank_id = payment()
+        transaction_rows.append((user_id, f"{tag}-TXN{i:07d}", f"{category} {i}", None, category,
+                                 gen.amount(), transaction_type, category, method, gen.past_date(), bank_id))
+    insert_many(cursor, """
+        INSERT INTO transactions (user_id, unique_id, title, description, purpose, amount, transaction_type,
+                                  category, payment_method, transaction_date, bank_account_id)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    """, transaction_rows)
+
+    expense_rows = []
+    for i in range(gen.count(args.expenses, weight)):
+        category = gen.weighted(EXPENSE_CATEGORIES)
+        method, bank_id = payment()
+        expense_rows.append((user_id, f"{tag}-EXP{i:07d}", f"{category} {i}", category, None, gen.amount(median=1200),
+                             category, method, 'invoice' if rng.random() < 0.2 else 'non_invoice',
+                             'upcoming' if rng.random() < 0.1 else 'completed', gen.past_date(), bank_id))
+    insert_many(cursor, """
+        INSERT INTO expenses (user_id, unique_id, title, purpose, description, amount, category, payment_method,
+                              payment_type, expense_type, expense_date, bank_account_id)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    """, expense_rows)
+
+    # Sub users with requests waiting for approval
+    sub_user_ids = []
+    request_rows = []
+    for i in range(args.sub_users):
+        sfirst, slast = gen.person()
+        login_id = f"{tag}S{i:02d}"
+        cursor.execute("""
+            INSERT INTO sub_users (sub_user_id, password_hash, first_name, last_name, email, created_by)
+            VALUES (%s, %s, %s, %s, %s, %s)
+        """, (login_id, password_hash, sfirst, slast, f"{login_id.lower()}@{EMAIL_DOMAIN}", user_id))
+        sub_id = cursor.lastrowid
+        sub_user_ids.append(login_id)
+        for j in range(args.pending_requests):
+            category = gen.weighted(EXPENSE_CATEGORIES)
+            request_rows.append((sub_id, 'expense', json.dumps({
+                'title': f"{category} claim {j}",
+                'description': '',
+                'amount': gen.amount(median=900),
+                'category': category,
+                'expense_date': gen.past_date().isoformat(),
+                'payment_method': 'cash',
+                'payment_type': 'non_invoice',
+                'bank_account_type': None,
+                'bank_account_id': None,
+                'unique_id': f"{login_id}-EXP{j:05d}"
+            }), 'pending'))
+    insert_many(cursor, """
+        INSERT INTO sub_user_requests (sub_user_id, request_type, request_data, status)
+        VALUES (%s, %s, %s, %s)
+    """, request_rows)
+
+    return {
+        'user_id': user_id,
+        'email': email,
+        'sub_users': sub_user_ids,
+        'bank_account_ids': bank_ids,
+        'rows': {
+            'customers': len(customer_rows), 'debts': len(debt_rows), 'emis': len(emi_rows),
+            'products': len(product_rows), 'invoices': len(invoice_rows), 'invoice_items': len(item_rows),
+            'transactions': len(transaction_rows), 'expenses': len(expense_rows),
+            'sub_user_requests': len(request_rows),
+        }
+    }
+
+
+# Child tables first; tables missing from this install are skipped
+SEEDED_TABLES = [
+    ('emis', 'user_id'), ('debt_payments', 'user_id'), ('debts', 'user_id'), ('customers', 'user_id'),
+    ('invoices', 'user_id'), ('transactions', 'user_id'), ('expenses', 'user_id'), ('products', 'user_id'),
+    ('bank_accounts', 'user_id'), ('sub_users', 'created_by'), ('user_sessions', 'user_id'),
+    ('ledger_entries', 'user_id'), ('ledger_snapshots', 'user_id'), ('collection_versions', 'owner_id'),
+]
+
+
+def reset(cursor):
+    """Delete every seeded tenant and the rows that belong to it"""
+    cursor.execute("SELECT id FROM users WHERE email LIKE %s", (EMAIL_PATTERN,))
+    user_ids = [row[0] for row in cursor.fetchall()]
+    if not user_ids:
+        return 0
+    cursor.execute("SELECT table_name FROM information_schema.tables WHERE table_schema = DATABASE()")
+    existing = {row[0] for row in cursor.fetchall()}
+    placeholders = ', '.join(['%s'] * len(user_ids))
+    cursor.execute(f"""
+        DELETE ii FROM invoice_items ii JOIN invoices i ON ii.invoice_id = i.id
+        WHERE i.user_id IN ({placeholders})
+    """, user_ids)
+    cursor.execute(f"""
+        DELETE sur FROM sub_user_requests sur JOIN sub_users su ON sur.sub_user_id = su.id
+        WHERE su.created_by IN ({placeholders})
+    """, user_ids)
+    for table, column in SEEDED_TABLES:
+        if table in existing:
+            cursor.execute(f"DELETE FROM {table} WHERE {column} IN ({placeholders})", user_ids)
+    cursor.execute(f"DELETE FROM users WHERE id IN ({placeholders})", user_ids)
+    return len(user_ids)
+
+
+def main():
+    args = parse_args()
+    connection = mysql.connector.connect(host=args.db_host, user=args.db_user,
+                                         password=args.db_password, database=args.db_name)
+    cursor = connection.cursor()
+    try:
+        removed = reset(cursor)
+        connection.commit()
+        if removed:
+            print(f"Removed {removed} previously seeded users")
+        if args.reset:
+            if os.path.exists(args.manifest):
+                os.remove(args.manifest)
+            return
+
+        gen = Generator(args.seed, args.days)
+        # Hashing is deliberately slow; every seeded account shares one hash
+        password_hash = generate_password_hash(args.user_password)
+        accounts = []
+        totals = {}
+        started = time.perf_counter()
+        for index in range(args.users):
+            account = seed_user(cursor, gen, args, index, password_hash)
+            connection.commit()
+            accounts.append(account)
+            for table, count in account['rows'].items():
+                totals[table] = totals.get(table, 0) + count
+            print(f"Seeded {account['email']}: {account['rows']['transactions']} transactions, "
+                  f"{account['rows']['invoices']} invoices")
+        # Seeded balances are written straight to the counters; open them in the ledger
+        seed_opening_entries(cursor)
+        connection.commit()
+
+        elapsed = time.perf_counter() - started
+        with open(args.manifest, 'w') as f:
+            json.dump({'password': args.user_password, 'seed': args.seed, 'users': accounts}, f, indent=2)
+        print(f"\nSeeded {len(accounts)} users in {elapsed:.1f}s; manifest written to {args.manifest}")
+        for table, count in sorted(totals.items()):
+            print(f"  {table:<18} {count:>10,}")
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+        connection.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
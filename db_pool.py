@@ -0,0 +1,288 @@
+"""
+Pooled MySQL connections for Laitusneo Track.
+
+get_db_connection() in app.py hands out PooledConnection proxies from a
+single process-wide ConnectionPool. Callers keep using the connection exactly
+as before; calling close() returns the underlying socket to the pool instead
+of tearing it down.
+
+An optional observer (see instrumentation.py) is told how long each checkout
+took and may wrap the cursors connections hand out.
+"""
+import threading
+import time
+from collections import deque
+
+import mysql.connector
+from mysql.connector.errors import PoolError
+
+
+class PoolTimeoutError(PoolError):
+    """Raised when no connection becomes available within the pool timeout"""
+
+
+class PooledConnection:
+    """Proxy around a raw MySQL connection checked out from a ConnectionPool"""
+
+    def __init__(self, pool, raw_connection, created_at):
+        self._pool = pool
+        self._raw = raw_connection
+        self._created_at = created_at
+        self._autocommit_changed = False
+
+    def close(self):
+        """Return the connection to the pool (safe to call more than once)"""
+        raw = self._raw
+        if raw is None:
+            return
+        self._raw = None
+        self._pool._release(raw, self._created_at, restore_autocommit=self._autocommit_changed)
+
+    def is_connected(self):
+        return self._raw is not None and self._raw.is_connected()
+
+    def cursor(self, *args, **kwargs):
+        if self._raw is None:
+            raise PoolError("Connection has already been returned to the pool")
+        cursor = self._raw.cursor(*args, **kwargs)
+        observer = self._pool.observer
+        return observer.wrap_cursor(cursor) if observer is not None else cursor
+
+    def __getattr__(self, name):
+        raw = self.__dict__.get('_raw')
+        if raw is None:
+            raise PoolError("Connection has already been returned to the pool")
+        return getattr(raw, name)
+
+    def __setattr__(self, name, value):
+        # Settings such as `connection.autocommit = True` belong to the real connection
+        if name.startswith('_'):
+            object.__setattr__(self, name, value)
+            return
+        raw = self.__dict__.get('_raw')
+        if raw is None:
+            raise PoolError("Connection has already been returned to the pool")
+        if name == 'autocommit':
+            object.__setattr__(self, '_autocommit_changed', True)
+        setattr(raw, name, value)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __del__(self):
+        # Safety net for code paths that forget to close on error
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class ConnectionPool:
+    """Thread-safe MySQL connection pool with overflow, timeout and health checks"""
+
+    RATE_WINDOW_SECONDS = 60
+
+    def __init__(self, db_config, pool_size=10, max_overflow=10, timeout=30,
+                 recycle=3600, ping_after=30, observer=None):
+        self.db_config = dict(db_config)
+        self.observer = observer
+        self.pool_size = max(1, int(pool_size))
+        self.max_overflow = max(0, int(max_overflow))
+        self.timeout = float(timeout)
+        self.recycle = recycle
+        self.ping_after = ping_after
+        # Session default every released connection is put back to
+        self.autocommit = bool(self.db_config.get('autocommit', False))
+
+        self._cond = threading.Condition()
+        self._idle = deque()  # (raw_connection, created_at, last_used)
+        self._opened = 0
+
+        self._checkouts = 0
+        self._waits = 0
+        self._wait_time = 0.0
+        self._timeouts = 0
+        self._created = 0
+        self._discarded = 0
+        self._health_check_failures = 0
+        self._checkout_times = deque()
+
+    @property
+    def max_connections(self):
+        return self.pool_size + self.max_overflow
+
+    def get_connection(self):
+        """Check out a healthy connection, waiting up to `timeout` seconds"""
+        start = time.monotonic()
+        deadline = start + self.timeout
+        waited = False
+
+        with self._cond:
+            while True:
+                if self._idle:
+                    raw, created_at, last_used = self._idle.pop()
+                    break
+                if self._opened < self.max_connections:
+                    self._opened += 1
+                    raw = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolTimeoutError(
+                        f"Timed out after {self.timeout}s waiting for a database connection "
+                        f"({self._opened} open, max {self.max_connections})"
+                    )
+                if not waited:
+                    waited = True
+                    self._waits += 1
+                self._cond.wait(remaining)
+
+            if waited:
+                self._wait_time += time.monotonic() - start
+
+        if raw is not None:
+            raw = self._check_health(raw, created_at, last_used)
+            if raw is None:
+                # Stale connection was discarded; its slot is reused for a fresh one
+                created_at = None
+        if raw is None:
+            raw = self._open_connection()
+            created_at = time.monotonic()
+
+        now = time.monotonic()
+        with self._cond:
+            self._checkouts += 1
+            self._checkout_times.append(now)
+            self._trim_rate_window(now)
+
+        if self.observer is not None:
+            self.observer.connection_acquired(now - start)
+        return PooledConnection(self, raw, created_at)
+
+    def _open_connection(self):
+        try:
+            raw = mysql.connector.connect(**self.db_config)
+        except Exception:
+            with self._cond:
+                self._opened -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._created += 1
+        return raw
+
+    def _check_health(self, raw, created_at, last_used):
+        """Return raw if it is still usable, otherwise close it and return None"""
+        now = time.monotonic()
+        healthy = True
+        if self.recycle and now - created_at > self.recycle:
+            healthy = False
+        elif self.ping_after is not None and now - last_used >= self.ping_after:
+            try:
+                raw.ping(reconnect=False)
+            except Exception:
+                healthy = False
+                with self._cond:
+                    self._health_check_failures += 1
+
+        if healthy:
+            return raw
+
+        self._close_quietly(raw)
+        with self._cond:
+            self._discarded += 1
+        return None
+
+    def _release(self, raw, created_at, restore_autocommit=False):
+        """Reset a connection and put it back in the idle queue (or discard it if the reset fails)"""
+        reusable = True
+        try:
+            # Never hand a half-finished transaction (or a stale snapshot) to the next caller
+            if raw.unread_result or raw.in_transaction:
+                raw.rollback()
+            # Nor a session left in the previous borrower's autocommit mode
+            if restore_autocommit:
+                raw.autocommit = self.autocommit
+        except Exception:
+            reusable = False
+
+        with self._cond:
+            if reusable and len(self._idle) < self.pool_size:
+                self._idle.append((raw, created_at, time.monotonic()))
+                raw = None
+            else:
+                self._opened -= 1
+                self._discarded += 1
+            self._cond.notify()
+
+        if raw is not None:
+            self._close_quietly(raw)
+
+    def dispose(self):
+        """Close every idle connection; checked-out ones are closed on release"""
+        with self._cond:
+            idle = list(self._idle)
+            self._idle.clear()
+            self._opened -= len(idle)
+            self._cond.notify_all()
+        for raw, _, _ in idle:
+            self._close_quietly(raw)
+
+    def reset_after_fork(self):
+        """Forget connections inherited from the parent process.
+
+        The sockets are shared with the parent, so they are dropped rather than
+        closed (closing would end the parent's sessions too). Call this first
+        thing in a forked worker.
+        """
+        self._cond = threading.Condition()
+        self._idle = deque()
+        self._opened = 0
+        self._checkouts = 0
+        self._waits = 0
+        self._wait_time = 0.0
+        self._timeouts = 0
+        self._created = 0
+        self._discarded = 0
+        self._health_check_failures = 0
+        self._checkout_times = deque()
+
+    @staticmethod
+    def _close_quietly(raw):
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+    def _trim_rate_window(self, now):
+        cutoff = now - self.RATE_WINDOW_SECONDS
+        while self._checkout_times and self._checkout_times[0] < cutoff:
+            self._checkout_times.popleft()
+
+    def stats(self):
+        """Snapshot of pool metrics"""
+        now = time.monotonic()
+        with self._cond:
+            self._trim_rate_window(now)
+            idle = len(self._idle)
+            return {
+                'pool_size': self.pool_size,
+                'max_overflow': self.max_overflow,
+                'timeout': self.timeout,
+                'open': self._opened,
+                'idle': idle,
+                'in_use': self._opened - idle,
+                'overflow_in_use': max(0, self._opened - self.pool_size),
+                'checkouts_total': self._checkouts,
+                'checkouts_per_sec': round(len(self._checkout_times) / self.RATE_WINDOW_SECONDS, 3),
+                'waits_total': self._waits,
+                'wait_time_total': round(self._wait_time, 4),
+                'timeouts_total': self._timeouts,
+                'connections_created': self._created,
+                'connections_discarded': self._discarded,
+                'health_check_failures': self._health_check_failures,
+            }
@@ -0,0 +1,158 @@
+"""
+In-process publish/subscribe for server-sent events.
+
+Write paths publish small events (request approved/rejected, pending count
+changed) to a channel such as 'user:12', 'sub_user:7' or 'admin' after their
+transaction commits. Each open /api/events/stream response holds a
+Subscription and forwards what it receives as text/event-stream, so pages
+update when something changes instead of re-querying on a timer.
+
+The bus only reaches subscribers in the same process, so with several
+worker processes a stream also runs a `sync` callable every
+`sync_interval` seconds. The app's sync callables compare cheap database
+state (collection_versions counters, pending counts) with what the stream
+last saw and emit the same events when a write committed in another
+process changed it. A change can therefore be announced twice (once by
+the bus, once by the sync); the pages' handlers just reload. Streams also
+emit a keep-alive comment periodically and end after `max_duration`
+seconds; the browser's EventSource reconnects on its own, and pages fall
+back to their old polling when the stream cannot be opened.
+"""
+import json
+import queue
+import threading
+import time
+from collections import defaultdict
+
+
+class Subscription:
+    """A subscriber's bounded inbox of (event, data) pairs"""
+
+    def __init__(self, channels, max_queue):
+        self.channels = tuple(channels)
+        self._queue = queue.Queue(maxsize=max_queue)
+        self.dropped = 0
+
+    def put(self, item):
+        try:
+            self._queue.put_nowait(item)
+            return True
+        except queue.Full:
+            # A stalled client must not block publishers; it resyncs on reconnect
+            self.dropped += 1
+            return False
+
+    def get(self, timeout):
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class EventBus:
+    """Channel -> subscriptions registry for the current process"""
+
+    def __init__(self, max_queue=100):
+        self.max_queue = max_queue
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+        self.published = 0
+        self.delivered = 0
+
+    def subscribe(self, *channels):
+        subscription = Subscription(channels, self.max_queue)
+        with self._lock:
+            for channel in channels:
+                self._subscribers[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                subscribers = self._subscribers.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscribers[channel]
+
+    def reset_after_fork(self):
+        """The parent's open streams are not this process's subscribers"""
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+        self.published = 0
+        self.delivered = 0
+
+    def has_subscribers(self, channel):
+        return bool(self._subscribers.get(channel))
+
+    def publish(self, channel, event, data=None):
+        """Deliver an event to everyone subscribed to `channel`; returns how many received it"""
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        self.published += 1
+        delivered = sum(1 for subscription in subscribers if subscription.put((event, data)))
+        self.delivered += delivered
+        return delivered
+
+    def stats(self):
+        with self._lock:
+            channels = len(self._subscribers)
+            subscriptions = len({s for subs in self._subscribers.values() for s in subs})
+        return {
+            'channels': channels,
+            'subscriptions': subscriptions,
+            'published': self.published,
+            'delivered': self.delivered
+        }
+
+
+def sse_message(event, data):
+    """Format one text/event-stream message"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def _run_sync(sync):
+    try:
+        return list(sync() or ())
+    except Exception as e:
+        print(f"DEBUG: Event stream sync failed: {e}")
+        return []
+
+
+def sse_stream(bus, channels, keepalive=15, max_duration=300, initial=None, sync=None, sync_interval=5):
+    """Generator yielding SSE messages for `channels` until the client goes away or max_duration passes.
+
+    `sync`, if given, is called every `sync_interval` seconds and returns
+    (event, data) pairs for changes made by other processes.
+    """
+    subscription = bus.subscribe(*channels)
+    try:
+        # Tell EventSource how long to wait before reconnecting after we close
+        yield "retry: 3000\n\n"
+        for event, data in initial or ():
+            yield sse_message(event, data)
+        now = time.monotonic()
+        deadline = now + max_duration
+        next_sync = now + sync_interval if sync is not None else None
+        last_sent = now
+        while True:
+            now = time.monotonic()
+            if now >= deadline:
+                return
+            wait = min(deadline, last_sent + keepalive) - now
+            if next_sync is not None:
+                wait = min(wait, next_sync - now)
+            item = subscription.get(max(wait, 0))
+            if item is not None:
+                yield sse_message(*item)
+                last_sent = time.monotonic()
+            if next_sync is not None and time.monotonic() >= next_sync:
+                for event, data in _run_sync(sync):
+                    yield sse_message(event, data)
+                    last_sent = time.monotonic()
+                next_sync = time.monotonic() + sync_interval
+            if time.monotonic() - last_sent >= keepalive:
+                yield ": keep-alive\n\n"
+                last_sent = time.monotonic()
+    finally:
+        bus.unsubscribe(subscription)
@@ -0,0 +1,284 @@
+"""
+Persistent background job queue for admin bulk exports.
+
+Jobs are rows in the export_jobs table, so they survive restarts and are
+visible from every worker process. A local worker thread claims queued
+jobs with a conditional UPDATE (only one process can flip a row from
+'queued' to 'running'), runs the registered handler, and records progress,
+the artifact path and its expiry. A heartbeat thread keeps a running job's
+claim fresh however long its handler goes without reporting progress.
+Expired job artifacts, and orphaned files in the queue's own jobs folder,
+are deleted once they are older than the retention period; other files in
+the export folder are never touched.
+"""
+import json
+import os
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+
+JOBS_TABLE = 'export_jobs'
+
+
+def create_export_jobs_table(cursor):
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS `{JOBS_TABLE}` (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            job_type VARCHAR(50) NOT NULL,
+            params JSON NULL,
+            status ENUM('queued', 'running', 'done', 'failed') NOT NULL DEFAULT 'queued',
+            progress TINYINT UNSIGNED NOT NULL DEFAULT 0,
+            message VARCHAR(255) NULL,
+            requested_by_admin_id INT NULL,
+            filename VARCHAR(255) NULL,
+            file_path VARCHAR(500) NULL,
+            error TEXT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            started_at DATETIME NULL,
+            heartbeat_at DATETIME NULL,
+            finished_at DATETIME NULL,
+            expires_at DATETIME NULL,
+            INDEX idx_export_jobs_status_created (status, created_at),
+            INDEX idx_export_jobs_expires (expires_at)
+        )
+    """)
+
+
+class ExportJobQueue:
+    """DB-backed export queue with one local worker thread per process"""
+
+    def __init__(self, get_connection, export_folder, retention_days=7,
+                 poll_interval=2, stale_after=600, heartbeat_interval=60):
+        self.get_connection = get_connection
+        self.export_folder = export_folder
+        self.jobs_folder = os.path.join(export_folder, 'jobs')
+        self.retention = timedelta(days=retention_days)
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        # Well under stale_after, so a live job is never mistaken for an abandoned one
+        self.heartbeat_interval = min(heartbeat_interval, stale_after / 3)
+        self._handlers = {}
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_cleanup = 0
+        os.makedirs(self.jobs_folder, exist_ok=True)
+
+    def register(self, job_type, handler):
+        """Register `handler(params, progress, jobs_folder) -> (filepath, filename)` for a job type"""
+        self._handlers[job_type] = handler
+
+    # --- API used by request handlers ---------------------------------
+
+    def enqueue(self, job_type, params=None, admin_id=None):
+        """Insert a queued job and wake the worker; returns the job id or None"""
+        if job_type not in self._handlers:
+            raise ValueError(f'Unknown export job type: {job_type}')
+        connection = self.get_connection()
+        if not connection:
+            return None
+        cursor = connection.cursor()
+        try:
+            cursor.execute(
+                f"INSERT INTO {JOBS_TABLE} (job_type, params, requested_by_admin_id, message) "
+                "VALUES (%s, %s, %s, %s)",
+                (job_type, json.dumps(params or {}), admin_id, 'Queued')
+            )
+            connection.commit()
+            job_id = cursor.lastrowid
+        finally:
+            cursor.close()
+            connection.close()
+        self._wake.set()
+        return job_id
+
+    def get(self, job_id):
+        connection = self.get_connection()
+        if not connection:
+            return None
+        cursor = connection.cursor(dictionary=True)
+        try:
+            cursor.execute(f"SELECT * FROM {JOBS_TABLE} WHERE id = %s", (job_id,))
+            return cursor.fetchone()
+        finally:
+            cursor.close()
+            connection.close()
+
+    def recent(self, limit=50):
+        connection = self.get_connection()
+        if not connection:
+            return None
+        cursor = connection.cursor(dictionary=True)
+        try:
+            cursor.execute(f"SELECT * FROM {JOBS_TABLE} ORDER BY id DESC LIMIT %s", (limit,))
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+            connection.close()
+
+    # --- worker ----------------------------------------------------------
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name='export-jobs', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                ran = self.run_next()
+                if time.time() - self._last_cleanup > 3600:
+                    self.cleanup()
+            except Exception as e:
+                print(f"DEBUG: Export job worker error: {e}")
+                ran = False
+            if not ran:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+    def _claim(self, cursor):
+        """Atomically move the oldest queued (or abandoned running) job to 'running'"""
+        stale_before = datetime.now() - timedelta(seconds=self.stale_after)
+        cursor.execute(f"""
+            SELECT id FROM {JOBS_TABLE}
+            WHERE status = %s OR (status = %s AND heartbeat_at < %s)
+            ORDER BY id LIMIT 1
+        """, (JOB_QUEUED, JOB_RUNNING, stale_before))
+        row = cursor.fetchone()
+        if not row:
+            return None
+        now = datetime.now()
+        cursor.execute(f"""
+            UPDATE {JOBS_TABLE}
+            SET status = %s, started_at = %s, heartbeat_at = %s, progress = 0, message = 'Starting'
+            WHERE id = %s AND (status = %s OR (status = %s AND heartbeat_at < %s))
+        """, (JOB_RUNNING, now, now, row['id'], JOB_QUEUED, JOB_RUNNING, stale_before))
+        return row['id'] if cursor.rowcount == 1 else None
+
+    def run_next(self):
+        """Claim and run one job; returns True if a job was processed"""
+        connection = self.get_connection()
+        if not connection:
+            return False
+        cursor = connection.cursor(dictionary=True)
+        try:
+            job_id = self._claim(cursor)
+            connection.commit()
+            if job_id is None:
+                return False
+            cursor.execute(f"SELECT * FROM {JOBS_TABLE} WHERE id = %s", (job_id,))
+            job = cursor.fetchone()
+        finally:
+            cursor.close()
+            connection.close()
+
+        handler = self._handlers.get(job['job_type'])
+        params = json.loads(job['params']) if job['params'] else {}
+
+        def progress(percent, message=None):
+            self._update(job_id, progress=max(0, min(100, int(percent))), message=message,
+                         heartbeat_at=datetime.now())
+
+        finished_event = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(job_id, finished_event),
+                                     name=f'export-job-{job_id}-heartbeat', daemon=True)
+        heartbeat.start()
+        try:
+            if handler is None:
+                raise ValueError(f"No handler registered for {job['job_type']}")
+            filepath, filename = handler(params, progress, self.jobs_folder)
+            finished_event.set()
+            finished = datetime.now()
+            self._update(job_id, status=JOB_DONE, progress=100, message='Completed',
+                         file_path=filepath, filename=filename, finished_at=finished,
+                         expires_at=finished + self.retention)
+        except Exception as e:
+            finished_event.set()
+            traceback.print_exc()
+            self._update(job_id, status=JOB_FAILED, message='Failed', error=str(e),
+                         finished_at=datetime.now())
+        finally:
+            heartbeat.join()
+        return True
+
+    def _heartbeat(self, job_id, finished_event):
+        """Refresh heartbeat_at every heartbeat_interval until the job finishes"""
+        while not finished_event.wait(self.heartbeat_interval):
+            try:
+                self._update(job_id, heartbeat_at=datetime.now())
+            except Exception as e:
+                print(f"DEBUG: Export job {job_id} heartbeat failed: {e}")
+
+    def _update(self, job_id, **fields):
+        fields = {k: v for k, v in fields.items() if v is not None}
+        connection = self.get_connection()
+        if not connection:
+            return
+        cursor = connection.cursor()
+        try:
+            assignments = ', '.join(f"{column} = %s" for column in fields)
+            cursor.execute(f"UPDATE {JOBS_TABLE} SET {assignments} WHERE id = %s",
+                           list(fields.values()) + [job_id])
+            connection.commit()
+        finally:
+            cursor.close()
+            connection.close()
+
+    # --- retention -------------------------------------------------------
+
+    def cleanup(self):
+        """Delete expired job artifacts/rows and orphaned files in jobs_folder older than the retention period"""
+        self._last_cleanup = time.time()
+        removed_files = 0
+        removed_jobs = 0
+        now = datetime.now()
+
+        connection = self.get_connection()
+        if connection:
+            cursor = connection.cursor(dictionary=True)
+            try:
+                cursor.execute(f"""
+                    SELECT id, file_path FROM {JOBS_TABLE}
+                    WHERE expires_at < %s OR (status = %s AND finished_at < %s)
+                """, (now, JOB_FAILED, now - self.retention))
+                expired = cursor.fetchall()
+                for job in expired:
+                    if job['file_path'] and os.path.exists(job['file_path']):
+                        os.remove(job['file_path'])
+                        removed_files += 1
+                if expired:
+                    ids = [job['id'] for job in expired]
+                    placeholders = ','.join(['%s'] * len(ids))
+                    cursor.execute(f"DELETE FROM {JOBS_TABLE} WHERE id IN ({placeholders})", ids)
+                    removed_jobs = cursor.rowcount
+                connection.commit()
+            finally:
+                cursor.close()
+                connection.close()
+
+        # Artifacts whose job row is gone; only handlers write into jobs_folder
+        cutoff = time.time() - self.retention.total_seconds()
+        for entry in os.scandir(self.jobs_folder):
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                try:
+                    os.remove(entry.path)
+                    removed_files += 1
+                except OSError:
+                    pass
+
+        print(f"DEBUG: Export cleanup removed {removed_jobs} jobs and {removed_files} files")
+        return {'removed_jobs': removed_jobs, 'removed_files': removed_files}
@@ -0,0 +1,78 @@
+"""
+Deferred deletion of uploaded files.
+
+Request handlers that delete rows with attached files (receipts, bills)
+schedule the files here after their transaction commits, instead of
+calling os.remove() per row while holding row locks. A single daemon
+thread works through the queue.
+"""
+import os
+import queue
+import threading
+
+
+class FileCleanupQueue:
+    """Background remover for files whose database rows have been deleted"""
+
+    def __init__(self, base_folder):
+        self.base_folder = os.path.abspath(base_folder)
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.removed = 0
+        self.missing = 0
+        self.failed = 0
+
+    def schedule(self, filenames):
+        """Queue stored filenames (relative to base_folder) for deletion; returns how many were queued"""
+        count = 0
+        for filename in filenames:
+            if filename:
+                self._queue.put(filename)
+                count += 1
+        if count:
+            self._ensure_worker()
+        return count
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='file-cleanup', daemon=True)
+                self._thread.start()
+
+    def reset_after_fork(self):
+        """Files queued in the parent are removed by the parent"""
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _run(self):
+        while True:
+            filename = self._queue.get()
+            try:
+                self._remove(filename)
+            finally:
+                self._queue.task_done()
+
+    def _remove(self, filename):
+        path = os.path.abspath(os.path.join(self.base_folder, filename))
+        # Stored names are plain filenames; never follow one outside the upload folder
+        if os.path.dirname(path) != self.base_folder:
+            self.failed += 1
+            return
+        try:
+            os.remove(path)
+            self.removed += 1
+        except FileNotFoundError:
+            self.missing += 1
+        except OSError as e:
+            print(f"DEBUG: Could not delete {path}: {e}")
+            self.failed += 1
+
+    def stats(self):
+        return {
+            'pending': self._queue.qsize(),
+            'removed': self.removed,
+            'missing': self.missing,
+            'failed': self.failed
+        }
@@ -0,0 +1,287 @@
+"""
+Materialized per-user financial summary behind /api/dashboard/stats.
+
+`user_financial_summary` holds one row per user with the expense, transaction
+and invoice aggregates the dashboard shows. It is maintained incrementally by
+AFTER INSERT/UPDATE/DELETE triggers on expenses, transactions and invoices,
+so every write path (add_expense, add_transaction, create_invoice, the
+delete_* routes, bulk_delete_transactions, sub-user approvals, ...) updates it
+in the same DB transaction as the write itself.
+
+SummaryReconciler periodically recomputes the aggregates from the base
+tables, reports users whose summary has drifted (e.g. rows removed by a
+foreign-key cascade, which does not fire triggers) and repairs them.
+"""
+import threading
+import time
+from decimal import Decimal
+
+SUMMARY_TABLE = 'user_financial_summary'
+
+# Per-table (column, delta expression) pairs; `{r}` is NEW or OLD inside a trigger
+SUMMARY_DELTAS = {
+    'expenses': [
+        ('total_expenses', "1"),
+        ('total_expense_amount', "COALESCE({r}.amount, 0)"),
+        ('upcoming_expense_count', "IF({r}.expense_type = 'upcoming', 1, 0)"),
+        ('upcoming_expenses', "IF({r}.expense_type = 'upcoming', COALESCE({r}.amount, 0), 0)"),
+    ],
+    'transactions': [
+        ('total_transactions', "1"),
+        ('total_debits', "IF({r}.transaction_type = 'debit', COALESCE({r}.amount, 0), 0)"),
+        ('total_credits', "IF({r}.transaction_type = 'credit', COALESCE({r}.amount, 0), 0)"),
+        ('cash_credits', "IF({r}.transaction_type = 'credit' AND ({r}.payment_method = 'cash' OR {r}.payment_method IS NULL), COALESCE({r}.amount, 0), 0)"),
+        ('bank_credits', "IF({r}.transaction_type = 'credit' AND {r}.payment_method = 'online', COALESCE({r}.amount, 0), 0)"),
+        ('cash_debits', "IF({r}.transaction_type = 'debit' AND ({r}.payment_method = 'cash' OR {r}.payment_method IS NULL), COALESCE({r}.amount, 0), 0)"),
+        ('bank_debits', "IF({r}.transaction_type = 'debit' AND {r}.payment_method = 'online', COALESCE({r}.amount, 0), 0)"),
+    ],
+    'invoices': [
+        ('total_invoices', "1"),
+        ('total_invoice_amount', "COALESCE({r}.total_amount, 0)"),
+        ('paid_amount', "IF({r}.status = 'paid', COALESCE({r}.total_amount, 0), 0)"),
+        ('in_invoice_amount', "IF({r}.invoice_type = 'in', COALESCE({r}.total_amount, 0), 0)"),
+        ('out_invoice_amount', "IF({r}.invoice_type = 'out', COALESCE({r}.total_amount, 0), 0)"),
+        ('overdue_invoice_count', "IF({r}.status = 'overdue', 1, 0)"),
+        ('incoming_overdue', "IF({r}.status = 'overdue', COALESCE({r}.total_amount, 0), 0)"),
+    ],
+}
+
+SUMMARY_COLUMNS = [column for deltas in SUMMARY_DELTAS.values() for column, _ in deltas]
+COUNT_COLUMNS = {'total_expenses', 'upcoming_expense_count', 'total_transactions',
+                 'total_invoices', 'overdue_invoice_count'}
+
+# Aggregates recomputed from the base tables (the definition the triggers maintain)
+SUMMARY_AGGREGATE_SQL = """
+    SELECT u.id AS user_id,
+           COALESCE(e.total_expenses, 0) AS total_expenses,
+           COALESCE(e.total_expense_amount, 0) AS total_expense_amount,
+           COALESCE(e.upcoming_expense_count, 0) AS upcoming_expense_count,
+           COALESCE(e.upcoming_expenses, 0) AS upcoming_expenses,
+           COALESCE(t.total_transactions, 0) AS total_transactions,
+           COALESCE(t.total_debits, 0) AS total_debits,
+           COALESCE(t.total_credits, 0) AS total_credits,
+           COALESCE(t.cash_credits, 0) AS cash_credits,
+           COALESCE(t.bank_credits, 0) AS bank_credits,
+           COALESCE(t.cash_debits, 0) AS cash_debits,
+           COALESCE(t.bank_debits, 0) AS bank_debits,
+           COALESCE(i.total_invoices, 0) AS total_invoices,
+           COALESCE(i.total_invoice_amount, 0) AS total_invoice_amount,
+           COALESCE(i.paid_amount, 0) AS paid_amount,
+           COALESCE(i.in_invoice_amount, 0) AS in_invoice_amount,
+           COALESCE(i.out_invoice_amount, 0) AS out_invoice_amount,
+           COALESCE(i.overdue_invoice_count, 0) AS overdue_invoice_count,
+           COALESCE(i.incoming_overdue, 0) AS incoming_overdue
+    FROM users u
+    LEFT JOIN (
+        SELECT user_id,
+               COUNT(*) AS total_expenses,
+               SUM(amount) AS total_expense_amount,
+               SUM(CASE WHEN expense_type = 'upcoming' THEN 1 ELSE 0 END) AS upcoming_expense_count,
+               SUM(CASE WHEN expense_type = 'upcoming' THEN amount ELSE 0 END) AS upcoming_expenses
+        FROM expenses {expense_filter}
+        GROUP BY user_id
+    ) e ON e.user_id = u.id
+    LEFT JOIN (
+        SELECT user_id,
+               COUNT(*) AS total_transactions,
+               SUM(CASE WHEN transaction_type = 'debit' THEN amount ELSE 0 END) AS total_debits,
+               SUM(CASE WHEN transaction_type = 'credit' THEN amount ELSE 0 END) AS total_credits,
+               SUM(CASE WHEN transaction_type = 'credit' AND (payment_method = 'cash' OR payment_method IS NULL) THEN amount ELSE 0 END) AS cash_credits,
+               SUM(CASE WHEN transaction_type = 'credit' AND payment_method = 'online' THEN amount ELSE 0 END) AS bank_credits,
+               SUM(CASE WHEN transaction_type = 'debit' AND (payment_method = 'cash' OR payment_method IS NULL) THEN amount ELSE 0 END) AS cash_debits,
+               SUM(CASE WHEN transaction_type = 'debit' AND payment_method = 'online' THEN amount ELSE 0 END) AS bank_debits
+        FROM transactions {transaction_filter}
+        GROUP BY user_id
+    ) t ON t.user_id = u.id
+    LEFT JOIN (
+        SELECT user_id,
+               COUNT(*) AS total_invoices,
+               SUM(total_amount) AS total_invoice_amount,
+               SUM(CASE WHEN status = 'paid' THEN total_amount ELSE 0 END) AS paid_amount,
+               SUM(CASE WHEN invoice_type = 'in' THEN total_amount ELSE 0 END) AS in_invoice_amount,
+               SUM(CASE WHEN invoice_type = 'out' THEN total_amount ELSE 0 END) AS out_invoice_amount,
+               SUM(CASE WHEN status = 'overdue' THEN 1 ELSE 0 END) AS overdue_invoice_count,
+               SUM(CASE WHEN status = 'overdue' THEN total_amount ELSE 0 END) AS incoming_overdue
+        FROM invoices {invoice_filter}
+        GROUP BY user_id
+    ) i ON i.user_id = u.id
+    {user_filter}
+"""
+
+
+def create_summary_table(cursor):
+    column_defs = []
+    for column in SUMMARY_COLUMNS:
+        if column in COUNT_COLUMNS:
+            column_defs.append(f"`{column}` INT NOT NULL DEFAULT 0")
+        else:
+            column_defs.append(f"`{column}` DECIMAL(15,2) NOT NULL DEFAULT 0.00")
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS `{SUMMARY_TABLE}` (
+          `user_id` int(11) NOT NULL,
+          {', '.join(column_defs)},
+          `updated_at` timestamp NOT NULL DEFAULT current_timestamp() ON UPDATE current_timestamp(),
+          PRIMARY KEY (`user_id`),
+          FOREIGN KEY (`user_id`) REFERENCES `users` (`id`) ON DELETE CASCADE
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci
+    """)
+
+
+def _summary_upsert_sql(table, row, sign):
+    """INSERT ... ON DUPLICATE KEY UPDATE applying one row's deltas"""
+    deltas = SUMMARY_DELTAS[table]
+    prefix = '-' if sign < 0 else ''
+    columns = ', '.join(column for column, _ in deltas)
+    values = ', '.join(f"{prefix}({expression.format(r=row)})" for _, expression in deltas)
+    updates = ', '.join(f"{column} = {column} + VALUES({column})" for column, _ in deltas)
+    return (
+        f"INSERT INTO {SUMMARY_TABLE} (user_id, {columns}) VALUES ({row}.user_id, {values}) "
+        f"ON DUPLICATE KEY UPDATE {updates};"
+    )
+
+
+def install_summary_triggers(cursor):
+    """(Re)create the triggers that keep user_financial_summary current"""
+    for table in SUMMARY_DELTAS:
+        triggers = {
+            'insert': _summary_upsert_sql(table, 'NEW', 1),
+            'delete': _summary_upsert_sql(table, 'OLD', -1),
+            'update': _summary_upsert_sql(table, 'OLD', -1) + ' ' + _summary_upsert_sql(table, 'NEW', 1),
+        }
+        for event, body in triggers.items():
+            name = f"trg_{table}_summary_{event}"
+            cursor.execute(f"DROP TRIGGER IF EXISTS `{name}`")
+            cursor.execute(
+                f"CREATE TRIGGER `{name}` AFTER {event.upper()} ON `{table}` "
+                f"FOR EACH ROW BEGIN {body} END"
+            )
+
+
+def rebuild_summaries(cursor, user_id=None):
+    """Recompute summary rows from the base tables (all users, or one)"""
+    columns = ', '.join(SUMMARY_COLUMNS)
+    cursor.execute(
+        f"REPLACE INTO {SUMMARY_TABLE} (user_id, {columns}) " + _aggregate_sql(user_id),
+        (user_id,) * 4 if user_id is not None else ()
+    )
+
+
+def _aggregate_sql(user_id):
+    if user_id is None:
+        return SUMMARY_AGGREGATE_SQL.format(expense_filter='', transaction_filter='', invoice_filter='', user_filter='')
+    return SUMMARY_AGGREGATE_SQL.format(
+        expense_filter='WHERE user_id = %s',
+        transaction_filter='WHERE user_id = %s',
+        invoice_filter='WHERE user_id = %s',
+        user_filter='WHERE u.id = %s'
+    )
+
+
+def get_user_summary(connection, user_id):
+    """Summary row for a user (a primary-key lookup); built on demand if missing"""
+    cursor = connection.cursor(dictionary=True)
+    try:
+        cursor.execute(f"SELECT * FROM {SUMMARY_TABLE} WHERE user_id = %s", (user_id,))
+        summary = cursor.fetchone()
+        if summary is None:
+            rebuild_summaries(cursor, user_id)
+            connection.commit()
+            cursor.execute(f"SELECT * FROM {SUMMARY_TABLE} WHERE user_id = %s", (user_id,))
+            summary = cursor.fetchone()
+        return summary
+    finally:
+        cursor.close()
+
+
+def find_summary_drift(connection, repair=True):
+    """Compare every summary row with freshly computed aggregates.
+
+    Returns [{'user_id', 'columns': {column: {'stored', 'actual'}}}] for users
+    whose summary is wrong or missing; repairs them when `repair` is set.
+    """
+    cursor = connection.cursor(dictionary=True)
+    try:
+        cursor.execute(f"SELECT * FROM {SUMMARY_TABLE}")
+        stored = {row['user_id']: row for row in cursor.fetchall()}
+        cursor.execute(_aggregate_sql(None))
+        actual_rows = cursor.fetchall()
+
+        drift = []
+        for actual in actual_rows:
+            summary = stored.get(actual['user_id'])
+            columns = {}
+            for column in SUMMARY_COLUMNS:
+                stored_value = Decimal(summary[column]) if summary else None
+                if stored_value != Decimal(actual[column]):
+                    columns[column] = {
+                        'stored': float(stored_value) if stored_value is not None else None,
+                        'actual': float(actual[column])
+                    }
+            if columns:
+                drift.append({'user_id': actual['user_id'], 'columns': columns})
+
+        if repair:
+            for entry in drift:
+                rebuild_summaries(cursor, entry['user_id'])
+            connection.commit()
+        return drift
+    finally:
+        cursor.close()
+
+
+class SummaryReconciler:
+    """Background thread that periodically detects and repairs summary drift"""
+
+    LOCK_NAME = 'laitusneo_summary_reconcile'
+
+    def __init__(self, get_connection, interval):
+        self.get_connection = get_connection
+        self.interval = interval
+        self.last_run = None
+        self.last_drift = []
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self.interval <= 0 or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='summary-reconciler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.run_once()
+
+    def run_once(self, repair=True):
+        """Reconcile now; skipped (returns None) if another process holds the lock"""
+        connection = self.get_connection()
+        if not connection:
+            print("Summary reconciliation skipped: database connection failed")
+            return None
+        cursor = connection.cursor()
+        try:
+            # Only one worker process reconciles at a time
+            cursor.execute("SELECT GET_LOCK(%s, 0)", (self.LOCK_NAME,))
+            if cursor.fetchone()[0] != 1:
+                return None
+            try:
+                drift = find_summary_drift(connection, repair=repair)
+            finally:
+                cursor.execute("SELECT RELEASE_LOCK(%s)", (self.LOCK_NAME,))
+                cursor.fetchone()
+            self.last_run = time.time()
+            self.last_drift = drift
+            if drift:
+                print(f"Financial summary drift detected for {len(drift)} user(s): "
+                      f"{[entry['user_id'] for entry in drift]}")
+            return drift
+        except Exception as e:
+            print(f"Error reconciling financial summaries: {e}")
+            return None
+        finally:
+            cursor.close()
+            connection.close()
@@ -0,0 +1,98 @@
+"""
+Production server configuration.
+
+    gunicorn -c gunicorn.conf.py
+
+The app is imported once in the master (preload_app), so create_app() runs
+the schema migrations once per deploy instead of once per worker, and the
+workers share the imported code copy-on-write. Each worker then gets its own
+connection pool, queues and background threads in post_fork.
+
+Worker processes x threads bounds concurrency. A PDF render holds its
+worker's GIL while it runs, but other workers keep serving, so keep
+GUNICORN_WORKERS above 1 when invoices are rendered synchronously. Every open
+/api/events/stream keeps one thread busy for up to SSE_STREAM_SECONDS, so
+size GUNICORN_THREADS for the expected number of open pages per worker.
+
+Metrics: every worker keeps its own counters, so each worker writes a
+snapshot to METRICS_MULTIPROC_DIR and /metrics merges them; any worker that
+answers a scrape reports totals for the whole server. The directory is
+emptied when the master starts, and a worker's counters are folded into an
+archive file when it exits. Per-process gauges (pool, queues) carry a pid
+label.
+
+Reloading: `kill -HUP <master>` restarts the workers gracefully with the
+code the master already loaded. To deploy new code, send USR2 (start a new
+master alongside the old one), then QUIT to the old master once the new
+one is up, or restart the service.
+"""
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+
+wsgi_app = 'app:create_app()'
+
+bind = os.environ.get('GUNICORN_BIND', '127.0.0.1:8000')
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+worker_class = 'gthread'
+
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+
+# gthread workers keep heartbeating while a request runs; this only catches hung workers
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+
+# Recycle workers now and then so slow leaks (PDF libraries, caches) stay bounded
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 100))
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-')
+errorlog = os.environ.get('GUNICORN_ERROR_LOG', '-')
+
+# Read by app.py when it is imported, so it must be set before the app loads
+os.environ.setdefault('METRICS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'laitusneo-metrics'))
+
+
+def _loaded_app():
+    """The app module if this process has imported it (always true with preload_app)"""
+    return sys.modules.get('app')
+
+
+def on_starting(server):
+    # Snapshots from a previous run would be added to this run's totals
+    metrics_dir = os.environ['METRICS_MULTIPROC_DIR']
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir, exist_ok=True)
+
+
+def when_ready(server):
+    # Close the connections the master used for migrations before any worker is forked
+    app = _loaded_app()
+    if app is not None:
+        app.db_pool.dispose()
+
+
+def post_fork(server, worker):
+    app = _loaded_app()
+    if app is not None:
+        app.reinit_after_fork()
+        server.log.info(f"Worker {worker.pid}: connection pool and background workers initialized")
+
+
+def worker_exit(server, worker):
+    # Write queued audit rows and the last metrics before the process goes away
+    app = _loaded_app()
+    if app is not None:
+        app.audit_sink.shutdown()
+        app.request_metrics.flush()
+
+
+def child_exit(server, worker):
+    # Runs in the master: keep the exited worker's counters, drop its gauges
+    app = _loaded_app()
+    if app is not None:
+        app.request_metrics.mark_process_dead(worker.pid)
@@ -0,0 +1,144 @@
+"""
+Conditional GETs and response compression for the JSON list endpoints.
+
+collection_versions holds one counter per (owner, collection), bumped by
+AFTER INSERT/UPDATE/DELETE triggers on each listed table, so every write
+path invalidates the lists it affects without changes in app.py. A list
+endpoint reads its few counters (a primary-key lookup), builds an ETag from
+them plus the query string, and answers a matching If-None-Match with 304
+before running its own query.
+
+The owner is users.id for user tables and sub_users.id for
+sub_user_requests, whose lists are per sub user.
+
+init_compression() gzip- or brotli-encodes larger JSON responses according
+to the client's Accept-Encoding. Brotli is used only if the `brotli`
+package is installed.
+"""
+import gzip
+import hashlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from flask import request
+
+VERSION_TABLE = 'collection_versions'
+
+# table -> column holding the id of the owner whose collection it is
+VERSIONED_TABLES = {
+    'transactions': 'user_id',
+    'expenses': 'user_id',
+    'invoices': 'user_id',
+    'products': 'user_id',
+    'debts': 'user_id',
+    'customers': 'user_id',
+    'sub_users': 'created_by',
+    'sub_user_requests': 'sub_user_id',
+}
+
+COMPRESSIBLE_MIMETYPES = ('application/json', 'text/csv', 'text/plain')
+
+
+def create_version_table(cursor):
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS `{VERSION_TABLE}` (
+            owner_id INT NOT NULL,
+            collection VARCHAR(32) NOT NULL,
+            version BIGINT UNSIGNED NOT NULL DEFAULT 0,
+            PRIMARY KEY (owner_id, collection)
+        )
+    """)
+
+
+def bump_version_sql(owner, collection):
+    """Trigger statement adding one to `owner`'s version of `collection` (skipped for NULL owners)"""
+    return (
+        f"IF {owner} IS NOT NULL THEN "
+        f"INSERT INTO {VERSION_TABLE} (owner_id, collection, version) VALUES ({owner}, '{collection}', 1) "
+        f"ON DUPLICATE KEY UPDATE version = version + 1; END IF;"
+    )
+
+
+def install_version_triggers(cursor):
+    """(Re)create the triggers that bump a collection's version on every write"""
+    for table, column in VERSIONED_TABLES.items():
+        bodies = {
+            'insert': bump_version_sql(f"NEW.{column}", table),
+            # A row moved to another owner changes both owners' lists
+            'update': bump_version_sql(f"NEW.{column}", table)
+                      + f" IF NOT (OLD.{column} <=> NEW.{column}) THEN {bump_version_sql(f'OLD.{column}', table)} END IF;",
+            'delete': bump_version_sql(f"OLD.{column}", table),
+        }
+        for event, body in bodies.items():
+            name = f"trg_{table}_version_{event}"
+            cursor.execute(f"DROP TRIGGER IF EXISTS `{name}`")
+            cursor.execute(
+                f"CREATE TRIGGER `{name}` AFTER {event.upper()} ON `{table}` "
+                f"FOR EACH ROW BEGIN {body} END"
+            )
+
+
+def collection_versions(cursor, owner_id, collections):
+    """{collection: version} for an owner; collections never written yet are version 0"""
+    placeholders = ', '.join(['%s'] * len(collections))
+    cursor.execute(f"""
+        SELECT collection, version FROM {VERSION_TABLE}
+        WHERE owner_id = %s AND collection IN ({placeholders})
+    """, [owner_id] + list(collections))
+    versions = {collection: 0 for collection in collections}
+    versions.update(dict(cursor.fetchall()))
+    return versions
+
+
+def make_etag(scope, owner_id, versions, query_string):
+    """Opaque validator for one owner's view of some collections with these request args"""
+    parts = [scope, str(owner_id)] + [f"{name}={versions[name]}" for name in sorted(versions)]
+    parts.append(query_string.decode('latin-1') if isinstance(query_string, bytes) else query_string)
+    return hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()
+
+
+def is_not_modified(etag):
+    """True if the request's If-None-Match shows the client already has this representation.
+
+    Only ETags are used: a write's timestamp is taken before it commits, so a
+    Last-Modified date could miss changes that commit late, a version cannot.
+    """
+    return bool(request.if_none_match) and request.if_none_match.contains_weak(etag)
+
+
+def compress_response(response, min_size=1024, level=6):
+    """Encode the body with br or gzip if the client accepts it and it's worth it"""
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+    response.vary.add('Accept-Encoding')
+    if response.content_length is not None and response.content_length < min_size:
+        return response
+
+    offers = ['br', 'gzip'] if brotli is not None else ['gzip']
+    encoding = request.accept_encodings.best_match(offers)
+    if not encoding:
+        return response
+
+    data = response.get_data()
+    if len(data) < min_size:
+        return response
+    if encoding == 'br':
+        data = brotli.compress(data, quality=min(level, 11))
+    else:
+        data = gzip.compress(data, compresslevel=level)
+    response.set_data(data)
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def init_compression(app, min_size=1024, level=6):
+    """Compress eligible responses after the view returns"""
+
+    @app.after_request
+    def compress_after_request(response):
+        return compress_response(response, min_size, level)
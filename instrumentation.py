@@ -0,0 +1,449 @@
+"""
+Per-request SQL and latency instrumentation, exported in Prometheus format.
+
+ConnectionPool reports to a RequestInstrumentation observer: every cursor it
+hands out is wrapped so execute()/executemany() are timed, and every checkout
+records how long it took to get a connection. Inside a request these land in
+a RequestStats object on flask.g; when the request ends they are folded into
+per-endpoint histograms:
+
+    laitusneo_request_duration_seconds   wall time of the request
+    laitusneo_request_sql_seconds        total time spent executing SQL
+    laitusneo_request_sql_queries        statements executed
+    laitusneo_db_acquire_seconds         time spent waiting for connections
+    laitusneo_template_render_seconds    Jinja rendering time
+    laitusneo_slowest_query_seconds      slowest statement seen, by fingerprint
+
+Requests slower than `slow_request_seconds` are printed with the
+fingerprints of the statements they ran. Work outside a request (background
+threads) is not attributed to any endpoint.
+
+Metrics live in process memory. With several worker processes (gunicorn),
+pass `multiprocess_dir`: every worker then writes a snapshot of its metrics
+to `<dir>/metrics-<pid>.json` (at most every `flush_interval` seconds), and
+render() merges all snapshots, so whichever worker answers a scrape reports
+totals for the whole server. Histograms and counters are summed across
+workers; counters of workers that have exited are folded into
+metrics-archive.json by mark_process_dead() so totals never go backwards.
+The add_gauges() values describe one process each (its pool, its queues)
+and are exported with a `pid` label for live workers only. The directory
+must be emptied when the server starts (see gunicorn.conf.py).
+"""
+import fcntl
+import glob
+import json
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+from functools import lru_cache
+
+from flask import g, has_request_context, request, template_rendered, before_render_template
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+_STRING_LITERAL = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER = re.compile(r"%\(\w+\)s|%s")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=2048)
+def fingerprint(sql):
+    """Normalize a statement so the same query with different values groups together"""
+    if isinstance(sql, (bytes, bytearray)):
+        sql = sql.decode('utf-8', errors='replace')
+    sql = _STRING_LITERAL.sub('?', sql)
+    sql = _PLACEHOLDER.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _IN_LIST.sub('(...)', sql)
+    sql = _WHITESPACE.sub(' ', sql).strip()
+    return sql[:200]
+
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by a tuple of label values"""
+
+    def __init__(self, name, help_text, label_names, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}
+
+    def observe(self, labels, value):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+        counts = series[0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+        series[1] += value
+        series[2] += 1
+
+    def dump(self):
+        return [[list(labels), counts, total, count] for labels, (counts, total, count) in self._series.items()]
+
+    def merge(self, dumped):
+        """Add the series of another process's dump() into this histogram"""
+        for labels, counts, total, count in dumped:
+            labels = tuple(labels)
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+            series[0] = [a + b for a, b in zip(series[0], counts)]
+            series[1] += total
+            series[2] += count
+
+    def copy(self):
+        clone = Histogram(self.name, self.help_text, self.label_names, self.buckets)
+        clone.merge(self.dump())
+        return clone
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total, count) in sorted(self._series.items()):
+            base = _format_labels(self.label_names, labels)
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f'{self.name}_bucket{{{base},le="{bound}"}} {bucket_count}')
+            lines.append(f'{self.name}_bucket{{{base},le="+Inf"}} {count}')
+            lines.append(f"{self.name}_sum{{{base}}} {total:.6f}")
+            lines.append(f"{self.name}_count{{{base}}} {count}")
+        return lines
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', ' ')
+
+
+def _format_labels(names, values):
+    return ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+
+
+class RequestStats:
+    """What one request spent its time on"""
+
+    __slots__ = ('started', 'queries', 'sql_time', 'acquire_time', 'render_time',
+                 'render_started', 'by_fingerprint', 'slowest')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql_time = 0.0
+        self.acquire_time = 0.0
+        self.render_time = 0.0
+        self.render_started = None
+        self.by_fingerprint = defaultdict(lambda: [0, 0.0])
+        self.slowest = (0.0, None)
+
+    def record_query(self, sql, elapsed):
+        self.queries += 1
+        self.sql_time += elapsed
+        key = fingerprint(sql)
+        entry = self.by_fingerprint[key]
+        entry[0] += 1
+        entry[1] += elapsed
+        if elapsed > self.slowest[0]:
+            self.slowest = (elapsed, key)
+
+
+def current_stats():
+    """The current request's RequestStats, or None outside a request"""
+    if not has_request_context():
+        return None
+    return g.get('_request_stats')
+
+
+class InstrumentedCursor:
+    """Cursor proxy that times statements for the current request"""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def _timed(self, method, operation, *args, **kwargs):
+        stats = current_stats()
+        if stats is None:
+            return method(operation, *args, **kwargs)
+        started = time.perf_counter()
+        try:
+            return method(operation, *args, **kwargs)
+        finally:
+            stats.record_query(operation, time.perf_counter() - started)
+
+    def execute(self, operation, *args, **kwargs):
+        return self._timed(self._cursor.execute, operation, *args, **kwargs)
+
+    def executemany(self, operation, *args, **kwargs):
+        return self._timed(self._cursor.executemany, operation, *args, **kwargs)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._cursor.close()
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class RequestInstrumentation:
+    """Pool observer + per-endpoint metrics registry"""
+
+    def __init__(self, slow_request_seconds=1.0, multiprocess_dir=None, flush_interval=2.0):
+        self.slow_request_seconds = slow_request_seconds
+        self.multiprocess_dir = multiprocess_dir
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._flusher_pid = None
+        if multiprocess_dir:
+            os.makedirs(multiprocess_dir, exist_ok=True)
+        labels = ('method', 'endpoint')
+        self.request_duration = Histogram('laitusneo_request_duration_seconds',
+                                          'Request wall time', labels + ('status',), DURATION_BUCKETS)
+        self.sql_time = Histogram('laitusneo_request_sql_seconds',
+                                  'Time spent executing SQL per request', labels, DURATION_BUCKETS)
+        self.sql_queries = Histogram('laitusneo_request_sql_queries',
+                                     'SQL statements executed per request', labels, QUERY_COUNT_BUCKETS)
+        self.acquire_time = Histogram('laitusneo_db_acquire_seconds',
+                                      'Time spent acquiring pooled connections per request', labels,
+                                      DURATION_BUCKETS)
+        self.render_time = Histogram('laitusneo_template_render_seconds',
+                                     'Template rendering time per request', labels, DURATION_BUCKETS)
+        self.slowest = {}  # (method, endpoint) -> (seconds, fingerprint)
+        self.slow_requests = 0
+        self._gauges = []
+
+    @property
+    def histograms(self):
+        return (self.request_duration, self.sql_time, self.sql_queries, self.acquire_time, self.render_time)
+
+    # Pool observer interface
+    def wrap_cursor(self, cursor):
+        return InstrumentedCursor(cursor)
+
+    def connection_acquired(self, elapsed):
+        stats = current_stats()
+        if stats is not None:
+            stats.acquire_time += elapsed
+
+    def add_gauges(self, prefix, collect):
+        """Export the numeric values of collect() (a dict) as `<prefix>_<key>` gauges"""
+        self._gauges.append((prefix, collect))
+
+    def init_app(self, app):
+        @app.before_request
+        def start_request_stats():
+            g._request_stats = RequestStats()
+
+        @app.after_request
+        def remember_status(response):
+            g._request_status = response.status_code
+            return response
+
+        @app.teardown_request
+        def finish_request_stats(exc):
+            stats = g.pop('_request_stats', None)
+            if stats is not None:
+                status = g.pop('_request_status', 500 if exc else 200)
+                self._finish(stats, status)
+
+        def render_started(sender, template, context, **extra):
+            stats = current_stats()
+            if stats is not None:
+                stats.render_started = time.perf_counter()
+
+        def render_finished(sender, template, context, **extra):
+            stats = current_stats()
+            if stats is not None and stats.render_started is not None:
+                stats.render_time += time.perf_counter() - stats.render_started
+                stats.render_started = None
+
+        before_render_template.connect(render_started, app, weak=False)
+        template_rendered.connect(render_finished, app, weak=False)
+
+    def _finish(self, stats, status):
+        duration = time.perf_counter() - stats.started
+        rule = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        labels = (request.method, rule)
+        with self._lock:
+            self.request_duration.observe(labels + (str(status),), duration)
+            self.sql_time.observe(labels, stats.sql_time)
+            self.sql_queries.observe(labels, stats.queries)
+            self.acquire_time.observe(labels, stats.acquire_time)
+            if stats.render_time:
+                self.render_time.observe(labels, stats.render_time)
+            if stats.slowest[1] and stats.slowest[0] > self.slowest.get(labels, (0.0, None))[0]:
+                self.slowest[labels] = stats.slowest
+            self._dirty = True
+        if self.multiprocess_dir:
+            self._ensure_flusher()
+
+        if self.slow_request_seconds and duration >= self.slow_request_seconds:
+            with self._lock:
+                self.slow_requests += 1
+            top = sorted(stats.by_fingerprint.items(), key=lambda item: item[1][1], reverse=True)[:5]
+            print(f"SLOW REQUEST: {request.method} {rule} {status} took {duration:.3f}s "
+                  f"({stats.queries} queries, {stats.sql_time:.3f}s SQL, "
+                  f"{stats.acquire_time:.3f}s acquiring connections, {stats.render_time:.3f}s rendering)")
+            for key, (count, elapsed) in top:
+                print(f"  {elapsed:.3f}s x{count}: {key}")
+
+    # --- multiprocess snapshots --------------------------------------------
+
+    def _snapshot_path(self, pid):
+        return os.path.join(self.multiprocess_dir, f"metrics-{pid}.json")
+
+    def _ensure_flusher(self):
+        """Start this process's snapshot writer (once per process, so forked workers get their own)"""
+        pid = os.getpid()
+        if self._flusher_pid == pid:
+            return
+        self._flusher_pid = pid
+        threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True).start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            if self._dirty:
+                try:
+                    self.flush()
+                except Exception as e:
+                    print(f"DEBUG: Could not write metrics snapshot: {e}")
+
+    def _local_state(self):
+        with self._lock:
+            self._dirty = False
+            return {
+                'histograms': {h.name: h.dump() for h in self.histograms},
+                'slowest': [[list(labels), seconds, key] for labels, (seconds, key) in self.slowest.items()],
+                'slow_requests': self.slow_requests,
+            }
+
+    def flush(self):
+        """Write this process's metrics snapshot (multiprocess mode only)"""
+        if not self.multiprocess_dir:
+            return
+        state = self._local_state()
+        state['gauges'] = self._collect_gauges()
+        path = self._snapshot_path(os.getpid())
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, path)
+
+    def mark_process_dead(self, pid):
+        """Fold an exited worker's counters into the archive and drop its snapshot"""
+        if not self.multiprocess_dir:
+            return
+        path = self._snapshot_path(pid)
+        with open(os.path.join(self.multiprocess_dir, 'archive.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            state = _read_json(path)
+            if state is None:
+                return
+            archive_path = os.path.join(self.multiprocess_dir, 'metrics-archive.json')
+            merged = self._merge([state, _read_json(archive_path) or {}])
+            archive = {
+                'histograms': {h.name: h.dump() for h in merged['histograms']},
+                'slowest': [[list(labels), seconds, key] for labels, (seconds, key) in merged['slowest'].items()],
+                'slow_requests': merged['slow_requests'],
+            }
+            tmp_path = f"{archive_path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(archive, f)
+            os.replace(tmp_path, archive_path)
+            os.remove(path)
+
+    def _merge(self, states):
+        histograms = [Histogram(h.name, h.help_text, h.label_names, h.buckets) for h in self.histograms]
+        slowest = {}
+        slow_requests = 0
+        for state in states:
+            for histogram in histograms:
+                histogram.merge(state.get('histograms', {}).get(histogram.name, []))
+            for labels, seconds, key in state.get('slowest', []):
+                labels = tuple(labels)
+                if seconds > slowest.get(labels, (0.0, None))[0]:
+                    slowest[labels] = (seconds, key)
+            slow_requests += state.get('slow_requests', 0)
+        return {'histograms': histograms, 'slowest': slowest, 'slow_requests': slow_requests}
+
+    def _collect_gauges(self):
+        gauges = {}
+        for prefix, collect in self._gauges:
+            try:
+                values = collect()
+            except Exception as e:
+                print(f"DEBUG: Could not collect {prefix} metrics: {e}")
+                continue
+            for key, value in values.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    gauges[f"{prefix}_{key}"] = value
+        return gauges
+
+    # --- exposition ------------------------------------------------------------
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format (all workers in multiprocess mode)"""
+        if self.multiprocess_dir:
+            self.flush()
+            states, gauges = [], {}
+            for path in glob.glob(os.path.join(self.multiprocess_dir, 'metrics-*.json')):
+                state = _read_json(path)
+                if state is None:
+                    continue
+                states.append(state)
+                pid = os.path.basename(path)[len('metrics-'):-len('.json')]
+                if pid.isdigit() and _process_alive(int(pid)):
+                    for name, value in state.get('gauges', {}).items():
+                        gauges.setdefault(name, []).append((pid, value))
+            merged = self._merge(states)
+            histograms, slowest, slow_requests = merged['histograms'], merged['slowest'], merged['slow_requests']
+        else:
+            with self._lock:
+                histograms = [h.copy() for h in self.histograms]
+                slowest = dict(self.slowest)
+                slow_requests = self.slow_requests
+            gauges = {name: [(None, value)] for name, value in self._collect_gauges().items()}
+
+        lines = []
+        for histogram in histograms:
+            lines.extend(histogram.render())
+        lines.append('# HELP laitusneo_slowest_query_seconds Slowest statement seen per endpoint')
+        lines.append('# TYPE laitusneo_slowest_query_seconds gauge')
+        for (method, endpoint), (seconds, key) in sorted(slowest.items()):
+            labels = _format_labels(('method', 'endpoint', 'fingerprint'), (method, endpoint, key))
+            lines.append(f"laitusneo_slowest_query_seconds{{{labels}}} {seconds:.6f}")
+        lines.append('# TYPE laitusneo_slow_requests_total counter')
+        lines.append(f"laitusneo_slow_requests_total {slow_requests}")
+        for name in sorted(gauges):
+            lines.append(f"# TYPE {name} gauge")
+            for pid, value in sorted(gauges[name]):
+                lines.append(f'{name}{{pid="{pid}"}} {value}' if pid else f"{name} {value}")
+        return '\n'.join(lines) + '\n'
+
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
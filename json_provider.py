@@ -0,0 +1,71 @@
+"""
+Flask JSON provider for database rows.
+
+Rows from mysql-connector contain Decimal, date, datetime and timedelta
+values. This provider serializes them directly, so views can jsonify()
+fetched rows as they are:
+
+- Decimal -> number (float)
+- date / datetime / time -> ISO 8601 string; aware datetimes keep their offset
+- timedelta (TIME columns) -> 'H:MM:SS'
+- bytes -> text
+
+orjson is used when installed (it serializes dates natively, in C); otherwise
+the standard library json module with the same conversions.
+"""
+import json
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from flask.json.provider import DefaultJSONProvider
+
+if orjson is not None:
+    ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+
+def json_default(value):
+    """Fallback for types neither serializer handles on its own"""
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, timedelta):
+        return str(value)
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode('utf-8', errors='replace')
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps_bytes(obj):
+    """Serialize to UTF-8 JSON bytes with the fastest available encoder"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=json_default, option=ORJSON_OPTIONS)
+    return json.dumps(obj, default=json_default, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """jsonify()/get_json() backed by orjson, with stdlib json as the fallback"""
+
+    def dumps(self, obj, **kwargs):
+        # Callers asking for specific formatting (indent, sort_keys, ...) get stdlib json
+        if orjson is not None and not kwargs:
+            return orjson.dumps(obj, default=json_default, option=ORJSON_OPTIONS).decode('utf-8')
+        kwargs.setdefault('default', json_default)
+        kwargs.setdefault('ensure_ascii', False)
+        return json.dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if orjson is not None and not kwargs:
+            return orjson.loads(s)
+        return json.loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps_bytes(obj), mimetype=self.mimetype)
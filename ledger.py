@@ -0,0 +1,465 @@
+"""
+Append-only ledger of cash and bank balance movements, with daily snapshots.
+
+users.cash_balance and bank_accounts.current_balance stay the fast "current
+balance" counters. The write paths in app.py change them only through
+post_movement() and friends, which update the counter and append the
+matching ledger_entries row on the caller's cursor, so both commit or roll
+back together. Each entry is a two-leg posting: `amount` moves into the
+account and out of `contra_account` (income, expense or equity), and
+names the row that caused it by source_type and source_id (a transaction,
+expense, invoice or sub-user request; a bank account or cash-balance
+history row for openings, closings and manual adjustments).
+
+ledger_snapshots holds the balance of each account at the end of a day
+together with the last entry it includes. A balance as of any date is the
+latest snapshot on or before it plus the entries after that snapshot.
+find_ledger_drift() compares that figure with the counters (catching
+writes that bypassed the ledger) and the entries with their source rows
+(catching sources deleted or edited without their balance being reversed).
+"""
+import threading
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+LEDGER_TABLE = 'ledger_entries'
+SNAPSHOT_TABLE = 'ledger_snapshots'
+
+# account_type -> (table, user column, id column, balance column)
+ACCOUNTS = {
+    'cash': ('users', 'id', 'id', 'cash_balance'),
+    'bank': ('bank_accounts', 'user_id', 'id', 'current_balance'),
+}
+
+CONTRA_ACCOUNTS = ('income', 'expense', 'equity')
+
+# source_type -> (table, amount column) that movements are reconciled against
+SOURCE_TABLES = {
+    'transaction': ('transactions', 'amount'),
+    'expense': ('expenses', 'amount'),
+    'invoice': ('invoices', 'total_amount'),
+    'sub_user_request': ('sub_user_requests', 'payload_amount'),
+}
+
+# Written by the first ledger version, dropped by migration 0019
+LEGACY_TRIGGERS = (
+    'trg_users_ledger_insert', 'trg_users_ledger_update',
+    'trg_bank_accounts_ledger_insert', 'trg_bank_accounts_ledger_update', 'trg_bank_accounts_ledger_delete',
+)
+
+# Latest snapshot per account (optionally only those on or before a date)
+LATEST_SNAPSHOTS_SQL = f"""
+    SELECT s.account_type, s.account_id, s.balance, s.last_entry_id
+    FROM {SNAPSHOT_TABLE} s
+    JOIN (
+        SELECT account_type, account_id, MAX(snapshot_date) AS snapshot_date
+        FROM {SNAPSHOT_TABLE}
+        {{where}}
+        GROUP BY account_type, account_id
+    ) latest ON latest.account_type = s.account_type
+            AND latest.account_id = s.account_id
+            AND latest.snapshot_date = s.snapshot_date
+"""
+
+
+def create_ledger_tables(cursor):
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS `{LEDGER_TABLE}` (
+          `id` bigint NOT NULL AUTO_INCREMENT,
+          `user_id` int(11) NOT NULL,
+          `account_type` enum('cash','bank') NOT NULL,
+          `account_id` int(11) NOT NULL,
+          `contra_account` varchar(32) NOT NULL,
+          `entry_type` enum('opening','movement','adjustment','closing') NOT NULL DEFAULT 'movement',
+          `amount` decimal(15,2) NOT NULL,
+          `balance_after` decimal(15,2) NOT NULL,
+          `source_type` varchar(32) DEFAULT NULL,
+          `source_id` int(11) DEFAULT NULL,
+          `entry_at` datetime(6) NOT NULL DEFAULT current_timestamp(6),
+          PRIMARY KEY (`id`),
+          KEY `idx_ledger_account_id` (`account_type`, `account_id`, `id`),
+          KEY `idx_ledger_account_time` (`account_type`, `account_id`, `entry_at`),
+          KEY `idx_ledger_user_time` (`user_id`, `entry_at`),
+          KEY `idx_ledger_source` (`source_type`, `source_id`)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci
+    """)
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS `{SNAPSHOT_TABLE}` (
+          `account_type` enum('cash','bank') NOT NULL,
+          `account_id` int(11) NOT NULL,
+          `snapshot_date` date NOT NULL,
+          `user_id` int(11) NOT NULL,
+          `balance` decimal(15,2) NOT NULL,
+          `last_entry_id` bigint NOT NULL,
+          `created_at` timestamp NOT NULL DEFAULT current_timestamp(),
+          PRIMARY KEY (`account_type`, `account_id`, `snapshot_date`),
+          KEY `idx_ledger_snapshots_user` (`user_id`, `snapshot_date`)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci
+    """)
+
+
+def _balance_for_update(cursor, user_id, account_type, account_id):
+    table, user_column, id_column, column = ACCOUNTS[account_type]
+    cursor.execute(f"""
+        SELECT COALESCE({column}, 0) AS balance FROM {table}
+        WHERE {id_column} = %s AND {user_column} = %s FOR UPDATE
+    """, (account_id, user_id))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    # Callers may hand over a dictionary cursor
+    return Decimal(row['balance'] if isinstance(row, dict) else row[0])
+
+
+def _journal(cursor, user_id, account_type, account_id, entry_type, amount, contra_account,
+             source_type, source_id, balance_sql=None):
+    """Append one entry; balance_after is read from the (already updated, locked) counter row"""
+    table, user_column, id_column, column = ACCOUNTS[account_type]
+    cursor.execute(f"""
+        INSERT INTO {LEDGER_TABLE} (user_id, account_type, account_id, contra_account, entry_type,
+                                    amount, balance_after, source_type, source_id)
+        SELECT %s, %s, %s, %s, %s, %s, {balance_sql or f'COALESCE({column}, 0)'}, %s, %s
+        FROM {table} WHERE {id_column} = %s AND {user_column} = %s
+    """, (user_id, account_type, account_id, contra_account, entry_type, amount,
+          source_type, source_id, account_id, user_id))
+
+
+def post_movement(cursor, user_id, account_type, account_id, transaction_type, amount,
+                  contra_account, source_type, source_id):
+    """Move `amount` into ('credit') or out of ('debit') an account and journal it.
+
+    account_id is the bank_accounts id, or the user id for the cash account.
+    Runs on the caller's cursor so the counter and its entry commit together.
+    Returns False (nothing written) if the account does not belong to the user.
+    """
+    if contra_account not in CONTRA_ACCOUNTS:
+        raise ValueError(f"Unknown contra account: {contra_account}")
+    amount = Decimal(str(amount or 0))
+    if transaction_type != 'credit':
+        amount = -amount
+    if not amount:
+        return True
+    table, user_column, id_column, column = ACCOUNTS[account_type]
+    cursor.execute(f"""
+        UPDATE {table} SET {column} = COALESCE({column}, 0) + %s
+        WHERE {id_column} = %s AND {user_column} = %s
+    """, (amount, account_id, user_id))
+    if cursor.rowcount == 0:
+        return False
+    _journal(cursor, user_id, account_type, account_id, 'movement', amount, contra_account,
+             source_type, source_id)
+    return True
+
+
+def post_movements(cursor, user_id, account_type, account_id, movements):
+    """Apply several movements to one account with a single counter update.
+
+    `movements` is [(transaction_type, amount, contra_account, source_type, source_id)];
+    each still gets its own entry. Returns False if the account does not belong to the user.
+    """
+    balance = _balance_for_update(cursor, user_id, account_type, account_id)
+    if balance is None:
+        return False
+    rows = []
+    for transaction_type, amount, contra_account, source_type, source_id in movements:
+        if contra_account not in CONTRA_ACCOUNTS:
+            raise ValueError(f"Unknown contra account: {contra_account}")
+        amount = Decimal(str(amount or 0))
+        if transaction_type != 'credit':
+            amount = -amount
+        if amount:
+            balance += amount
+            rows.append((user_id, account_type, account_id, contra_account, 'movement',
+                         amount, balance, source_type, source_id))
+    if not rows:
+        return True
+    table, user_column, id_column, column = ACCOUNTS[account_type]
+    cursor.execute(f"UPDATE {table} SET {column} = %s WHERE {id_column} = %s AND {user_column} = %s",
+                   (balance, account_id, user_id))
+    cursor.executemany(f"""
+        INSERT INTO {LEDGER_TABLE} (user_id, account_type, account_id, contra_account, entry_type,
+                                    amount, balance_after, source_type, source_id)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+    """, rows)
+    return True
+
+
+def posted_source(cursor, candidates):
+    """The first of `candidates` [(source_type, source_id)] with unreversed movements, else the first one.
+
+    A reversal should be journaled under the source the original movement was
+    posted to; the same money can be recorded as an expense, an invoice and a
+    transaction, and which one carried it depends on the write path taken.
+    """
+    return posted_sources(cursor, {None: candidates})[None]
+
+
+def posted_sources(cursor, candidates_by_key):
+    """posted_source() for many rows in one query: {key: candidates} -> {key: (source_type, source_id)}"""
+    candidates_by_key = {key: [(source_type, source_id) for source_type, source_id in candidates if source_id]
+                         for key, candidates in candidates_by_key.items()}
+    # Rows with a single candidate need no lookup
+    ids_by_type = defaultdict(set)
+    for candidates in candidates_by_key.values():
+        if len(candidates) > 1:
+            for source_type, source_id in candidates:
+                ids_by_type[source_type].add(source_id)
+    posted = set()
+    if ids_by_type:
+        conditions = ' OR '.join(f"(source_type = %s AND source_id IN ({', '.join(['%s'] * len(ids))}))"
+                                 for ids in ids_by_type.values())
+        params = []
+        for source_type, ids in ids_by_type.items():
+            params += [source_type] + sorted(ids)
+        cursor.execute(f"""
+            SELECT source_type, source_id FROM {LEDGER_TABLE}
+            WHERE entry_type = 'movement' AND ({conditions})
+            GROUP BY source_type, source_id
+            HAVING SUM(amount) <> 0
+        """, params)
+        posted = {(row['source_type'], row['source_id']) if isinstance(row, dict) else tuple(row)
+                  for row in cursor.fetchall()}
+    return {key: next((candidate for candidate in candidates if candidate in posted), candidates[0])
+            if candidates else (None, None)
+            for key, candidates in candidates_by_key.items()}
+
+
+def post_adjustment(cursor, user_id, account_type, account_id, new_balance, source_type, source_id):
+    """Set an account's balance outright (manual correction), journaling the difference against equity"""
+    balance = _balance_for_update(cursor, user_id, account_type, account_id)
+    if balance is None:
+        return False
+    table, user_column, id_column, column = ACCOUNTS[account_type]
+    delta = Decimal(str(new_balance or 0)) - balance
+    cursor.execute(f"UPDATE {table} SET {column} = %s WHERE {id_column} = %s AND {user_column} = %s",
+                   (new_balance, account_id, user_id))
+    if delta:
+        _journal(cursor, user_id, account_type, account_id, 'adjustment', delta, 'equity',
+                 source_type, source_id)
+    return True
+
+
+def post_opening(cursor, user_id, account_type, account_id, source_type, source_id):
+    """Journal a newly created account's starting balance (call right after the INSERT)"""
+    balance = _balance_for_update(cursor, user_id, account_type, account_id)
+    if balance:
+        _journal(cursor, user_id, account_type, account_id, 'opening', balance, 'equity',
+                 source_type, source_id)
+
+
+def post_closing(cursor, user_id, account_type, account_id, source_type, source_id):
+    """Journal the balance leaving with an account (call right before the DELETE)"""
+    balance = _balance_for_update(cursor, user_id, account_type, account_id)
+    if balance:
+        _journal(cursor, user_id, account_type, account_id, 'closing', -balance, 'equity',
+                 source_type, source_id, balance_sql='0')
+
+
+def drop_ledger_triggers(cursor):
+    """Drop the counter triggers that used to write unattributed ledger rows"""
+    for name in LEGACY_TRIGGERS:
+        cursor.execute(f"DROP TRIGGER IF EXISTS `{name}`")
+
+
+def seed_opening_entries(cursor):
+    """Open every account that has no entries yet at its current counter value"""
+    for account_type, (table, user_column, id_column, column) in ACCOUNTS.items():
+        cursor.execute(f"""
+            INSERT INTO {LEDGER_TABLE} (user_id, account_type, account_id, contra_account, entry_type, amount, balance_after)
+            SELECT a.{user_column}, %s, a.{id_column}, 'equity', 'opening', a.{column}, a.{column}
+            FROM {table} a
+            WHERE COALESCE(a.{column}, 0) <> 0
+              AND NOT EXISTS (
+                  SELECT 1 FROM {LEDGER_TABLE} e
+                  WHERE e.account_type = %s AND e.account_id = a.{id_column}
+              )
+        """, (account_type, account_type))
+
+
+def take_snapshots(cursor, snapshot_date):
+    """Record end-of-day balances for `snapshot_date` for every account with new entries.
+
+    Each snapshot is the previous one plus the entries since, so the cost is
+    proportional to that day's activity. Re-running for the same date is safe.
+    """
+    end = datetime.combine(snapshot_date + timedelta(days=1), datetime.min.time())
+    previous = LATEST_SNAPSHOTS_SQL.format(where='WHERE snapshot_date < %s')
+    cursor.execute(f"""
+        INSERT INTO {SNAPSHOT_TABLE} (account_type, account_id, snapshot_date, user_id, balance, last_entry_id)
+        SELECT e.account_type, e.account_id, %s, MAX(e.user_id),
+               COALESCE(MAX(p.balance), 0) + SUM(e.amount), MAX(e.id)
+        FROM {LEDGER_TABLE} e
+        LEFT JOIN ({previous}) p ON p.account_type = e.account_type AND p.account_id = e.account_id
+        WHERE e.entry_at < %s AND e.id > COALESCE(p.last_entry_id, 0)
+        GROUP BY e.account_type, e.account_id
+        ON DUPLICATE KEY UPDATE balance = VALUES(balance), last_entry_id = VALUES(last_entry_id)
+    """, (snapshot_date, snapshot_date, end))
+    return cursor.rowcount
+
+
+def balance_as_of(cursor, user_id, account_type, account_id, as_of):
+    """Balance at the end of `as_of` (a date): latest snapshot on/before it + later entries"""
+    end = datetime.combine(as_of + timedelta(days=1), datetime.min.time())
+    cursor.execute(f"""
+        SELECT balance, last_entry_id FROM {SNAPSHOT_TABLE}
+        WHERE account_type = %s AND account_id = %s AND user_id = %s AND snapshot_date <= %s
+        ORDER BY snapshot_date DESC LIMIT 1
+    """, (account_type, account_id, user_id, as_of))
+    snapshot = cursor.fetchone()
+    base, after_id = (Decimal(snapshot[0]), snapshot[1]) if snapshot else (Decimal(0), 0)
+
+    cursor.execute(f"""
+        SELECT COALESCE(SUM(amount), 0) FROM {LEDGER_TABLE}
+        WHERE account_type = %s AND account_id = %s AND user_id = %s AND id > %s AND entry_at < %s
+    """, (account_type, account_id, user_id, after_id, end))
+    return base + Decimal(cursor.fetchone()[0])
+
+
+def account_statement(cursor, user_id, account_type, account_id, date_from, date_to):
+    """Opening balance, entries and closing balance for an account over [date_from, date_to]"""
+    opening = balance_as_of(cursor, user_id, account_type, account_id, date_from - timedelta(days=1))
+    cursor.execute(f"""
+        SELECT id, entry_type, contra_account, amount, balance_after, entry_at
+        FROM {LEDGER_TABLE}
+        WHERE account_type = %s AND account_id = %s AND user_id = %s
+          AND entry_at >= %s AND entry_at < %s
+        ORDER BY id
+    """, (account_type, account_id, user_id,
+          datetime.combine(date_from, datetime.min.time()),
+          datetime.combine(date_to + timedelta(days=1), datetime.min.time())))
+    columns = [c[0] for c in cursor.description]
+    entries = [dict(zip(columns, row)) for row in cursor.fetchall()]
+    closing = opening + sum((Decimal(e['amount']) for e in entries), Decimal(0))
+    return {'opening_balance': opening, 'entries': entries, 'closing_balance': closing}
+
+
+def find_ledger_drift(connection):
+    """Disagreements between the ledger, the balance counters and the source rows.
+
+    'counter' drift: an account whose counter differs from its ledger balance
+    (latest snapshot + later entries), i.e. a write that bypassed the ledger.
+    'source' drift: a source whose movements no longer match it - the row was
+    deleted without its balance being reversed, or its amount was edited
+    without the balance following.
+
+    Returns [{'kind': 'counter', 'account_type', 'account_id', 'user_id', 'counter', 'ledger'}]
+    followed by [{'kind': 'source', 'source_type', 'source_id', 'user_id', 'source_amount', 'ledger'}].
+    """
+    cursor = connection.cursor(dictionary=True)
+    try:
+        latest = LATEST_SNAPSHOTS_SQL.format(where='')
+        cursor.execute(f"""
+            SELECT e.account_type, e.account_id,
+                   COALESCE(MAX(s.balance), 0) + COALESCE(SUM(e.amount), 0) AS ledger
+            FROM {LEDGER_TABLE} e
+            LEFT JOIN ({latest}) s ON s.account_type = e.account_type AND s.account_id = e.account_id
+            WHERE e.id > COALESCE(s.last_entry_id, 0)
+            GROUP BY e.account_type, e.account_id
+        """)
+        ledger = {(row['account_type'], row['account_id']): Decimal(row['ledger']) for row in cursor.fetchall()}
+        # Accounts with no entries since their snapshot
+        cursor.execute(latest)
+        for row in cursor.fetchall():
+            ledger.setdefault((row['account_type'], row['account_id']), Decimal(row['balance']))
+
+        drift = []
+        for account_type, (table, user_column, id_column, column) in ACCOUNTS.items():
+            cursor.execute(f"SELECT {id_column} AS account_id, {user_column} AS user_id, "
+                           f"COALESCE({column}, 0) AS counter FROM {table}")
+            for row in cursor.fetchall():
+                ledger_balance = ledger.get((account_type, row['account_id']), Decimal(0))
+                if Decimal(row['counter']) != ledger_balance:
+                    drift.append({
+                        'kind': 'counter',
+                        'account_type': account_type,
+                        'account_id': row['account_id'],
+                        'user_id': row['user_id'],
+                        'counter': float(row['counter']),
+                        'ledger': float(ledger_balance)
+                    })
+
+        # A live source nets to its amount (or to zero once reversed); a deleted one to zero
+        for source_type, (table, column) in SOURCE_TABLES.items():
+            cursor.execute(f"""
+                SELECT e.source_id, MAX(e.user_id) AS user_id, SUM(e.amount) AS net,
+                       MAX(s.{column}) AS source_amount, COUNT(s.id) > 0 AS present
+                FROM {LEDGER_TABLE} e
+                LEFT JOIN {table} s ON s.id = e.source_id
+                WHERE e.source_type = %s AND e.entry_type = 'movement'
+                GROUP BY e.source_id
+                HAVING net <> 0 AND (NOT present OR ABS(net) <> ABS(COALESCE(source_amount, 0)))
+            """, (source_type,))
+            for row in cursor.fetchall():
+                drift.append({
+                    'kind': 'source',
+                    'source_type': source_type,
+                    'source_id': row['source_id'],
+                    'user_id': row['user_id'],
+                    'source_amount': float(row['source_amount']) if row['present'] and row['source_amount'] is not None else None,
+                    'ledger': float(row['net'])
+                })
+        return drift
+    finally:
+        cursor.close()
+
+
+class LedgerSnapshotter:
+    """Background thread that snapshots yesterday's balances and checks for drift"""
+
+    LOCK_NAME = 'laitusneo_ledger_snapshot'
+
+    def __init__(self, get_connection, interval):
+        self.get_connection = get_connection
+        self.interval = interval
+        self.last_run = None
+        self.last_drift = []
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self.interval <= 0 or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='ledger-snapshotter', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.run_once()
+
+    def run_once(self, snapshot_date=None):
+        """Snapshot `snapshot_date` (default: yesterday) and return the drift found, or None if skipped"""
+        snapshot_date = snapshot_date or date.today() - timedelta(days=1)
+        connection = self.get_connection()
+        if not connection:
+            print("Ledger snapshot skipped: database connection failed")
+            return None
+        cursor = connection.cursor()
+        try:
+            # Only one worker process snapshots at a time
+            cursor.execute("SELECT GET_LOCK(%s, 0)", (self.LOCK_NAME,))
+            if cursor.fetchone()[0] != 1:
+                return None
+            try:
+                take_snapshots(cursor, snapshot_date)
+                connection.commit()
+                drift = find_ledger_drift(connection)
+            finally:
+                cursor.execute("SELECT RELEASE_LOCK(%s)", (self.LOCK_NAME,))
+                cursor.fetchone()
+            self.last_run = time.time()
+            self.last_drift = drift
+            if drift:
+                print(f"Ledger drift detected for {len(drift)} account(s)")
+            return drift
+        except Exception as e:
+            print(f"Error taking ledger snapshots: {e}")
+            return None
+        finally:
+            cursor.close()
+            connection.close()
@@ -0,0 +1,739 @@
+"""
+Versioned schema migrations for Laitusneo Track.
+
+Every schema change the application depends on lives here as a numbered
+migration. Applied versions are recorded in the `schema_migrations` table, so
+each migration runs exactly once per database. app.py applies pending
+migrations at startup; run this file directly to apply them by hand:
+
+    python migrations.py
+"""
+
+from datetime import date
+
+import mysql.connector
+from mysql.connector import Error
+
+from financial_summary import create_summary_table, install_summary_triggers, rebuild_summaries
+from export_jobs import create_export_jobs_table
+from sequences import create_sequence_table, seed_sequences
+from ledger import create_ledger_tables, drop_ledger_triggers, seed_opening_entries, take_snapshots
+from http_cache import create_version_table, install_version_triggers
+from reference_cache import install_reference_triggers
+
+# Database configuration (used only when run as a script)
+DB_CONFIG = {
+    'host': 'localhost',
+    'user': 'root',  # Change this to your MySQL username
+    'password': '',  # Change this to your MySQL password
+    'database': 'expense_tracker'
+}
+
+MIGRATION_LOCK_NAME = 'laitusneo_schema_migrations'
+MIGRATION_LOCK_TIMEOUT = 60
+
+
+# ---------------------------------------------------------------------------
+# Introspection helpers (only ever called from migrations, never per request)
+# ---------------------------------------------------------------------------
+
+def column_exists(cursor, table, column):
+    cursor.execute("""
+        SELECT COUNT(*) FROM INFORMATION_SCHEMA.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s
+    """, (table, column))
+    return cursor.fetchone()[0] > 0
+
+
+def index_exists(cursor, table, index_name):
+    cursor.execute("""
+        SELECT COUNT(*) FROM INFORMATION_SCHEMA.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s
+    """, (table, index_name))
+    return cursor.fetchone()[0] > 0
+
+
+def table_exists(cursor, table):
+    cursor.execute("""
+        SELECT COUNT(*) FROM INFORMATION_SCHEMA.TABLES
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+    """, (table,))
+    return cursor.fetchone()[0] > 0
+
+
+def foreign_key_targets(cursor, table, column):
+    """Return [(constraint_name, referenced_table)] for FKs on table.column"""
+    cursor.execute("""
+        SELECT CONSTRAINT_NAME, REFERENCED_TABLE_NAME
+        FROM INFORMATION_SCHEMA.KEY_COLUMN_USAGE
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s
+        AND REFERENCED_TABLE_NAME IS NOT NULL
+    """, (table, column))
+    return cursor.fetchall()
+
+
+def add_column(cursor, table, column, definition):
+    """Add a column unless it already exists"""
+    if not column_exists(cursor, table, column):
+        cursor.execute(f"ALTER TABLE `{table}` ADD COLUMN `{column}` {definition}")
+        print(f"  Added column {table}.{column}")
+
+
+def add_index(cursor, table, index_name, columns, kind='INDEX'):
+    """Add an index (kind='FULLTEXT INDEX' for full-text) unless one with the same name already exists"""
+    if not index_exists(cursor, table, index_name):
+        cursor.execute(f"ALTER TABLE `{table}` ADD {kind} `{index_name}` ({columns})")
+        print(f"  Added index {table}.{index_name}")
+
+
+def add_foreign_key(cursor, table, column, reference, on_delete='SET NULL'):
+    """Add a foreign key on table.column unless one already exists"""
+    if not foreign_key_targets(cursor, table, column):
+        cursor.execute(
+            f"ALTER TABLE `{table}` ADD FOREIGN KEY (`{column}`) REFERENCES {reference} ON DELETE {on_delete}"
+        )
+        print(f"  Added foreign key {table}.{column} -> {reference}")
+
+
+# ---------------------------------------------------------------------------
+# Migrations
+# ---------------------------------------------------------------------------
+
+def migration_0001_sub_users(cursor):
+    """Sub-users, sub-user requests and sub-user bank accounts"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS sub_users (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            sub_user_id VARCHAR(50) UNIQUE NOT NULL,
+            password_hash VARCHAR(255) NOT NULL,
+            first_name VARCHAR(100) NOT NULL,
+            last_name VARCHAR(100) NOT NULL,
+            email VARCHAR(255),
+            created_by INT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            is_active BOOLEAN DEFAULT TRUE,
+            FOREIGN KEY (created_by) REFERENCES users(id) ON DELETE CASCADE,
+            INDEX idx_sub_user_id (sub_user_id),
+            INDEX idx_created_by (created_by)
+        )
+    """)
+
+    # Approval tracking columns on invoices
+    add_column(cursor, 'invoices', 'approved_at', 'TIMESTAMP NULL')
+    add_column(cursor, 'invoices', 'approved_by', 'INT NULL')
+    add_column(cursor, 'invoices', 'approved_bank_account_id', 'INT NULL')
+    add_column(cursor, 'invoices', 'approved_payment_method', 'VARCHAR(20) NULL')
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS sub_user_requests (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            sub_user_id INT NOT NULL,
+            request_type ENUM('expense', 'transaction', 'invoice') NOT NULL,
+            request_data JSON NOT NULL,
+            status ENUM('pending', 'approved', 'rejected') DEFAULT 'pending',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            reviewed_by INT,
+            reviewed_at TIMESTAMP NULL,
+            notes TEXT,
+            FOREIGN KEY (sub_user_id) REFERENCES sub_users(id) ON DELETE CASCADE,
+            FOREIGN KEY (reviewed_by) REFERENCES users(id) ON DELETE SET NULL,
+            INDEX idx_sub_user_id (sub_user_id),
+            INDEX idx_status (status),
+            INDEX idx_request_type (request_type)
+        )
+    """)
+
+    for table in ('expenses', 'transactions'):
+        add_column(cursor, table, 'created_by_sub_user', 'INT NULL')
+        add_foreign_key(cursor, table, 'created_by_sub_user', 'sub_users(id)')
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS sub_user_bank_accounts (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            sub_user_id INT NOT NULL,
+            bank_name VARCHAR(255) NOT NULL,
+            account_number VARCHAR(50) NOT NULL,
+            ifsc_code VARCHAR(20) NOT NULL,
+            account_holder_name VARCHAR(255) NOT NULL,
+            upi_id VARCHAR(255),
+            phone_number VARCHAR(20),
+            notes TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            FOREIGN KEY (sub_user_id) REFERENCES sub_users(id) ON DELETE CASCADE,
+            UNIQUE KEY unique_sub_user_bank (sub_user_id),
+            INDEX idx_sub_user_id (sub_user_id)
+        )
+    """)
+
+
+def migration_0002_download_approvals(cursor):
+    """Invoice download approvals requested by sub-users"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS sub_user_download_approvals (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            invoice_id INT NOT NULL,
+            sub_user_id INT NOT NULL,
+            status ENUM('pending', 'approved', 'rejected') DEFAULT 'pending',
+            requested_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            approved_at TIMESTAMP NULL,
+            approved_by INT NULL,
+            notes TEXT,
+            FOREIGN KEY (invoice_id) REFERENCES invoices(id) ON DELETE CASCADE,
+            FOREIGN KEY (sub_user_id) REFERENCES sub_users(id) ON DELETE CASCADE,
+            FOREIGN KEY (approved_by) REFERENCES users(id) ON DELETE SET NULL,
+            UNIQUE KEY unique_request (invoice_id, sub_user_id),
+            INDEX idx_status (status),
+            INDEX idx_sub_user (sub_user_id)
+        )
+    """)
+
+
+def migration_0003_vendor_bank_details(cursor):
+    """Vendor bank details attached to invoices"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS vendor_bank_details (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            invoice_id INT NOT NULL,
+            bank_name VARCHAR(255),
+            account_number VARCHAR(50),
+            ifsc_code VARCHAR(20),
+            account_holder_name VARCHAR(255),
+            upi_id VARCHAR(100),
+            phone_number VARCHAR(20),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (invoice_id) REFERENCES invoices(id) ON DELETE CASCADE,
+            INDEX idx_invoice (invoice_id)
+        )
+    """)
+
+
+def migration_0004_invoice_columns(cursor):
+    """Invoice type, sub-user ownership, billing and payment columns"""
+    add_column(cursor, 'invoices', 'invoice_type', "ENUM('in', 'out') DEFAULT 'out' AFTER status")
+    add_index(cursor, 'invoices', 'idx_invoices_type', 'invoice_type')
+    add_column(cursor, 'invoices', 'created_by_sub_user', 'INT NULL')
+    add_index(cursor, 'invoices', 'idx_created_by_sub_user', 'created_by_sub_user')
+
+    add_column(cursor, 'invoices', 'billing_company_name', 'VARCHAR(255)')
+    add_column(cursor, 'invoices', 'billing_address', 'TEXT')
+    add_column(cursor, 'invoices', 'billing_city', 'VARCHAR(100)')
+    add_column(cursor, 'invoices', 'billing_state', 'VARCHAR(100)')
+    add_column(cursor, 'invoices', 'billing_pin', 'VARCHAR(10)')
+    add_column(cursor, 'invoices', 'gstin_number', 'VARCHAR(20)')
+    add_column(cursor, 'invoices', 'pan_number', 'VARCHAR(20)')
+    add_column(cursor, 'invoices', 'payment_method', "VARCHAR(20) DEFAULT 'cash'")
+    add_column(cursor, 'invoices', 'bank_account_type', 'VARCHAR(20)')
+
+    add_column(cursor, 'invoices', 'bank_account_id', 'INT NULL')
+    add_column(cursor, 'invoices', 'expense_id', 'INT NULL')
+
+
+def migration_0005_debt_management(cursor):
+    """Customers, debts, EMIs, payments, reminders and debt settings"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS `customers` (
+          `id` int(11) NOT NULL AUTO_INCREMENT,
+          `user_id` int(11) NOT NULL,
+          `customer_code` varchar(50) DEFAULT NULL,
+          `name` varchar(255) NOT NULL,
+          `phone` varchar(20) DEFAULT NULL,
+          `email` varchar(255) DEFAULT NULL,
+          `address` text DEFAULT NULL,
+          `city` varchar(100) DEFAULT NULL,
+          `state` varchar(100) DEFAULT NULL,
+          `pincode` varchar(10) DEFAULT NULL,
+          `pan_number` varchar(20) DEFAULT NULL,
+          `aadhar_number` varchar(20) DEFAULT NULL,
+          `status` enum('active','inactive') DEFAULT 'active',
+          `notes` text DEFAULT NULL,
+          `created_at` timestamp NOT NULL DEFAULT current_timestamp(),
+          `updated_at` timestamp NOT NULL DEFAULT current_timestamp() ON UPDATE current_timestamp(),
+          PRIMARY KEY (`id`),
+          KEY `idx_user_id` (`user_id`),
+          KEY `idx_customer_code` (`customer_code`),
+          KEY `idx_status` (`status`),
+          KEY `idx_name` (`name`),
+          FOREIGN KEY (`user_id`) REFERENCES `users` (`id`) ON DELETE CASCADE
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci
+    """)
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS `debts` (
+          `id` int(11) NOT NULL AUTO_INCREMENT,
+          `user_id` int(11) NOT NULL,
+          `customer_id` int(11) NOT NULL,
+          `debt_code` varchar(50) DEFAULT NULL,
+          `total_amount` decimal(15,2) NOT NULL DEFAULT 0.00,
+          `paid_amount` decimal(15,2) NOT NULL DEFAULT 0.00,
+          `balance` decimal(15,2) NOT NULL DEFAULT 0.00,
+          `interest_rate` decimal(5,2) DEFAULT 0.00,
+          `due_date` date DEFAULT NULL,
+          `start_date` date NOT NULL,
+          `status` enum('active','overdue','settled','cancelled') DEFAULT 'active',
+          `loan_purpose` text DEFAULT NULL,
+          `notes` text DEFAULT NULL,
+          `emi_enabled` tinyint(1) DEFAULT 0,
+          `emi_count` int(11) DEFAULT 0,
+          `emi_amount` decimal(15,2) DEFAULT 0.00,
+          `product_id` int(11) DEFAULT NULL,
+          `transaction_id` int(11) DEFAULT NULL,
+          `created_at` timestamp NOT NULL DEFAULT current_timestamp(),
+          `updated_at` timestamp NOT NULL DEFAULT current_timestamp() ON UPDATE current_timestamp(),
+          PRIMARY KEY (`id`),
+          KEY `idx_user_id` (`user_id`),
+          KEY `idx_customer_id` (`customer_id`),
+          KEY `idx_debt_code` (`debt_code`),
+          KEY `idx_status` (`status`),
+          KEY `idx_due_date` (`due_date`),
+          FOREIGN KEY (`user_id`) REFERENCES `users` (`id`) ON DELETE CASCADE,
+          FOREIGN KEY (`customer_id`) REFERENCES `customers` (`id`) ON DELETE CASCADE
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci
+    """)
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS `emis` (
+          `id` int(11) NOT NULL AUTO_INCREMENT,
+          `debt_id` int(11) NOT NULL,
+          `customer_id` int(11) NOT NULL,
+          `user_id` int(11) NOT NULL,
+          `installment_number` int(11) NOT NULL,
+          `due_date` date NOT NULL,
+          `amount` decimal(15,2) NOT NULL DEFAULT 0.00,
+          `paid_amount` decimal(15,2) NOT NULL DEFAULT 0.00,
+          `status` enum('pending','paid','overdue','partial') DEFAULT 'pending',
+          `paid_date` date DEFAULT NULL,
+          `late_fee` decimal(15,2) DEFAULT 0.00,
+          `notes` text DEFAULT NULL,
+          `created_at` timestamp NOT NULL DEFAULT current_timestamp(),
+          `updated_at` timestamp NOT NULL DEFAULT current_timestamp() ON UPDATE current_timestamp(),
+          PRIMARY KEY (`id`),
+          KEY `idx_debt_id` (`debt_id`),
+          KEY `idx_customer_id` (`customer_id`),
+          KEY `idx_user_id` (`user_id`),
+          KEY `idx_due_date` (`due_date`),
+          KEY `idx_status` (`status`),
+          FOREIGN KEY (`debt_id`) REFERENCES `debts` (`id`) ON DELETE CASCADE,
+          FOREIGN KEY (`customer_id`) REFERENCES `customers` (`id`) ON DELETE CASCADE,
+          FOREIGN KEY (`user_id`) REFERENCES `users` (`id`) ON DELETE CASCADE
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci
+    """)
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS `debt_payments` (
+          `id` int(11) NOT NULL AUTO_INCREMENT,
+          `debt_id` int(11) NOT NULL,
+          `customer_id` int(11) NOT NULL,
+          `user_id` int(11) NOT NULL,
+          `emi_id` int(11) DEFAULT NULL,
+          `amount` decimal(15,2) NOT NULL DEFAULT 0.00,
+          `payment_method` enum('cash','upi','bank','card','cheque','other') DEFAULT 'cash',
+          `payment_date` date NOT NULL,
+          `transaction_id` varchar(255) DEFAULT NULL,
+          `bank_account_id` int(11) DEFAULT NULL,
+          `receipt_number` varchar(50) DEFAULT NULL,
+          `remarks` text DEFAULT NULL,
+          `created_at` timestamp NOT NULL DEFAULT current_timestamp(),
+          `updated_at` timestamp NOT NULL DEFAULT current_timestamp() ON UPDATE current_timestamp(),
+          PRIMARY KEY (`id`),
+          KEY `idx_debt_id` (`debt_id`),
+          KEY `idx_customer_id` (`customer_id`),
+          KEY `idx_user_id` (`user_id`),
+          KEY `idx_emi_id` (`emi_id`),
+          KEY `idx_payment_date` (`payment_date`),
+          KEY `idx_receipt_number` (`receipt_number`),
+          FOREIGN KEY (`debt_id`) REFERENCES `debts` (`id`) ON DELETE CASCADE,
+          FOREIGN KEY (`customer_id`) REFERENCES `customers` (`id`) ON DELETE CASCADE,
+          FOREIGN KEY (`user_id`) REFERENCES `users` (`id`) ON DELETE CASCADE,
+          FOREIGN KEY (`emi_id`) REFERENCES `emis` (`id`) ON DELETE SET NULL
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci
+    """)
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS `debt_reminders` (
+          `id` int(11) NOT NULL AUTO_INCREMENT,
+          `debt_id` int(11) NOT NULL,
+          `customer_id` int(11) NOT NULL,
+          `user_id` int(11) NOT NULL,
+          `emi_id` int(11) DEFAULT NULL,
+          `reminder_type` enum('upcoming_due','due_today','overdue','manual') DEFAULT 'upcoming_due',
+          `scheduled_date` date NOT NULL,
+          `sent_date` datetime DEFAULT NULL,
+          `sent` tinyint(1) DEFAULT 0,
+          `channel` enum('email','sms','whatsapp','in_app') DEFAULT 'in_app',
+          `message` text DEFAULT NULL,
+          `subject` varchar(255) DEFAULT NULL,
+          `created_at` timestamp NOT NULL DEFAULT current_timestamp(),
+          `updated_at` timestamp NOT NULL DEFAULT current_timestamp() ON UPDATE current_timestamp(),
+          PRIMARY KEY (`id`),
+          KEY `idx_debt_id` (`debt_id`),
+          KEY `idx_customer_id` (`customer_id`),
+          KEY `idx_user_id` (`user_id`),
+          KEY `idx_emi_id` (`emi_id`),
+          KEY `idx_scheduled_date` (`scheduled_date`),
+          KEY `idx_sent` (`sent`),
+          KEY `idx_reminder_type` (`reminder_type`),
+          FOREIGN KEY (`debt_id`) REFERENCES `debts` (`id`) ON DELETE CASCADE,
+          FOREIGN KEY (`customer_id`) REFERENCES `customers` (`id`) ON DELETE CASCADE,
+          FOREIGN KEY (`user_id`) REFERENCES `users` (`id`) ON DELETE CASCADE,
+          FOREIGN KEY (`emi_id`) REFERENCES `emis` (`id`) ON DELETE SET NULL
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci
+    """)
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS `debt_settings` (
+          `id` int(11) NOT NULL AUTO_INCREMENT,
+          `user_id` int(11) NOT NULL,
+          `reminder_days_before` varchar(50) DEFAULT '3,1,0',
+          `notification_channels` varchar(100) DEFAULT 'in_app,email',
+          `default_emi_max_installments` int(11) DEFAULT 12,
+          `grace_period_days` int(11) DEFAULT 0,
+          `late_fee_percentage` decimal(5,2) DEFAULT 0.00,
+          `auto_reminder_enabled` tinyint(1) DEFAULT 1,
+          `created_at` timestamp NOT NULL DEFAULT current_timestamp(),
+          `updated_at` timestamp NOT NULL DEFAULT current_timestamp() ON UPDATE current_timestamp(),
+          PRIMARY KEY (`id`),
+          UNIQUE KEY `unique_user_debt_settings` (`user_id`),
+          FOREIGN KEY (`user_id`) REFERENCES `users` (`id`) ON DELETE CASCADE
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci
+    """)
+
+
+def migration_0006_inventory(cursor):
+    """Products, user settings and invoice item product links"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS `products` (
+          `id` int(11) NOT NULL AUTO_INCREMENT,
+          `user_id` int(11) NOT NULL,
+          `product_name` varchar(255) NOT NULL,
+          `product_code` varchar(100) DEFAULT NULL,
+          `description` text DEFAULT NULL,
+          `quantity` decimal(10,2) NOT NULL DEFAULT 0.00,
+          `unit_price` decimal(10,2) NOT NULL DEFAULT 0.00,
+          `sac_code` varchar(20) DEFAULT '998313',
+          `cost_price` decimal(10,2) DEFAULT 0.00,
+          `category` varchar(100) DEFAULT NULL,
+          `sku` varchar(100) DEFAULT NULL,
+          `unit` varchar(50) DEFAULT 'pcs',
+          `status` enum('active','inactive') DEFAULT 'active',
+          `created_at` timestamp NOT NULL DEFAULT current_timestamp(),
+          `updated_at` timestamp NOT NULL DEFAULT current_timestamp() ON UPDATE current_timestamp(),
+          PRIMARY KEY (`id`),
+          KEY `idx_user_id` (`user_id`),
+          KEY `idx_product_code` (`product_code`),
+          KEY `idx_status` (`status`),
+          CONSTRAINT `fk_products_user` FOREIGN KEY (`user_id`) REFERENCES `users` (`id`) ON DELETE CASCADE
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci
+    """)
+    # Older installs created products before these columns existed
+    add_column(cursor, 'products', 'description', 'text DEFAULT NULL AFTER `product_code`')
+    add_column(cursor, 'products', 'sac_code', "varchar(20) DEFAULT '998313' AFTER `unit_price`")
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS `user_settings` (
+          `id` int(11) NOT NULL AUTO_INCREMENT,
+          `user_id` int(11) NOT NULL,
+          `low_stock_threshold` int(11) DEFAULT 5,
+          `created_at` timestamp NOT NULL DEFAULT current_timestamp(),
+          `updated_at` timestamp NOT NULL DEFAULT current_timestamp() ON UPDATE current_timestamp(),
+          PRIMARY KEY (`id`),
+          UNIQUE KEY `unique_user_settings` (`user_id`),
+          CONSTRAINT `fk_user_settings_user` FOREIGN KEY (`user_id`) REFERENCES `users` (`id`) ON DELETE CASCADE
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci
+    """)
+    add_column(cursor, 'user_settings', 'low_stock_threshold', 'INT DEFAULT 5')
+
+    add_column(cursor, 'invoice_items', 'product_id', 'int(11) DEFAULT NULL')
+    add_index(cursor, 'invoice_items', 'idx_product_id', '`product_id`')
+    add_foreign_key(cursor, 'invoice_items', 'product_id', '`products` (`id`)')
+
+
+def migration_0007_monthly_expenses(cursor):
+    """Monthly expenses for main users"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS monthly_expenses (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            user_id INT NOT NULL,
+            expense_name VARCHAR(255) NOT NULL,
+            amount DECIMAL(10, 2) NOT NULL,
+            month INT NOT NULL,
+            year INT NOT NULL,
+            description TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+            INDEX idx_user_month_year (user_id, month, year)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    """)
+    add_column(cursor, 'monthly_expenses', 'expense_type', "VARCHAR(50) DEFAULT 'Fixed' AFTER user_id")
+    add_column(cursor, 'monthly_expenses', 'payment_date', 'DATE AFTER month')
+    add_column(cursor, 'monthly_expenses', 'payment_day', 'INT AFTER payment_date')
+
+
+def migration_0008_expense_columns(cursor):
+    """Expense payment columns previously added inside add_expense/update_expense"""
+    add_column(cursor, 'expenses', 'payment_type', "ENUM('invoice', 'cash') DEFAULT 'cash'")
+    add_column(cursor, 'expenses', 'payment_method', "ENUM('cash', 'online') DEFAULT 'cash'")
+    add_column(cursor, 'expenses', 'bank_account_id', 'INT NULL')
+    add_column(cursor, 'expenses', 'unique_id', 'VARCHAR(50)')
+    add_column(cursor, 'expenses', 'purpose', 'VARCHAR(255)')
+
+    if column_exists(cursor, 'expenses', 'expense_type'):
+        cursor.execute(
+            "ALTER TABLE expenses MODIFY COLUMN expense_type ENUM('completed', 'upcoming') NOT NULL DEFAULT 'completed'"
+        )
+    else:
+        add_column(cursor, 'expenses', 'expense_type', "ENUM('completed', 'upcoming') NOT NULL DEFAULT 'completed'")
+
+    # Older schemas pointed expenses.bank_account_id at the retired user_banks table
+    for constraint_name, referenced_table in foreign_key_targets(cursor, 'expenses', 'bank_account_id'):
+        if referenced_table == 'user_banks':
+            cursor.execute(f"ALTER TABLE expenses DROP FOREIGN KEY `{constraint_name}`")
+            cursor.execute("""
+                ALTER TABLE expenses
+                ADD CONSTRAINT fk_expenses_bank_accounts
+                FOREIGN KEY (bank_account_id) REFERENCES bank_accounts(id) ON DELETE SET NULL
+            """)
+            print(f"  Repointed expenses.bank_account_id foreign key {constraint_name} to bank_accounts")
+
+
+def migration_0009_transaction_columns(cursor):
+    """Transaction source/payment columns previously added inside request handlers"""
+    add_column(cursor, 'transactions', 'unique_id', 'VARCHAR(50)')
+    add_column(cursor, 'transactions', 'payment_method', "VARCHAR(50) DEFAULT 'cash'")
+    add_column(cursor, 'transactions', 'source', 'VARCHAR(50)')
+    add_column(cursor, 'transactions', 'source_id', 'INT')
+    add_column(cursor, 'transactions', 'bank_account_id', 'INT NULL')
+
+
+def migration_0010_list_indexes(cursor):
+    """Composite indexes backing keyset pagination and filters on the list endpoints"""
+    add_index(cursor, 'expenses', 'idx_expenses_user_created', 'user_id, created_at, id')
+    add_index(cursor, 'expenses', 'idx_expenses_user_date', 'user_id, expense_date')
+    add_index(cursor, 'expenses', 'idx_expenses_user_type_created', 'user_id, expense_type, created_at, id')
+    add_index(cursor, 'expenses', 'idx_expenses_user_bank_created', 'user_id, bank_account_id, created_at')
+    add_index(cursor, 'transactions', 'idx_transactions_user_created', 'user_id, created_at, id')
+    add_index(cursor, 'transactions', 'idx_transactions_user_date', 'user_id, transaction_date')
+    add_index(cursor, 'transactions', 'idx_transactions_user_type_created', 'user_id, transaction_type, created_at, id')
+    add_index(cursor, 'transactions', 'idx_transactions_user_bank_created', 'user_id, bank_account_id, created_at')
+
+
+def migration_0011_financial_summary(cursor):
+    """Per-user financial summary maintained by triggers, backfilled from existing rows"""
+    create_summary_table(cursor)
+    install_summary_triggers(cursor)
+    rebuild_summaries(cursor)
+    # The dashboard's remaining detail lists (overdue invoices, upcoming expenses)
+    add_index(cursor, 'invoices', 'idx_invoices_user_status_due', 'user_id, status, due_date')
+    add_index(cursor, 'expenses', 'idx_expenses_user_type_date', 'user_id, expense_type, expense_date')
+
+
+def migration_0012_export_jobs(cursor):
+    """Persistent queue for admin bulk export jobs"""
+    create_export_jobs_table(cursor)
+
+
+def migration_0013_document_sequences(cursor):
+    """Per-user counters for invoice numbers, debt codes and receipt numbers"""
+    create_sequence_table(cursor)
+    seed_sequences(cursor)
+
+
+def migration_0014_customer_search(cursor):
+    """Indexes for the paginated customer list, its search and outstanding-balance aggregate"""
+    add_index(cursor, 'customers', 'idx_customers_user_created', 'user_id, created_at, id')
+    add_index(cursor, 'customers', 'idx_customers_user_phone', 'user_id, phone')
+    add_index(cursor, 'customers', 'idx_customers_user_code', 'user_id, customer_code')
+    add_index(cursor, 'customers', 'ft_customers_name_email', 'name, email', kind='FULLTEXT INDEX')
+    add_index(cursor, 'debts', 'idx_debts_user_status_customer', 'user_id, status, customer_id, balance')
+
+
+def migration_0015_ledger(cursor):
+    """Append-only balance ledger, opened at today's counters, with a first snapshot"""
+    create_ledger_tables(cursor)
+    seed_opening_entries(cursor)
+    take_snapshots(cursor, date.today())
+
+
+def _json_text(path):
+    return f"JSON_UNQUOTE(JSON_EXTRACT(request_data, '{path}'))"
+
+
+def _json_decimal(path):
+    # Non-numeric payload values become NULL instead of failing the INSERT
+    text = _json_text(path)
+    return f"CAST(CASE WHEN {text} REGEXP '^-?[0-9]+([.][0-9]+)?$' THEN {text} END AS DECIMAL(15,2))"
+
+
+def migration_0016_sub_user_request_columns(cursor):
+    """Stored columns for the request_data fields sub-user lists filter and aggregate on"""
+    add_column(cursor, 'sub_user_requests', 'payload_invoice_type',
+               f"VARCHAR(10) GENERATED ALWAYS AS ({_json_text('$.invoice_type')}) STORED")
+    add_column(cursor, 'sub_user_requests', 'payload_status',
+               f"VARCHAR(20) GENERATED ALWAYS AS ({_json_text('$.status')}) STORED")
+    add_column(cursor, 'sub_user_requests', 'payload_title',
+               f"VARCHAR(255) GENERATED ALWAYS AS (LEFT({_json_text('$.title')}, 255)) STORED")
+    # Invoice requests carry total_amount; expense and transaction requests carry amount
+    add_column(cursor, 'sub_user_requests', 'payload_amount',
+               f"DECIMAL(15,2) GENERATED ALWAYS AS (IF(request_type = 'invoice', "
+               f"{_json_decimal('$.total_amount')}, {_json_decimal('$.amount')})) STORED")
+
+    # The owning user lives on sub_users, so it is copied in on insert rather than generated
+    add_column(cursor, 'sub_user_requests', 'owner_user_id', 'INT NULL')
+    cursor.execute("""
+        UPDATE sub_user_requests sur
+        JOIN sub_users su ON su.id = sur.sub_user_id
+        SET sur.owner_user_id = su.created_by
+        WHERE sur.owner_user_id IS NULL
+    """)
+    cursor.execute("DROP TRIGGER IF EXISTS `trg_sub_user_requests_owner_insert`")
+    cursor.execute("""
+        CREATE TRIGGER `trg_sub_user_requests_owner_insert` BEFORE INSERT ON `sub_user_requests`
+        FOR EACH ROW SET NEW.owner_user_id = (SELECT created_by FROM sub_users WHERE id = NEW.sub_user_id)
+    """)
+
+    add_index(cursor, 'sub_user_requests', 'idx_sur_owner_status_created', 'owner_user_id, status, created_at')
+    add_index(cursor, 'sub_user_requests', 'idx_sur_sub_user_status_updated', 'sub_user_id, status, updated_at')
+    add_index(cursor, 'sub_user_requests', 'idx_sur_invoice_metrics',
+              'sub_user_id, request_type, payload_invoice_type, payload_status, payload_amount')
+
+
+def migration_0017_collection_versions(cursor):
+    """Per-owner list versions behind the list endpoints' ETags"""
+    create_version_table(cursor)
+    install_version_triggers(cursor)
+
+
+def migration_0018_reference_versions(cursor):
+    """Per-user versions of the cached reference rows (profile, settings, bank accounts)"""
+    install_reference_triggers(cursor)
+
+
+def migration_0019_ledger_sources(cursor):
+    """Ledger entries name their source row and contra account; app.py writes them instead of triggers"""
+    drop_ledger_triggers(cursor)
+    add_column(cursor, 'ledger_entries', 'source_type', 'VARCHAR(32) DEFAULT NULL AFTER balance_after')
+    add_column(cursor, 'ledger_entries', 'source_id', 'INT DEFAULT NULL AFTER source_type')
+    add_index(cursor, 'ledger_entries', 'idx_ledger_source', 'source_type, source_id')
+    cursor.execute("""
+        ALTER TABLE ledger_entries
+        MODIFY `contra_account` varchar(32) NOT NULL,
+        MODIFY `entry_type` enum('opening','movement','adjustment','closing') NOT NULL DEFAULT 'movement'
+    """)
+    # Trigger-written openings were balance carried in, not outside money
+    cursor.execute("""
+        UPDATE ledger_entries SET contra_account = 'equity'
+        WHERE contra_account = 'external' AND entry_type IN ('opening', 'closing')
+    """)
+
+
+def migration_0020_sub_user_request_unique_id(cursor):
+    """Indexed link from an approved sub-user request to the expense/transaction rows it created"""
+    # Approvals used to record a freshly generated unique_id only in the notes
+    cursor.execute("""
+        UPDATE sub_user_requests
+        SET request_data = JSON_SET(request_data, '$.unique_id', TRIM(SUBSTRING_INDEX(notes, 'Unique ID: ', -1)))
+        WHERE status = 'approved' AND JSON_EXTRACT(request_data, '$.unique_id') IS NULL
+          AND notes LIKE '%Unique ID: %'
+    """)
+    add_column(cursor, 'sub_user_requests', 'payload_unique_id',
+               f"VARCHAR(50) GENERATED ALWAYS AS ({_json_text('$.unique_id')}) STORED")
+    add_index(cursor, 'sub_user_requests', 'idx_sur_owner_unique_id', 'owner_user_id, payload_unique_id')
+
+
+MIGRATIONS = [
+    (1, 'sub_users', migration_0001_sub_users),
+    (2, 'download_approvals', migration_0002_download_approvals),
+    (3, 'vendor_bank_details', migration_0003_vendor_bank_details),
+    (4, 'invoice_columns', migration_0004_invoice_columns),
+    (5, 'debt_management', migration_0005_debt_management),
+    (6, 'inventory', migration_0006_inventory),
+    (7, 'monthly_expenses', migration_0007_monthly_expenses),
+    (8, 'expense_columns', migration_0008_expense_columns),
+    (9, 'transaction_columns', migration_0009_transaction_columns),
+    (10, 'list_indexes', migration_0010_list_indexes),
+    (11, 'financial_summary', migration_0011_financial_summary),
+    (12, 'export_jobs', migration_0012_export_jobs),
+    (13, 'document_sequences', migration_0013_document_sequences),
+    (14, 'customer_search', migration_0014_customer_search),
+    (15, 'ledger', migration_0015_ledger),
+    (16, 'sub_user_request_columns', migration_0016_sub_user_request_columns),
+    (17, 'collection_versions', migration_0017_collection_versions),
+    (18, 'reference_versions', migration_0018_reference_versions),
+    (19, 'ledger_sources', migration_0019_ledger_sources),
+    (20, 'sub_user_request_unique_id', migration_0020_sub_user_request_unique_id),
+]
+
+
+# ---------------------------------------------------------------------------
+# Runner
+# ---------------------------------------------------------------------------
+
+def ensure_migrations_table(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INT PRIMARY KEY,
+            name VARCHAR(100) NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+def get_applied_versions(cursor):
+    cursor.execute("SELECT version FROM schema_migrations")
+    return {row[0] for row in cursor.fetchall()}
+
+
+def run_migrations(connection):
+    """Apply every pending migration in order; returns the versions applied.
+
+    A MySQL named lock serialises concurrent runners (e.g. several workers
+    booting at once), so each migration is applied by exactly one process.
+    """
+    applied_now = []
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT GET_LOCK(%s, %s)", (MIGRATION_LOCK_NAME, MIGRATION_LOCK_TIMEOUT))
+        if cursor.fetchone()[0] != 1:
+            raise Error(msg="Timed out waiting for the schema migration lock")
+
+        try:
+            ensure_migrations_table(cursor)
+            applied = get_applied_versions(cursor)
+
+            for version, name, migrate in MIGRATIONS:
+                if version in applied:
+                    continue
+                print(f"Applying migration {version:04d}_{name}...")
+                migrate(cursor)
+                cursor.execute(
+                    "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                    (version, name)
+                )
+                connection.commit()
+                applied_now.append(version)
+        finally:
+            cursor.execute("SELECT RELEASE_LOCK(%s)", (MIGRATION_LOCK_NAME,))
+            cursor.fetchone()
+    finally:
+        cursor.close()
+
+    if applied_now:
+        print(f"Applied migrations: {applied_now}")
+    return applied_now
+
+
+if __name__ == "__main__":
+    print("=" * 50)
+    print("Laitusneo Track - Schema Migrations")
+    print("=" * 50)
+    try:
+        connection = mysql.connector.connect(**DB_CONFIG)
+        applied = run_migrations(connection)
+        if not applied:
+            print("Database schema is up to date.")
+        connection.close()
+    except Error as e:
+        print(f"[ERROR] Migration failed: {e}")
@@ -0,0 +1,58 @@
+"""
+Keyset (cursor) pagination helpers for list endpoints.
+
+Lists are ordered by (created_at DESC, id DESC). A cursor is the opaque,
+URL-safe encoding of the last row's (created_at, id); the next page is every
+row strictly "older" than it, which an index on (user_id, created_at, id)
+answers without scanning or counting earlier pages.
+"""
+import base64
+from datetime import datetime
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+
+def encode_cursor(created_at, row_id):
+    """Opaque cursor for the row (created_at, row_id)"""
+    raw = f"{created_at.isoformat()}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return (created_at, row_id) for a cursor; raises ValueError if malformed"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, row_id = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+        return datetime.fromisoformat(created_at), int(row_id)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+
+def parse_limit(value, default=DEFAULT_PAGE_SIZE):
+    """Clamp a ?limit= query value to 1..MAX_PAGE_SIZE"""
+    if value in (None, ''):
+        return default
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        raise ValueError('limit must be an integer')
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def keyset_condition(alias, cursor):
+    """WHERE fragment and params selecting rows after `cursor` in (created_at, id) DESC order"""
+    created_at, row_id = decode_cursor(cursor)
+    return (
+        f"({alias}.created_at < %s OR ({alias}.created_at = %s AND {alias}.id < %s))",
+        [created_at, created_at, row_id]
+    )
+
+
+def split_page(rows, limit):
+    """Trim a LIMIT limit+1 result to `limit` rows and return (rows, next_cursor)"""
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(last['created_at'], last['id'])
@@ -0,0 +1,289 @@
+"""
+Background invoice PDF rendering with content-addressed caching.
+
+Invoice PDFs are rendered on a worker pool instead of the request thread and
+stored under a key derived from everything that affects the output (invoice
+row, items, company settings, bank details and the template files). Asking
+for an unchanged invoice again is a plain file send with no re-render.
+
+The job id is the content key itself, so a finished job can be downloaded
+from any worker process: the cached PDF and its small JSON sidecar (owner,
+invoice id, download filename) are all that is needed.
+
+A maintenance thread per process forgets old job records and keeps the
+cache directory bounded: PDFs unused for `max_age` seconds are deleted
+(a cache hit refreshes the file's mtime), and beyond `max_bytes` the least
+recently used ones go first. Files younger than `grace` seconds are never
+evicted, so a job that just finished can still be downloaded.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# Bump when renderer output changes in a way the inputs do not capture
+RENDERER_VERSION = 1
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+
+
+def invoice_content_key(invoice, items, company, bank_details, template_paths=()):
+    """sha256 over the render inputs plus the template files' mtimes and sizes"""
+    templates = []
+    for path in template_paths:
+        try:
+            stat = os.stat(path)
+            templates.append([path, stat.st_mtime_ns, stat.st_size])
+        except OSError:
+            templates.append([path, None, None])
+    payload = {
+        'version': RENDERER_VERSION,
+        'invoice': invoice,
+        'items': items,
+        'company': company,
+        'bank_details': bank_details,
+        'templates': templates,
+    }
+    encoded = json.dumps(payload, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class PdfRenderQueue:
+    """Thread pool that renders PDFs into a content-addressed cache directory"""
+
+    def __init__(self, cache_dir, max_workers=2, max_age=7 * 86400, max_bytes=512 * 1024 * 1024,
+                 prune_interval=600, grace=900):
+        self.cache_dir = cache_dir
+        self.max_workers = max_workers
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.prune_interval = prune_interval
+        self.grace = grace
+        self._executor = None
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._futures = {}
+        self._stop = threading.Event()
+        self._thread = None
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                thread_name_prefix='pdf-render')
+        return self._executor
+
+    def reset_after_fork(self):
+        """Drop the parent's executor, in-flight jobs and maintenance thread handle;
+        a new pool starts on first use and start() launches a new thread"""
+        self._executor = None
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._futures = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name='pdf-cache-prune', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _loop(self):
+        while not self._stop.wait(self.prune_interval):
+            try:
+                self.prune_jobs()
+                self.prune_cache()
+            except Exception as e:
+                print(f"DEBUG: PDF cache maintenance error: {e}")
+
+    def pdf_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.pdf")
+
+    def _meta_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _read_meta(self, key):
+        try:
+            with open(self._meta_path(key), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def enqueue(self, key, owner_id, invoice_id, filename, render):
+        """Schedule `render(filepath)` unless the PDF is cached or already in flight.
+
+        `render` must write the PDF to the path it is given and return that
+        path on success (anything else is treated as an error message).
+        """
+        if os.path.exists(self.pdf_path(key)) and self._read_meta(key):
+            try:
+                # Mark as recently used so the size cap evicts colder PDFs first
+                os.utime(self.pdf_path(key))
+            except OSError:
+                pass
+            return self.status(key, owner_id)
+
+        with self._lock:
+            job = self._jobs.get(key)
+            if job and job['status'] in (JOB_QUEUED, JOB_RUNNING):
+                return dict(job)
+            job = {
+                'job_id': key,
+                'invoice_id': invoice_id,
+                'owner_id': owner_id,
+                'filename': filename,
+                'status': JOB_QUEUED,
+                'error': None,
+                'created_at': time.time(),
+                'finished_at': None,
+            }
+            self._jobs[key] = job
+            self._futures[key] = self._get_executor().submit(self._run, key, render)
+            return dict(job)
+
+    def _run(self, key, render):
+        with self._lock:
+            job = self._jobs[key]
+            job['status'] = JOB_RUNNING
+
+        # Render to a private temp file, then publish atomically
+        tmp_path = os.path.join(self.cache_dir, f".{key}.{uuid.uuid4().hex}.tmp.pdf")
+        try:
+            result = render(tmp_path)
+            if isinstance(result, str) and os.path.exists(result):
+                meta = {'owner_id': job['owner_id'], 'invoice_id': job['invoice_id'],
+                        'filename': job['filename']}
+                with open(self._meta_path(key), 'w', encoding='utf-8') as f:
+                    json.dump(meta, f)
+                os.replace(result, self.pdf_path(key))
+                status, error = JOB_DONE, None
+            else:
+                error = result[0]['error'] if isinstance(result, tuple) else str(result)
+                status = JOB_FAILED
+        except Exception as e:
+            status, error = JOB_FAILED, str(e)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        with self._lock:
+            job['status'] = status
+            job['error'] = error
+            job['finished_at'] = time.time()
+            self._futures.pop(key, None)
+
+    def wait(self, key, timeout=None):
+        """Block until an in-flight job finishes (no-op if it is not running here)"""
+        future = self._futures.get(key)
+        if future is not None:
+            future.result(timeout=timeout)
+
+    def status(self, key, owner_id):
+        """Job status visible to `owner_id`, or None if unknown/not theirs"""
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None:
+                if job['owner_id'] != owner_id:
+                    return None
+                if job['status'] != JOB_DONE:
+                    return dict(job)
+
+        meta = self._read_meta(key)
+        if meta and meta.get('owner_id') == owner_id and os.path.exists(self.pdf_path(key)):
+            return {
+                'job_id': key,
+                'invoice_id': meta.get('invoice_id'),
+                'owner_id': owner_id,
+                'filename': meta.get('filename'),
+                'status': JOB_DONE,
+                'error': None,
+            }
+        return None
+
+    def prune_jobs(self, max_age=3600):
+        """Forget finished job records older than `max_age` seconds"""
+        cutoff = time.time() - max_age
+        with self._lock:
+            for key in [k for k, job in self._jobs.items()
+                        if job['finished_at'] and job['finished_at'] < cutoff]:
+                del self._jobs[key]
+
+    def prune_cache(self):
+        """Delete cached PDFs past `max_age`, then the least recently used ones
+        until the directory is under `max_bytes`; returns the number of files removed.
+
+        Every worker process runs this against the same directory, so files
+        vanishing underneath it are expected.
+        """
+        now = time.time()
+        with self._lock:
+            busy = set(self._futures)
+        entries = {}
+        removed = 0
+        try:
+            names = os.listdir(self.cache_dir)
+        except OSError:
+            return 0
+        for name in names:
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if name.startswith('.') and name.endswith('.tmp.pdf'):
+                # Left behind by a worker that died mid-render
+                key = name.split('.')[1]
+                if key not in busy and stat.st_mtime < now - self.max_age:
+                    removed += self._remove(path)
+                continue
+            key, ext = os.path.splitext(name)
+            if ext not in ('.pdf', '.json'):
+                continue
+            entry = entries.setdefault(key, {'mtime': 0, 'size': 0, 'pdf': False})
+            entry['size'] += stat.st_size
+            if ext == '.pdf':
+                entry['pdf'] = True
+                entry['mtime'] = stat.st_mtime
+            else:
+                entry['mtime'] = entry['mtime'] or stat.st_mtime
+
+        total = sum(entry['size'] for entry in entries.values())
+        for key, entry in sorted(entries.items(), key=lambda item: item[1]['mtime']):
+            if key in busy or entry['mtime'] > now - self.grace:
+                continue
+            expired = entry['mtime'] < now - self.max_age
+            orphaned = not entry['pdf']
+            if not (expired or orphaned or total > self.max_bytes):
+                continue
+            removed += self._remove(self.pdf_path(key)) + self._remove(self._meta_path(key))
+            total -= entry['size']
+        return removed
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+            return 1
+        except FileNotFoundError:
+            return 0
+        except OSError as e:
+            print(f"DEBUG: Could not remove cached PDF {path}: {e}")
+            return 0
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
@@ -0,0 +1,167 @@
+"""
+Per-user cache of slow-changing reference rows: the profile columns of
+users, company_settings, user_settings and bank_accounts.
+
+Entries are validated against per-user version counters kept in
+collection_versions (the table behind the list ETags) and bumped by
+AFTER INSERT/UPDATE/DELETE triggers, so a write from any worker process or
+code path makes the cached copy unusable everywhere. The counters for a
+user are read once per request with a single primary-key range lookup, and
+every kind that request asks for is answered from that read; a request that
+needs several reference rows pays one query instead of one per table.
+
+On top of the version check, entries expire after `ttl` seconds and the
+least recently used entries are evicted beyond `max_entries`, so the cache
+stays bounded however many users a worker sees. invalidate() drops a
+user's entries right away in this process (update endpoints call it after
+committing) and forgets the versions already read for the request.
+
+Cached values are shared between requests; callers must not mutate them.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from flask import g, has_request_context
+
+from http_cache import VERSION_TABLE, bump_version_sql
+
+# kind -> (table, owner column, columns whose change bumps the version or None for any change)
+REFERENCE_KINDS = {
+    'profile': ('users', 'id', ('username', 'email', 'first_name', 'last_name')),
+    'company_settings': ('company_settings', 'user_id', None),
+    'user_settings': ('user_settings', 'user_id', None),
+    'bank_accounts': ('bank_accounts', 'user_id', None),
+}
+
+
+def _version_name(kind):
+    return f"ref:{kind}"
+
+
+def install_reference_triggers(cursor):
+    """(Re)create the triggers that bump a user's reference versions on every relevant write"""
+    for kind, (table, column, watched) in REFERENCE_KINDS.items():
+        collection = _version_name(kind)
+        update_body = bump_version_sql(f"NEW.{column}", collection)
+        if watched:
+            # users rows are updated on every cash transaction; only profile edits matter here
+            changed = ' OR '.join(f"NOT (OLD.{name} <=> NEW.{name})" for name in watched)
+            update_body = f"IF {changed} THEN {update_body} END IF;"
+        bodies = {
+            'insert': bump_version_sql(f"NEW.{column}", collection),
+            'update': update_body
+                      + f" IF NOT (OLD.{column} <=> NEW.{column}) THEN {bump_version_sql(f'OLD.{column}', collection)} END IF;",
+            'delete': bump_version_sql(f"OLD.{column}", collection),
+        }
+        for event, body in bodies.items():
+            name = f"trg_{table}_refversion_{event}"
+            cursor.execute(f"DROP TRIGGER IF EXISTS `{name}`")
+            cursor.execute(
+                f"CREATE TRIGGER `{name}` AFTER {event.upper()} ON `{table}` "
+                f"FOR EACH ROW BEGIN {body} END"
+            )
+
+
+class ReferenceCache:
+    """TTL + LRU read-through cache of {(user_id, kind): value} validated by version counters"""
+
+    def __init__(self, max_entries=4096, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.version_reads = 0
+
+    def get(self, connection, user_id, kind, load):
+        """Cached value of `kind` for a user, or load(cursor) on a miss.
+
+        `connection` is only used for the version read and, on a miss, for
+        load(); it is not closed here.
+        """
+        versions = self._versions(connection, user_id)
+        version = versions[kind]
+        key = (user_id, kind)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] == version and entry[1] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            if entry:
+                self.stale += 1
+            self.misses += 1
+
+        cursor = connection.cursor(dictionary=True)
+        try:
+            value = load(cursor)
+        finally:
+            cursor.close()
+
+        with self._lock:
+            self._entries[key] = (version, now + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def invalidate(self, user_id, *kinds):
+        """Drop a user's cached kinds (all of them if none are given) in this process"""
+        kinds = kinds or tuple(REFERENCE_KINDS)
+        with self._lock:
+            for kind in kinds:
+                self._entries.pop((user_id, kind), None)
+            self.invalidations += 1
+        if has_request_context():
+            g.get('_reference_versions', {}).pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+
+    def _versions(self, connection, user_id):
+        """{kind: version} for a user, read from the database once per request"""
+        memo = g.setdefault('_reference_versions', {}) if has_request_context() else {}
+        versions = memo.get(user_id)
+        if versions is None:
+            names = {_version_name(kind): kind for kind in REFERENCE_KINDS}
+            placeholders = ', '.join(['%s'] * len(names))
+            cursor = connection.cursor()
+            try:
+                cursor.execute(f"""
+                    SELECT collection, version FROM {VERSION_TABLE}
+                    WHERE owner_id = %s AND collection IN ({placeholders})
+                """, [user_id] + list(names))
+                rows = cursor.fetchall()
+            finally:
+                cursor.close()
+            versions = {kind: 0 for kind in REFERENCE_KINDS}
+            versions.update((names[name], version) for name, version in rows)
+            memo[user_id] = versions
+            with self._lock:
+                self.version_reads += 1
+        return versions
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+                'stale': self.stale,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'version_reads': self.version_reads,
+            }
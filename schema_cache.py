@@ -0,0 +1,61 @@
+"""
+Process-wide cache of table column names.
+
+Request handlers that pick between INSERT/UPDATE variants based on which
+columns exist read from this cache instead of running DESCRIBE on every
+request. The whole schema is loaded with one information_schema query the
+first time it is needed and kept until invalidate() is called (after
+migrations run).
+"""
+import threading
+
+
+class SchemaCache:
+    """Lazily loaded {table_name: frozenset(column_names)} for the current database"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._columns = None
+        self.loads = 0
+
+    def get_columns(self, connection, table):
+        """Return the column names of `table`, loading the schema on first use"""
+        columns = self._columns
+        if columns is None:
+            columns = self._load(connection)
+        return columns.get(table, frozenset())
+
+    def has_columns(self, connection, table, *names):
+        """True when every name in `names` is a column of `table`"""
+        columns = self.get_columns(connection, table)
+        return all(name in columns for name in names)
+
+    def invalidate(self):
+        """Forget the cached schema; the next lookup reloads it"""
+        with self._lock:
+            self._columns = None
+
+    def _load(self, connection):
+        cursor = connection.cursor()
+        try:
+            cursor.execute("""
+                SELECT TABLE_NAME, COLUMN_NAME FROM INFORMATION_SCHEMA.COLUMNS
+                WHERE TABLE_SCHEMA = DATABASE()
+            """)
+            rows = cursor.fetchall()
+        finally:
+            cursor.close()
+
+        tables = {}
+        for table_name, column_name in rows:
+            if isinstance(table_name, (bytes, bytearray)):
+                table_name = table_name.decode()
+            if isinstance(column_name, (bytes, bytearray)):
+                column_name = column_name.decode()
+            tables.setdefault(table_name, set()).add(column_name)
+
+        columns = {name: frozenset(cols) for name, cols in tables.items()}
+        with self._lock:
+            self._columns = columns
+            self.loads += 1
+        return columns
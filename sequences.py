@@ -0,0 +1,74 @@
+"""
+Per-user document number sequences.
+
+Invoice numbers (LNTP/LNTS), debt codes (DEBT) and payment receipt numbers
+(RCP) are allocated from a counter row per (user, document type). One
+statement both creates/increments the row and returns the new value via
+LAST_INSERT_ID(expr), so allocation is a single round trip however many
+documents the user already has. The counter row stays locked until the
+caller's transaction ends, so concurrent allocations for the same user
+and type are serialized and never hand out the same number; a rolled-back
+transaction gives its number back.
+"""
+
+SEQUENCE_TABLE = 'document_sequences'
+
+# doc_type -> (prefix, zero-padded width); the prefix is also the doc_type key
+DOCUMENT_FORMATS = {
+    'LNTP': ('LNTP', 3),
+    'LNTS': ('LNTS', 3),
+    'DEBT': ('DEBT', 4),
+    'RCP': ('RCP', 6),
+}
+
+# doc_type -> (table, number column) the counters are seeded from
+DOCUMENT_SOURCES = {
+    'LNTP': ('invoices', 'invoice_number'),
+    'LNTS': ('invoices', 'invoice_number'),
+    'DEBT': ('debts', 'debt_code'),
+    'RCP': ('debt_payments', 'receipt_number'),
+}
+
+
+def create_sequence_table(cursor):
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS `{SEQUENCE_TABLE}` (
+            user_id INT NOT NULL,
+            doc_type VARCHAR(16) NOT NULL,
+            last_value BIGINT UNSIGNED NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, doc_type)
+        )
+    """)
+
+
+def seed_sequences(cursor):
+    """Start every counter after the highest number already issued (safe to re-run)"""
+    for doc_type, (table, column) in DOCUMENT_SOURCES.items():
+        prefix = DOCUMENT_FORMATS[doc_type][0]
+        cursor.execute(f"""
+            INSERT INTO {SEQUENCE_TABLE} (user_id, doc_type, last_value)
+            SELECT user_id, %s, MAX(CAST(SUBSTRING({column}, %s) AS UNSIGNED))
+            FROM {table}
+            WHERE {column} REGEXP %s
+            GROUP BY user_id
+            ON DUPLICATE KEY UPDATE last_value = GREATEST(last_value, VALUES(last_value))
+        """, (doc_type, len(prefix) + 1, f'^{prefix}[0-9]+$'))
+
+
+def next_value(cursor, user_id, doc_type):
+    """Increment and return the (user_id, doc_type) counter inside the cursor's transaction"""
+    if doc_type not in DOCUMENT_FORMATS:
+        raise ValueError(f'Unknown document type: {doc_type}')
+    cursor.execute(f"""
+        INSERT INTO {SEQUENCE_TABLE} (user_id, doc_type, last_value)
+        VALUES (%s, %s, LAST_INSERT_ID(1))
+        ON DUPLICATE KEY UPDATE last_value = LAST_INSERT_ID(last_value + 1)
+    """, (user_id, doc_type))
+    return cursor.lastrowid
+
+
+def next_document_number(cursor, user_id, doc_type):
+    """Allocate the next formatted number, e.g. LNTP007, DEBT0012, RCP000045"""
+    prefix, width = DOCUMENT_FORMATS[doc_type]
+    return f"{prefix}{next_value(cursor, user_id, doc_type):0{width}d}"
@@ -573,7 +573,7 @@ function viewUserDetails(userId) {
 
  // Export user data
  function exportUserData(userId) {
-     window.location.href = `/admin/api/users/${userId}/export-data`;
+     runAdminExport(`/admin/api/users/${userId}/export-data`);
  }
 
 // Reset user password
@@ -654,14 +654,43 @@ function terminateAllSessions() {
     );
 }
 
+// Start a background export job, poll its progress and download the file when ready
+function runAdminExport(url) {
+    $.get(url, function(response) {
+        if (!response.success) {
+            showAlert(response.error || 'Error starting export', 'error');
+            return;
+        }
+        showAlert('Export started. The download will begin when it is ready.', 'info');
+        pollExportJob(response.job.status_url);
+    }).fail(function(xhr) {
+        showAlert((xhr.responseJSON && xhr.responseJSON.error) || 'Error starting export', 'error');
+    });
+}
+
+function pollExportJob(statusUrl) {
+    $.get(statusUrl, function(response) {
+        const job = response.job;
+        if (job.status === 'done') {
+            window.location.href = job.download_url;
+        } else if (job.status === 'failed') {
+            showAlert('Export failed: ' + (job.error || 'unknown error'), 'error');
+        } else {
+            setTimeout(function() { pollExportJob(statusUrl); }, 2000);
+        }
+    }).fail(function() {
+        showAlert('Lost track of the export job', 'error');
+    });
+}
+
 // Export all data
 function exportAllData() {
-    window.location.href = '/admin/api/export-all-data';
+    runAdminExport('/admin/api/export-all-data');
 }
 
 // Export audit logs
 function exportAuditLogs() {
-    window.location.href = '/admin/api/export-audit-logs';
+    runAdminExport('/admin/api/export-audit-logs');
 }
 
 // Generate system report
@@ -694,7 +723,7 @@ function showSystemReport() {
 
 // Export user data
 function exportUserData(userId) {
-    window.location.href = `/admin/api/users/${userId}/export-data`;
+    runAdminExport(`/admin/api/users/${userId}/export-data`);
 }
 
 // Show alert
@@ -722,9 +751,46 @@ function showAlert(message, type) {
     }, 5000);
 }
 
-// Auto-refresh data every 30 seconds
-setInterval(function() {
+// Refresh the dashboard when audited activity is pushed, at most every 5 seconds;
+// fall back to polling every 30 seconds while the event stream is unavailable
+let dashboardRefreshPending = false;
+let dashboardPollTimer = null;
+
+function refreshActiveDashboard() {
     if ($('#dashboard').hasClass('active')) {
         loadDashboardData();
     }
-}, 30000);
+}
+
+function startDashboardPolling() {
+    if (!dashboardPollTimer) {
+        dashboardPollTimer = setInterval(refreshActiveDashboard, 30000);
+    }
+}
+
+if (window.EventSource) {
+    const adminEvents = new EventSource('/admin/api/events/stream');
+    let adminEventsOpened = false;
+    adminEvents.onopen = function() {
+        clearInterval(dashboardPollTimer);
+        dashboardPollTimer = null;
+        // Activity while the stream was down is not replayed
+        if (adminEventsOpened) {
+            refreshActiveDashboard();
+        }
+        adminEventsOpened = true;
+    };
+    adminEvents.onerror = startDashboardPolling;
+    adminEvents.addEventListener('activity', function() {
+        if (dashboardRefreshPending) {
+            return;
+        }
+        dashboardRefreshPending = true;
+        setTimeout(function() {
+            dashboardRefreshPending = false;
+            refreshActiveDashboard();
+        }, 5000);
+    });
+} else {
+    startDashboardPolling();
+}
@@ -769,3 +769,53 @@ function toggleSearch() {
 
 // Make toggleSearch globally available
 window.toggleSearch = toggleSearch;
+
+/**
+ * Subscribe to server-sent events, falling back to polling.
+ * handlers maps event names to callbacks receiving the parsed data.
+ * If EventSource is unavailable, or the stream keeps failing, fallbackPoll
+ * runs every fallbackInterval ms until the stream reconnects. Every
+ * reconnect also runs onResync (default: fallbackPoll) once, since events
+ * sent while the stream was down are not replayed.
+ */
+function subscribeToEvents(url, handlers, fallbackPoll, fallbackInterval, onResync) {
+    let pollTimer = null;
+    const startPolling = () => {
+        if (!pollTimer && fallbackPoll) {
+            pollTimer = setInterval(fallbackPoll, fallbackInterval);
+        }
+    };
+    const stopPolling = () => {
+        if (pollTimer) {
+            clearInterval(pollTimer);
+            pollTimer = null;
+        }
+    };
+    
+    if (!window.EventSource) {
+        startPolling();
+        return null;
+    }
+    
+    const resync = onResync || fallbackPoll;
+    let opened = false;
+    const source = new EventSource(url);
+    source.onopen = () => {
+        stopPolling();
+        if (opened && resync) {
+            resync();
+        }
+        opened = true;
+    };
+    // EventSource retries by itself; poll in the meantime so nothing is missed
+    source.onerror = startPolling;
+    Object.keys(handlers).forEach(eventName => {
+        source.addEventListener(eventName, event => {
+            handlers[eventName](JSON.parse(event.data));
+        });
+    });
+    window.addEventListener('beforeunload', () => source.close());
+    return source;
+}
+
+window.subscribeToEvents = subscribeToEvents;
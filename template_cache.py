@@ -0,0 +1,80 @@
+"""
+Compiled-template cache for the invoice HTML templates on disk.
+
+The pdftemp templates are compiled once and reused, keyed by (mtime, size)
+so an edited file is picked up on the next render. Compiled bytecode is
+also written to a FileSystemBytecodeCache so a restarted process skips the
+Jinja2 parse/compile step as well.
+"""
+import os
+import threading
+
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+
+
+class TemplateCache:
+    """Process-wide cache of compiled Jinja2 templates with hit/miss counters"""
+
+    def __init__(self, search_path='.', bytecode_dir=None):
+        bytecode_cache = None
+        if bytecode_dir:
+            os.makedirs(bytecode_dir, exist_ok=True)
+            bytecode_cache = FileSystemBytecodeCache(bytecode_dir)
+        # Compiled templates live in self._templates; the Environment's own
+        # LRU is disabled so there is exactly one place to invalidate.
+        self.env = Environment(
+            loader=FileSystemLoader(search_path),
+            bytecode_cache=bytecode_cache,
+            cache_size=0,
+            auto_reload=False
+        )
+        self.search_path = search_path
+        self._lock = threading.Lock()
+        self._templates = {}
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _lookup(self, key, version):
+        with self._lock:
+            entry = self._templates.get(key)
+            if entry and entry[0] == version:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+
+    def _store(self, key, version, template):
+        with self._lock:
+            self._templates[key] = (version, template)
+
+    def get_file_template(self, name):
+        """Compiled template for a file under search_path, recompiled when its mtime/size change"""
+        path = os.path.join(self.search_path, name)
+        stat = os.stat(path)
+        version = (stat.st_mtime_ns, stat.st_size)
+        key = ('file', name)
+
+        template = self._lookup(key, version)
+        if template is None:
+            template = self.env.get_template(name)
+            self._store(key, version, template)
+        return template
+
+    def clear(self):
+        """Drop all compiled templates (bytecode on disk is kept; it is checked against the source)"""
+        with self._lock:
+            self._templates.clear()
+            self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._templates),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+                'invalidations': self.invalidations,
+                'bytecode_cache': self.env.bytecode_cache is not None
+            }
@@ -0,0 +1,143 @@
+"""
+Request-scoped unit of work.
+
+get_request_connection() in app.py returns one connection per request,
+stored on flask.g and acquired lazily on first use. Every helper that asks
+for it shares the same connection and the same transaction:
+
+- commit() only marks the unit of work as having changes to keep; the real
+  COMMIT is issued once, after the view returns a non-error response
+- rollback() rolls back everything done so far in the request and makes
+  the unit of work rollback-only: later commit() calls are ignored and a
+  success response is replaced with a 500, so a helper's failure can never
+  leave the request half committed
+- close() is a no-op; the connection goes back to the pool at teardown
+- mark_rollback_only() fails the request without undoing work yet, for
+  helpers that report failure by return value instead of raising
+- after_commit(callback) defers side effects that must not happen unless
+  the data change sticks (deleting uploaded files, for example)
+
+Outside a request (background threads, scripts) callers get an ordinary
+pooled connection instead, so the same helper code works in both places.
+"""
+from flask import g, has_request_context, jsonify, request
+
+
+class UnitOfWorkConnection:
+    """Connection proxy handed to code participating in a request's unit of work"""
+
+    def __init__(self, uow):
+        self._uow = uow
+
+    def cursor(self, *args, **kwargs):
+        # Buffered by default: several helpers share this connection, and an
+        # unread result on one cursor would break the next helper's query
+        kwargs.setdefault('buffered', True)
+        return self._uow.raw.cursor(*args, **kwargs)
+
+    def commit(self):
+        if not self._uow.rollback_only:
+            self._uow.pending_commit = True
+
+    def rollback(self):
+        self._uow.rollback()
+        self._uow.rollback_only = True
+
+    def mark_rollback_only(self):
+        self._uow.rollback_only = True
+
+    def close(self):
+        pass
+
+    def __getattr__(self, name):
+        return getattr(self._uow.raw, name)
+
+
+class UnitOfWork:
+    """One lazily acquired connection and one transaction for the current request"""
+
+    def __init__(self, acquire):
+        self._acquire = acquire
+        self.raw = None
+        self.pending_commit = False
+        self.rollback_only = False
+        self.commits = 0
+        self._after_commit = []
+
+    def connection(self):
+        if self.raw is None:
+            self.raw = self._acquire()
+            if self.raw is None:
+                return None
+        return UnitOfWorkConnection(self)
+
+    def after_commit(self, callback):
+        self._after_commit.append(callback)
+
+    def commit(self):
+        if self.raw is not None and self.pending_commit:
+            self.raw.commit()
+            self.commits += 1
+        self.pending_commit = False
+        callbacks, self._after_commit = self._after_commit, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"DEBUG: Unit of work after-commit callback failed: {e}")
+
+    def rollback(self):
+        if self.raw is not None:
+            self.raw.rollback()
+        self.pending_commit = False
+        self._after_commit = []
+
+    def release(self):
+        raw, self.raw = self.raw, None
+        if raw is not None:
+            # The pool rolls back anything left uncommitted
+            raw.close()
+
+
+def current_unit_of_work(acquire):
+    """The request's UnitOfWork (created on first use), or None outside a request"""
+    if not has_request_context():
+        return None
+    uow = g.get('_unit_of_work')
+    if uow is None:
+        uow = g._unit_of_work = UnitOfWork(acquire)
+    return uow
+
+
+def init_unit_of_work(app):
+    """Commit after successful responses and release the connection at teardown"""
+
+    @app.after_request
+    def commit_unit_of_work(response):
+        uow = g.get('_unit_of_work')
+        if uow is None or uow.raw is None:
+            return response
+        if response.status_code >= 400:
+            uow.rollback()
+            return response
+        if uow.rollback_only:
+            # A helper rolled back part of this request; don't report success
+            print(f"DEBUG: Unit of work was rolled back during {request.method} {request.path}")
+            uow.rollback()
+            response = jsonify({'error': 'Could not save changes'})
+            response.status_code = 500
+            return response
+        try:
+            uow.commit()
+        except Exception as e:
+            print(f"DEBUG: Unit of work commit failed: {e}")
+            uow.rollback()
+            response = jsonify({'error': 'Could not save changes'})
+            response.status_code = 500
+        return response
+
+    @app.teardown_request
+    def release_unit_of_work(exc):
+        uow = g.pop('_unit_of_work', None)
+        if uow is not None:
+            uow.release()